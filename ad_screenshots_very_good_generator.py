@@ -7,9 +7,9 @@
 import os
 import json
 import psycopg2
-from minio import Minio
+from minio_factory import get_minio
 from dotenv import load_dotenv
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
 from PIL import Image, ImageDraw, ImageFont
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
@@ -17,14 +17,80 @@ from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 import tempfile
 import base64
+import threading
+
+from utils.image_cache import get_image_cache, ORIGINAL
+from artifact_codec import decode_json
+from upload_service import get_upload_service
+from report_manifest import manifest_writer
+from report_index import ReportIndex, get_report_index
+from stats_store import StatsTable, stats_table_filename, load_stats_table
 
 # Загружаем переменные окружения
 load_dotenv()
 
+# Веб-драйвер рендеринга, общий для отчетов процесса (режим службы, см. main_processor)
+_shared_driver = None
+_shared_driver_lock = threading.Lock()
+_chromedriver_path = None
+
+
+def _create_renderer_driver():
+    """Chrome для HTML рендеринга объявлений; ChromeDriver устанавливается один раз на процесс"""
+    global _chromedriver_path
+    chrome_options = Options()
+    chrome_options.add_argument('--headless')  # Запуск без GUI
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--window-size=300,600')
+    chrome_options.add_argument('--force-device-scale-factor=1')
+    chrome_options.add_argument('--disable-web-security')
+    chrome_options.add_argument('--disable-features=VizDisplayCompositor')
+
+    # Автоматическая установка ChromeDriver
+    if _chromedriver_path is None:
+        _chromedriver_path = ChromeDriverManager().install()
+    return webdriver.Chrome(service=Service(_chromedriver_path), options=chrome_options)
+
+
+def get_shared_driver():
+    """Общий веб-драйвер рендеринга (создается заново, если браузер завершился)"""
+    global _shared_driver
+    with _shared_driver_lock:
+        if _shared_driver is not None:
+            try:
+                _shared_driver.current_url
+            except Exception:
+                _close_shared_driver()
+        if _shared_driver is None:
+            _shared_driver = _create_renderer_driver()
+        return _shared_driver
+
+
+def _close_shared_driver():
+    global _shared_driver
+    if _shared_driver is not None:
+        try:
+            _shared_driver.quit()
+        except Exception:
+            pass
+        _shared_driver = None
+
+
+def close_shared_driver():
+    """Закрывает общий веб-драйвер (при остановке службы)"""
+    with _shared_driver_lock:
+        _close_shared_driver()
+
 
 class AdScreenshotsGenerator:
-    def __init__(self):
-        """Инициализация подключений к БД и MinIO"""
+    def __init__(self, keep_driver: bool = False):
+        """
+        Инициализация подключений к БД и MinIO
+        :param keep_driver: использовать общий веб-драйвер процесса и не закрывать его
+        """
+        self.keep_driver = keep_driver
         # Настройки БД
         self.db_config = {
             'host': os.getenv('DB_HOST', 'localhost'),
@@ -44,14 +110,11 @@ class AdScreenshotsGenerator:
         self.s3_secure = os.getenv('S3_SECURE', 'False').lower() == 'true'
         self.s3_bucket_name = os.getenv('S3_BUCKET_NAME', 'dit-services-dev')
 
-        self.minio_client = Minio(
-            endpoint=self.s3_endpoint_url,
-            access_key=self.s3_access_key,
-            secret_key=self.s3_secret_key,
-            secure=self.s3_secure
-        )
+        self.minio_client = get_minio(self.s3_endpoint_url, self.s3_access_key, self.s3_secret_key, self.s3_secure)
 
         self.bucket_name = os.getenv('S3_BUCKET_NAME', 'dit-services-dev')
+        # Загрузки скриншотов обрабатываемого отчета (ждем только их, см. process_top_ads_report)
+        self._uploads = []
 
         # Инициализация веб-драйвера для HTML рендеринга
         self._setup_webdriver()
@@ -59,19 +122,7 @@ class AdScreenshotsGenerator:
     def _setup_webdriver(self):
         """Настройка веб-драйвера для HTML рендеринга"""
         try:
-            chrome_options = Options()
-            chrome_options.add_argument('--headless')  # Запуск без GUI
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            chrome_options.add_argument('--disable-gpu')
-            chrome_options.add_argument('--window-size=300,600')
-            chrome_options.add_argument('--force-device-scale-factor=1')
-            chrome_options.add_argument('--disable-web-security')
-            chrome_options.add_argument('--disable-features=VizDisplayCompositor')
-
-            # Автоматическая установка ChromeDriver
-            service = Service(ChromeDriverManager().install())
-            self.driver = webdriver.Chrome(service=service, options=chrome_options)
+            self.driver = get_shared_driver() if self.keep_driver else _create_renderer_driver()
             print("✓ Веб-драйвер инициализирован")
         except Exception as e:
             print(f"⚠ Ошибка инициализации веб-драйвера: {e}")
@@ -79,7 +130,7 @@ class AdScreenshotsGenerator:
 
     def __del__(self):
         """Закрытие веб-драйвера при удалении объекта"""
-        if hasattr(self, 'driver') and self.driver:
+        if hasattr(self, 'driver') and self.driver and not getattr(self, 'keep_driver', False):
             try:
                 self.driver.quit()
             except:
@@ -202,6 +253,15 @@ class AdScreenshotsGenerator:
             f'ad_stats_{report_id}.json'  # Добавляем файл статистики
         ]
 
+        # Статистику объявлений берем в колоночном виде, если она сохранена
+        ad_stats_filename = f'ad_stats_{report_id}.json'
+        ad_stats_table = load_stats_table(self.minio_client, self.bucket_name,
+                                          f"{folder_path}/{stats_table_filename(ad_stats_filename)}")
+        if ad_stats_table is not None:
+            data[ad_stats_filename] = ad_stats_table
+            files_to_load.remove(ad_stats_filename)
+            print(f"✓ Загружен файл: {stats_table_filename(ad_stats_filename)}")
+
         for filename in files_to_load:
             try:
                 object_path = f"{folder_path}/{filename}"
@@ -210,8 +270,8 @@ class AdScreenshotsGenerator:
                 if self.minio_client.stat_object(self.bucket_name, object_path):
                     # Загружаем объект
                     response = self.minio_client.get_object(self.bucket_name, object_path)
-                    content = response.read().decode('utf-8')
-                    data[filename] = json.loads(content)
+                    content = response.read()
+                    data[filename] = decode_json(content)
                     print(f"✓ Загружен файл: {filename}")
                 else:
                     print(f"⚠ Файл не найден: {filename}")
@@ -222,21 +282,24 @@ class AdScreenshotsGenerator:
 
         return data
 
-    def get_top_ads_by_clicks(self, ad_stats_data: Dict, top_count: int = 10) -> List[Dict]:
+    def get_top_ads_by_clicks(self, ad_stats_data: Union[Dict, StatsTable], top_count: int = 10) -> List[Dict]:
         """Получить топ объявлений по количеству кликов с учетом BounceRate"""
-        if not ad_stats_data or 'result' not in ad_stats_data:
-            print("⚠ Нет данных статистики объявлений")
-            return []
+        if isinstance(ad_stats_data, StatsTable):
+            stats = ad_stats_data
+        else:
+            if not ad_stats_data or 'result' not in ad_stats_data:
+                print("⚠ Нет данных статистики объявлений")
+                return []
+            stats = StatsTable.from_rows(ad_stats_data['result'].get('rows', []))
 
-        rows = ad_stats_data['result'].get('rows', [])
-        if not rows:
+        if not len(stats):
             print("⚠ Нет строк в данных статистики")
             return []
 
-        print(f"📊 Всего объявлений в статистике: {len(rows)}")
+        print(f"📊 Всего объявлений в статистике: {len(stats)}")
 
         # Применяем фильтрацию по BounceRate с адаптивной логикой
-        top_ads = self._filter_by_bounce_rate_and_sort(rows, top_count)
+        top_ads = self._filter_by_bounce_rate_and_sort(stats, top_count)
 
         print(f"🏆 Топ {len(top_ads)} объявлений по кликам (после фильтрации по отказу):")
         for i, ad in enumerate(top_ads, 1):
@@ -251,7 +314,7 @@ class AdScreenshotsGenerator:
 
         return top_ads
 
-    def _filter_by_bounce_rate_and_sort(self, rows: List[Dict], top_count: int, initial_threshold: float = 35.0) -> \
+    def _filter_by_bounce_rate_and_sort(self, stats: StatsTable, top_count: int, initial_threshold: float = 35.0) -> \
             List[Dict]:
         """Фильтрация по BounceRate с адаптивной логикой"""
         threshold = initial_threshold
@@ -259,52 +322,40 @@ class AdScreenshotsGenerator:
         print(f"\n🔍 ФИЛЬТРАЦИЯ ПО BounceRate (начальный порог: {threshold}%):")
 
         # Первая попытка: фильтруем по 35% отказов
-        filtered = [ad for ad in rows if ad.get('BounceRate', 0) <= threshold]
+        filtered = stats.indices_where('BounceRate', threshold)
         print(f"  ✓ Объявлений с BounceRate <= {threshold}%: {len(filtered)}")
 
         # Если после фильтрации осталось 0 или 1 объявление, увеличиваем порог до 50%
         if len(filtered) <= 1:
             print(f"  ⚠ Слишком мало объявлений ({len(filtered)}), увеличиваем порог до 50%")
             threshold = 50.0
-            filtered = [ad for ad in rows if ad.get('BounceRate', 0) <= threshold]
+            filtered = stats.indices_where('BounceRate', threshold)
             print(f"  ✓ Объявлений с BounceRate <= {threshold}%: {len(filtered)}")
 
         # Если и после увеличения порога осталось 0 или 1 объявление, убираем ограничение
         if len(filtered) <= 1:
             print(f"  ⚠ Все еще слишком мало объявлений ({len(filtered)}), убираем ограничение по BounceRate")
-            filtered = rows
-            print(f"  ✓ Объявлений без ограничения по BounceRate: {len(filtered)}")
-
-        # Сортируем по количеству кликов (по убыванию)
-        sorted_ads = sorted(filtered, key=lambda x: x.get('Clicks', 0), reverse=True)
-
-        # Берем топ N объявлений
-        top_ads = sorted_ads[:top_count]
+            filtered = None
+            print(f"  ✓ Объявлений без ограничения по BounceRate: {len(stats)}")
 
-        return top_ads
+        # Берем топ N объявлений по количеству кликов (по убыванию)
+        return stats.records(stats.top_k(top_count, 'Clicks', filtered))
 
     def load_ad_details_from_stats(self, top_ads: List[Dict], report_id: int) -> List[Dict]:
         """Загрузить детали объявлений из ads_report для топ объявлений"""
-        # Загружаем данные объявлений
-        data = self.load_data_from_minio(report_id)
-        ads_report_key = f'ads_report_{report_id}.json'
-
-        if not data.get(ads_report_key):
+        # Объявления ищутся по ID в индексе отчета
+        index = get_report_index(self.minio_client, self.bucket_name, report_id)
+        if index is None:
             print("⚠ Нет данных объявлений")
             return []
 
-        ads_data = data[ads_report_key]
-        all_ads = ads_data.get('result', {}).get('Ads', [])
-
-        # Создаем словарь для быстрого поиска по ID
-        ads_dict = {ad.get('Id'): ad for ad in all_ads}
-
         # Собираем детали для топ объявлений
         top_ads_details = []
         for ad_stat in top_ads:
             ad_id = ad_stat.get('AdId')
-            if ad_id in ads_dict:
-                ad_detail = ads_dict[ad_id]
+            ad_detail = index.ad(ad_id)
+            if ad_detail is not None:
+                ad_detail = dict(ad_detail)
                 # Добавляем статистику к деталям объявления
                 ad_detail['statistics'] = ad_stat
                 top_ads_details.append(ad_detail)
@@ -323,11 +374,8 @@ class AdScreenshotsGenerator:
             print("⚠ Нет объявлений для создания скриншотов")
             return created_screenshots
 
-        # Загружаем дополнительные данные
-        data = self.load_data_from_minio(report_id)
-        sitelinks_data = data.get(f'sitelinks_{report_id}.json')
-        extensions_data = data.get(f'extensions_{report_id}.json')
-        image_data = data.get(f'image_hashes_report_{report_id}.json')
+        # Быстрые ссылки, уточнения и изображения объявлений берутся из индекса отчета
+        index = get_report_index(self.minio_client, self.bucket_name, report_id)
 
         print(f"\n🖼️ ГЕНЕРАЦИЯ СКРИНШОТОВ ДЛЯ ТОП {len(top_ads_details)} ОБЪЯВЛЕНИЙ:")
         print(f"📊 Создаем по 1 объявлению на скриншот")
@@ -339,20 +387,12 @@ class AdScreenshotsGenerator:
 
             print(f"\n📸 Создание скриншота #{i} для объявления ID: {ad_id} (клики: {clicks}):")
 
-            # Получаем sitelinks для объявления
-            sitelinks = self._get_sitelinks_for_ad(ad_detail, sitelinks_data)
-
-            # Получаем изображение для объявления
-            image_url = self._get_image_for_ad(ad_detail, image_data)
-
             # Создаем скриншот (используем ID объявления как имя файла)
             screenshot_path = self.generate_single_ad_screenshot(
                 ad_detail,
                 ad_id,  # Используем ID объявления вместо индекса
                 output_dir,
-                sitelinks_data,
-                extensions_data,
-                image_data,
+                index,
                 report_id
             )
 
@@ -366,8 +406,7 @@ class AdScreenshotsGenerator:
         return created_screenshots
 
     def generate_single_ad_screenshot(self, ad_data: Dict, ad_id: str, output_dir: str = "screenshots",
-                                      sitelinks_data: Dict = None, extensions_data: Dict = None,
-                                      image_data: Dict = None, report_id: int = None) -> str:
+                                      index: ReportIndex = None, report_id: int = None) -> str:
         """Генерировать скриншот одного объявления с именем файла по ID"""
         try:
             # Создаем папку для скриншотов, если её нет
@@ -395,13 +434,13 @@ class AdScreenshotsGenerator:
                 return self._generate_fallback_single_screenshot(ad_data, ad_id, output_dir)
 
             # Получаем sitelinks для объявления
-            sitelinks = self._get_sitelinks_for_ad(ad_data, sitelinks_data)
+            sitelinks = self._get_sitelinks_for_ad(ad_data, index)
 
             # Получаем изображение для объявления
-            image_url = self._get_image_for_ad(ad_data, image_data)
+            image_url = self._get_image_for_ad(ad_data, index)
 
             # Создаем HTML с правильным форматированием
-            html_content = self._create_html_content(display_text, sitelinks, ad_data, extensions_data, image_url)
+            html_content = self._create_html_content(display_text, sitelinks, ad_data, index, image_url)
 
             # Создаем временный HTML файл
             with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as f:
@@ -522,13 +561,8 @@ class AdScreenshotsGenerator:
                     minio_path = f"gen_report_context_contracts/data_yandex_direct/{report_id}_результаты/very_good_ads/{filename}"
                 else:
                     minio_path = f"gen_report_context_contracts/data_yandex_direct/unknown_результаты/very_good_ads/{filename}"
-                if self.upload_to_minio(filepath, minio_path):
-                    # Удаляем локальный файл после успешной загрузки
-                    try:
-                        os.remove(filepath)
-                        print(f"      🗑️ Локальный файл удален: {filename}")
-                    except:
-                        pass
+                if self.upload_to_minio(filepath, minio_path, report_id):
+                    # Локальный файл удаляется сервисом загрузки после успешной загрузки
                     return minio_path
                 else:
                     return filepath
@@ -619,13 +653,8 @@ class AdScreenshotsGenerator:
             else:
                 minio_path = f"gen_report_context_contracts/data_yandex_direct/unknown_результаты/very_good_ads/{filename}"
 
-            if self.upload_to_minio(filepath, minio_path):
-                # Удаляем локальный файл после успешной загрузки
-                try:
-                    os.remove(filepath)
-                    print(f"      🗑️ Локальный файл удален: {filename}")
-                except:
-                    pass
+            if self.upload_to_minio(filepath, minio_path, report_id):
+                # Локальный файл удаляется сервисом загрузки после успешной загрузки
                 return minio_path
             else:
                 return filepath
@@ -634,9 +663,9 @@ class AdScreenshotsGenerator:
             print(f"✗ Ошибка при создании fallback скриншота: {e}")
             return None
 
-    def _get_image_for_ad(self, ad_data: Dict, image_data: Dict) -> str:
+    def _get_image_for_ad(self, ad_data: Dict, index: ReportIndex) -> str:
         """Получить URL изображения для объявления"""
-        if not image_data:
+        if not index:
             print(f"      ⚠ Нет данных изображений")
             return None
 
@@ -648,30 +677,21 @@ class AdScreenshotsGenerator:
             print(f"      ⚠ Нет AdImageHash в объявлении")
             return None
 
-        print(f"      🔍 Ищем изображение с хешем: {ad_image_hash}")
-
-        # Получаем все изображения
-        ad_images = image_data.get('result', {}).get('AdImages', [])
-        print(f"      📸 Всего изображений в данных: {len(ad_images)}")
-
-        # Ищем изображение по AdImageHash
-        for image in ad_images:
-            image_hash = image.get('AdImageHash')
-            if image_hash == ad_image_hash:
-                original_url = image.get('OriginalUrl')
-                if original_url:
-                    print(f"      ✅ Найдено изображение: {original_url}")
-                    return original_url
-                else:
-                    print(f"      ⚠ Нет OriginalUrl в найденном изображении")
-                    return None
+        image = index.image(ad_image_hash)
+        if image is None:
+            print(f"      ⚠ Изображение с хешем {ad_image_hash} не найдено")
+            return None
 
-        print(f"      ⚠ Изображение с хешем {ad_image_hash} не найдено")
+        original_url = image.get('OriginalUrl')
+        if original_url:
+            print(f"      ✅ Найдено изображение: {original_url}")
+            return original_url
+        print(f"      ⚠ Нет OriginalUrl в найденном изображении")
         return None
 
-    def _get_sitelinks_for_ad(self, ad_data: Dict, sitelinks_data: Dict) -> List[Dict]:
+    def _get_sitelinks_for_ad(self, ad_data: Dict, index: ReportIndex) -> List[Dict]:
         """Получить sitelinks для конкретного объявления"""
-        if not sitelinks_data:
+        if not index:
             print(f"      ⚠ Нет данных sitelinks")
             return []
 
@@ -685,39 +705,19 @@ class AdScreenshotsGenerator:
             print(f"      ⚠ У объявления нет SitelinkSetId")
             return []
 
-        # Ищем sitelinks по ID - проверяем структуру данных
-        print(f"      🔍 Структура sitelinks_data: {list(sitelinks_data.keys())}")
-
-        # Пробуем найти sitelinks в разных структурах
-        sitelinks_sets = []
-
-        # Вариант 1: прямая структура
-        if 'result' in sitelinks_data:
-            sitelinks_sets = sitelinks_data.get('result', {}).get('SitelinksSets', [])
-            print(f"      📋 Найдено наборов sitelinks (вариант 1): {len(sitelinks_sets)}")
-
-        # Вариант 2: структура с ID как ключ
-        if str(sitelink_set_id) in sitelinks_data:
-            sitelinks_data_by_id = sitelinks_data[str(sitelink_set_id)]
-            sitelinks_sets = sitelinks_data_by_id.get('result', {}).get('SitelinksSets', [])
-            print(f"      📋 Найдено наборов sitelinks (вариант 2): {len(sitelinks_sets)}")
-
-        for sitelinks_set in sitelinks_sets:
-            set_id = sitelinks_set.get('Id')
-            print(f"      🔍 Проверяем набор с ID: {set_id}")
-            if set_id == sitelink_set_id:
-                # Берем первые 4 sitelinks
-                sitelinks = sitelinks_set.get('Sitelinks', [])
-                print(f"      ✅ Найдены sitelinks: {len(sitelinks)} штук")
-                for i, sitelink in enumerate(sitelinks[:4]):
-                    print(f"        {i + 1}. {sitelink.get('Title', 'Без заголовка')}")
-                return sitelinks[:4]
-
-        print(f"      ❌ Sitelinks с ID {sitelink_set_id} не найдены")
-        return []
+        # Берем первые 4 sitelinks набора
+        sitelinks = index.sitelinks(sitelink_set_id)
+        if not sitelinks:
+            print(f"      ❌ Sitelinks с ID {sitelink_set_id} не найдены")
+            return []
+
+        print(f"      ✅ Найдены sitelinks: {len(sitelinks)} штук")
+        for i, sitelink in enumerate(sitelinks[:4]):
+            print(f"        {i + 1}. {sitelink.get('Title', 'Без заголовка')}")
+        return sitelinks[:4]
 
     def _create_html_content(self, display_text: str, sitelinks: List[Dict] = None, ad_data: Dict = None,
-                             extensions_data: Dict = None, image_url: str = None) -> str:
+                             index: ReportIndex = None, image_url: str = None) -> str:
         """Создание HTML контента для скриншота"""
         # Экранируем HTML символы
         safe_text = display_text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
@@ -785,14 +785,16 @@ class AdScreenshotsGenerator:
         # Формируем HTML для изображения
         image_html = ""
         if image_url:
-            image_html = f'<div class="ad-image"><img src="{image_url}" alt="Ad Image"></div>'
+            image_hash = (ad_data or {}).get('TextAd', {}).get('AdImageHash')
+            image_src = get_image_cache().get_local_uri(image_hash, ORIGINAL, image_url)
+            image_html = f'<div class="ad-image"><img src="{image_src}" alt="Ad Image"></div>'
             print(f"      ✅ Добавлено изображение: {image_url}")
         else:
             print(f"      ⚠ Изображение не найдено")
 
         # Формируем расширения (extensions)
         extensions_html = ""
-        if ad_data and extensions_data:
+        if ad_data and index:
             # Получаем AdExtensionId из объявления
             text_ad = ad_data.get('TextAd', {})
             ad_extensions = text_ad.get('AdExtensions', [])
@@ -801,19 +803,8 @@ class AdScreenshotsGenerator:
                 extension_ids = [ext.get('AdExtensionId') for ext in ad_extensions if ext.get('AdExtensionId')]
                 print(f"      🔍 Найдены AdExtensionId: {extension_ids}")
 
-                # Получаем все расширения из extensions_data
-                all_extensions = extensions_data.get('batch_1', {}).get('result', {}).get('AdExtensions', [])
-                print(f"      📋 Всего расширений в данных: {len(all_extensions)}")
-
-                # Фильтруем расширения по ID
-                matching_extensions = []
-                for ext in all_extensions:
-                    if ext.get('Id') in extension_ids:
-                        callout = ext.get('Callout', {})
-                        callout_text = callout.get('CalloutText', '')
-                        if callout_text:
-                            matching_extensions.append(callout_text)
-                            print(f"        📝 Найдено расширение: {callout_text}")
+                # Тексты уточнений объявления из индекса отчета
+                matching_extensions = index.callouts_for_ad(ad_data)
 
                 if matching_extensions:
                     # Объединяем через символ "·" с пробелами
@@ -1004,25 +995,41 @@ class AdScreenshotsGenerator:
         """
         return html_content
 
-    def upload_to_minio(self, file_path: str, minio_path: str) -> bool:
-        """Загрузить файл в MinIO"""
+    def upload_to_minio(self, file_path: str, minio_path: str, report_id=None) -> bool:
+        """
+        Ставит файл в очередь загрузки в MinIO (файл удаляется после успешной загрузки).
+        Загрузки завершаются в process_top_ads_report, пока рендерятся следующие скриншоты;
+        загруженный файл отмечается в манифесте отчета (выходные объекты шага top_ads_screenshots)
+        """
         try:
-            # Загружаем файл используя уже существующий клиент
-            self.minio_client.fput_object(
-                self.s3_bucket_name,
-                minio_path,
-                file_path
-            )
+            size = os.path.getsize(file_path)
+            manifest = manifest_writer(self.minio_client, self.s3_bucket_name, report_id) if report_id else None
+            # Объект относится к шагу, поставившему загрузку
+            stage = manifest.active_stage if manifest is not None else None
 
-            print(f"      ✅ Загружено в MinIO: {minio_path}")
+            def on_done(result):
+                if manifest is not None:
+                    manifest.record(minio_path, size, result.etag, stage)
+                print(f"      ✅ Загружено в MinIO: {minio_path}")
+
+            self._uploads.append(get_upload_service(self.minio_client, self.s3_bucket_name).submit_file(
+                minio_path,
+                file_path,
+                content_type='image/png',
+                remove=True,
+                on_done=on_done
+            ))
             return True
 
         except Exception as e:
             print(f"      ❌ Ошибка загрузки в MinIO: {e}")
             return False
 
-    def process_top_ads_report(self, report: Dict) -> None:
-        """Обработать отчет для топ объявлений по кликам"""
+    def process_top_ads_report(self, report: Dict) -> bool:
+        """
+        Обработать отчет для топ объявлений по кликам
+        :return: True, если создан хотя бы один скриншот и все скриншоты загружены в MinIO
+        """
         print(f"\n{'=' * 60}")
         print(f"ОБРАБОТКА ТОП ОБЪЯВЛЕНИЙ ОТЧЕТА #{report['id']}")
         print(f"{'=' * 60}")
@@ -1041,7 +1048,7 @@ class AdScreenshotsGenerator:
 
         if not ad_stats_data:
             print(f"⚠ Нет данных статистики объявлений в файле {ad_stats_key}")
-            return
+            return False
 
         # Получаем топ 10 объявлений по кликам
         print(f"\n📊 АНАЛИЗ СТАТИСТИКИ ОБЪЯВЛЕНИЙ:")
@@ -1049,7 +1056,7 @@ class AdScreenshotsGenerator:
 
         if not top_ads:
             print("⚠ Не удалось получить топ объявления")
-            return
+            return False
 
         # Загружаем детали объявлений
         print(f"\n🔍 ЗАГРУЗКА ДЕТАЛЕЙ ОБЪЯВЛЕНИЙ:")
@@ -1057,11 +1064,15 @@ class AdScreenshotsGenerator:
 
         if not top_ads_details:
             print("⚠ Не удалось загрузить детали объявлений")
-            return
+            return False
 
         # Создаем скриншоты для топ объявлений
         print(f"\n🖼️ СОЗДАНИЕ СКРИНШОТОВ ДЛЯ ТОП ОБЪЯВЛЕНИЙ:")
         created_screenshots = self.generate_top_ads_screenshots(top_ads_details, report['id'], ".")
+        uploaded = get_upload_service(self.minio_client, self.s3_bucket_name).wait(self._uploads)
+        self._uploads = []
+        if not uploaded:
+            print("⚠ Часть скриншотов не загружена в MinIO")
 
         print(f"\n✅ ОБРАБОТКА ЗАВЕРШЕНА:")
         print(f"📊 Обработано объявлений: {len(top_ads_details)}")
@@ -1074,6 +1085,8 @@ class AdScreenshotsGenerator:
                 filename = os.path.basename(screenshot_path)
                 print(f"  - {filename}")
 
+        return bool(created_screenshots) and uploaded
+
     def run(self):
         """Основной метод запуска обработки топ объявлений по кликам"""
         print("🚀 Запуск генератора скриншотов для топ объявлений по кликам...")
@@ -1097,8 +1110,8 @@ class AdScreenshotsGenerator:
 
         print(f"\n✅ Обработка топ объявлений завершена. Обработано отчетов: {len(reports)}")
 
-    def single_run(self, report_id):
-        """Метод запуска обработки топ объявлений по кликам для одного отчёта"""
+    def single_run(self, report_id) -> bool:
+        """Метод запуска обработки топ объявлений по кликам для одного отчёта (True - скриншоты загружены)"""
         print("🚀 Запуск генератора скриншотов для топ объявлений по кликам...")
 
         try:
@@ -1124,7 +1137,7 @@ class AdScreenshotsGenerator:
                     'id_requests': report[2],
                     'number_contract': report[3],
                     'subject_contract': report[4]}
-                self.process_top_ads_report(report)
+                return self.process_top_ads_report(report)
             else:
                 raise ValueError(f'Отчёт {report_id} не найден')
 
@@ -1135,11 +1148,15 @@ class AdScreenshotsGenerator:
             conn.close()
 
 
-def very_good_screenshot_generator(report_id):
-    """Главная функция"""
+def very_good_screenshot_generator(report_id, keep_driver: bool = False) -> bool:
+    """
+    Главная функция
+    :param keep_driver: оставить веб-драйвер открытым для следующих отчетов (режим службы)
+    :return: True, если скриншоты топ объявлений созданы и загружены
+    """
     try:
-        generator = AdScreenshotsGenerator()
-        generator.single_run(report_id)
+        generator = AdScreenshotsGenerator(keep_driver=keep_driver)
+        return generator.single_run(report_id)
 
         # report = get_report_by_id(report_id)
 
@@ -12,6 +12,8 @@ import requests
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timedelta
 
+from report_tsv_parser import tsv_to_records
+
 class DirectAPIClient:
     """Клиент для работы с API Яндекс.Директ"""
     
@@ -19,6 +21,8 @@ class DirectAPIClient:
         self.token = token
         self.client_login = client_login
         self.base_url = 'https://api.direct.yandex.com/json/v5'
+        # Код ответа последнего запроса к Reports API (для деления отчетов на части при HTTP 502)
+        self.last_report_status = None
         self.headers = {
             'Authorization': f'Bearer {self.token}',
             'Accept-Language': 'ru',
@@ -71,7 +75,46 @@ class DirectAPIClient:
         except Exception as e:
             print(f"❌ Ошибка тестирования API: {e}")
             return False
-    
+
+    def _changes_request(self, method_name: str, params: Dict) -> Optional[Dict]:
+        """Выполняет запрос к сервису Changes и возвращает result ответа"""
+        try:
+            response = requests.post(
+                f"{self.base_url}/changes",
+                headers=self.headers,
+                json={"method": method_name, "params": params},
+                timeout=30
+            )
+
+            if response.status_code == 200:
+                result = response.json()
+
+                if 'error' in result:
+                    error = result['error']
+                    print(f"❌ Ошибка API: {error.get('error_string', 'Неизвестная ошибка')}")
+                    print(f"Код ошибки: {error.get('error_code', 'N/A')}")
+                    return None
+                return result.get('result')
+            else:
+                print(f"❌ Ошибка HTTP: {response.status_code}")
+                return None
+
+        except Exception as e:
+            print(f"❌ Ошибка запроса к сервису Changes: {e}")
+            return None
+
+    def get_changes_timestamp(self) -> Optional[str]:
+        """Текущая метка времени сервера для последующих проверок изменений (changes.checkDictionaries)"""
+        result = self._changes_request("checkDictionaries", {})
+        return result.get('Timestamp') if result else None
+
+    def check_campaigns_changes(self, timestamp: str) -> Optional[Dict]:
+        """
+        Кампании, изменившиеся после указанной метки времени (changes.checkCampaigns)
+        :return: {'Campaigns': [{'CampaignId', 'ChangesIn': [SELF / CHILDREN / STAT]}], 'Timestamp'}
+        """
+        return self._changes_request("checkCampaigns", {"Timestamp": timestamp})
+
     def get_ads_by_campaigns(self, campaign_ids: List[int]) -> Optional[Dict]:
         """Получает объявления по ID кампаний"""
         if not campaign_ids:
@@ -654,39 +697,34 @@ class DirectAPIClient:
     def _parse_wordstat_tsv(self, tsv_data: str) -> List[Dict]:
         """Парсит TSV данные отчета Wordstat"""
         try:
-            lines = tsv_data.strip().split('\n')
-            
-            # Пропускаем заголовок отчета и названия колонок (первые 2 строки)
-            data_lines = lines[2:]
-            
-            # Удаляем последнюю строку с "Total rows: X" если есть
-            if data_lines and data_lines[-1].startswith('Total rows:'):
-                data_lines = data_lines[:-1]
-            
-            # Удаляем пустые строки
-            data_lines = [line.strip() for line in data_lines if line.strip()]
-            
-            forecasts = []
-            for line in data_lines:
-                fields = line.split('\t')
-                if len(fields) >= 5:  # Query, Impressions, Clicks, Ctr, BounceRate
-                    forecast = {
-                        'Query': fields[0] if fields[0] else '',
-                        'Impressions': int(fields[1]) if fields[1].isdigit() else 0,
-                        'Clicks': int(fields[2]) if fields[2].isdigit() else 0,
-                        'Ctr': float(fields[3]) if fields[3].replace('.', '').isdigit() else 0.0,
-                        'BounceRate': float(fields[4]) if fields[4].replace('.', '').isdigit() else 0.0
-                    }
-                    forecasts.append(forecast)
-            
-            return forecasts
+            return tsv_to_records(tsv_data, ['Query', 'Impressions', 'Clicks', 'Ctr', 'BounceRate'])
             
         except Exception as e:
             print(f"❌ Ошибка парсинга TSV данных Wordstat: {e}")
             return []
     
-    def create_campaign_performance_report(self, campaign_ids: List[int], start_date: str, end_date: str) -> Optional[Dict]:
-        """Создает отчет по производительности кампаний согласно официальному примеру"""
+    def _read_report_stream(self, response: requests.Response, sink) -> int:
+        """
+        Построчно читает тело ответа Reports API и передает строки в приемник
+        :return: количество прочитанных строк
+        """
+        lines = 0
+        try:
+            for line in response.iter_lines(chunk_size=64 * 1024, decode_unicode=True):
+                if line is None:
+                    continue
+                sink.feed(line)
+                lines += 1
+        finally:
+            response.close()
+        print(f"📥 Отчет прочитан потоково: {lines} строк")
+        return lines
+    
+    def create_campaign_performance_report(self, campaign_ids: List[int], start_date: str, end_date: str,
+                                           report_name: str = None) -> Optional[Dict]:
+        """Создает отчет по производительности кампаний согласно официальному примеру
+        :param report_name: имя отчета в очереди (по умолчанию - тип отчета и время запроса)
+        """
         if not campaign_ids:
             print("⚠️ Список ID кампаний пуст")
             return None
@@ -718,7 +756,7 @@ class DirectAPIClient:
                     "Cost",
                     "AvgCpc"
                 ],
-                "ReportName": f"Campaign Performance Report {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                "ReportName": report_name or f"Campaign Performance Report {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
                 "ReportType": "CAMPAIGN_PERFORMANCE_REPORT",
                 "DateRangeType": "CUSTOM_DATE",
                 "Format": "TSV",
@@ -740,6 +778,7 @@ class DirectAPIClient:
                     json=body,
                     timeout=60
                 )
+                self.last_report_status = response.status_code
                 
                 # Устанавливаем кодировку UTF-8 для корректного отображения русских символов
                 response.encoding = 'utf-8'
@@ -906,6 +945,7 @@ class DirectAPIClient:
                     json=body,
                     timeout=60
                 )
+                self.last_report_status = response.status_code
                 
                 # Устанавливаем кодировку UTF-8 для корректного отображения русских символов
                 response.encoding = 'utf-8'
@@ -976,8 +1016,11 @@ class DirectAPIClient:
                 print(f"❌ Произошла непредвиденная ошибка: {e}")
                 return None
     
-    def create_custom_campaign_report_with_group_filter(self, campaign_ids: List[int], start_date: str, end_date: str, deleted_group_ids: List[int] = None) -> Optional[Dict]:
-        """Создает кастомный отчет по кампаниям с возможностью фильтрации по группам"""
+    def create_custom_campaign_report_with_group_filter(self, campaign_ids: List[int], start_date: str, end_date: str, deleted_group_ids: List[int] = None,
+                                                        report_name: str = None) -> Optional[Dict]:
+        """Создает кастомный отчет по кампаниям с возможностью фильтрации по группам
+        :param report_name: имя отчета в очереди (по умолчанию - тип отчета и время запроса)
+        """
         if not campaign_ids:
             print("⚠️ Список ID кампаний пуст")
             return None
@@ -1021,7 +1064,7 @@ class DirectAPIClient:
                     "Cost",
                     "AvgCpc"
                 ],
-                "ReportName": f"Custom Campaign Report {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                "ReportName": report_name or f"Custom Campaign Report {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
                 "ReportType": "CUSTOM_REPORT",
                 "DateRangeType": "CUSTOM_DATE",
                 "Format": "TSV",
@@ -1042,6 +1085,7 @@ class DirectAPIClient:
                     headers=headers_with_processing,
                     json=body
                 )
+                self.last_report_status = response.status_code
                 
                 if response.status_code == 200:
                     # Проверяем Content-Type ответа
@@ -1171,6 +1215,7 @@ class DirectAPIClient:
                     headers=headers_with_processing,
                     json=body
                 )
+                self.last_report_status = response.status_code
                 
                 if response.status_code == 200:
                     # Проверяем Content-Type ответа
@@ -1289,6 +1334,7 @@ class DirectAPIClient:
                     json=body,
                     timeout=60
                 )
+                self.last_report_status = response.status_code
                 
                 # Устанавливаем кодировку UTF-8 для корректного отображения русских символов
                 response.encoding = 'utf-8'
@@ -1359,8 +1405,14 @@ class DirectAPIClient:
                 print(f"❌ Произошла непредвиденная ошибка: {e}")
                 return None
     
-    def create_ad_performance_report(self, campaign_ids: List[int], start_date: str, end_date: str, deleted_group_ids: List[int] = None) -> Optional[Dict]:
-        """Создает отчет по производительности объявлений согласно официальному примеру"""
+    def create_ad_performance_report(self, campaign_ids: List[int], start_date: str, end_date: str, deleted_group_ids: List[int] = None,
+                                     sink=None, report_name: str = None) -> Optional[Dict]:
+        """Создает отчет по производительности объявлений согласно официальному примеру
+        :param sink: приемник строк отчета (MinIOClient.open_report_stream); если задан,
+            ответ читается потоково, текст ответа в памяти не собирается
+            (разобранные строки sink пишет в JSON по пачкам, см. ReportStreamSink)
+        :param report_name: имя отчета в очереди (по умолчанию - тип отчета и время запроса)
+        """
         if not campaign_ids:
             print("⚠️ Список ID кампаний пуст")
             return None
@@ -1404,7 +1456,7 @@ class DirectAPIClient:
                     "Cost",
                     "AvgCpc"
                 ],
-                "ReportName": f"Ad Performance Report {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                "ReportName": report_name or f"Ad Performance Report {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
                 "ReportType": "AD_PERFORMANCE_REPORT",
                 "DateRangeType": "CUSTOM_DATE",
                 "Format": "TSV",
@@ -1424,8 +1476,10 @@ class DirectAPIClient:
                     f"{self.base_url}/reports",
                     headers=headers_with_processing,
                     json=body,
-                    timeout=60
+                    timeout=60,
+                    stream=sink is not None
                 )
+                self.last_report_status = response.status_code
                 
                 # Устанавливаем кодировку UTF-8 для корректного отображения русских символов
                 response.encoding = 'utf-8'
@@ -1440,9 +1494,13 @@ class DirectAPIClient:
                     print("✅ Отчет по объявлениям создан успешно")
                     print(f"RequestId: {response.headers.get('RequestId', 'N/A')}")
                     
+                    # При потоковом режиме строки отчета передаются в приемник
+                    if sink is not None:
+                        self._read_report_stream(response, sink)
+                    
                     # Возвращаем данные отчета
                     result = {
-                        'report': response.text,  # Содержимое отчета в TSV формате
+                        'report': response.text if sink is None else None,  # Содержимое отчета в TSV формате
                         'status': 'completed',
                         '_meta': {
                             'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -1450,7 +1508,8 @@ class DirectAPIClient:
                             'api_version': 'v5',
                             'request_id': response.headers.get('RequestId', 'N/A'),
                             'format': 'TSV',
-                            'type': 'ad_performance'
+                            'type': 'ad_performance',
+                            'streamed': sink is not None
                         }
                     }
                     return result
@@ -1460,6 +1519,7 @@ class DirectAPIClient:
                     retry_in = int(response.headers.get("retryIn", 60))
                     print(f"🔄 Повторная отправка запроса через {retry_in} секунд")
                     print(f"RequestId: {response.headers.get('RequestId', 'N/A')}")
+                    response.close()
                     time.sleep(retry_in)
                     
                 elif response.status_code == 202:
@@ -1467,6 +1527,7 @@ class DirectAPIClient:
                     retry_in = int(response.headers.get("retryIn", 60))
                     print(f"🔄 Повторная отправка запроса через {retry_in} секунд")
                     print(f"RequestId: {response.headers.get('RequestId', 'N/A')}")
+                    response.close()
                     time.sleep(retry_in)
                     
                 elif response.status_code == 500:
@@ -1496,8 +1557,14 @@ class DirectAPIClient:
                 print(f"❌ Произошла непредвиденная ошибка: {e}")
                 return None
     
-    def create_adgroup_performance_report(self, campaign_ids: List[int], start_date: str, end_date: str, deleted_group_ids: List[int] = None) -> Optional[Dict]:
-        """Создает отчет по производительности групп объявлений согласно официальному примеру"""
+    def create_adgroup_performance_report(self, campaign_ids: List[int], start_date: str, end_date: str, deleted_group_ids: List[int] = None,
+                                          sink=None, report_name: str = None) -> Optional[Dict]:
+        """Создает отчет по производительности групп объявлений согласно официальному примеру
+        :param sink: приемник строк отчета (MinIOClient.open_report_stream); если задан,
+            ответ читается потоково, текст ответа в памяти не собирается
+            (разобранные строки sink пишет в JSON по пачкам, см. ReportStreamSink)
+        :param report_name: имя отчета в очереди (по умолчанию - тип отчета и время запроса)
+        """
         if not campaign_ids:
             print("⚠️ Список ID кампаний пуст")
             return None
@@ -1544,7 +1611,7 @@ class DirectAPIClient:
                     "Cost",
                     "AvgCpc"
                 ],
-                "ReportName": f"AdGroup Performance Report {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                "ReportName": report_name or f"AdGroup Performance Report {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
                 "ReportType": "ADGROUP_PERFORMANCE_REPORT",
                 "DateRangeType": "CUSTOM_DATE",
                 "Format": "TSV",
@@ -1564,8 +1631,10 @@ class DirectAPIClient:
                     f"{self.base_url}/reports",
                     headers=headers_with_processing,
                     json=body,
-                    timeout=60
+                    timeout=60,
+                    stream=sink is not None
                 )
+                self.last_report_status = response.status_code
                 
                 # Устанавливаем кодировку UTF-8 для корректного отображения русских символов
                 response.encoding = 'utf-8'
@@ -1580,9 +1649,13 @@ class DirectAPIClient:
                     print("✅ Отчет по группам объявлений создан успешно")
                     print(f"RequestId: {response.headers.get('RequestId', 'N/A')}")
                     
+                    # При потоковом режиме строки отчета передаются в приемник
+                    if sink is not None:
+                        self._read_report_stream(response, sink)
+                    
                     # Возвращаем данные отчета
                     result = {
-                        'report': response.text,  # Содержимое отчета в TSV формате
+                        'report': response.text if sink is None else None,  # Содержимое отчета в TSV формате
                         'status': 'completed',
                         '_meta': {
                             'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -1590,7 +1663,8 @@ class DirectAPIClient:
                             'api_version': 'v5',
                             'request_id': response.headers.get('RequestId', 'N/A'),
                             'format': 'TSV',
-                            'type': 'adgroup_performance'
+                            'type': 'adgroup_performance',
+                            'streamed': sink is not None
                         }
                     }
                     return result
@@ -1600,6 +1674,7 @@ class DirectAPIClient:
                     retry_in = int(response.headers.get("retryIn", 60))
                     print(f"🔄 Повторная отправка запроса через {retry_in} секунд")
                     print(f"RequestId: {response.headers.get('RequestId', 'N/A')}")
+                    response.close()
                     time.sleep(retry_in)
                     
                 elif response.status_code == 202:
@@ -1607,6 +1682,7 @@ class DirectAPIClient:
                     retry_in = int(response.headers.get("retryIn", 60))
                     print(f"🔄 Повторная отправка запроса через {retry_in} секунд")
                     print(f"RequestId: {response.headers.get('RequestId', 'N/A')}")
+                    response.close()
                     time.sleep(retry_in)
                     
                 elif response.status_code == 500:
@@ -1636,6 +1712,112 @@ class DirectAPIClient:
                 print(f"❌ Произошла непредвиденная ошибка: {e}")
                 return None
     
+    def create_daily_stats_report(self, campaign_ids: List[int], start_date: str, end_date: str,
+                                  sink, report_name: str = None) -> Optional[Dict]:
+        """Создает отчет по объявлениям с разбивкой по дням для хранилища дневной статистики
+        :param sink: приемник строк отчета (например, ReportTSVParser), ответ читается потоково
+        :param report_name: имя отчета в очереди (по умолчанию - тип отчета и время запроса)
+        """
+        if not campaign_ids:
+            print("⚠️ Список ID кампаний пуст")
+            return None
+
+        print(f"🔍 Создание дневного отчета по объявлениям: {campaign_ids}")
+        print(f"📅 Период: {start_date} - {end_date}")
+
+        # Только аддитивные показатели: производные (Ctr, AvgCpc, BounceRate) считаются при сборке периода
+        body = {
+            "params": {
+                "SelectionCriteria": {
+                    "Filter": [
+                        {
+                            "Field": "CampaignId",
+                            "Operator": "IN",
+                            "Values": campaign_ids
+                        }
+                    ],
+                    "DateFrom": start_date,
+                    "DateTo": end_date
+                },
+                "FieldNames": [
+                    "Date",
+                    "CampaignId",
+                    "CampaignName",
+                    "CampaignType",
+                    "AdGroupId",
+                    "AdGroupName",
+                    "AdId",
+                    "AdNetworkType",
+                    "Impressions",
+                    "Clicks",
+                    "Cost",
+                    "Sessions",
+                    "Bounces"
+                ],
+                "ReportName": report_name or f"Daily Ad Stats Report {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+                "ReportType": "AD_PERFORMANCE_REPORT",
+                "DateRangeType": "CUSTOM_DATE",
+                "Format": "TSV",
+                "IncludeVAT": "YES",
+                "IncludeDiscount": "NO"
+            }
+        }
+
+        headers_with_processing = self.headers.copy()
+        headers_with_processing["processingMode"] = "auto"
+
+        while True:
+            try:
+                response = requests.post(
+                    f"{self.base_url}/reports",
+                    headers=headers_with_processing,
+                    json=body,
+                    timeout=60,
+                    stream=True
+                )
+                self.last_report_status = response.status_code
+                response.encoding = 'utf-8'
+
+                if response.status_code == 200:
+                    print("✅ Дневной отчет по объявлениям создан успешно")
+                    print(f"RequestId: {response.headers.get('RequestId', 'N/A')}")
+                    self._read_report_stream(response, sink)
+                    return {
+                        'status': 'completed',
+                        '_meta': {
+                            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            'api_method': 'reports.post',
+                            'api_version': 'v5',
+                            'request_id': response.headers.get('RequestId', 'N/A'),
+                            'format': 'TSV',
+                            'type': 'daily_ad_stats',
+                            'streamed': True
+                        }
+                    }
+
+                elif response.status_code in (201, 202):
+                    print("⏳ Дневной отчет по объявлениям формируется в режиме офлайн")
+                    retry_in = int(response.headers.get("retryIn", 60))
+                    print(f"🔄 Повторная отправка запроса через {retry_in} секунд")
+                    print(f"RequestId: {response.headers.get('RequestId', 'N/A')}")
+                    response.close()
+                    time.sleep(retry_in)
+
+                else:
+                    print(f"❌ Ошибка формирования дневного отчета по объявлениям: HTTP {response.status_code}")
+                    print(f"RequestId: {response.headers.get('RequestId', 'N/A')}")
+                    print(f"Ответ сервера: {response.text[:500]}")
+                    response.close()
+                    return None
+
+            except requests.exceptions.ConnectionError:
+                print("❌ Произошла ошибка соединения с сервером API")
+                return None
+
+            except Exception as e:
+                print(f"❌ Произошла непредвиденная ошибка: {e}")
+                return None
+
     def get_keywords_by_adgroups(self, adgroup_ids: List[int]) -> Optional[Dict]:
         """Получает ключевые фразы по ID групп объявлений"""
         if not adgroup_ids:
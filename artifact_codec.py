@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль кодирования JSON-артефактов, сохраняемых в MinIO
+Артефакты пишутся компактным JSON со сжатием gzip и помечаются метаданными объекта;
+при чтении формат определяется по сигнатуре данных, поэтому старые файлы
+(форматированный JSON без сжатия) читаются без изменений
+"""
+
+import gzip
+import json
+import os
+import zlib
+from typing import Any, Dict, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv('.env')
+
+# Кодек новых артефактов: json+gzip (по умолчанию) или json (форматированный JSON без сжатия)
+JSON_GZIP = 'json+gzip'
+JSON_PLAIN = 'json'
+ARTIFACT_CODEC = os.getenv('ARTIFACT_CODEC', JSON_GZIP).lower()
+ARTIFACT_COMPRESS_LEVEL = int(os.getenv('ARTIFACT_COMPRESS_LEVEL', '6'))
+
+# Ключ пользовательских метаданных объекта (в S3 хранится как x-amz-meta-artifact-codec)
+CODEC_METADATA_KEY = 'artifact-codec'
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Кодеки бинарной колоночной статистики (*.cols, см. stats_store) - не JSON, читается только StatsTable.from_bytes
+COLUMNS_GZIP = 'cols+gzip'
+COLUMNS_PLAIN = 'cols'
+
+
+def is_compressed() -> bool:
+    """Включено ли сжатие для новых артефактов"""
+    return ARTIFACT_CODEC == JSON_GZIP
+
+
+def encode_json(data: Any) -> Tuple[bytes, Dict[str, str]]:
+    """
+    Кодирует данные в байты артефакта
+    :return: (байты, метаданные объекта для put_object)
+    """
+    if not is_compressed():
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8'), {CODEC_METADATA_KEY: JSON_PLAIN}
+
+    raw = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return gzip.compress(raw, compresslevel=ARTIFACT_COMPRESS_LEVEL), {CODEC_METADATA_KEY: JSON_GZIP}
+
+
+def new_compressor():
+    """Потоковый gzip-компрессор для артефактов, которые пишутся частями (None без сжатия)"""
+    if not is_compressed():
+        return None
+    return zlib.compressobj(ARTIFACT_COMPRESS_LEVEL, zlib.DEFLATED, 31)
+
+
+def columns_metadata(compressed: bool) -> Dict[str, str]:
+    """Метаданные объекта колоночной статистики для put_object (сжатие - по ARTIFACT_CODEC)"""
+    return {CODEC_METADATA_KEY: COLUMNS_GZIP if compressed else COLUMNS_PLAIN}
+
+
+def decode_bytes(raw: bytes) -> bytes:
+    """Возвращает несжатое содержимое артефакта"""
+    if raw[:2] == GZIP_MAGIC:
+        return gzip.decompress(raw)
+    return raw
+
+
+def decode_json(raw: bytes) -> Any:
+    """Декодирует артефакт любого формата (сжатый или старый форматированный JSON)"""
+    return json.loads(decode_bytes(raw))
+
@@ -11,6 +11,7 @@ import psycopg2
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from dotenv import load_dotenv
+from artifact_codec import decode_json
 
 # Загружаем переменные окружения
 load_dotenv('.env')
@@ -46,7 +47,23 @@ class DatabaseManager:
         if self.connection:
             self.connection.close()
         print("🔌 Соединение с БД закрыто")
-    
+
+    def ensure_connected(self) -> bool:
+        """Проверяет открытое соединение (режим службы) и при необходимости подключается заново"""
+        if self.connection is not None and not self.connection.closed:
+            try:
+                self.cursor.execute("SELECT 1")
+                self.cursor.fetchone()
+                self.connection.rollback()
+                return True
+            except Exception as e:
+                print(f"⚠️ Соединение с БД потеряно: {e}")
+                try:
+                    self.connection.close()
+                except Exception:
+                    pass
+        return self.connect()
+
     def get_yandex_accounts(self) -> List[Dict]:
         """Получает аккаунты Яндекс.Директ из БД"""
         try:
@@ -186,19 +203,12 @@ class DatabaseManager:
     def load_keywords_from_minio(self, minio_client, report_id: int) -> List[str]:
         """Загружает ключевые фразы из файла keywords_traffic_forecast_ в MinIO"""
         try:
-            # Получаем список объектов с префиксом для текущего отчета
-            prefix = f"gen_report_context_contracts/data_yandex_direct/{report_id}_результаты/"
-            objects = minio_client.list_objects(prefix)
+            # Находим файл по манифесту отчета
+            latest_file = minio_client.find_report_file(report_id, f"keywords_traffic_forecast_{report_id}.json")
             
-            # Фильтруем только файлы keywords_traffic_forecast_
-            keywords_files = [obj for obj in objects if f"keywords_traffic_forecast_{report_id}.json" in obj]
-            
-            if not keywords_files:
+            if not latest_file:
                 print("❌ Файл keywords_traffic_forecast_ не найден в MinIO")
                 return []
-            
-            # Берем первый найденный файл (должен быть только один)
-            latest_file = keywords_files[0]
             print(f"📁 Загружаем фразы из файла в MinIO: {latest_file}")
             
             # Загружаем данные из MinIO
@@ -206,7 +216,7 @@ class DatabaseManager:
                 minio_client.bucket_name, 
                 latest_file
             )
-            data = json.loads(response.read().decode('utf-8'))
+            data = decode_json(response.read())
             response.close()
             response.release_conn()
             
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш объектов Яндекс.Директ по клиенту (группы, объявления, быстрые ссылки,
+расширения, изображения)
+Кэш хранится в MinIO вместе с меткой времени сервиса Changes. При формировании отчета
+через changes.checkCampaigns определяются кампании, изменившиеся с прошлой синхронизации:
+из API заново запрашиваются только их группы и объявления, остальные данные берутся из кэша.
+Сами кампании не кэшируются: остаток средств (Funds) и статусы оплаты меняются
+без изменений SELF в сервисе Changes
+"""
+
+import io
+import os
+import re
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+from artifact_codec import decode_json, encode_json
+
+load_dotenv('.env')
+
+# Срок хранения в кэше быстрых ссылок, расширений и изображений (статусы модерации могут меняться)
+ENTITY_CACHE_TTL_DAYS = int(os.getenv('ENTITY_CACHE_TTL_DAYS', '7'))
+
+ENTITY_CACHE_PREFIX = 'gen_report_context_contracts/entity_cache'
+
+# Версия формата состояния кэша (при изменении кэш пересобирается)
+CACHE_VERSION = 2
+
+# Объекты, запрашиваемые по кампаниям
+CAMPAIGN_ENTITIES = ('adgroups', 'ads')
+# Объекты, запрашиваемые по ID
+DICTIONARY_ENTITIES = ('sitelinks', 'extensions', 'images')
+
+
+def _empty_state() -> Dict:
+    state = {'version': CACHE_VERSION, 'timestamp': None}
+    for kind in CAMPAIGN_ENTITIES + DICTIONARY_ENTITIES:
+        state[kind] = {}
+    return state
+
+
+class EntityCache:
+    """Кэш объектов Директа одного клиента с инкрементальной синхронизацией через сервис Changes"""
+
+    def __init__(self, minio_client, client_login: str, ttl_days: int = ENTITY_CACHE_TTL_DAYS):
+        """
+        :param minio_client: MinIOClient (подключенный)
+        :param client_login: логин клиента Директа
+        :param ttl_days: срок хранения быстрых ссылок, расширений и изображений
+        """
+        self.minio_client = minio_client
+        self.client_login = client_login
+        self.ttl_days = ttl_days
+        safe_login = re.sub(r'[^\w.-]', '_', client_login or 'default')
+        self.object_name = f"{ENTITY_CACHE_PREFIX}/{safe_login}/state.json"
+        self.state = _empty_state()
+        # Метка времени, которая будет сохранена после успешной обработки отчета
+        self._pending_timestamp = None
+
+    # ---------- Состояние ----------
+
+    def load(self) -> bool:
+        """Загружает состояние кэша из MinIO"""
+        response = None
+        try:
+            response = self.minio_client.client.get_object(self.minio_client.bucket_name, self.object_name)
+            state = decode_json(response.read())
+            if state.get('version') != CACHE_VERSION:
+                print("⚠️ Формат кэша объектов устарел, кэш будет пересобран")
+                return False
+            self.state = state
+            return True
+        except Exception:
+            return False
+        finally:
+            if response:
+                response.close()
+                response.release_conn()
+
+    def save(self) -> bool:
+        """Сохраняет состояние кэша с меткой времени текущей синхронизации"""
+        try:
+            if self._pending_timestamp:
+                self.state['timestamp'] = self._pending_timestamp
+            data, metadata = encode_json(self.state)
+            self.minio_client.client.put_object(
+                bucket_name=self.minio_client.bucket_name,
+                object_name=self.object_name,
+                data=io.BytesIO(data),
+                length=len(data),
+                content_type='application/json',
+                metadata=metadata
+            )
+            print(f"💾 Кэш объектов клиента {self.client_login} сохранен")
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка сохранения кэша объектов: {e}")
+            return False
+
+    def reset(self):
+        """Очищает кэш"""
+        self.state = _empty_state()
+
+    # ---------- Синхронизация ----------
+
+    def sync(self, api_client) -> bool:
+        """
+        Определяет изменения с прошлой синхронизации и удаляет из кэша устаревшие данные
+        :param api_client: DirectAPIClient текущего клиента
+        :return: True, если изменения определены (иначе кэш очищен и все данные будут запрошены заново)
+        """
+        timestamp = self.state.get('timestamp')
+        if timestamp:
+            changes = api_client.check_campaigns_changes(timestamp)
+            if changes is not None:
+                self._apply_changes(changes.get('Campaigns', []))
+                self._pending_timestamp = changes.get('Timestamp')
+                return True
+            print("⚠️ Не удалось получить изменения, кэш объектов будет пересобран")
+
+        # Первая синхронизация: метка времени фиксируется до загрузки данных,
+        # чтобы изменения во время загрузки попали в следующую проверку
+        self.reset()
+        self._pending_timestamp = api_client.get_changes_timestamp()
+        return False
+
+    def _apply_changes(self, campaigns: List[Dict]):
+        """Удаляет из кэша группы и объявления изменившихся кампаний"""
+        children_changed = 0
+        for campaign in campaigns:
+            if 'CHILDREN' in campaign.get('ChangesIn', []):
+                children_changed += 1
+                campaign_key = str(campaign.get('CampaignId'))
+                for kind in CAMPAIGN_ENTITIES:
+                    self.state[kind].pop(campaign_key, None)
+
+        print(f"🔄 Изменения с {self.state['timestamp']}: группы и объявления - в {children_changed} кампаниях")
+
+    # ---------- Группы и объявления ----------
+
+    def get_campaign_entities(self, kind: str, campaign_ids: List[int],
+                              fetch: Callable[[List[int]], Optional[Dict]], result_key: str) -> List[Dict]:
+        """
+        Объекты кампаний (группы или объявления): из кэша для неизменившихся кампаний,
+        для остальных - из API одним запросом
+        :param kind: adgroups / ads
+        :param fetch: функция получения ответа API по списку ID кампаний
+        :param result_key: ключ списка объектов в result ответа (AdGroups / Ads)
+        """
+        cached = self.state[kind]
+        stale = [campaign_id for campaign_id in campaign_ids if str(campaign_id) not in cached]
+        print(f"📦 {kind}: кампаний в кэше {len(campaign_ids) - len(stale)} из {len(campaign_ids)}")
+
+        if stale:
+            response = fetch(stale)
+            entities = (response or {}).get('result', {}).get(result_key, [])
+            by_campaign = {}
+            for entity in entities:
+                by_campaign.setdefault(str(entity.get('CampaignId')), []).append(entity)
+            # Кампании без объектов не кэшируются: пустой ответ может быть следствием ошибки запроса
+            cached.update(by_campaign)
+
+        result = []
+        for campaign_id in campaign_ids:
+            result.extend(cached.get(str(campaign_id), []))
+        return result
+
+    # ---------- Объекты по ID ----------
+
+    def _is_fresh(self, entry: Dict) -> bool:
+        cached_at = datetime.strptime(entry['cached_at'], "%Y-%m-%d").date()
+        return (date.today() - cached_at).days < self.ttl_days
+
+    def get_by_ids(self, kind: str, ids: Iterable, fetch: Callable[[List], Dict]) -> Dict:
+        """
+        Объекты по ID (быстрые ссылки, расширения, изображения)
+        :param kind: sitelinks / extensions / images
+        :param fetch: функция получения объектов по списку ID, возвращает словарь ID -> объект
+        :return: словарь ID -> объект (только найденные)
+        """
+        cached = self.state[kind]
+        result = {}
+        missing = []
+        for entity_id in ids:
+            entry = cached.get(str(entity_id))
+            if entry is not None and self._is_fresh(entry):
+                result[entity_id] = entry['data']
+            else:
+                missing.append(entity_id)
+        print(f"📦 {kind}: в кэше {len(result)} из {len(result) + len(missing)}")
+
+        if missing:
+            today = date.today().strftime("%Y-%m-%d")
+            fetched = fetch(missing)
+            for entity_id, data in fetched.items():
+                cached[str(entity_id)] = {'cached_at': today, 'data': data}
+                result[entity_id] = data
+        return result
@@ -9,17 +9,89 @@ import json
 import io
 
 import psycopg2
-from minio import Minio
+from minio_factory import get_minio
 from dotenv import load_dotenv
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 import openpyxl
-from openpyxl.styles import PatternFill, Font, Alignment, Side, Border
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font, Alignment, Side, Border, NamedStyle
+from openpyxl.worksheet.cell_range import CellRange
+from artifact_codec import decode_json
+from report_index import ReportIndex, get_report_index
 
 
 # Загружаем переменные окружения
 load_dotenv()
 
+# Именованные стили медиаплана (регистрируются в книге один раз)
+STYLE_HEADER = 'Медиаплан: заголовок'
+STYLE_HEADER_GRID = 'Медиаплан: заголовок в сетке'
+STYLE_GRID = 'Медиаплан: ячейка в сетке'
+STYLE_CALLOUTS_GRID = 'Медиаплан: уточнения в сетке'
+
+
+def register_mediaplan_styles(wb, header_fill: PatternFill) -> None:
+    """Добавить в книгу именованные стили медиаплана"""
+    thin = Side(style='thin')
+    grid = Border(left=thin, right=thin, top=thin, bottom=thin)
+    wb.add_named_style(NamedStyle(name=STYLE_HEADER, fill=header_fill, font=Font(bold=True)))
+    wb.add_named_style(NamedStyle(name=STYLE_HEADER_GRID, fill=header_fill, font=Font(bold=True), border=grid))
+    wb.add_named_style(NamedStyle(name=STYLE_GRID, border=grid))
+    wb.add_named_style(NamedStyle(name=STYLE_CALLOUTS_GRID, border=grid,
+                                  alignment=Alignment(wrapText=True, vertical='top')))
+
+
+class SheetRows:
+    """
+    Строки листа книги write_only.
+    Лист write_only принимает строки только по порядку, а медиаплан заполняется по столбцам
+    в пределах блока кампании: ячейки блока копятся в буфере и выводятся при flush,
+    поэтому в памяти находится только текущий блок
+    """
+
+    def __init__(self, ws, grid_columns: int = 0):
+        """
+        :param ws: лист книги write_only
+        :param grid_columns: количество столбцов сетки (все ячейки строк выводятся с рамкой), 0 - без сетки
+        """
+        self.ws = ws
+        self.grid_columns = grid_columns
+        self._rows: Dict[int, Dict[int, tuple]] = {}
+        self._next_row = 1
+
+    def set(self, row: int, column: int, value, style: Optional[str] = None) -> None:
+        """Записать ячейку (строки с номерами 1..N, строки до последнего flush уже выведены)"""
+        if row < self._next_row:
+            raise ValueError(f"Строка {row} листа {self.ws.title} уже записана")
+        self._rows.setdefault(row, {})[column] = (value, style)
+
+    def merge(self, start_row: int, start_column: int, end_row: int, end_column: int) -> None:
+        self.ws.merged_cells.add(CellRange(min_col=start_column, min_row=start_row,
+                                           max_col=end_column, max_row=end_row))
+
+    def flush(self, before_row: Optional[int] = None) -> None:
+        """Вывести накопленные строки до before_row (не включая); по умолчанию - все"""
+        if not self._rows:
+            return
+        last_row = max(self._rows) if before_row is None else before_row - 1
+        for row in range(self._next_row, last_row + 1):
+            cells = self._rows.pop(row, {})
+            columns = max(self.grid_columns, max(cells) if cells else 0)
+            values = []
+            for column in range(1, columns + 1):
+                value, style = cells.get(column, (None, None))
+                if self.grid_columns:
+                    style = STYLE_HEADER_GRID if style == STYLE_HEADER else (style or STYLE_GRID)
+                if style is None:
+                    values.append(value)
+                    continue
+                cell = WriteOnlyCell(self.ws, value=value)
+                cell.style = style
+                values.append(cell)
+            self.ws.append(values)
+        self._next_row = max(self._next_row, last_row + 1)
+
 
 class MediaPlanGenerator:
     def __init__(self):
@@ -34,12 +106,7 @@ class MediaPlanGenerator:
         }
 
         # Настройки MinIO
-        self.minio_client = Minio(
-            endpoint=os.getenv('S3_ENDPOINT_URL', 'minio.upk-mos.ru'),
-            access_key=os.getenv('S3_ACCESS_KEY'),
-            secret_key=os.getenv('S3_SECRET_KEY'),
-            secure=os.getenv('S3_SECURE', 'False').lower() == 'true'
-        )
+        self.minio_client = get_minio()
 
         self.bucket_name = os.getenv('S3_BUCKET_NAME', 'dit-services-dev')
 
@@ -153,8 +220,8 @@ class MediaPlanGenerator:
             if self.minio_client.stat_object(self.bucket_name, object_path):
                 # Загружаем объект
                 response = self.minio_client.get_object(self.bucket_name, object_path)
-                content = response.read().decode('utf-8')
-                data = json.loads(content)
+                content = response.read()
+                data = decode_json(content)
                 print(f"✓ Загружен файл {filename}")
                 return data
             else:
@@ -165,168 +232,92 @@ class MediaPlanGenerator:
             print(f"✗ Ошибка при загрузке {filename}: {e}")
             return None
 
-    def get_unique_ad_combinations(self, campaign_id: int, ads_data: Dict) -> List[Dict]:
+    def get_unique_ad_combinations(self, campaign_id: int, index: ReportIndex) -> List[Dict]:
         """Получить уникальные комбинации заголовок-текст из объявлений"""
         try:
-            if not ads_data or not ads_data.get('result'):
-                return []
-
             combinations = set()
             result = []
-            for ad in ads_data.get('result', {}).get('Ads', []):
-                if ad.get('CampaignId') == campaign_id:
-                    text_ad = ad.get('TextAd', {})
-                    title = text_ad.get('Title', '')
-                    text = text_ad.get('Text', '')
-                    if title and text:
-                        combination = (title, text)
-                        if combination not in combinations:
-                            combinations.add(combination)
-                            result.append({
-                                'title': title,
-                                'text': text
-                            })
+            for ad in index.ads_for_campaign(campaign_id):
+                text_ad = ad.get('TextAd', {})
+                title = text_ad.get('Title', '')
+                text = text_ad.get('Text', '')
+                if title and text:
+                    combination = (title, text)
+                    if combination not in combinations:
+                        combinations.add(combination)
+                        result.append({
+                            'title': title,
+                            'text': text
+                        })
             return result
         except Exception as e:
             print(f"  ⚠ Ошибка при получении комбинаций объявлений: {e}")
             return []
 
-    def get_campaign_callouts(self, campaign_id: int, extensions_data: Dict, ads_data: Dict) -> List[str]:
-        """Получить уникальные уточнения для кампании"""
+    def get_campaign_callouts(self, campaign_id: int, index: ReportIndex) -> List[str]:
+        """Получить уникальные уточнения для кампании (в порядке появления в файле расширений)"""
         try:
-            if not extensions_data or not isinstance(extensions_data, dict) or not ads_data:
-                return []
-
-            # Сначала найдем все ID уточнений, используемые в объявлениях кампании
-            extension_ids = set()
-            for ad in ads_data.get('result', {}).get('Ads', []):
-                if ad.get('CampaignId') == campaign_id:
-                    ad_extensions = ad.get('TextAd', {}).get('AdExtensions', [])
-                    for ext in ad_extensions:
-                        if ext.get('Type') == 'CALLOUT':
-                            extension_ids.add(ext.get('AdExtensionId'))
-
-            # Если нет уточнений, возвращаем пустой список
-            if not extension_ids:
-                return []
-
-            # Теперь найдем тексты уточнений по их ID, сохраняя порядок из файла
-            callouts = []
-            seen = set()  # Для проверки уникальности
-            batch_data = next(iter(extensions_data.values()), {})
-            if not batch_data or not batch_data.get('result'):
-                return []
-
-            for ext in batch_data.get('result', {}).get('AdExtensions', []):
-                if ext.get('Id') in extension_ids and ext.get('Type') == 'CALLOUT':
-                    callout_text = ext.get('Callout', {}).get('CalloutText', '')
-                    if callout_text and callout_text not in seen:
-                        seen.add(callout_text)
-                        callouts.append(callout_text)
-
-            return callouts  # Возвращаем список в порядке появления в файле
+            return index.callouts_for_campaign(campaign_id)
         except Exception as e:
             print(f"  ⚠ Ошибка при получении уточнений: {e}")
             return []
 
-    def get_campaign_adgroups(self, campaign_id: int, adgroups_data: Dict) -> List[str]:
+    def get_campaign_adgroups(self, campaign_id: int, index: ReportIndex) -> List[str]:
         """Получить уникальные названия групп объявлений для кампании"""
         try:
-            if not adgroups_data or not adgroups_data.get('result'):
-                return []
-
             group_names = set()
-            for group in adgroups_data.get('result', {}).get('AdGroups', []):
-                if group.get('CampaignId') == campaign_id:
-                    name = group.get('Name', '')
-                    if name:
-                        group_names.add(name)
+            for group in index.adgroups_for_campaign(campaign_id):
+                name = group.get('Name', '')
+                if name:
+                    group_names.add(name)
             return sorted(list(group_names))
         except Exception as e:
             print(f"  ⚠ Ошибка при получении групп объявлений: {e}")
             return []
 
-    def get_campaign_sitelinks(self, campaign_id: int, sitelinks_data: Dict, ads_data: Dict) -> List[Dict]:
+    def get_campaign_sitelinks(self, campaign_id: int, index: ReportIndex) -> List[Dict]:
         """Получить уникальные быстрые ссылки для кампании"""
         try:
-            if not sitelinks_data or not isinstance(sitelinks_data, dict) or not ads_data:
-                return []
-
-            # Сначала найдем все ID наборов быстрых ссылок, используемые в объявлениях кампании
-            sitelink_set_ids = set()
-            for ad in ads_data.get('result', {}).get('Ads', []):
-                if ad.get('CampaignId') == campaign_id:
-                    sitelink_set_id = ad.get('TextAd', {}).get('SitelinkSetId')
-                    if sitelink_set_id:
-                        sitelink_set_ids.add(str(sitelink_set_id))
-
-            # Если нет наборов быстрых ссылок, возвращаем пустой список
-            if not sitelink_set_ids:
-                return []
-
             sitelinks = []
             seen = set()
 
-            # Проходим по всем наборам данных
-            for set_id, set_data in sitelinks_data.items():
-                # Проверяем, что это нужный нам набор быстрых ссылок
-                if set_id not in sitelink_set_ids:
-                    continue
-
-                if not isinstance(set_data, dict):
-                    continue
-
-                # Получаем список наборов быстрых ссылок
-                sitelinks_sets = set_data.get('result', {}).get('SitelinksSets', [])
-                if not sitelinks_sets:
+            # Наборы быстрых ссылок объявлений кампании
+            for links in index.sitelink_sets_for_campaign(campaign_id):
+                if not isinstance(links, list):
                     continue
 
-                # Обрабатываем каждый набор
-                for sitelinks_set in sitelinks_sets:
-                    if not isinstance(sitelinks_set, dict):
+                # Обрабатываем каждую ссылку
+                for link in links:
+                    if not isinstance(link, dict):
                         continue
 
-                    # Получаем список ссылок
-                    links = sitelinks_set.get('Sitelinks', [])
-                    if not isinstance(links, list):
-                        continue
+                    title = link.get('Title', '')
+                    description = link.get('Description', '')
+                    href = link.get('Href', '')
 
-                    # Обрабатываем каждую ссылку
-                    for link in links:
-                        if not isinstance(link, dict):
-                            continue
-
-                        title = link.get('Title', '')
-                        description = link.get('Description', '')
-                        href = link.get('Href', '')
-
-                        # Создаем уникальный ключ для комбинации
-                        key = (title, description, href)
-                        if key not in seen and all([title, description, href]):
-                            seen.add(key)
-                            sitelinks.append({
-                                'title': title,
-                                'description': description,
-                                'href': href
-                            })
+                    # Создаем уникальный ключ для комбинации
+                    key = (title, description, href)
+                    if key not in seen and all([title, description, href]):
+                        seen.add(key)
+                        sitelinks.append({
+                            'title': title,
+                            'description': description,
+                            'href': href
+                        })
 
             return sitelinks
         except Exception as e:
             print(f"  ⚠ Ошибка при получении быстрых ссылок: {e}")
             return []
 
-    def get_unique_hrefs(self, campaign_id: int, ads_data: Dict) -> List[str]:
+    def get_unique_hrefs(self, campaign_id: int, index: ReportIndex) -> List[str]:
         """Получить список уникальных ссылок из объявлений кампании"""
         try:
-            if not ads_data or not ads_data.get('result'):
-                return []
-
             hrefs = set()
-            for ad in ads_data.get('result', {}).get('Ads', []):
-                if ad.get('CampaignId') == campaign_id:
-                    href = ad.get('TextAd', {}).get('Href')
-                    if href:
-                        hrefs.add(href)
+            for ad in index.ads_for_campaign(campaign_id):
+                href = ad.get('TextAd', {}).get('Href')
+                if href:
+                    hrefs.add(href)
 
             return sorted(list(hrefs))
         except Exception as e:
@@ -352,31 +343,26 @@ class MediaPlanGenerator:
             print(f"  ⚠ Ошибка при получении минус-слов: {e}")
             return []
 
-    def get_campaign_keywords(self, campaign_id: int, keywords_data: Dict) -> List[str]:
+    def get_campaign_keywords(self, campaign_id: int, index: ReportIndex) -> List[str]:
         """Получить список ключевых фраз для кампании"""
-        if not keywords_data or not keywords_data.get('result'):
-            return []
-
         keywords = []
-        for keyword in keywords_data.get('result', {}).get('Keywords', []):
-            if keyword.get('CampaignId') == campaign_id:
-                # Убираем кавычки из ключевой фразы
-                keyword_text = keyword.get('Keyword', '').strip('"')
-                # Пропускаем автотаргетинг
-                if keyword_text and '---autotargeting' not in keyword_text:
-                    keywords.append(keyword_text)
+        for keyword in index.keywords_for_campaign(campaign_id):
+            # Убираем кавычки из ключевой фразы
+            keyword_text = keyword.get('Keyword', '').strip('"')
+            # Пропускаем автотаргетинг
+            if keyword_text and '---autotargeting' not in keyword_text:
+                keywords.append(keyword_text)
 
         return keywords  # Возвращаем как есть, без сортировки
 
-    def is_keyword_campaign(self, campaign_id: int, keywords_data: Dict) -> bool:
+    def is_keyword_campaign(self, campaign_id: int, index: ReportIndex) -> bool:
         """
         Определить, является ли кампания ключевой
         Если есть хотя бы одна ключевая фраза (кроме автотаргетинга), считаем кампанию ключевой
         """
-        keywords = self.get_campaign_keywords(campaign_id, keywords_data)
-        return len(keywords) > 0
+        return index.has_keywords(campaign_id)
 
-    def categorize_campaigns(self, campaigns_data: Dict, request_campaign_ids: Any, keywords_data: Dict) -> Dict[
+    def categorize_campaigns(self, index: ReportIndex, request_campaign_ids: Any) -> Dict[
         int, Dict[str, Dict[str, List[Dict]]]]:
         """
         Разделить кампании на категории и проекты:
@@ -386,11 +372,11 @@ class MediaPlanGenerator:
           - Поиск (ключи/интересы)
           - МК (пока пропускаем)
         """
-        if not campaigns_data or not campaigns_data.get('result'):
+        all_campaigns = index.campaigns()
+        if not all_campaigns:
             print("⚠ Нет данных кампаний")
             return {}
 
-        all_campaigns = campaigns_data.get('result', {}).get('Campaigns', [])
         print(f"📊 Всего кампаний в данных: {len(all_campaigns)}")
 
         # Получаем список кампаний с их project_id из заявки
@@ -444,7 +430,7 @@ class MediaPlanGenerator:
             # Определяем категорию по имени
             if '/РСЯ/' in campaign_name:
                 # Определяем тип кампании (ключи/интересы)
-                if self.is_keyword_campaign(campaign_id, keywords_data):
+                if self.is_keyword_campaign(campaign_id, index):
                     projects[project_id]['rsy']['keywords'].append(campaign)
                     print(f"  ✓ Проект {project_id}: Найдена РСЯ-кампания с ключами: {campaign_name}")
                 else:
@@ -452,7 +438,7 @@ class MediaPlanGenerator:
                     print(f"  ✓ Проект {project_id}: Найдена РСЯ-кампания с интересами: {campaign_name}")
             elif '/Поиск/' in campaign_name:
                 # Определяем тип кампании (ключи/интересы)
-                if self.is_keyword_campaign(campaign_id, keywords_data):
+                if self.is_keyword_campaign(campaign_id, index):
                     projects[project_id]['search']['keywords'].append(campaign)
                     print(f"  ✓ Проект {project_id}: Найдена поисковая кампания с ключами: {campaign_name}")
                 else:
@@ -507,15 +493,17 @@ class MediaPlanGenerator:
         return ''
 
     def create_mediaplan_excel(self, report_id: int, projects: Dict[int, Dict[str, Dict[str, List[Dict]]]],
-                               keywords_data: Dict, ads_data: Dict, extensions_data: Dict, sitelinks_data: Dict,
-                               adgroups_data: Dict, output_path: str) -> bool:
-        """Создать Excel-документ с медиапланом"""
+                               index: ReportIndex, output) -> bool:
+        """
+        Создать Excel-документ с медиапланом
+        Книга пишется потоково (openpyxl write_only): строки листов выводятся по мере формирования
+        блоков кампаний, стили и ширины столбцов задаются один раз
+        :param output: путь к файлу или файловый объект (BytesIO)
+        """
         try:
-            # Создаем новую книгу Excel
-            wb = openpyxl.Workbook()
-
-            # Удаляем стандартный лист
-            wb.remove(wb.active)
+            # Создаем новую книгу Excel (без стандартного листа)
+            wb = openpyxl.Workbook(write_only=True)
+            register_mediaplan_styles(wb, self.header_fill)
 
             # Сначала присваиваем номера группам для всех кампаний
             self.campaign_group_numbers = {}  # Сбрасываем словарь
@@ -555,73 +543,46 @@ class MediaPlanGenerator:
                     sheet_name = self.sanitize_sheet_name(f"Ключи - {category_name} - {project_name}")
                     ws = wb.create_sheet(sheet_name)
 
-                    # Добавляем заголовки
-                    ws['A1'] = "Название / Тип"
-                    ws['B1'] = "Минус-слова"
-                    ws['C1'] = "Посадочная страница"
-
-                    # Применяем заливку и жирный шрифт к заголовкам
-                    for cell in ws[1]:
-                        cell.fill = self.header_fill
-                        cell.font = Font(bold=True)
-
-                    # Фиксируем первую строку
+                    # Настраиваем ширину столбцов и фиксируем первую строку
+                    self.adjust_column_widths(ws)
                     ws.freeze_panes = 'A2'
+                    sheet = SheetRows(ws)
+
+                    # Добавляем заголовки с заливкой и жирным шрифтом
+                    for column, header in enumerate(["Название / Тип", "Минус-слова", "Посадочная страница"], 1):
+                        sheet.set(1, column, header, STYLE_HEADER)
 
                     current_row = 2
 
                     # Обрабатываем каждую кампанию
                     for campaign in campaigns:
+                        sheet.flush(current_row)
                         campaign_id = campaign.get('Id')
                         campaign_name = campaign.get('Name', '')
 
                         # Добавляем название кампании как есть
-                        cell = ws.cell(row=current_row, column=1, value=campaign_name)
-                        cell.fill = self.header_fill
-                        cell.font = Font(bold=True)
-
-                        # Оставляем пустую ячейку для минус-слов в заголовке кампании без стилей
-                        ws.cell(row=current_row, column=2, value="")
-
-                        # Настраиваем ширину столбцов
-                        self.adjust_column_widths(ws)
-
-                        # Используем тот же номер группы, что и на листе "Ключи"
-                        campaign_id = campaign.get('Id')
-                        group_number = self.campaign_group_numbers.get(campaign_id, self.key_group_counter)
+                        sheet.set(current_row, 1, campaign_name, STYLE_HEADER)
 
                         # Добавляем "Группа ключей N", используя ранее присвоенный номер
                         current_row += 1
                         group_number = self.campaign_group_numbers[campaign_id]
-                        cell = ws.cell(row=current_row, column=1, value=f"Группа ключей {group_number}")
-                        cell.fill = self.header_fill
-                        cell.font = Font(bold=True)
+                        sheet.set(current_row, 1, f"Группа ключей {group_number}", STYLE_HEADER)
 
                         # Получаем все данные
-                        keywords = self.get_campaign_keywords(campaign_id, keywords_data)
+                        keywords = self.get_campaign_keywords(campaign_id, index)
                         minus_words = self.get_negative_keywords(campaign)
-                        hrefs = self.get_unique_hrefs(campaign_id, ads_data)
+                        hrefs = self.get_unique_hrefs(campaign_id, index)
 
                         # Определяем начальную строку для контента
                         content_start_row = current_row + 1
 
-                        # Добавляем ключевые фразы
-                        current_row = content_start_row
-                        for keyword in keywords:
-                            ws.cell(row=current_row, column=1, value=keyword)
-                            current_row += 1
-
-                        # Добавляем минус-слова в столбик
-                        current_row = content_start_row
-                        for minus_word in minus_words:
-                            ws.cell(row=current_row, column=2, value=minus_word.strip('"'))
-                            current_row += 1
-
-                        # Добавляем ссылки в столбик
-                        current_row = content_start_row
-                        for href in hrefs:
-                            ws.cell(row=current_row, column=3, value=href)
-                            current_row += 1
+                        # Ключевые фразы, минус-слова и ссылки - в столбик
+                        for i, keyword in enumerate(keywords):
+                            sheet.set(content_start_row + i, 1, keyword)
+                        for i, minus_word in enumerate(minus_words):
+                            sheet.set(content_start_row + i, 2, minus_word.strip('"'))
+                        for i, href in enumerate(hrefs):
+                            sheet.set(content_start_row + i, 3, href)
 
                         # Обновляем current_row до максимального значения
                         current_row = max(
@@ -629,62 +590,54 @@ class MediaPlanGenerator:
                             content_start_row + len(minus_words),
                             content_start_row + len(hrefs)
                         )
+                    sheet.flush()
 
-                    # Создаем лист медиаплана для кампаний с ключами
+                    # Создаем лист медиаплана для кампаний с ключами (заполняется после листа интересов)
                     sheet_name = self.sanitize_sheet_name(f"Медиаплан - {category_name} - {project_name}")
                     ws = wb.create_sheet(sheet_name)
 
-                    # Настраиваем ширину столбцов
-                    ws.column_dimensions['A'].width = 30  # Заголовок
-                    ws.column_dimensions['B'].width = 30  # Текст
-                    ws.column_dimensions['C'].width = 30  # Уточнения
-                    ws.column_dimensions['D'].width = 30  # Быстрые ссылки
-                    ws.column_dimensions['E'].width = 30  # Описание быстрых ссылок
-                    ws.column_dimensions['F'].width = 30  # Адреса быстрых ссылок
+                    # Настраиваем ширину столбцов:
+                    # Заголовок, Текст, Уточнения, Быстрые ссылки, Описание и Адреса быстрых ссылок
+                    for column in 'ABCDEF':
+                        ws.column_dimensions[column].width = 30
 
                     # Создаем лист для кампаний с интересами
                     if categories[category]['interests']:
                         sheet_name = self.sanitize_sheet_name(f"Интересы - {category_name} - {project_name}")
                         ws_interests = wb.create_sheet(sheet_name)
 
-                        # Настраиваем ширину столбцов
-                        ws_interests.column_dimensions['A'].width = 30  # Интересы
-                        ws_interests.column_dimensions['B'].width = 30  # Посадочная страница
-                        ws_interests.column_dimensions['C'].width = 30  # Заголовок
-                        ws_interests.column_dimensions['D'].width = 30  # Текст
-                        ws_interests.column_dimensions['E'].width = 30  # Уточнения
-                        ws_interests.column_dimensions['F'].width = 30  # Быстрые ссылки
-                        ws_interests.column_dimensions['G'].width = 30  # Описание быстрых ссылок
-                        ws_interests.column_dimensions['H'].width = 30  # Адреса быстрых ссылок
+                        # Настраиваем ширину столбцов: Интересы, Посадочная страница, Заголовок, Текст,
+                        # Уточнения, Быстрые ссылки, Описание и Адреса быстрых ссылок
+                        for column in 'ABCDEFGH':
+                            ws_interests.column_dimensions[column].width = 30
+
+                        headers = ["Интересы", "Посадочная страница", "Заголовок", "Текст",
+                                   "Уточнения", "Быстрые ссылки", "Описание быстрых ссылок",
+                                   "Адреса быстрых ссылок"]
+                        interests_sheet = SheetRows(ws_interests, grid_columns=len(headers))
 
                         current_row = 1
 
                         # Обрабатываем каждую кампанию с интересами
                         for campaign in categories[category]['interests']:
+                            interests_sheet.flush(current_row)
                             campaign_id = campaign.get('Id')
                             campaign_name = campaign.get('Name', '')
 
                             # Добавляем название кампании
-                            cell = ws_interests.cell(row=current_row, column=1, value=campaign_name)
-                            cell.fill = self.header_fill
-                            cell.font = Font(bold=True)
+                            interests_sheet.set(current_row, 1, campaign_name, STYLE_HEADER)
 
                             # Добавляем заголовки столбцов
                             current_row += 1
-                            headers = ["Интересы", "Посадочная страница", "Заголовок", "Текст",
-                                       "Уточнения", "Быстрые ссылки", "Описание быстрых ссылок",
-                                       "Адреса быстрых ссылок"]
                             for col, header in enumerate(headers, 1):
-                                cell = ws_interests.cell(row=current_row, column=col, value=header)
-                                cell.fill = self.header_fill
-                                cell.font = Font(bold=True)
+                                interests_sheet.set(current_row, col, header, STYLE_HEADER)
 
                             # Получаем все данные
-                            adgroups = self.get_campaign_adgroups(campaign_id, adgroups_data)
-                            hrefs = self.get_unique_hrefs(campaign_id, ads_data)
-                            ad_combinations = self.get_unique_ad_combinations(campaign_id, ads_data)
-                            callouts = self.get_campaign_callouts(campaign_id, extensions_data, ads_data)
-                            sitelinks = self.get_campaign_sitelinks(campaign_id, sitelinks_data, ads_data)
+                            adgroups = self.get_campaign_adgroups(campaign_id, index)
+                            hrefs = self.get_unique_hrefs(campaign_id, index)
+                            ad_combinations = self.get_unique_ad_combinations(campaign_id, index)
+                            callouts = self.get_campaign_callouts(campaign_id, index)
+                            sitelinks = self.get_campaign_sitelinks(campaign_id, index)
 
                             # Добавляем данные
                             content_row = current_row + 1
@@ -692,108 +645,83 @@ class MediaPlanGenerator:
 
                             # Добавляем интересы (названия групп)
                             for i, group_name in enumerate(adgroups):
-                                ws_interests.cell(row=content_row + i, column=1, value=group_name)
+                                interests_sheet.set(content_row + i, 1, group_name)
 
                             # Добавляем посадочные страницы
                             for i, href in enumerate(hrefs):
-                                ws_interests.cell(row=content_row + i, column=2, value=href)
+                                interests_sheet.set(content_row + i, 2, href)
 
                             # Добавляем комбинации заголовок-текст
                             for i, ad in enumerate(ad_combinations):
-                                ws_interests.cell(row=content_row + i, column=3, value=ad['title'])
-                                ws_interests.cell(row=content_row + i, column=4, value=ad['text'])
+                                interests_sheet.set(content_row + i, 3, ad['title'])
+                                interests_sheet.set(content_row + i, 4, ad['text'])
 
-                            # Добавляем уточнения
+                            # Добавляем уточнения (объединенная ячейка с переносом строк)
                             if callouts:
-                                # Объединяем ячейки для уточнений
                                 if max_rows > 1:
-                                    ws_interests.merge_cells(
-                                        start_row=content_row,
-                                        start_column=5,
-                                        end_row=content_row + max_rows - 1,
-                                        end_column=5
-                                    )
-                                cell = ws_interests.cell(row=content_row, column=5, value="\n".join(callouts))
-                                cell.alignment = Alignment(wrapText=True, vertical='top')
+                                    interests_sheet.merge(content_row, 5, content_row + max_rows - 1, 5)
+                                interests_sheet.set(content_row, 5, "\n".join(callouts), STYLE_CALLOUTS_GRID)
 
                             # Добавляем быстрые ссылки
                             for i, link in enumerate(sitelinks):
-                                ws_interests.cell(row=content_row + i, column=6, value=link['title'])
-                                ws_interests.cell(row=content_row + i, column=7, value=link['description'])
-                                ws_interests.cell(row=content_row + i, column=8, value=link['href'])
+                                interests_sheet.set(content_row + i, 6, link['title'])
+                                interests_sheet.set(content_row + i, 7, link['description'])
+                                interests_sheet.set(content_row + i, 8, link['href'])
 
                             # Обновляем current_row для следующей кампании
                             current_row = content_row + max_rows
+                        interests_sheet.flush()
+
+                    headers = ["Заголовок", "Текст", "Уточнения", "Быстрые ссылки", "Описание быстрых ссылок",
+                               "Адреса быстрых ссылок"]
+                    sheet = SheetRows(ws, grid_columns=len(headers))
 
                     current_row = 1
 
                     # Обрабатываем каждую кампанию
                     for campaign in campaigns:
+                        sheet.flush(current_row)
                         campaign_id = campaign.get('Id')
                         campaign_name = campaign.get('Name', '')
 
                         # Добавляем номер группы ключей, используя ранее присвоенный номер
-                        campaign_id = campaign.get('Id')
                         group_number = self.campaign_group_numbers[campaign_id]
-                        cell = ws.cell(row=current_row, column=1, value=f"Группа ключей {group_number}")
-                        cell.fill = self.header_fill
-                        cell.font = Font(bold=True)
+                        sheet.set(current_row, 1, f"Группа ключей {group_number}", STYLE_HEADER)
 
                         # Добавляем название кампании
                         current_row += 1
-                        cell = ws.cell(row=current_row, column=1, value=campaign_name)
-                        cell.fill = self.header_fill
-                        cell.font = Font(bold=True)
+                        sheet.set(current_row, 1, campaign_name, STYLE_HEADER)
 
                         # Добавляем заголовки столбцов
                         current_row += 1
-                        headers = ["Заголовок", "Текст", "Уточнения", "Быстрые ссылки", "Описание быстрых ссылок",
-                                   "Адреса быстрых ссылок"]
                         for col, header in enumerate(headers, 1):
-                            cell = ws.cell(row=current_row, column=col, value=header)
-                            cell.fill = self.header_fill
-                            cell.font = Font(bold=True)
+                            sheet.set(current_row, col, header, STYLE_HEADER)
 
                         # Получаем данные для кампании
-                        ad_combinations = self.get_unique_ad_combinations(campaign_id, ads_data)
-                        callouts = self.get_campaign_callouts(campaign_id, extensions_data, ads_data)
-                        sitelinks = self.get_campaign_sitelinks(campaign_id, sitelinks_data, ads_data)
-
-                        # Добавляем данные
-                        content_row = current_row + 1
+                        ad_combinations = self.get_unique_ad_combinations(campaign_id, index)
+                        callouts = self.get_campaign_callouts(campaign_id, index)
+                        sitelinks = self.get_campaign_sitelinks(campaign_id, index)
 
                         # Добавляем комбинации заголовок-текст
-                        for ad in ad_combinations:
-                            ws.cell(row=content_row, column=1, value=ad['title'])
-                            ws.cell(row=content_row, column=2, value=ad['text'])
-                            content_row += 1
+                        for i, ad in enumerate(ad_combinations):
+                            sheet.set(current_row + 1 + i, 1, ad['title'])
+                            sheet.set(current_row + 1 + i, 2, ad['text'])
 
                         # Добавляем уточнения и объединяем ячейки
                         if callouts:
                             # Вычисляем количество строк для объединения
                             max_rows = max(len(ad_combinations), len(sitelinks), 1)
-
-                            # Объединяем ячейки
                             if max_rows > 1:
-                                ws.merge_cells(
-                                    start_row=current_row + 1,
-                                    start_column=3,
-                                    end_row=current_row + max_rows,
-                                    end_column=3
-                                )
-
-                            # Добавляем текст с переносами строк
-                            cell = ws.cell(row=current_row + 1, column=3, value="\n".join(callouts))
-                            # Включаем перенос строк и выравнивание по верху
-                            cell.alignment = Alignment(wrapText=True, vertical='top')
+                                sheet.merge(current_row + 1, 3, current_row + max_rows, 3)
+
+                            # Текст с переносами строк, выравнивание по верху
+                            sheet.set(current_row + 1, 3, "\n".join(callouts), STYLE_CALLOUTS_GRID)
 
                         # Добавляем быстрые ссылки
-                        content_row = current_row + 1
-                        for link in sitelinks:
-                            ws.cell(row=content_row, column=4, value=link['title'])
-                            ws.cell(row=content_row, column=5, value=link['description'])
-                            ws.cell(row=content_row, column=6, value=link['href'])
-                            content_row += 1
+                        for i, link in enumerate(sitelinks):
+                            sheet.set(current_row + 1 + i, 4, link['title'])
+                            sheet.set(current_row + 1 + i, 5, link['description'])
+                            sheet.set(current_row + 1 + i, 6, link['href'])
 
                         # Обновляем current_row до максимального значения
                         max_rows = max(
@@ -801,23 +729,11 @@ class MediaPlanGenerator:
                             len(sitelinks)
                         )
                         current_row = current_row + max_rows + 1
+                    sheet.flush()
 
-            # Добавляем сетку для всех листов медиаплана
-            thin_border = Border(left=Side(style='thin'),
-                                 right=Side(style='thin'),
-                                 top=Side(style='thin'),
-                                 bottom=Side(style='thin'))
-
-            for sheet_name in wb.sheetnames:
-                if 'Медиаплан' in sheet_name or 'Интересы' in sheet_name:
-                    ws = wb[sheet_name]
-                    for row in ws.iter_rows(min_row=1, max_row=ws.max_row, min_col=1, max_col=ws.max_column):
-                        for cell in row:
-                            cell.border = thin_border
-
-            # Сохраняем файл
-            wb.save(output_path)
-            print(f"✅ Excel-файл создан: {output_path}")
+            # Сохраняем книгу
+            wb.save(output)
+            print(f"✅ Excel-файл создан")
             return True
 
         except Exception as e:
@@ -837,66 +753,34 @@ class MediaPlanGenerator:
         print(f"Номер договора: {report['number_contract']}")
         print(f"Предмет договора: {report['subject_contract']}")
 
-        # Загружаем данные из MinIO
+        # Загружаем индекс данных отчета из MinIO
         print(f"\n📥 Загрузка данных из MinIO...")
-        campaigns_data = self.load_file_from_minio(report['id'], 'campaigns.json')
-
-        if not campaigns_data:
-            print("❌ Не удалось загрузить campaigns.json")
-            return
-
-        keywords_data = self.load_file_from_minio(report['id'], f'keywords_traffic_forecast_{report["id"]}.json')
-        if not keywords_data:
-            print(f"❌ Не удалось загрузить keywords_traffic_forecast_{report['id']}.json")
+        index = get_report_index(self.minio_client, self.bucket_name, report['id'])
+        if index is None:
+            print("❌ Не удалось загрузить данные отчета")
             return
 
         # Категоризируем кампании
         print(f"\n🔍 Категоризация кампаний...")
-        categories = self.categorize_campaigns(campaigns_data, report['campaign_ids'], keywords_data)
+        categories = self.categorize_campaigns(index, report['campaign_ids'])
 
         if not categories:
             print("⚠ Нет кампаний для обработки")
             raise IOError('Нет кампаний для обработки')
             return
 
-        # Загружаем все необходимые данные
-        ads_data = self.load_file_from_minio(report['id'], f'ads_report_{report["id"]}.json')
-        if not ads_data:
-            print(f"❌ Не удалось загрузить ads_report_{report['id']}.json")
-            return
-
-        extensions_data = self.load_file_from_minio(report['id'], f'extensions_{report["id"]}.json')
-        if not extensions_data:
-            print(f"❌ Не удалось загрузить extensions_{report['id']}.json")
-            return
-
-        sitelinks_data = self.load_file_from_minio(report['id'], f'sitelinks_{report["id"]}.json')
-        if not sitelinks_data:
-            print(f"❌ Не удалось загрузить sitelinks_{report['id']}.json")
-            return
-
-        adgroups_data = self.load_file_from_minio(report['id'], f'adgroups_{report["id"]}.json')
-        if not adgroups_data:
-            print(f"❌ Не удалось загрузить adgroups_{report['id']}.json")
-            return
-
-        # Создаем Excel-файл
+        # Создаем Excel-файл сразу в памяти
         print(f"\n📊 Создание Excel-файла...")
         # Генерируем имя файла с датой и временем
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         filename = f"Медиаплан_{timestamp}.xlsx"
-        output_path = os.path.join(self.output_folder, filename)
 
-        success = self.create_mediaplan_excel(report['id'], categories, keywords_data, ads_data, extensions_data,
-                                              sitelinks_data, adgroups_data, output_path)
+        file = io.BytesIO()
+        success = self.create_mediaplan_excel(report['id'], categories, index, file)
 
         if success:
-            # читаем файл и переводим в байты
-            file = io.BytesIO(open(output_path, 'rb').read())
+            file.seek(0)
             filename = f"{report['id']}/" + filename
-
-            # удаляем файл
-            os.remove(output_path)
             return file, filename
 
             print(f"✅ Медиаплан успешно создан")
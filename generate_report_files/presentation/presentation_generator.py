@@ -7,7 +7,8 @@ import io
 import os
 import json
 import psycopg2
-from minio import Minio
+from concurrent.futures import ThreadPoolExecutor
+from minio_factory import get_minio
 from dotenv import load_dotenv
 from typing import Dict, List, Optional, Any
 from pptx import Presentation
@@ -16,14 +17,20 @@ from pptx.enum.text import PP_ALIGN
 from pptx.dml.color import RGBColor
 from pptx.oxml.xmlchemy import OxmlElement
 from datetime import datetime
-import requests
 from io import BytesIO
 from PIL import Image
 
+from utils.image_prefetch import CompressedImageVariants
+from artifact_codec import decode_json
+from report_index import ReportIndex, get_report_index
+
 
 # Загружаем переменные окружения
 load_dotenv()
 
+# Количество кампаний, данные слайдов которых готовятся одновременно
+PRESENTATION_WORKERS = int(os.getenv('PRESENTATION_WORKERS', '4'))
+
 
 class PresentationGenerator:
     def __init__(self):
@@ -38,12 +45,7 @@ class PresentationGenerator:
         }
         
         # Настройки MinIO
-        self.minio_client = Minio(
-            endpoint=os.getenv('S3_ENDPOINT_URL', 'minio.upk-mos.ru'),
-            access_key=os.getenv('S3_ACCESS_KEY'),
-            secret_key=os.getenv('S3_SECRET_KEY'),
-            secure=os.getenv('S3_SECURE', 'False').lower() == 'true'
-        )
+        self.minio_client = get_minio()
         
         self.bucket_name = os.getenv('S3_BUCKET_NAME', 'dit-services-dev')
         
@@ -51,8 +53,8 @@ class PresentationGenerator:
         self.output_folder = 'presentations_results'
         self._ensure_output_folder()
         
-        # Кэш для изображений
-        self.image_cache = {}
+        # Сжатые изображения текущей презентации (общие для всех кампаний)
+        self.image_variants = None
     
     def _ensure_output_folder(self):
         """Создать папку для результатов, если её нет"""
@@ -124,8 +126,8 @@ class PresentationGenerator:
             if self.minio_client.stat_object(self.bucket_name, object_path):
                 # Загружаем объект
                 response = self.minio_client.get_object(self.bucket_name, object_path)
-                content = response.read().decode('utf-8')
-                data = json.loads(content)
+                content = response.read()
+                data = decode_json(content)
                 print(f"✓ Загружен файл {filename}")
                 return data
             else:
@@ -136,17 +138,17 @@ class PresentationGenerator:
             print(f"✗ Ошибка при загрузке {filename}: {e}")
             return None
     
-    def filter_rsy_campaigns(self, campaigns_data: Dict, request_campaign_ids: Any) -> List[Dict]:
+    def filter_rsy_campaigns(self, index: ReportIndex, request_campaign_ids: Any) -> List[Dict]:
         """
         Фильтровать кампании:
         1. Только те, которые есть в заявке (request_campaign_ids)
         2. Только те, где в Name есть "РСЯ"
         """
-        if not campaigns_data or not campaigns_data.get('result'):
+        all_campaigns = index.campaigns()
+        if not all_campaigns:
             print("⚠ Нет данных кампаний")
             return []
         
-        all_campaigns = campaigns_data.get('result', {}).get('Campaigns', [])
         print(f"📊 Всего кампаний в данных: {len(all_campaigns)}")
         
         # Получаем список ID кампаний из заявки
@@ -196,13 +198,14 @@ class PresentationGenerator:
         print(f"📋 ID кампаний из заявки: {allowed_campaign_ids}")
         
         # Фильтруем кампании
+        allowed_campaign_set = set(allowed_campaign_ids)
         rsy_campaigns = []
         for campaign in all_campaigns:
             campaign_id = campaign.get('Id')
             campaign_name = campaign.get('Name', '')
             
             # Проверяем, что кампания есть в списке из заявки
-            if allowed_campaign_ids and campaign_id not in allowed_campaign_ids:
+            if allowed_campaign_set and campaign_id not in allowed_campaign_set:
                 continue
             
             # Проверяем, что в названии есть "РСЯ"
@@ -224,26 +227,14 @@ class PresentationGenerator:
                 return parts[1].strip()
         return campaign_name
     
-    def get_unique_ads_for_campaign(self, campaign_id: int, ads_data: Dict, image_hashes_data: Dict) -> List[Dict]:
+    def get_unique_ads_for_campaign(self, campaign_id: int, index: ReportIndex) -> List[Dict]:
         """
         Получить уникальные комбинации объявлений для кампании
         Уникальность определяется по (Title, Text, AdImageHash)
         """
-        if not ads_data or not ads_data.get('result'):
-            return []
-        
-        all_ads = ads_data.get('result', {}).get('Ads', [])
-        
-        # Фильтруем объявления по campaign_id и наличию изображения
-        campaign_ads = []
-        for ad in all_ads:
-            if ad.get('CampaignId') == campaign_id:
-                text_ad = ad.get('TextAd', {})
-                ad_image_hash = text_ad.get('AdImageHash')
-                
-                # Только объявления с изображением
-                if ad_image_hash:
-                    campaign_ads.append(ad)
+        # Объявления кампании с изображением
+        campaign_ads = [ad for ad in index.ads_for_campaign(campaign_id)
+                        if ad.get('TextAd', {}).get('AdImageHash')]
         
         print(f"  📊 Найдено объявлений с изображениями для кампании {campaign_id}: {len(campaign_ads)}")
         
@@ -259,121 +250,31 @@ class PresentationGenerator:
             key = (title, text, ad_image_hash)
             
             if key not in unique_combinations:
-                # Получаем URL изображения
-                image_url = self._get_image_url_by_hash(ad_image_hash, image_hashes_data)
-                
-                # Получаем ссылку на посадочную страницу
-                href = text_ad.get('Href', '')
-                
                 unique_combinations[key] = {
                     'title': title,
                     'text': text,
                     'image_hash': ad_image_hash,
-                    'image_url': image_url,
-                    'href': href
+                    'image_url': index.image_url(ad_image_hash),
+                    'href': text_ad.get('Href', '')
                 }
         
         print(f"  ✅ Уникальных комбинаций: {len(unique_combinations)}")
         return list(unique_combinations.values())
     
-    def _get_image_url_by_hash(self, ad_image_hash: str, image_hashes_data: Dict) -> Optional[str]:
-        """Получить URL изображения по хешу"""
-        if not image_hashes_data:
-            return None
-        
-        ad_images = image_hashes_data.get('result', {}).get('AdImages', [])
-        for image in ad_images:
-            if image.get('AdImageHash') == ad_image_hash:
-                return image.get('OriginalUrl')
-        
-        return None
-    
-    def download_image(self, url: str, max_retries: int = 3) -> Optional[BytesIO]:
-        """Скачать изображение по URL с повторными попытками"""
-        # Проверяем кэш
-        if url in self.image_cache:
-            print(f"    📦 Используем кэшированное изображение")
-            return BytesIO(self.image_cache[url])
-        
-        for attempt in range(max_retries):
-            try:
-                print(f"    🔄 Попытка {attempt + 1}/{max_retries} скачивания изображения...")
-                response = requests.get(url, timeout=15)
-                if response.status_code == 200:
-                    content = response.content
-                    # Сохраняем в кэш
-                    self.image_cache[url] = content
-                    print(f"    ✅ Изображение скачано и закэшировано")
-                    return BytesIO(content)
-                else:
-                    print(f"    ⚠ HTTP {response.status_code} на попытке {attempt + 1}")
-            except Exception as e:
-                print(f"    ✗ Ошибка на попытке {attempt + 1}: {e}")
-                if attempt < max_retries - 1:
-                    import time
-                    time.sleep(2)  # Пауза перед повторной попыткой
-        
-        print(f"    ❌ Не удалось скачать изображение после {max_retries} попыток")
-        return None
-    
-    def compress_image(self, image_stream: BytesIO, max_width: int = 800, max_height: int = 600, quality: int = 85) -> BytesIO:
+    def prepare_campaign_slides(self, campaign: Dict, index: ReportIndex) -> tuple:
         """
-        Сжать изображение для уменьшения размера файла
+        Подготовить данные слайдов кампании (выполняется в пуле потоков)
+        :return: (уникальные объявления, AdImageHash -> (байты сжатого изображения, ширина, высота))
         """
-        try:
-            image_stream.seek(0)
-            img = Image.open(image_stream)
-            
-            # Получаем исходные размеры
-            original_width, original_height = img.size
-            print(f"    📏 Исходные размеры: {original_width}x{original_height}")
-            
-            # Вычисляем новые размеры с сохранением пропорций
-            ratio = min(max_width / original_width, max_height / original_height)
-            
-            # Если изображение уже меньше максимальных размеров, не увеличиваем его
-            if ratio >= 1:
-                ratio = 1
-            
-            new_width = int(original_width * ratio)
-            new_height = int(original_height * ratio)
-            
-            print(f"    📏 Новые размеры: {new_width}x{new_height} (коэффициент: {ratio:.2f})")
-            
-            # Изменяем размер изображения
-            if ratio < 1:
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Конвертируем в RGB если нужно (для JPEG)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Создаем белый фон для прозрачных изображений
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Сохраняем с сжатием
-            output = BytesIO()
-            img.save(output, format='JPEG', quality=quality, optimize=True)
-            output.seek(0)
-            
-            # Получаем размеры до и после сжатия
-            original_size = len(image_stream.getvalue())
-            compressed_size = len(output.getvalue())
-            compression_ratio = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
-            
-            print(f"    💾 Сжатие: {original_size // 1024}KB → {compressed_size // 1024}KB ({compression_ratio:.1f}% экономии)")
-            
-            return output
-            
-        except Exception as e:
-            print(f"    ✗ Ошибка при сжатии изображения: {e}")
-            return image_stream
+        unique_ads = self.get_unique_ads_for_campaign(campaign.get('Id'), index)
+        images = {}
+        for ad in unique_ads:
+            prepared = self.image_variants.get(ad.get('image_hash'), ad.get('image_url'))
+            if prepared is not None:
+                images[ad['image_hash']] = prepared
+        return unique_ads, images
     
-    def create_presentation(self, rsy_campaigns: List[Dict], ads_data: Dict, image_hashes_data: Dict, output_path: str) -> bool:
+    def create_presentation(self, rsy_campaigns: List[Dict], index: ReportIndex, output_path: str) -> bool:
         """Создать презентацию с заголовками для РСЯ-кампаний"""
         try:
             # Создаем новую презентацию
@@ -383,8 +284,16 @@ class PresentationGenerator:
             prs.slide_width = Inches(10)
             prs.slide_height = Inches(5.625)  # 16:9 = 10/5.625
             
+            # Данные слайдов (уникальные объявления, сжатые изображения) готовятся для кампаний
+            # параллельно, слайды собираются по порядку кампаний
+            self.image_variants = CompressedImageVariants(max_width=800, max_height=600, quality=85)
+            with ThreadPoolExecutor(max_workers=max(1, min(PRESENTATION_WORKERS, len(rsy_campaigns)))) as executor:
+                prepared_campaigns = list(executor.map(
+                    lambda campaign: self.prepare_campaign_slides(campaign, index), rsy_campaigns
+                ))
+            
             # Создаем слайд для каждой РСЯ-кампании
-            for campaign in rsy_campaigns:
+            for campaign, (unique_ads, images) in zip(rsy_campaigns, prepared_campaigns):
                 campaign_id = campaign.get('Id')
                 campaign_name = campaign.get('Name', '')
                 subtitle = self.extract_campaign_subtitle(campaign_name)
@@ -394,9 +303,6 @@ class PresentationGenerator:
                 
                 print(f"  📄 Создание слайда: {title_text}")
                 
-                # Получаем уникальные объявления для кампании
-                unique_ads = self.get_unique_ads_for_campaign(campaign_id, ads_data, image_hashes_data)
-                
                 if not unique_ads:
                     print(f"  ⚠ Нет объявлений с изображениями для кампании {campaign_id}")
                     continue
@@ -452,7 +358,7 @@ class PresentationGenerator:
                     images_height = Inches(0.8)  # Фиксированная высота для изображений
                     
                     # Добавляем картинки для текущей части
-                    self._add_images_to_slide(slide, part_ads, Inches(0.3), images_top, Inches(9.4), images_height)
+                    self._add_images_to_slide(slide, part_ads, images, Inches(0.3), images_top, Inches(9.4), images_height)
                     
                     # === 3. ТАБЛИЦА (оставшееся место) ===
                     table_top = images_top + images_height + Inches(0.1)
@@ -481,8 +387,11 @@ class PresentationGenerator:
             traceback.print_exc()
             return False
     
-    def _add_images_to_slide(self, slide, unique_ads: List[Dict], left, top, width, height):
-        """Добавить картинки на слайд с сохранением пропорций"""
+    def _add_images_to_slide(self, slide, unique_ads: List[Dict], images: Dict[str, tuple], left, top, width, height):
+        """
+        Добавить картинки на слайд с сохранением пропорций
+        :param images: подготовленные изображения AdImageHash -> (байты, ширина, высота)
+        """
         if not unique_ads:
             return
         
@@ -500,20 +409,15 @@ class PresentationGenerator:
                 print(f"    ⚠ Нет URL изображения для объявления {i+1}")
                 continue
             
-            # Скачиваем изображение
-            image_stream = self.download_image(image_url)
-            if not image_stream:
-                print(f"    ⚠ Не удалось скачать изображение {i+1}")
+            prepared = images.get(ad.get('image_hash'))
+            if prepared is None:
+                print(f"    ⚠ Не удалось получить изображение {i+1}")
                 continue
             
             try:
-                # Сжимаем изображение перед добавлением
-                compressed_stream = self.compress_image(image_stream, max_width=800, max_height=600, quality=85)
-                
-                # Получаем размеры сжатого изображения
-                compressed_stream.seek(0)
-                img = Image.open(compressed_stream)
-                original_width, original_height = img.size
+                # Сжатое изображение и его размеры подготовлены заранее
+                image_data, original_width, original_height = prepared
+                compressed_stream = BytesIO(image_data)
                 
                 # Вычисляем пропорциональную ширину
                 aspect_ratio = original_width / original_height
@@ -719,30 +623,14 @@ class PresentationGenerator:
         # Загружаем данные из MinIO
         print(f"\n📥 Загрузка данных из MinIO...")
         
-        # Формируем имена файлов с учетом номера отчета
-        report_num = report['id']  # Используем id отчета как номер отчета
-        ads_filename = f'ads_report_{report_num}.json'
-        image_hashes_filename = f'image_hashes_report_{report_num}.json'
-        
-        # Загружаем файлы
-        campaigns_data = self.load_file_from_minio(report['id'], 'campaigns.json')
-        if not campaigns_data:
-            print("❌ Не удалось загрузить campaigns.json")
-            return
-        
-        ads_data = self.load_file_from_minio(report['id'], ads_filename)
-        if not ads_data:
-            print(f"❌ Не удалось загрузить {ads_filename}")
-            return
-        
-        image_hashes_data = self.load_file_from_minio(report['id'], image_hashes_filename)
-        if not image_hashes_data:
-            print(f"❌ Не удалось загрузить {image_hashes_filename}")
+        index = get_report_index(self.minio_client, self.bucket_name, report['id'])
+        if index is None:
+            print("❌ Не удалось загрузить данные отчета")
             return
         
         # Фильтруем РСЯ-кампании
         print(f"\n🔍 Фильтрация РСЯ-кампаний...")
-        rsy_campaigns = self.filter_rsy_campaigns(campaigns_data, report['campaign_ids'])
+        rsy_campaigns = self.filter_rsy_campaigns(index, report['campaign_ids'])
         
         if not rsy_campaigns:
             print("⚠ Не найдено РСЯ-кампаний для обработки")
@@ -755,7 +643,7 @@ class PresentationGenerator:
         output_path = os.path.join(self.output_folder, filename)
         
         print(f"\n📊 Создание презентации...")
-        success = self.create_presentation(rsy_campaigns, ads_data, image_hashes_data, output_path)
+        success = self.create_presentation(rsy_campaigns, index, output_path)
         
         if success:
             # читаем файл и переводим в байты
@@ -7,16 +7,16 @@ import io
 import os
 import sys
 import json
-import tempfile
-import requests
+import hashlib
+import threading
+from collections import OrderedDict
 import psycopg2
 from psycopg2.extensions import cursor as cur
 import time
-from minio import Minio
+from minio_factory import get_minio
 from dotenv import load_dotenv
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime
-from PIL import Image
 from docx import Document
 from docx.shared import Pt, Inches, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
@@ -27,6 +27,15 @@ from docx.enum.style import WD_STYLE_TYPE
 from docx.oxml import parse_xml, OxmlElement
 from docx.oxml.ns import qn
 
+from utils.image_cache import get_image_cache, PREVIEW
+from utils.image_prefetch import prefetch_images
+from utils.docx_images import DocxImageEmbedder
+from utils.docx_tables import TableRowsBuilder, Cell
+from artifact_codec import decode_json
+from stats_store import StatsTable, stats_table_filename, load_stats_table
+from report_manifest import load_manifest, find_artifact, screenshot_count
+from report_index import ReportIndex, get_report_index
+
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -34,6 +43,28 @@ load_dotenv()
 # Настройки для таблицы лучших объявлений
 TOP_ADS_COUNT = 2  # Количество лучших объявлений для отображения в таблице
 
+# Сборка документа из шаблона (стили, поля, колонтитулы) с кэшем статических разделов 1-5
+REPORT_TEMPLATE_CACHE = int(os.getenv('REPORT_TEMPLATE_CACHE', '1'))
+# Количество вариантов статических разделов в кэше процесса
+REPORT_STATIC_CACHE_SIZE = int(os.getenv('REPORT_STATIC_CACHE_SIZE', '32'))
+# Время жизни кэша текстов отчета (textforformdocument), сек
+REPORT_TEXTS_TTL = int(os.getenv('REPORT_TEXTS_TTL', '300'))
+
+# Поля report_data, от которых зависят разделы 1-5
+STATIC_SECTION_FIELDS = (
+    'date_contract', 'number_contract', 'theme_contract', 'date_request', 'application_number',
+    'customer_org', 'customer_position', 'customer_signature',
+    'contractor_org', 'contractor_position', 'contractor_signature', 'terms'
+)
+
+# Кэши процесса: тексты отчета, шаблон документа, документы с готовыми разделами 1-5
+_texts_lock = threading.Lock()
+_texts_cache = {'texts': None, 'version': None, 'loaded_at': 0.0}
+_template_lock = threading.Lock()
+_template_data: Optional[bytes] = None
+_static_sections_lock = threading.Lock()
+_static_sections: 'OrderedDict[str, bytes]' = OrderedDict()
+
 class ReportGenerator:
     def __init__(self):
         """Инициализация подключений к БД и MinIO"""
@@ -47,18 +78,22 @@ class ReportGenerator:
         }
         
         # Настройки MinIO
-        self.minio_client = Minio(
-            endpoint=os.getenv('S3_ENDPOINT_URL', 'minio.upk-mos.ru'),
-            access_key=os.getenv('S3_ACCESS_KEY'),
-            secret_key=os.getenv('S3_SECRET_KEY'),
-            secure=os.getenv('S3_SECURE', 'False').lower() == 'true'
-        )
+        self.minio_client = get_minio()
         
         self.bucket_name = os.getenv('S3_BUCKET_NAME', 'dit-services-dev')
         
         # Папка для результатов
         self.output_folder = 'report_results'
         self._ensure_output_folder()
+        
+        # Вставка изображений из памяти (пересоздается для каждого документа)
+        self.image_embedder = DocxImageEmbedder()
+
+        # Манифесты отчетов (report_id -> манифест или None для отчетов без манифеста)
+        self._manifests = {}
+
+        # Тексты отчета, закрепленные на время формирования разделов 1-5 (см. create_document_with_static_sections)
+        self._pinned_texts: Optional[Dict[str, str]] = None
 
     def _ensure_output_folder(self):
         """Создать папку для результатов, если её нет"""
@@ -99,7 +134,32 @@ class ReportGenerator:
         return None
 
     def get_report_text(self, key: str) -> Optional[str]:
-        """Получить текст для отчета по ключу из БД"""
+        """Получить текст для отчета по ключу (из кэша текстов процесса)"""
+        if self._pinned_texts is not None:
+            return self._pinned_texts.get(key)
+        return self._get_report_texts().get(key)
+
+    def _get_report_texts(self) -> Dict[str, str]:
+        """Все тексты отчета; загружаются из БД одним запросом не чаще раза в REPORT_TEXTS_TTL сек"""
+        return self._get_report_texts_version()[0]
+
+    def _get_report_texts_version(self) -> Tuple[Dict[str, str], Optional[str]]:
+        """Все тексты отчета и их версия (None, если тексты не загружены)"""
+        with _texts_lock:
+            if _texts_cache['texts'] is None or time.monotonic() - _texts_cache['loaded_at'] > REPORT_TEXTS_TTL:
+                texts = self._load_report_texts()
+                if texts is None:
+                    # Нет подключения к БД - не кэшируем, каждый текст будет считаться отсутствующим
+                    return {}, None
+                _texts_cache['texts'] = texts
+                _texts_cache['version'] = hashlib.sha1(
+                    json.dumps(texts, sort_keys=True, ensure_ascii=False).encode('utf-8')
+                ).hexdigest()
+                _texts_cache['loaded_at'] = time.monotonic()
+            return _texts_cache['texts'], _texts_cache['version']
+
+    def _load_report_texts(self) -> Dict[str, str]:
+        """Загрузить все тексты для отчета из БД"""
         conn = None
         try:
             conn = self._connect_to_db()
@@ -111,20 +171,19 @@ class ReportGenerator:
             # Устанавливаем схему по умолчанию
             cursor.execute("SET search_path TO gen_report_context_contracts, public;")
             
-            # Получаем текст по ключу
+            # Получаем все тексты
             query = """
-            SELECT text_data
+            SELECT key, text_data
             FROM textforformdocument
-            WHERE key = %s
             """
             
-            cursor.execute(query, (key,))
-            result = cursor.fetchone()
+            cursor.execute(query)
+            result = cursor.fetchall()
             
             cursor.close()
             conn.close()
             
-            return result[0] if result else None
+            return {key: text_data for key, text_data in result}
             
         except Exception as e:
             # !!! здесь иногда возникает ошибка: server closed the connection unexpectedly
@@ -771,18 +830,41 @@ class ReportGenerator:
         except Exception:
             return False
 
+    def get_report_manifest(self, report_id: int) -> Optional[Dict]:
+        """Манифест артефактов отчета (загружается один раз)"""
+        if report_id not in self._manifests:
+            self._manifests[report_id] = load_manifest(self.minio_client, self.bucket_name, report_id)
+        return self._manifests[report_id]
+
+    def load_screenshot(self, report_id: int, url_index: int, screenshot_index: int) -> Optional[bytes]:
+        """
+        Загрузить скриншот screenshot_NNN.png из папки url_N.
+        Количество скриншотов берется из манифеста; для отчетов без манифеста
+        файлы перебираются до первого отсутствующего
+        """
+        image_path = (f"gen_report_context_contracts/data_yandex_direct/{report_id}_результаты/"
+                      f"screenshots/url_{url_index}/screenshot_{screenshot_index:03d}.png")
+        count = screenshot_count(self.get_report_manifest(report_id), url_index)
+        if count is None:
+            return self.load_image_from_minio(image_path, silent=True)
+        if screenshot_index > count:
+            return None
+        return self.load_image_from_minio(image_path)
+
     def load_file_from_minio(self, report_id: int, filename: str) -> Optional[Dict]:
         """Загрузить JSON файл из MinIO для конкретного отчета"""
         try:
             folder_path = f"gen_report_context_contracts/data_yandex_direct/{report_id}_результаты"
             object_path = f"{folder_path}/{filename}"
             
-            # Проверяем существование объекта
-            if self.minio_client.stat_object(self.bucket_name, object_path):
+            # Проверяем существование объекта (по манифесту, при его отсутствии - запросом)
+            manifest = self.get_report_manifest(report_id)
+            if (find_artifact(manifest, report_id, filename) is not None
+                    or self.minio_client.stat_object(self.bucket_name, object_path)):
                 # Загружаем объект
                 response = self.minio_client.get_object(self.bucket_name, object_path)
-                content = response.read().decode('utf-8')
-                data = json.loads(content)
+                content = response.read()
+                data = decode_json(content)
                 print(f"✓ Загружен файл {filename}")
                 return data
             else:
@@ -852,6 +934,12 @@ class ReportGenerator:
         
         return mapping
 
+    @staticmethod
+    def _campaign_has_keywords(index: ReportIndex, campaign_id: int) -> bool:
+        """Есть ли у кампании ключевые фразы (фраза "---autotargeting" не учитывается)"""
+        return any(keyword.get('Keyword', '') != "---autotargeting"
+                   for keyword in index.keywords_for_campaign(campaign_id))
+
     def get_campaigns_data_for_report(self, report_id: int, project_mapping: Dict[int, int] = None) -> List[Dict]:
         """Получить данные о кампаниях для отчета
         
@@ -863,81 +951,13 @@ class ReportGenerator:
             project_mapping = {}
             
         try:
-            # Загружаем данные о кампаниях (основной источник порядка)
-            campaigns_data = self.load_file_from_minio(report_id, "campaigns.json")
-            if not campaigns_data:
+            # Индекс данных отчета (кампании в порядке campaigns.json, объявления по кампаниям)
+            index = get_report_index(self.minio_client, self.bucket_name, report_id)
+            if index is None:
                 print("❌ Не удалось загрузить данные о кампаниях")
                 return []
             
-            # Загружаем данные об объявлениях
-            ads_data = self.load_file_from_minio(report_id, f"ads_report_{report_id}.json")
-            if not ads_data:
-                print("❌ Не удалось загрузить данные об объявлениях")
-                return []
-            
-            # Загружаем данные о расширениях
-            extensions_data = self.load_file_from_minio(report_id, f"extensions_{report_id}.json")
-            if not extensions_data:
-                print("❌ Не удалось загрузить данные о расширениях")
-                return []
-            
-            # Загружаем данные о быстрых ссылках
-            sitelinks_data = self.load_file_from_minio(report_id, f"sitelinks_{report_id}.json")
-            if not sitelinks_data:
-                print("❌ Не удалось загрузить данные о быстрых ссылках")
-                return []
-            
-            # Загружаем данные о ключевых фразах
-            keywords_data = self.load_file_from_minio(report_id, f"keywords_traffic_forecast_{report_id}.json")
-            if not keywords_data:
-                print("❌ Не удалось загрузить данные о ключевых фразах")
-                return []
-            
-            # Получаем список объявлений
-            ads = ads_data.get('result', {}).get('Ads', [])
-            
-            # Создаем словарь для связи AdExtensionId с текстом уточнения
-            extensions_dict = {}
-            # Обрабатываем структуру extensions_1.json (может быть в batch_1 или прямо в result)
-            extensions = None
-            if 'batch_1' in extensions_data and 'result' in extensions_data['batch_1']:
-                extensions = extensions_data['batch_1']['result'].get('AdExtensions', [])
-            elif 'result' in extensions_data:
-                extensions = extensions_data['result'].get('AdExtensions', [])
-            
-            if extensions:
-                for ext in extensions:
-                    if ext.get('Type') == 'CALLOUT' and ext.get('Callout'):
-                        ext_id = ext.get('Id')
-                        callout_text = ext['Callout'].get('CalloutText')
-                        if ext_id and callout_text:
-                            extensions_dict[ext_id] = callout_text
-            
-            # Создаем словарь для связи SitelinkSetId с быстрыми ссылками
-            sitelinks_dict = {}
-            # Обрабатываем структуру sitelinks файла
-            for sitelink_set_id, sitelink_set_data in sitelinks_data.items():
-                if isinstance(sitelink_set_data, dict) and 'result' in sitelink_set_data:
-                    sitelinks_sets = sitelink_set_data['result'].get('SitelinksSets', [])
-                    for sitelinks_set in sitelinks_sets:
-                        set_id = sitelinks_set.get('Id')
-                        sitelinks = sitelinks_set.get('Sitelinks', [])
-                        if set_id and sitelinks:
-                            sitelinks_dict[set_id] = sitelinks
-            
-            # Создаем множество кампаний с ключевыми фразами
-            campaigns_with_keywords = set()
-            keywords = keywords_data.get('result', {}).get('Keywords', [])
-            for keyword in keywords:
-                campaign_id = keyword.get('CampaignId')
-                keyword_text = keyword.get('Keyword', '')
-                
-                # Исключаем ключевые фразы с текстом "---autotargeting"
-                if campaign_id and keyword_text != "---autotargeting":
-                    campaigns_with_keywords.add(campaign_id)
-            
-            # Получаем список кампаний из campaigns.json в правильном порядке
-            campaigns_list_from_json = campaigns_data.get('result', {}).get('Campaigns', [])
+            campaigns_list_from_json = index.campaigns()
             
             # Создаем словарь для быстрого доступа к данным кампаний
             campaigns_dict = {}
@@ -955,7 +975,7 @@ class ReportGenerator:
                     category = "РСЯ" if "рся" in campaign_name_lower else "Поиск" if "поиск" in campaign_name_lower else "Неопределено"
                     
                     # Определяем тип кампании: "ключи" или "интересы"
-                    campaign_type = "ключи" if campaign_id in campaigns_with_keywords else "интересы"
+                    campaign_type = "ключи" if self._campaign_has_keywords(index, campaign_id) else "интересы"
                     
                     campaigns_dict[campaign_id] = {
                         'campaign_id': campaign_id,
@@ -963,7 +983,7 @@ class ReportGenerator:
                         'category': category,
                         'campaign_type': campaign_type,
                         'project_id': project_id,
-                        'ads': [],
+                        'ads': index.ads_for_campaign(campaign_id),
                         'title_text_combinations': [],  # Изменили на список для сохранения порядка
                         'callouts': [],  # Изменили на список для сохранения порядка
                         'landing_pages': set(),  # Посадочные страницы (Href)
@@ -971,48 +991,41 @@ class ReportGenerator:
                         'sitelinks_descriptions': []  # Изменили на список для сохранения порядка
                     }
             
-            # Теперь обрабатываем объявления и заполняем данные кампаний
-            for ad in ads:
-                campaign_id = ad.get('CampaignId')
-                if campaign_id in campaigns_dict:
-                    campaigns_dict[campaign_id]['ads'].append(ad)
-                
-                # Собираем уникальные комбинации заголовок + текст
-                if ad.get('Type') == 'TEXT_AD' and ad.get('TextAd'):
+            # Теперь обрабатываем объявления каждой кампании и заполняем данные кампаний
+            for campaign_id, campaign in campaigns_dict.items():
+                for ad in campaign['ads']:
+                    # Собираем уникальные комбинации заголовок + текст
+                    if ad.get('Type') != 'TEXT_AD' or not ad.get('TextAd'):
+                        continue
                     text_ad = ad['TextAd']
                     title = text_ad.get('Title')
                     text = text_ad.get('Text')
                     href = text_ad.get('Href')
-                    sitelink_set_id = text_ad.get('SitelinkSetId')
                     
                     # Добавляем только если есть И заголовок И текст
                     if title and text:
                         # Создаем уникальную комбинацию
                         combination = f"{title} | {text}"
-                        if combination not in campaigns_dict[campaign_id]['title_text_combinations']:
-                            campaigns_dict[campaign_id]['title_text_combinations'].append(combination)
+                        if combination not in campaign['title_text_combinations']:
+                            campaign['title_text_combinations'].append(combination)
                     
                     # Посадочные страницы (Href) - для заголовка кампании
                     if href:
-                        campaigns_dict[campaign_id]['landing_pages'].add(href)
+                        campaign['landing_pages'].add(href)
                     
                     # Быстрые ссылки из SitelinkSetId
-                    if sitelink_set_id and sitelink_set_id in sitelinks_dict:
-                        for sitelink in sitelinks_dict[sitelink_set_id]:
-                            if sitelink.get('Title') and sitelink['Title'] not in campaigns_dict[campaign_id]['sitelinks_titles']:
-                                campaigns_dict[campaign_id]['sitelinks_titles'].append(sitelink['Title'])
-                            if sitelink.get('Description') and sitelink['Description'] not in campaigns_dict[campaign_id]['sitelinks_descriptions']:
-                                campaigns_dict[campaign_id]['sitelinks_descriptions'].append(sitelink['Description'])
+                    for sitelink in index.sitelinks(text_ad.get('SitelinkSetId')):
+                        if sitelink.get('Title') and sitelink['Title'] not in campaign['sitelinks_titles']:
+                            campaign['sitelinks_titles'].append(sitelink['Title'])
+                        if sitelink.get('Description') and sitelink['Description'] not in campaign['sitelinks_descriptions']:
+                            campaign['sitelinks_descriptions'].append(sitelink['Description'])
                     
                     # Обрабатываем AdExtensions для получения уникальных уточнений
-                    ad_extensions = text_ad.get('AdExtensions', [])
-                    for ad_ext in ad_extensions:
+                    for ad_ext in text_ad.get('AdExtensions', []):
                         if ad_ext.get('Type') == 'CALLOUT':
-                            ext_id = ad_ext.get('AdExtensionId')
-                            if ext_id and ext_id in extensions_dict:
-                                callout_text = extensions_dict[ext_id]
-                                if callout_text not in campaigns_dict[campaign_id]['callouts']:
-                                    campaigns_dict[campaign_id]['callouts'].append(callout_text)
+                            callout_text = index.callout_text(ad_ext.get('AdExtensionId'))
+                            if callout_text and callout_text not in campaign['callouts']:
+                                campaign['callouts'].append(callout_text)
             
             # Группируем кампании по project_id
             campaigns_by_project = {}
@@ -1205,7 +1218,6 @@ class ReportGenerator:
 
     def create_section_7(self, doc: Document, report_data: Dict) -> None:
         """Создать шестой раздел отчета"""
-        import tempfile
         import os
         
         # Получаем тексты из БД
@@ -1342,46 +1354,12 @@ class ReportGenerator:
                             paragraph = cells[2].paragraphs[0]
                             run = paragraph.add_run()
                             
-                            # Вставляем изображение
+                            # Максимальная ширина 350px, размеры берем из заголовка файла
+                            width_inches, height_inches = self.image_embedder.fit_size(image_data, max_width_px=350)
+                            self.image_embedder.add_picture(run, image_data, width=width_inches, height=height_inches)
                             
-                            # Создаем временный файл для изображения
-                            
-                            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
-                                temp_file.write(image_data)
-                                temp_file_path = temp_file.name
-                            
-                            try:
-                                # Определяем размеры изображения
-                                with Image.open(temp_file_path) as img:
-                                    original_width, original_height = img.size
-                                    
-                                    # Максимальная ширина 350px
-                                    max_width_px = 350
-                                    
-                                    # Рассчитываем пропорциональные размеры
-                                    if original_width > max_width_px:
-                                        # Масштабируем по ширине
-                                        scale_factor = max_width_px / original_width
-                                        new_width = max_width_px
-                                        new_height = int(original_height * scale_factor)
-                                        
-                                        # Конвертируем в дюймы
-                                        width_inches = Inches(new_width / 96)  # 96 DPI
-                                        height_inches = Inches(new_height / 96)
-                                    else:
-                                        # Изображение уже подходящего размера
-                                        width_inches = Inches(original_width / 96)
-                                        height_inches = Inches(original_height / 96)
-                                    
-                                    # Добавляем изображение с рассчитанными размерами
-                                    run.add_picture(temp_file_path, width=width_inches, height=height_inches)
-                                
-                                # Выравниваем изображение по центру
-                                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                                
-                            finally:
-                                # Удаляем временный файл
-                                os.unlink(temp_file_path)
+                            # Выравниваем изображение по центру
+                            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
                         else:
                             cells[2].text = f"[Ошибка загрузки: {correspondence_item[3]}]"
                             cells[2].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
@@ -1600,122 +1578,63 @@ class ReportGenerator:
             doc.add_paragraph()
 
             # Создаем таблицу с одной колонкой
-            table = doc.add_table(rows=1, cols=1)
+            table = doc.add_table(rows=0, cols=1)
             table.style = 'Table Grid'
             table.allow_autofit = False
             table.width = Inches(6.0)
 
-            # Первая строка - report_33 жирная по центру
-            first_cell = table.rows[0].cells[0]
-            first_cell.text = report_33
-            first_cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-            first_cell.paragraphs[0].runs[0].font.name = 'Times New Roman'
-            first_cell.paragraphs[0].runs[0].font.size = Pt(12)
-            first_cell.paragraphs[0].runs[0].bold = True
-            first_cell.paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.EXACTLY
-            first_cell.paragraphs[0].paragraph_format.line_spacing = Pt(13.8)  # 12pt * 1.15
-
-            # Список для сбора всех минус-слов из всех кампаний
-            all_negative_keywords = []
-
-            # Счетчик для сквозной нумерации кампаний
-            campaign_counter = 1
-
-            # Обрабатываем кампании в том порядке, в котором они пришли из get_campaigns_data_for_report
-            for campaign in keyword_campaigns_list:
-                campaign_id = campaign['campaign_id']
-                
-                # Вторая строка - шаблон с номером кампании и ссылками
-                row = table.add_row()
-                cell = row.cells[0]
-                
-                # Получаем ссылки на проект из кампании
-                landing_pages = campaign.get('landing_pages', [])
-                links_text = ', '.join(landing_pages) if landing_pages else ''
-                
-                cell_text = f"{report_34} {campaign_counter} {report_35} ({links_text}) {report_36}"
-                campaign_counter += 1
-                cell.text = cell_text
-                cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-                cell.paragraphs[0].runs[0].font.name = 'Times New Roman'
-                cell.paragraphs[0].runs[0].font.size = Pt(12)
-                cell.paragraphs[0].runs[0].bold = True
-                cell.paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.EXACTLY
-                cell.paragraphs[0].paragraph_format.line_spacing = Pt(13.8)  # 12pt * 1.15
-
-                # Третья строка - ключевые фразы (каждая в отдельной строке)
-                # Фильтруем ключевые фразы для данной кампании
-                campaign_keywords = []
-                for keyword in keywords:
-                    if (keyword.get('CampaignId') == campaign_id and 
-                        keyword.get('Keyword', '') != "---autotargeting"):
-                        keyword_text = keyword.get('Keyword', '')
-                        if keyword_text:
-                            campaign_keywords.append(keyword_text)
-
-                # Добавляем каждую ключевую фразу в отдельную строку
-                for keyword_text in campaign_keywords:
-                    row = table.add_row()
-                    cell = row.cells[0]
-                    # Убираем кавычки из ключевых фраз
-                    clean_keyword = keyword_text.strip('"')
-                    cell.text = clean_keyword
-                    cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
-                    cell.paragraphs[0].runs[0].font.name = 'Times New Roman'
-                    cell.paragraphs[0].runs[0].font.size = Pt(12)
-                    cell.paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.EXACTLY
-                    cell.paragraphs[0].paragraph_format.line_spacing = Pt(13.8)  # 12pt * 1.15
-
-                # Ищем минус-слова для данной кампании и добавляем в общий список
-                negative_keywords = []
-                campaigns_list = campaigns_json_data.get('result', {}).get('Campaigns', [])
-                for campaign_data in campaigns_list:
-                    if campaign_data.get('Id') == campaign_id:
-                        negative_data = campaign_data.get('NegativeKeywords')
-                        if negative_data and negative_data.get('Items'):
-                            negative_keywords = negative_data['Items']
-                        break
-
-                # Собираем все минус-слова в общий список
-                if negative_keywords:
-                    all_negative_keywords.extend(negative_keywords)
-
-            # После обработки всех кампаний добавляем заголовок минус-слов всегда
-            # Добавляем заголовок report_37
-            row = table.add_row()
-            cell = row.cells[0]
-            cell.text = report_37
-            cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-            cell.paragraphs[0].runs[0].font.name = 'Times New Roman'
-            cell.paragraphs[0].runs[0].font.size = Pt(12)
-            cell.paragraphs[0].runs[0].bold = True
-            cell.paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.EXACTLY
-            cell.paragraphs[0].paragraph_format.line_spacing = Pt(13.8)  # 12pt * 1.15
-
-            # Добавляем минус-слова или прочерк, если их нет
-            if all_negative_keywords:
-                # Добавляем все минус-слова построчно (каждое в отдельной строке)
-                for negative_keyword in all_negative_keywords:
-                    row = table.add_row()
-                    cell = row.cells[0]
-                    # Убираем кавычки из минус-слов
-                    clean_negative = negative_keyword.strip('"')
-                    cell.text = clean_negative
-                    cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
-                    cell.paragraphs[0].runs[0].font.name = 'Times New Roman'
-                    cell.paragraphs[0].runs[0].font.size = Pt(12)
-                    cell.paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.EXACTLY
-                    cell.paragraphs[0].paragraph_format.line_spacing = Pt(13.8)  # 12pt * 1.15
-            else:
-                # Если минус-слов нет, добавляем прочерк
-                row = table.add_row()
-                cell = row.cells[0]
-                cell.text = "-"
-                cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
-                cell.paragraphs[0].runs[0].font.name = 'Times New Roman'
-                cell.paragraphs[0].runs[0].font.size = Pt(12)
-                cell.paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.EXACTLY
-                cell.paragraphs[0].paragraph_format.line_spacing = Pt(13.8)  # 12pt * 1.15
+            # Ключевые фразы по кампаниям (один проход по списку фраз)
+            keywords_by_campaign = {}
+            for keyword in keywords:
+                keyword_text = keyword.get('Keyword', '')
+                if keyword_text and keyword_text != "---autotargeting":
+                    keywords_by_campaign.setdefault(keyword.get('CampaignId'), []).append(keyword_text)
+
+            # Минус-слова по кампаниям
+            negative_keywords_by_campaign = {}
+            for campaign_data in campaigns_json_data.get('result', {}).get('Campaigns', []):
+                negative_data = campaign_data.get('NegativeKeywords')
+                negative_keywords_by_campaign.setdefault(
+                    campaign_data.get('Id'), negative_data.get('Items') if negative_data else None
+                )
+
+            # Межстрочный интервал 12pt * 1.15
+            with TableRowsBuilder(table, line_spacing=Pt(13.8)) as rows:
+                # Первая строка - report_33 жирная по центру
+                rows.add_row([Cell(report_33, WD_ALIGN_PARAGRAPH.CENTER, bold=True)])
+
+                # Список для сбора всех минус-слов из всех кампаний
+                all_negative_keywords = []
+
+                # Обрабатываем кампании в том порядке, в котором они пришли из get_campaigns_data_for_report
+                # (сквозная нумерация кампаний)
+                for campaign_counter, campaign in enumerate(keyword_campaigns_list, 1):
+                    campaign_id = campaign['campaign_id']
+
+                    # Вторая строка - шаблон с номером кампании и ссылками
+                    landing_pages = campaign.get('landing_pages', [])
+                    links_text = ', '.join(landing_pages) if landing_pages else ''
+                    cell_text = f"{report_34} {campaign_counter} {report_35} ({links_text}) {report_36}"
+                    rows.add_row([Cell(cell_text, WD_ALIGN_PARAGRAPH.CENTER, bold=True)])
+
+                    # Третья строка - ключевые фразы (каждая в отдельной строке, без кавычек)
+                    for keyword_text in keywords_by_campaign.get(campaign_id, []):
+                        rows.add_row([Cell(keyword_text.strip('"'))])
+
+                    # Собираем все минус-слова в общий список
+                    negative_keywords = negative_keywords_by_campaign.get(campaign_id)
+                    if negative_keywords:
+                        all_negative_keywords.extend(negative_keywords)
+
+                # После обработки всех кампаний добавляем заголовок минус-слов report_37 всегда
+                rows.add_row([Cell(report_37, WD_ALIGN_PARAGRAPH.CENTER, bold=True)])
+
+                # Минус-слова построчно (без кавычек) или прочерк, если их нет
+                if all_negative_keywords:
+                    for negative_keyword in all_negative_keywords:
+                        rows.add_row([Cell(negative_keyword.strip('"'))])
+                else:
+                    rows.add_row([Cell("-")])
 
         except Exception as e:
             print(f"❌ Ошибка при создании таблицы ключевых фраз: {e}")
@@ -1723,9 +1642,6 @@ class ReportGenerator:
 
     def create_section_9(self, doc: Document, report_data: Dict, report_id: int) -> None:
         """Создать восьмой раздел отчета с изображениями"""
-        import tempfile
-        import requests
-        
         # Получаем тексты из БД
         report_39 = self.get_report_text('report_39')
         report_40 = self.get_report_text('report_40')
@@ -1798,6 +1714,11 @@ class ReportGenerator:
             print("⚠ Нет изображений для отображения")
             return
 
+        # Параллельно загружаем все превью до заполнения таблицы
+        prefetched_images = prefetch_images(
+            ((image['hash'], image['preview_url']) for image in unique_images), variant=PREVIEW
+        )
+
         # Создаем таблицу с изображениями
         table = doc.add_table(rows=len(unique_images), cols=2)
         table.style = 'Table Grid'  # Стиль с видимыми границами
@@ -1844,57 +1765,25 @@ class ReportGenerator:
             # Вторая колонка - изображение
             try:
                 # Загружаем изображение по URL
-                # Хардкод response = requests.get(image['original_url'], timeout=30) Preview
-                response = requests.get(image['preview_url'], timeout=30)
-                if response.status_code == 200:
-                    # Создаем временный файл
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                        temp_file.write(response.content)
-                        temp_file_path = temp_file.name
+                # Хардкод image_cache.get(image['hash'], ORIGINAL, image['original_url']) Preview
+                image_content = prefetched_images.get(image['hash'])
+                if image_content is None:
+                    image_content = get_image_cache().get(image['hash'], PREVIEW, image['preview_url'])
+                if image_content is not None:
+                    # Максимальная высота 100px, квадратные изображения не меньше 80px
+                    width_inches, height_inches = self.image_embedder.fit_size(
+                        image_content, max_height_px=100, min_square_height_px=80
+                    )
                     
-                    try:
-                        # Определяем размеры изображения
-                        with Image.open(temp_file_path) as img:
-                            original_width, original_height = img.size
-                            
-                            # Максимальная высота 100px
-                            max_height_px = 100
-                            # Минимальная высота для квадратных изображений 80px
-                            min_height_px = 80
-                            
-                            # Рассчитываем пропорциональные размеры
-                            if original_height > max_height_px:
-                                # Масштабируем по высоте
-                                scale_factor = max_height_px / original_height
-                                new_width = int(original_width * scale_factor)
-                                new_height = max_height_px
-                            elif original_height < min_height_px and original_width == original_height:
-                                # Для квадратных изображений увеличиваем до минимальной высоты
-                                scale_factor = min_height_px / original_height
-                                new_width = int(original_width * scale_factor)
-                                new_height = min_height_px
-                            else:
-                                # Изображение уже подходящего размера
-                                new_width = original_width
-                                new_height = original_height
-                            
-                            # Конвертируем в дюймы
-                            width_inches = Inches(new_width / 96)  # 96 DPI
-                            height_inches = Inches(new_height / 96)
-                            
-                            # Добавляем изображение в ячейку
-                            paragraph = cells[1].paragraphs[0]
-                            run = paragraph.add_run()
-                            run.add_picture(temp_file_path, width=width_inches, height=height_inches)
-                            
-                            # Выравниваем изображение по центру
-                            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                            
-                    finally:
-                        # Удаляем временный файл
-                        os.unlink(temp_file_path)
+                    # Добавляем изображение в ячейку
+                    paragraph = cells[1].paragraphs[0]
+                    run = paragraph.add_run()
+                    self.image_embedder.add_picture(run, image_content, width=width_inches, height=height_inches)
+                    
+                    # Выравниваем изображение по центру
+                    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
                 else:
-                    cells[1].text = f"[Ошибка загрузки изображения: {response.status_code}]"
+                    cells[1].text = "[Ошибка загрузки изображения]"
                     cells[1].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
                     cells[1].paragraphs[0].runs[0].font.name = 'Times New Roman'
                     cells[1].paragraphs[0].runs[0].font.size = Pt(12)
@@ -1979,29 +1868,16 @@ class ReportGenerator:
         
         print(f"📊 Кампании 'ключи': {len(keyword_campaigns_list)}, 'интересы': {len(interest_campaigns_list)} (пропускаются)")
         
-        # Счетчик для сквозной нумерации кампаний
-        campaign_counter = 1
-        
         # Обрабатываем кампании в том порядке, в котором они пришли из get_campaigns_data_for_report
-        for campaign in keyword_campaigns_list:
-            # Создаем объединенную ячейку для заголовка кампании
-            header_row = table.add_row()
-            
-            # Заголовок кампании - объединяем все 5 ячеек
-            campaign_header = f"{report_48} {campaign_counter} {report_49} ({', '.join(campaign['landing_pages'])}) {report_50}"
-            campaign_counter += 1
-            header_row.cells[0].text = campaign_header
-            header_row.cells[0].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-            header_row.cells[0].paragraphs[0].runs[0].font.name = 'Times New Roman'
-            header_row.cells[0].paragraphs[0].runs[0].font.size = Pt(12)
-            header_row.cells[0].paragraphs[0].runs[0].bold = True
-            
-            # Объединяем ячейки (остальные 4 ячейки объединяем с первой)
-            # Используем метод merge() для объединения ячеек
-            merged_cell = header_row.cells[0].merge(header_row.cells[4])
-
-            # Добавляем строки данных для кампании
-            self._add_campaign_data_rows(table, campaign)
+        # (сквозная нумерация кампаний)
+        with TableRowsBuilder(table, line_spacing=1.0) as rows:
+            for campaign_counter, campaign in enumerate(keyword_campaigns_list, 1):
+                # Заголовок кампании - объединенная ячейка на все 5 колонок
+                campaign_header = f"{report_48} {campaign_counter} {report_49} ({', '.join(campaign['landing_pages'])}) {report_50}"
+                rows.add_row([Cell(campaign_header, WD_ALIGN_PARAGRAPH.CENTER, bold=True, span=5)], line_spacing=None)
+
+                # Добавляем строки данных для кампании
+                self._add_campaign_data_rows(rows, campaign)
         
         # Обрабатываем кампании типа "интересы" - ЗАКОММЕНТИРОВАНО
         # for campaign_num, campaign in enumerate(interest_campaigns, 1):
@@ -2023,15 +1899,8 @@ class ReportGenerator:
         #     # Добавляем строки данных для кампании
         #     self._add_campaign_data_rows(table, campaign)
 
-    def _add_campaign_data_rows(self, table, campaign):
+    def _add_campaign_data_rows(self, rows: TableRowsBuilder, campaign):
         """Добавить строки данных для кампании"""
-        # Получаем тексты из БД для форматирования
-        # report_43 = self.get_report_text('report_43')
-        # report_44 = self.get_report_text('report_44')
-        # report_45 = self.get_report_text('report_45')
-        # report_46 = self.get_report_text('report_46')
-        # report_47 = self.get_report_text('report_47')
-
         # Находим максимальное количество строк для данной кампании
         # Учитываем только столбцы 1, 2, 4, 5 (исключаем столбец 3 - уточнения)
         max_rows = max(
@@ -2040,87 +1909,39 @@ class ReportGenerator:
             len(campaign['sitelinks_descriptions'])
         )
 
+        # Уточнения (report_45) - в первой строке, ячейки ниже объединяются с ней по вертикали
+        callouts = campaign['callouts']
+        merge_callouts = max_rows > 1 and bool(callouts)
+
         # Создаем строки данных только если есть хотя бы одно значение
-        if max_rows > 0:
-            for i in range(max_rows):
-                data_row = table.add_row()
-                cells = data_row.cells
-                
-                # Комбинации заголовок + текст (report_43 и report_44)
-                if i < len(campaign['title_text_combinations']):
-                    combination = campaign['title_text_combinations'][i]
-                    # Разделяем комбинацию на заголовок и текст
-                    if ' | ' in combination:
-                        title, text = combination.split(' | ', 1)
-                        cells[0].text = title  # report_43
-                        cells[1].text = text   # report_44
-                    else:
-                        cells[0].text = combination
-                        cells[1].text = "—"
+        for i in range(max_rows):
+            # Комбинации заголовок + текст (report_43 и report_44)
+            if i < len(campaign['title_text_combinations']):
+                combination = campaign['title_text_combinations'][i]
+                # Разделяем комбинацию на заголовок и текст
+                if ' | ' in combination:
+                    title, text = combination.split(' | ', 1)
                 else:
-                    cells[0].text = "—"
-                    cells[1].text = "—"
-                
-                # Форматирование для заголовков (report_43)
-                cells[0].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
-                cells[0].paragraphs[0].runs[0].font.name = 'Times New Roman'
-                cells[0].paragraphs[0].runs[0].font.size = Pt(12)
-                cells[0].paragraphs[0].paragraph_format.line_spacing = 1.0
-                
-                # Форматирование для текстов (report_44)
-                cells[1].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
-                cells[1].paragraphs[0].runs[0].font.name = 'Times New Roman'
-                cells[1].paragraphs[0].runs[0].font.size = Pt(12)
-                cells[1].paragraphs[0].paragraph_format.line_spacing = 1.0
-                
-                # Уточнения (report_45) - только в первой строке
-                if i == 0 and campaign['callouts']:
-                    # Объединяем все уточнения в одну ячейку с пустыми строками между ними
-                    all_callouts = '\n\n'.join(campaign['callouts'])
-                    cells[2].text = all_callouts
-                elif i == 0:
-                    cells[2].text = "—"
-                else:
-                    # Очищаем ячейку для объединения
-                    cells[2].text = ""
-                
-                # Форматирование для уточнений (report_45)
-                if i == 0:
-                    cells[2].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
-                    cells[2].paragraphs[0].runs[0].font.name = 'Times New Roman'
-                    cells[2].paragraphs[0].runs[0].font.size = Pt(12)
-                    cells[2].paragraphs[0].paragraph_format.line_spacing = 1.0
-                
+                    title, text = combination, "—"
+            else:
+                title, text = "—", "—"
+
+            if i == 0:
+                # Все уточнения в одной ячейке с пустыми строками между ними
+                callouts_cell = Cell('\n\n'.join(callouts) if callouts else "—",
+                                     vmerge='restart' if merge_callouts else None)
+            else:
+                callouts_cell = Cell(vmerge='continue' if merge_callouts else None)
+
+            rows.add_row([
+                Cell(title),
+                Cell(text),
+                callouts_cell,
                 # Заголовки быстрых ссылок (report_46)
-                if i < len(campaign['sitelinks_titles']):
-                    cells[3].text = campaign['sitelinks_titles'][i]
-                else:
-                    cells[3].text = "—"
-                cells[3].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
-                cells[3].paragraphs[0].runs[0].font.name = 'Times New Roman'
-                cells[3].paragraphs[0].runs[0].font.size = Pt(12)
-                cells[3].paragraphs[0].paragraph_format.line_spacing = 1.0
-                
+                Cell(campaign['sitelinks_titles'][i] if i < len(campaign['sitelinks_titles']) else "—"),
                 # Описания быстрых ссылок (report_47)
-                if i < len(campaign['sitelinks_descriptions']):
-                    cells[4].text = campaign['sitelinks_descriptions'][i]
-                else:
-                    cells[4].text = "—"
-                cells[4].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
-                cells[4].paragraphs[0].runs[0].font.name = 'Times New Roman'
-                cells[4].paragraphs[0].runs[0].font.size = Pt(12)
-                cells[4].paragraphs[0].paragraph_format.line_spacing = 1.0
-        
-            # Объединяем ячейки уточнений по вертикали
-            if max_rows > 1 and campaign['callouts']:
-                # Находим строки данных для данной кампании
-                data_rows_start = len(table.rows) - max_rows
-                # Объединяем ячейки уточнений (колонка 2) по вертикали
-                for i in range(1, max_rows):
-                    row_index = data_rows_start + i
-                    if row_index < len(table.rows):
-                        # Объединяем ячейку с предыдущей строкой
-                        table.rows[data_rows_start].cells[2].merge(table.rows[row_index].cells[2])
+                Cell(campaign['sitelinks_descriptions'][i] if i < len(campaign['sitelinks_descriptions']) else "—"),
+            ])
 
     def create_section_9_new(self, doc: Document, report_data: Dict) -> None:
         """Создать девятый раздел отчета"""
@@ -2197,39 +2018,6 @@ class ReportGenerator:
             # return None
             raise e
 
-    def load_campaign_stats(self, report_id: int) -> Optional[Dict]:
-        """Загрузить данные из campaign_stats файла из MinIO"""
-        try:
-            # Формируем имя файла
-            filename = f"campaign_stats_{report_id}.json"
-            return self.load_file_from_minio(report_id, filename)
-        except Exception as e:
-            print(f"❌ Ошибка при загрузке campaign_stats: {e}")
-            # return None
-            raise e
-
-    def load_adgroup_stats(self, report_id: int) -> Optional[Dict]:
-        """Загрузить данные из adgroup_stats файла из MinIO"""
-        try:
-            # Формируем имя файла
-            filename = f"adgroup_stats_{report_id}.json"
-            return self.load_file_from_minio(report_id, filename)
-        except Exception as e:
-            print(f"❌ Ошибка при загрузке adgroup_stats: {e}")
-            # return None
-            raise e
-
-    def load_ad_stats(self, report_id: int) -> Optional[Dict]:
-        """Загрузить данные из ad_stats файла из MinIO"""
-        try:
-            # Формируем имя файла
-            filename = f"ad_stats_{report_id}.json"
-            return self.load_file_from_minio(report_id, filename)
-        except Exception as e:
-            print(f"❌ Ошибка при загрузке ad_stats: {e}")
-            # return None
-            raise e
-
     def load_ads_report(self, report_id: int) -> Optional[Dict]:
         """Загрузить данные из ads_report файла из MinIO"""
         try:
@@ -2252,21 +2040,36 @@ class ReportGenerator:
             # return None
             raise e
 
+    def load_stats_table(self, report_id: int, filename: str) -> Optional[StatsTable]:
+        """
+        Загрузить статистику в колоночном виде: из файла *.cols, а для отчетов,
+        сохраненных без него, - из JSON-файла статистики
+        """
+        folder_path = f"gen_report_context_contracts/data_yandex_direct/{report_id}_результаты"
+        table = load_stats_table(self.minio_client, self.bucket_name, f"{folder_path}/{stats_table_filename(filename)}")
+        if table is not None:
+            print(f"✓ Загружена колоночная статистика {stats_table_filename(filename)}")
+            return table
+
+        data = self.load_file_from_minio(report_id, filename)
+        if not data:
+            return None
+        return StatsTable.from_rows(data.get('result', {}).get('rows', []))
+
     def get_top_ads(self, report_id: int) -> List[Dict]:
         """Получить топ объявлений по кликам с фильтрацией по BounceRate"""
         try:
             # Загружаем данные
-            ad_stats_data = self.load_ad_stats(report_id)
+            ad_stats = self.load_stats_table(report_id, f"ad_stats_{report_id}.json")
             ads_report_data = self.load_ads_report(report_id)
             campaigns_data = self.load_campaigns(report_id)
             
-            if not ad_stats_data or not ads_report_data or not campaigns_data:
+            if ad_stats is None or not ads_report_data or not campaigns_data:
                 print("❌ Не удалось загрузить данные для топ объявлений")
                 return []
             
-            # Получаем объявления из ad_stats
-            ad_stats_rows = ad_stats_data.get('result', {}).get('rows', [])
-            if not ad_stats_rows:
+            # Проверяем наличие объявлений в ad_stats
+            if not len(ad_stats):
                 print("❌ Нет данных объявлений в ad_stats")
                 return []
             
@@ -2280,22 +2083,15 @@ class ReportGenerator:
                 campaigns_dict[campaign['Id']] = campaign
             
             # Фильтруем объявления по BounceRate < 35%
-            filtered_ads = []
-            for ad_stat in ad_stats_rows:
-                bounce_rate = ad_stat.get('BounceRate', 0)
-                if bounce_rate < 35:
-                    filtered_ads.append(ad_stat)
+            filtered_ads = ad_stats.indices_where('BounceRate', 35, inclusive=False)
             
             # Если после фильтрации не осталось объявлений, убираем фильтр
             if not filtered_ads:
                 print("⚠️ После фильтрации по BounceRate < 35% не осталось объявлений, убираем фильтр")
-                filtered_ads = ad_stats_rows
+                filtered_ads = None
             
-            # Сортируем по количеству кликов (по убыванию)
-            filtered_ads.sort(key=lambda x: x.get('Clicks', 0), reverse=True)
-            
-            # Берем топ N объявлений
-            top_ads = filtered_ads[:TOP_ADS_COUNT]
+            # Берем топ N объявлений по количеству кликов (по убыванию)
+            top_ads = ad_stats.records(ad_stats.top_k(TOP_ADS_COUNT, 'Clicks', filtered_ads))
             
             # Обогащаем данными из других файлов
             enriched_ads = []
@@ -2393,15 +2189,15 @@ class ReportGenerator:
             print("❌ Не удалось загрузить данные campaign_stats_summary")
             return
 
-        # Загружаем данные из campaign_stats
-        campaign_stats_data = self.load_campaign_stats(report_id)
-        if not campaign_stats_data:
+        # Загружаем статистику кампаний и групп в колоночном виде (строки отчетов уже
+        # по одной на кампанию / группу и тип площадки - таблицы выводят их без группировки)
+        campaign_stats_table = self.load_stats_table(report_id, f"campaign_stats_{report_id}.json")
+        if campaign_stats_table is None:
             print("❌ Не удалось загрузить данные campaign_stats")
             return
 
-        # Загружаем данные из adgroup_stats
-        adgroup_stats_data = self.load_adgroup_stats(report_id)
-        if not adgroup_stats_data:
+        adgroup_stats_table = self.load_stats_table(report_id, f"adgroup_stats_{report_id}.json")
+        if adgroup_stats_table is None:
             print("❌ Не удалось загрузить данные adgroup_stats")
             return
 
@@ -2573,7 +2369,7 @@ class ReportGenerator:
         run.font.size = Pt(12)
 
         # 9. Создаем таблицу с данными кампаний
-        campaigns_rows = campaign_stats_data.get('result', {}).get('rows', [])
+        campaigns_rows = campaign_stats_table.records()
         if campaigns_rows:
             # Создаем таблицу с заголовками + данные + итоговая строка
             table = doc.add_table(rows=1, cols=7)
@@ -2603,114 +2399,35 @@ class ReportGenerator:
                 header_cells[i].paragraphs[0].runs[0].bold = True
                 header_cells[i].paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
 
-            # Добавляем данные кампаний
-            for i, campaign in enumerate(campaigns_rows, 1):
-                row = table.add_row()
-                cells = row.cells
-                
-                # 1. Номер (сквозная нумерация)
-                cells[0].text = str(i)
-                cells[0].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-                cells[0].paragraphs[0].runs[0].font.name = 'Times New Roman'
-                cells[0].paragraphs[0].runs[0].font.size = Pt(12)
-                cells[0].paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                
-                # 2. CampaignName
-                cells[1].text = campaign.get('CampaignName', '')
-                cells[1].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.LEFT
-                cells[1].paragraphs[0].runs[0].font.name = 'Times New Roman'
-                cells[1].paragraphs[0].runs[0].font.size = Pt(12)
-                cells[1].paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                
-                # 3. CampaignId
-                cells[2].text = str(campaign.get('CampaignId', ''))
-                cells[2].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-                cells[2].paragraphs[0].runs[0].font.name = 'Times New Roman'
-                cells[2].paragraphs[0].runs[0].font.size = Pt(12)
-                cells[2].paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                
-                # 4. Impressions
-                impressions = campaign.get('Impressions', 0)
-                cells[3].text = self.format_number_with_spaces(impressions)
-                cells[3].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-                cells[3].paragraphs[0].runs[0].font.name = 'Times New Roman'
-                cells[3].paragraphs[0].runs[0].font.size = Pt(12)
-                cells[3].paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                
-                # 5. Clicks
-                clicks = campaign.get('Clicks', 0)
-                cells[4].text = self.format_number_with_spaces(clicks)
-                cells[4].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-                cells[4].paragraphs[0].runs[0].font.name = 'Times New Roman'
-                cells[4].paragraphs[0].runs[0].font.size = Pt(12)
-                cells[4].paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                
-                # 6. Ctr
-                ctr = campaign.get('Ctr', 0)
-                cells[5].text = self.format_number_with_spaces(ctr)
-                cells[5].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-                cells[5].paragraphs[0].runs[0].font.name = 'Times New Roman'
-                cells[5].paragraphs[0].runs[0].font.size = Pt(12)
-                cells[5].paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                
-                # 7. BounceRate
-                bounce_rate = campaign.get('BounceRate', 0)
-                cells[6].text = self.format_number_with_spaces(bounce_rate)
-                cells[6].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-                cells[6].paragraphs[0].runs[0].font.name = 'Times New Roman'
-                cells[6].paragraphs[0].runs[0].font.size = Pt(12)
-                cells[6].paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-
-            # Добавляем итоговую строку
-            total_row = table.add_row()
-            cells = total_row.cells
-            
-            # Объединяем первые 3 ячейки для report_74
-            cells[0].text = report_74
-            cells[0].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-            cells[0].paragraphs[0].runs[0].font.name = 'Times New Roman'
-            cells[0].paragraphs[0].runs[0].font.size = Pt(12)
-            cells[0].paragraphs[0].runs[0].bold = True
-            cells[0].paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-            
-            # Объединяем ячейки 0, 1, 2
-            merged_cell = cells[0].merge(cells[2])
-            
-            # 4. Impressions из summary
-            summary_impressions = campaign_stats.get('summary', {}).get('Impressions', 0)
-            cells[3].text = self.format_number_with_spaces(summary_impressions)
-            cells[3].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-            cells[3].paragraphs[0].runs[0].font.name = 'Times New Roman'
-            cells[3].paragraphs[0].runs[0].font.size = Pt(12)
-            cells[3].paragraphs[0].runs[0].bold = True
-            cells[3].paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-            
-            # 5. Clicks из summary
-            summary_clicks = campaign_stats.get('summary', {}).get('Clicks', 0)
-            cells[4].text = self.format_number_with_spaces(summary_clicks)
-            cells[4].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-            cells[4].paragraphs[0].runs[0].font.name = 'Times New Roman'
-            cells[4].paragraphs[0].runs[0].font.size = Pt(12)
-            cells[4].paragraphs[0].runs[0].bold = True
-            cells[4].paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-            
-            # 6. Ctr из summary
-            summary_ctr = campaign_stats.get('summary', {}).get('Ctr', 0)
-            cells[5].text = self.format_number_with_spaces(summary_ctr)
-            cells[5].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-            cells[5].paragraphs[0].runs[0].font.name = 'Times New Roman'
-            cells[5].paragraphs[0].runs[0].font.size = Pt(12)
-            cells[5].paragraphs[0].runs[0].bold = True
-            cells[5].paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-            
-            # 7. BounceRate из summary
-            summary_bounce_rate = campaign_stats.get('summary', {}).get('BounceRate', 0)
-            cells[6].text = self.format_number_with_spaces(summary_bounce_rate)
-            cells[6].paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
-            cells[6].paragraphs[0].runs[0].font.name = 'Times New Roman'
-            cells[6].paragraphs[0].runs[0].font.size = Pt(12)
-            cells[6].paragraphs[0].runs[0].bold = True
-            cells[6].paragraphs[0].paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
+            # Добавляем данные кампаний и итоговую строку (одинарный интервал)
+            summary = campaign_stats.get('summary', {})
+            with TableRowsBuilder(table, line_spacing=1.0) as rows:
+                for i, campaign in enumerate(campaigns_rows, 1):
+                    rows.add_row([
+                        # 1. Номер (сквозная нумерация)
+                        Cell(str(i), WD_ALIGN_PARAGRAPH.CENTER),
+                        # 2. CampaignName
+                        Cell(campaign.get('CampaignName', '')),
+                        # 3. CampaignId
+                        Cell(str(campaign.get('CampaignId', '')), WD_ALIGN_PARAGRAPH.CENTER),
+                        # 4. Impressions
+                        Cell(self.format_number_with_spaces(campaign.get('Impressions', 0)), WD_ALIGN_PARAGRAPH.CENTER),
+                        # 5. Clicks
+                        Cell(self.format_number_with_spaces(campaign.get('Clicks', 0)), WD_ALIGN_PARAGRAPH.CENTER),
+                        # 6. Ctr
+                        Cell(self.format_number_with_spaces(campaign.get('Ctr', 0)), WD_ALIGN_PARAGRAPH.CENTER),
+                        # 7. BounceRate
+                        Cell(self.format_number_with_spaces(campaign.get('BounceRate', 0)), WD_ALIGN_PARAGRAPH.CENTER),
+                    ])
+
+                # Итоговая строка: report_74 в объединенных ячейках 0-2, значения из summary
+                rows.add_row([
+                    Cell(report_74, WD_ALIGN_PARAGRAPH.CENTER, bold=True, span=3),
+                    Cell(self.format_number_with_spaces(summary.get('Impressions', 0)), WD_ALIGN_PARAGRAPH.CENTER, bold=True),
+                    Cell(self.format_number_with_spaces(summary.get('Clicks', 0)), WD_ALIGN_PARAGRAPH.CENTER, bold=True),
+                    Cell(self.format_number_with_spaces(summary.get('Ctr', 0)), WD_ALIGN_PARAGRAPH.CENTER, bold=True),
+                    Cell(self.format_number_with_spaces(summary.get('BounceRate', 0)), WD_ALIGN_PARAGRAPH.CENTER, bold=True),
+                ])
 
         # 10. report_75 под таблицей слева жирным
         p = doc.add_paragraph()
@@ -2729,27 +2446,17 @@ class ReportGenerator:
                 image_path = f"gen_report_context_contracts/data_yandex_direct/{report_id}_результаты/screenshots/url_1/screenshot_{screenshot_counter:03d}.png"
                 
                 # Загружаем изображение из MinIO (silent=True, чтобы не выводить ошибку для несуществующих файлов)
-                image_data = self.load_image_from_minio(image_path, silent=True)
+                image_data = self.load_screenshot(report_id, 1, screenshot_counter)
                 
                 if image_data:
-                    # Создаем временный файл для изображения
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
-                        temp_file.write(image_data)
-                        temp_file_path = temp_file.name
+                    # Добавляем изображение в документ
+                    paragraph = doc.add_paragraph()
+                    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                    run = paragraph.add_run()
+                    # Вставляем изображение с максимальной шириной, Word автоматически подберет высоту
+                    self.image_embedder.add_picture(run, image_data, width=Inches(6.0))
                     
-                    try:
-                        # Добавляем изображение в документ
-                        paragraph = doc.add_paragraph()
-                        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        run = paragraph.add_run()
-                        # Вставляем изображение с максимальной шириной, Word автоматически подберет высоту
-                        run.add_picture(temp_file_path, width=Inches(6.0))
-                        
-                        print(f"✅ Загружен скриншот: screenshot_{screenshot_counter:03d}.png")
-                        
-                    finally:
-                        # Удаляем временный файл
-                        os.unlink(temp_file_path)
+                    print(f"✅ Загружен скриншот: screenshot_{screenshot_counter:03d}.png")
                     
                     screenshot_counter += 1
                 else:
@@ -2777,7 +2484,7 @@ class ReportGenerator:
         doc.add_paragraph()
 
         # 14. Создаем таблицу с данными групп объявлений
-        adgroup_rows = adgroup_stats_data.get('result', {}).get('rows', [])
+        adgroup_rows = adgroup_stats_table.records()
         if adgroup_rows:
             # Создаем таблицу с заголовками + данные + итоговая строка
             table = doc.add_table(rows=1, cols=9)
@@ -2851,187 +2558,46 @@ class ReportGenerator:
                 # Вертикальное выравнивание по центру
                 header_cells[i].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
 
-            # Добавляем данные групп объявлений
-            for i, adgroup in enumerate(adgroup_rows, 1):
-                row = table.add_row()
-                cells = row.cells
-                
-                # 1. Номер (сквозная нумерация)
-                paragraph = cells[0].paragraphs[0]
-                paragraph.text = str(i)
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                run = paragraph.runs[0]
-                run.font.name = 'Times New Roman'
-                run.font.size = Pt(12)
-                cells[0].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                
-                # 2. Проверяем CampaignType
-                campaign_type = adgroup.get('CampaignType', '')
-                paragraph = cells[1].paragraphs[0]
-                if campaign_type == 'TEXT_CAMPAIGN':
-                    paragraph.text = report_77
-                else:
-                    paragraph.text = ''
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                if paragraph.runs:
-                    run = paragraph.runs[0]
-                    run.font.name = 'Times New Roman'
-                    run.font.size = Pt(12)
-                cells[1].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                
-                # 3. AdGroupName
-                paragraph = cells[2].paragraphs[0]
-                paragraph.text = adgroup.get('AdGroupName', '')
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                if paragraph.runs:
-                    run = paragraph.runs[0]
-                    run.font.name = 'Times New Roman'
-                    run.font.size = Pt(12)
-                cells[2].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                
-                # 4. Всегда пишем report_87
-                paragraph = cells[3].paragraphs[0]
-                paragraph.text = report_87
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                run = paragraph.runs[0]
-                run.font.name = 'Times New Roman'
-                run.font.size = Pt(12)
-                cells[3].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                
-                # 5. Проверяем AdNetworkType
-                ad_network_type = adgroup.get('AdNetworkType', '')
-                paragraph = cells[4].paragraphs[0]
-                if ad_network_type == 'SEARCH':
-                    paragraph.text = report_88
-                elif ad_network_type == 'AD_NETWORK':
-                    paragraph.text = report_89
-                else:
-                    paragraph.text = ''
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                if paragraph.runs:
-                    run = paragraph.runs[0]
-                    run.font.name = 'Times New Roman'
-                    run.font.size = Pt(12)
-                cells[4].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                
-                # 6. Clicks
-                clicks = adgroup.get('Clicks', 0)
-                paragraph = cells[5].paragraphs[0]
-                paragraph.text = self.format_number_with_spaces(clicks)
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                run = paragraph.runs[0]
-                run.font.name = 'Times New Roman'
-                run.font.size = Pt(12)
-                cells[5].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                
-                # 7. Cost (переводим из микрорублей в рубли и дополнительно делим на 10)
-                cost = adgroup.get('Cost', 0)
-                cost_in_rubles = cost / 1000000.0
-                paragraph = cells[6].paragraphs[0]
-                paragraph.text = self.format_number_with_two_decimals(cost_in_rubles)
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                run = paragraph.runs[0]
-                run.font.name = 'Times New Roman'
-                run.font.size = Pt(12)
-                cells[6].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                
-                # 8. BounceRate
-                bounce_rate = adgroup.get('BounceRate', 0)
-                paragraph = cells[7].paragraphs[0]
-                paragraph.text = self.format_number_with_spaces(bounce_rate)
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                run = paragraph.runs[0]
-                run.font.name = 'Times New Roman'
-                run.font.size = Pt(12)
-                cells[7].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-                
-                # 9. AvgCpc (переводим из микрорублей в рубли и дополнительно делим на 10)
-                avg_cpc = adgroup.get('AvgCpc', 0)
-                avg_cpc_in_rubles = avg_cpc / 1000000.0
-                paragraph = cells[8].paragraphs[0]
-                paragraph.text = self.format_number_with_two_decimals(avg_cpc_in_rubles)
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-                run = paragraph.runs[0]
-                run.font.name = 'Times New Roman'
-                run.font.size = Pt(12)
-                cells[8].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-
-            # Добавляем итоговую строку из campaign_stats_summary
-            total_row = table.add_row()
-            cells = total_row.cells
-            
-            # Объединяем первые 5 ячеек для report_90
-            paragraph = cells[0].paragraphs[0]
-            paragraph.text = report_90
-            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-            run = paragraph.runs[0]
-            run.font.name = 'Times New Roman'
-            run.font.size = Pt(12)
-            run.bold = True
-            cells[0].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-            
-            # Объединяем ячейки 0-4
-            merged_cell = cells[0].merge(cells[4])
-            
-            # 6. Clicks из summary
-            summary_clicks = campaign_stats.get('summary', {}).get('Clicks', 0)
-            paragraph = cells[5].paragraphs[0]
-            paragraph.text = self.format_number_with_spaces(summary_clicks)
-            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-            run = paragraph.runs[0]
-            run.font.name = 'Times New Roman'
-            run.font.size = Pt(12)
-            run.bold = True
-            cells[5].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-            
-            # 7. Cost из summary (переводим из микрорублей в рубли и дополнительно делим на 10)
-            summary_cost = campaign_stats.get('summary', {}).get('Cost', 0)
-            summary_cost_in_rubles = summary_cost / 1000000.0
-            paragraph = cells[6].paragraphs[0]
-            paragraph.text = self.format_number_with_two_decimals(summary_cost_in_rubles)
-            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-            run = paragraph.runs[0]
-            run.font.name = 'Times New Roman'
-            run.font.size = Pt(12)
-            run.bold = True
-            cells[6].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-            
-            # 8. BounceRate из summary
-            summary_bounce_rate = campaign_stats.get('summary', {}).get('BounceRate', 0)
-            paragraph = cells[7].paragraphs[0]
-            paragraph.text = self.format_number_with_spaces(summary_bounce_rate)
-            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-            run = paragraph.runs[0]
-            run.font.name = 'Times New Roman'
-            run.font.size = Pt(12)
-            run.bold = True
-            cells[7].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
-            
-            # 9. AvgCpc из summary (переводим из микрорублей в рубли и дополнительно делим на 10)
-            summary_avg_cpc = campaign_stats.get('summary', {}).get('AvgCpc', 0)
-            summary_avg_cpc_in_rubles = summary_avg_cpc / 1000000.0
-            paragraph = cells[8].paragraphs[0]
-            paragraph.text = self.format_number_with_two_decimals(summary_avg_cpc_in_rubles)
-            paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-            paragraph.paragraph_format.line_spacing_rule = WD_LINE_SPACING.SINGLE
-            run = paragraph.runs[0]
-            run.font.name = 'Times New Roman'
-            run.font.size = Pt(12)
-            run.bold = True
-            cells[8].vertical_alignment = WD_ALIGN_VERTICAL.CENTER
+            # Добавляем данные групп объявлений и итоговую строку
+            # (одинарный интервал, вертикальное выравнивание по центру)
+            network_texts = {'SEARCH': report_88, 'AD_NETWORK': report_89}
+            summary = campaign_stats.get('summary', {})
+            with TableRowsBuilder(table, line_spacing=1.0, vertical_center=True) as rows:
+                for i, adgroup in enumerate(adgroup_rows, 1):
+                    rows.add_row([
+                        # 1. Номер (сквозная нумерация)
+                        Cell(str(i), WD_ALIGN_PARAGRAPH.CENTER),
+                        # 2. Тип кампании
+                        Cell(report_77 if adgroup.get('CampaignType', '') == 'TEXT_CAMPAIGN' else '',
+                             WD_ALIGN_PARAGRAPH.CENTER),
+                        # 3. AdGroupName
+                        Cell(adgroup.get('AdGroupName', ''), WD_ALIGN_PARAGRAPH.CENTER),
+                        # 4. Всегда пишем report_87
+                        Cell(report_87, WD_ALIGN_PARAGRAPH.CENTER),
+                        # 5. AdNetworkType
+                        Cell(network_texts.get(adgroup.get('AdNetworkType', ''), ''), WD_ALIGN_PARAGRAPH.CENTER),
+                        # 6. Clicks
+                        Cell(self.format_number_with_spaces(adgroup.get('Clicks', 0)), WD_ALIGN_PARAGRAPH.CENTER),
+                        # 7. Cost (переводим из микрорублей в рубли)
+                        Cell(self.format_number_with_two_decimals(adgroup.get('Cost', 0) / 1000000.0),
+                             WD_ALIGN_PARAGRAPH.CENTER),
+                        # 8. BounceRate
+                        Cell(self.format_number_with_spaces(adgroup.get('BounceRate', 0)), WD_ALIGN_PARAGRAPH.CENTER),
+                        # 9. AvgCpc (переводим из микрорублей в рубли)
+                        Cell(self.format_number_with_two_decimals(adgroup.get('AvgCpc', 0) / 1000000.0),
+                             WD_ALIGN_PARAGRAPH.CENTER),
+                    ])
+
+                # Итоговая строка из campaign_stats_summary: report_90 в объединенных ячейках 0-4
+                rows.add_row([
+                    Cell(report_90, WD_ALIGN_PARAGRAPH.CENTER, bold=True, span=5),
+                    Cell(self.format_number_with_spaces(summary.get('Clicks', 0)), WD_ALIGN_PARAGRAPH.CENTER, bold=True),
+                    Cell(self.format_number_with_two_decimals(summary.get('Cost', 0) / 1000000.0),
+                         WD_ALIGN_PARAGRAPH.CENTER, bold=True),
+                    Cell(self.format_number_with_spaces(summary.get('BounceRate', 0)), WD_ALIGN_PARAGRAPH.CENTER, bold=True),
+                    Cell(self.format_number_with_two_decimals(summary.get('AvgCpc', 0) / 1000000.0),
+                         WD_ALIGN_PARAGRAPH.CENTER, bold=True),
+                ])
 
         # 16. report_91 слева жирным
         p = doc.add_paragraph()
@@ -3052,29 +2618,19 @@ class ReportGenerator:
                 image_path = f"{screenshots_folder}screenshot_{screenshot_index:03d}.png"
                 
                 # Загружаем изображение из MinIO (silent=True, чтобы не выводить ошибку для несуществующих файлов)
-                image_data = self.load_image_from_minio(image_path, silent=True)
+                image_data = self.load_screenshot(report_id, 2, screenshot_index)
                 
                 if image_data:
                     # Добавляем отступ перед скриншотом (начиная со второго)
                     if screenshot_index > 1:
                         doc.add_paragraph()
                     
-                    # Создаем временный файл для изображения
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
-                        temp_file.write(image_data)
-                        temp_file_path = temp_file.name
-                    
-                    try:
-                        # Добавляем изображение в документ
-                        paragraph = doc.add_paragraph()
-                        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        run = paragraph.add_run()
-                        # Вставляем изображение с максимальной шириной 6.0 дюймов (как для url_1)
-                        run.add_picture(temp_file_path, width=Inches(6.0))
-                            
-                    finally:
-                        # Удаляем временный файл
-                        os.unlink(temp_file_path)
+                    # Добавляем изображение в документ
+                    paragraph = doc.add_paragraph()
+                    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                    run = paragraph.add_run()
+                    # Вставляем изображение с максимальной шириной 6.0 дюймов (как для url_1)
+                    self.image_embedder.add_picture(run, image_data, width=Inches(6.0))
                     
                     screenshot_index += 1
                 else:
@@ -3184,28 +2740,18 @@ class ReportGenerator:
                 image_path = f"{screenshots_folder}screenshot_{screenshot_index:03d}.png"
                 
                 # Загружаем изображение из MinIO (silent=True, чтобы не выводить ошибку для несуществующих файлов)
-                image_data = self.load_image_from_minio(image_path, silent=True)
+                image_data = self.load_screenshot(report_id, 3, screenshot_index)
                 
                 if image_data:
-                    # Создаем временный файл для изображения
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
-                        temp_file.write(image_data)
-                        temp_file_path = temp_file.name
+                    # Добавляем изображение в документ
+                    paragraph = doc.add_paragraph()
+                    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                    run = paragraph.add_run()
+                    # Вставляем изображение с максимальной шириной 6.0 дюймов
+                    self.image_embedder.add_picture(run, image_data, width=Inches(6.0))
                     
-                    try:
-                        # Добавляем изображение в документ
-                        paragraph = doc.add_paragraph()
-                        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        run = paragraph.add_run()
-                        # Вставляем изображение с максимальной шириной 6.0 дюймов
-                        run.add_picture(temp_file_path, width=Inches(6.0))
-                        
-                        # Добавляем небольшой отступ после каждого скриншота
-                        doc.add_paragraph()
-                            
-                    finally:
-                        # Удаляем временный файл
-                        os.unlink(temp_file_path)
+                    # Добавляем небольшой отступ после каждого скриншота
+                    doc.add_paragraph()
                     
                     screenshot_index += 1
                 else:
@@ -3510,44 +3056,14 @@ class ReportGenerator:
                 image_data = self.load_image_from_minio(image_path, silent=True)
                 
                 if image_data:
-                    # Создаем временный файл для изображения
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
-                        temp_file.write(image_data)
-                        temp_file_path = temp_file.name
+                    # Добавляем изображение в ячейку с ограничением по высоте
+                    paragraph = image_cell.paragraphs[0]
+                    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                    run = paragraph.add_run()
                     
-                    try:
-                        # Добавляем изображение в ячейку с ограничением по высоте
-                        paragraph = image_cell.paragraphs[0]
-                        paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        run = paragraph.add_run()
-                        
-                        # Определяем размеры изображения и масштабируем
-                        with Image.open(temp_file_path) as img:
-                            original_width, original_height = img.size
-                            
-                            # Максимальная высота 300px
-                            max_height_px = 300
-                            
-                            # Рассчитываем пропорциональные размеры
-                            if original_height > max_height_px:
-                                # Масштабируем по высоте
-                                scale_factor = max_height_px / original_height
-                                new_width = int(original_width * scale_factor)
-                                new_height = max_height_px
-                                
-                                # Конвертируем в дюймы
-                                width_inches = Inches(new_width / 96)  # 96 DPI
-                                height_inches = Inches(new_height / 96)
-                            else:
-                                # Изображение уже подходящего размера
-                                width_inches = Inches(original_width / 96)
-                                height_inches = Inches(original_height / 96)
-                            
-                            # Добавляем изображение с рассчитанными размерами
-                            run.add_picture(temp_file_path, width=width_inches, height=height_inches)
-                    finally:
-                        # Удаляем временный файл
-                        os.unlink(temp_file_path)
+                    # Максимальная высота 300px
+                    width_inches, height_inches = self.image_embedder.fit_size(image_data, max_height_px=300)
+                    self.image_embedder.add_picture(run, image_data, width=width_inches, height=height_inches)
                 else:
                     # Если изображение не найдено, выводим сообщение
                     paragraph = image_cell.paragraphs[0]
@@ -3621,31 +3137,138 @@ class ReportGenerator:
             image_path = f"{screenshots_folder}screenshot_{screenshot_index:03d}.png"
             
             # Загружаем изображение из MinIO (silent=True, чтобы не выводить ошибку для несуществующих файлов)
-            image_data = self.load_image_from_minio(image_path, silent=True)
+            image_data = self.load_screenshot(report_id, 4, screenshot_index)
             
             if image_data:
-                # Создаем временный файл для изображения
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
-                    temp_file.write(image_data)
-                    temp_file_path = temp_file.name
+                # Добавляем изображение в документ
+                paragraph = doc.add_paragraph()
+                paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+                run = paragraph.add_run()
+                # Вставляем изображение с максимальной шириной 6.0 дюймов
+                self.image_embedder.add_picture(run, image_data, width=Inches(6.0))
                 
-                try:
-                    # Добавляем изображение в документ
-                    paragraph = doc.add_paragraph()
-                    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                    run = paragraph.add_run()
-                    # Вставляем изображение с максимальной шириной 6.0 дюймов
-                    run.add_picture(temp_file_path, width=Inches(6.0))
-                    
-                    print(f"✅ Загружен скриншот: screenshot_{screenshot_index:03d}.png")
-                    
-                finally:
-                    # Удаляем временный файл
-                    os.unlink(temp_file_path)
+                print(f"✅ Загружен скриншот: screenshot_{screenshot_index:03d}.png")
             else:
                 # Если файл не найден, это нормально - просто файлы закончились
                 break
 
+    def create_base_document(self) -> Document:
+        """Создать пустой документ со стилем по умолчанию, полями и нумерацией страниц"""
+        doc = Document()
+
+        # Настраиваем стиль по умолчанию
+        style = doc.styles['Normal']
+        style.font.name = 'Times New Roman'
+        style.font.size = Pt(12)
+        style.paragraph_format.line_spacing_rule = WD_LINE_SPACING.ONE_POINT_FIVE
+
+        # Настраиваем поля страницы (2.5 см со всех сторон)
+        sections = doc.sections
+        for section in sections:
+            section.top_margin = Inches(1)
+            section.bottom_margin = Inches(1)
+            section.left_margin = Inches(1)
+            section.right_margin = Inches(1)
+
+        # Добавляем нумерацию страниц в правый нижний угол
+        for section in sections:
+            # Включаем разные колонтитулы для первой страницы
+            section.different_first_page_header_footer = True
+            
+            # Основной колонтитул (для всех страниц кроме первой)
+            footer = section.footer
+            paragraph = footer.paragraphs[0]
+            paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
+            
+            # Добавляем поле номера страницы
+            fldChar1 = OxmlElement('w:fldChar')
+            fldChar1.set(qn('w:fldCharType'), 'begin')
+            run = paragraph.add_run()
+            run._r.append(fldChar1)
+            
+            instrText = OxmlElement('w:instrText')
+            instrText.text = "PAGE"
+            run._r.append(instrText)
+            
+            fldChar2 = OxmlElement('w:fldChar')
+            fldChar2.set(qn('w:fldCharType'), 'end')
+            run._r.append(fldChar2)
+            
+            # Колонтитул первой страницы остается пустым
+            first_page_footer = section.first_page_footer
+            if first_page_footer.paragraphs:
+                first_page_footer.paragraphs[0].clear()
+
+        return doc
+
+    def _load_template(self) -> Document:
+        """Новый документ из шаблона (шаблон формируется один раз на процесс)"""
+        global _template_data
+        with _template_lock:
+            if _template_data is None:
+                file = io.BytesIO()
+                self.create_base_document().save(file)
+                _template_data = file.getvalue()
+        return Document(io.BytesIO(_template_data))
+
+    def _static_sections_key(self, report_data: Dict, texts_version: str) -> str:
+        """Ключ разделов 1-5: версия текстов отчета и значения полей, от которых они зависят"""
+        fields = {field: report_data.get(field) for field in STATIC_SECTION_FIELDS}
+        payload = json.dumps([texts_version, fields], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _add_static_sections(self, doc: Document, report_data: Dict) -> None:
+        """Разделы, зависящие только от данных контракта/заявки и текстов отчета"""
+        self.create_section_1(doc, report_data)  # Первый раздел
+        self.create_section_2(doc, report_data)  # Таблица в первом разделе
+        self.create_section_3(doc)  # Второй раздел с содержанием
+        self.create_section_4(doc, report_data)  # Третий раздел с таблицей терминов
+        self.create_section_5(doc, report_data)  # Четвертый раздел
+
+    def create_document_with_static_sections(self, report_data: Dict) -> Document:
+        """
+        Документ с оформлением и разделами 1-5.
+        При REPORT_TEMPLATE_CACHE документ собирается из шаблона процесса, а готовые разделы 1-5
+        берутся из кэша для отчетов с теми же данными контракта/заявки - каждый раз
+        формируются только разделы, зависящие от данных отчета
+        """
+        if not REPORT_TEMPLATE_CACHE:
+            doc = self.create_base_document()
+            self._add_static_sections(doc, report_data)
+            return doc
+
+        texts, texts_version = self._get_report_texts_version()
+        if texts_version is None:
+            # Тексты не загрузились - разделы без них в кэш не попадают
+            print("⚠️ Тексты отчета не загружены, разделы 1-5 формируются без кэша")
+            doc = self._load_template()
+            self._add_static_sections(doc, report_data)
+            return doc
+
+        key = self._static_sections_key(report_data, texts_version)
+        with _static_sections_lock:
+            data = _static_sections.get(key)
+            if data is not None:
+                _static_sections.move_to_end(key)
+        if data is not None:
+            print("📄 Разделы 1-5 взяты из кэша шаблона")
+            return Document(io.BytesIO(data))
+
+        doc = self._load_template()
+        # Разделы формируются по тем же текстам, по версии которых построен ключ
+        self._pinned_texts = texts
+        try:
+            self._add_static_sections(doc, report_data)
+        finally:
+            self._pinned_texts = None
+        file = io.BytesIO()
+        doc.save(file)
+        with _static_sections_lock:
+            _static_sections[key] = file.getvalue()
+            while len(_static_sections) > REPORT_STATIC_CACHE_SIZE:
+                _static_sections.popitem(last=False)
+        return doc
+
     def create_report(self, report_id: int) -> bool:
         """Создать отчет в формате Word"""
         try:
@@ -3655,58 +3278,10 @@ class ReportGenerator:
                 print(f"❌ Не удалось получить данные отчета {report_id}")
                 return False
 
-            # Создаем новый документ
-            doc = Document()
-
-            # Настраиваем стиль по умолчанию
-            style = doc.styles['Normal']
-            style.font.name = 'Times New Roman'
-            style.font.size = Pt(12)
-            style.paragraph_format.line_spacing_rule = WD_LINE_SPACING.ONE_POINT_FIVE
-
-            # Настраиваем поля страницы (2.5 см со всех сторон)
-            sections = doc.sections
-            for section in sections:
-                section.top_margin = Inches(1)
-                section.bottom_margin = Inches(1)
-                section.left_margin = Inches(1)
-                section.right_margin = Inches(1)
-
-            # Добавляем нумерацию страниц в правый нижний угол
-            for section in sections:
-                # Включаем разные колонтитулы для первой страницы
-                section.different_first_page_header_footer = True
-                
-                # Основной колонтитул (для всех страниц кроме первой)
-                footer = section.footer
-                paragraph = footer.paragraphs[0]
-                paragraph.alignment = WD_ALIGN_PARAGRAPH.RIGHT
-                
-                # Добавляем поле номера страницы
-                fldChar1 = OxmlElement('w:fldChar')
-                fldChar1.set(qn('w:fldCharType'), 'begin')
-                run = paragraph.add_run()
-                run._r.append(fldChar1)
-                
-                instrText = OxmlElement('w:instrText')
-                instrText.text = "PAGE"
-                run._r.append(instrText)
-                
-                fldChar2 = OxmlElement('w:fldChar')
-                fldChar2.set(qn('w:fldCharType'), 'end')
-                run._r.append(fldChar2)
-                
-                # Колонтитул первой страницы остается пустым
-                first_page_footer = section.first_page_footer
-                if first_page_footer.paragraphs:
-                    first_page_footer.paragraphs[0].clear()
-
-            # Создаем разделы
-            self.create_section_1(doc, report_data)  # Первый раздел
-            self.create_section_2(doc, report_data)  # Таблица в первом разделе
-            self.create_section_3(doc)  # Второй раздел с содержанием
-            self.create_section_4(doc, report_data)  # Третий раздел с таблицей терминов
-            self.create_section_5(doc, report_data)  # Четвертый раздел
+            # Создаем документ: шаблон и разделы 1-5 (из кэша процесса, если они уже формировались)
+            doc = self.create_document_with_static_sections(report_data)
+            self.image_embedder = DocxImageEmbedder()
+
             self.create_section_6(doc, report_data)  # Пятый раздел
             self.create_section_7(doc, report_data)  # Шестой раздел
             self.create_section_8(doc, report_data)  # Седьмой раздел
@@ -3840,18 +3415,17 @@ class ReportGenerator:
         # 3. Получаем данные кампаний для поиска кампании с наибольшим количеством кликов
         try:
             # Загружаем данные кампаний
-            campaign_stats_data = self.load_file_from_minio(report_id, f"campaign_stats_{report_id}.json")
-            if not campaign_stats_data:
+            campaign_stats = self.load_stats_table(report_id, f"campaign_stats_{report_id}.json")
+            if campaign_stats is None:
                 print("❌ Не удалось загрузить данные кампаний")
                 return
 
-            campaigns_rows = campaign_stats_data.get('result', {}).get('rows', [])
-            if not campaigns_rows:
+            if not len(campaign_stats):
                 print("❌ Нет данных о кампаниях")
                 return
 
             # Находим кампанию с наибольшим количеством кликов
-            max_clicks_campaign = max(campaigns_rows, key=lambda x: x.get('Clicks', 0))
+            max_clicks_campaign = campaign_stats.record(campaign_stats.argmax('Clicks'))
             
             # Извлекаем данные кампании
             campaign_id = max_clicks_campaign.get('CampaignId', '')
@@ -10,7 +10,7 @@ import traceback
 from zipfile import ZipFile
 
 import psycopg2
-from minio import Minio
+from minio_factory import get_minio
 from dotenv import load_dotenv
 from typing import Dict, List, Optional, Any
 from PIL import Image, ImageDraw, ImageFont
@@ -23,6 +23,9 @@ import base64
 
 
 from generate_report_files.screen_ads.postprocess import create_and_packaging_zip, html_remove
+from utils.image_cache import get_image_cache, ORIGINAL
+from artifact_codec import decode_json
+from report_index import ReportIndex, get_report_index
 
 # Загружаем переменные окружения
 load_dotenv('.env')
@@ -44,12 +47,7 @@ class AdScreenshotsGenerator:
         self.ads_per_screenshot = 5  # Количество объявлений на одном скриншоте
 
         # Настройки MinIO
-        self.minio_client = Minio(
-            endpoint=os.getenv('S3_ENDPOINT_URL', 'minio.upk-mos.ru'),
-            access_key=os.getenv('S3_ACCESS_KEY'),
-            secret_key=os.getenv('S3_SECRET_KEY'),
-            secure=os.getenv('S3_SECURE', 'False').lower() == 'true'
-        )
+        self.minio_client = get_minio()
 
         self.bucket_name = os.getenv('S3_BUCKET_NAME', 'dit-services-dev')
 
@@ -209,8 +207,8 @@ class AdScreenshotsGenerator:
                 if self.minio_client.stat_object(self.bucket_name, object_path):
                     # Загружаем объект
                     response = self.minio_client.get_object(self.bucket_name, object_path)
-                    content = response.read().decode('utf-8')
-                    data[filename] = json.loads(content)
+                    content = response.read()
+                    data[filename] = decode_json(content)
                     print(f"✓ Загружен файл: {filename}")
                 else:
                     print(f"⚠ Файл не найден: {filename}")
@@ -494,8 +492,7 @@ class AdScreenshotsGenerator:
             return None
 
     def generate_ad_screenshot(self, ad_data: Dict, ad_index: int, output_dir: str = "screenshots",
-                               sitelinks_data: Dict = None, extensions_data: Dict = None,
-                               image_data: Dict = None) -> str:
+                               index: ReportIndex = None) -> str:
         """Генерировать скриншот объявления с использованием HTML"""
         try:
             # Создаем папку для скриншотов, если её нет
@@ -526,13 +523,13 @@ class AdScreenshotsGenerator:
                 return self._generate_fallback_screenshot(ad_data, ad_index, output_dir)
 
             # Получаем sitelinks для объявления
-            sitelinks = self._get_sitelinks_for_ad(ad_data, sitelinks_data)
+            sitelinks = self._get_sitelinks_for_ad(ad_data, index)
 
             # Получаем изображение для объявления
-            image_url = self._get_image_for_ad(ad_data, image_data)
+            image_url = self._get_image_for_ad(ad_data, index)
 
             # Создаем HTML с правильным форматированием
-            html_content = self._create_html_content(display_text, sitelinks, ad_data, extensions_data, image_url)
+            html_content = self._create_html_content(display_text, sitelinks, ad_data, index, image_url)
 
             # Создаем временный HTML файл
             with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as f:
@@ -669,9 +666,9 @@ class AdScreenshotsGenerator:
             # Fallback к старому методу
             return self._generate_fallback_screenshot(ad_data, ad_index, output_dir)
 
-    def _get_image_for_ad(self, ad_data: Dict, image_data: Dict) -> str:
+    def _get_image_for_ad(self, ad_data: Dict, index: ReportIndex) -> str:
         """Получить URL изображения для объявления"""
-        if not image_data:
+        if not index:
             print(f"      ⚠ Нет данных изображений")
             return None
 
@@ -683,30 +680,21 @@ class AdScreenshotsGenerator:
             print(f"      ⚠ Нет AdImageHash в объявлении")
             return None
 
-        print(f"      🔍 Ищем изображение с хешем: {ad_image_hash}")
-
-        # Получаем все изображения
-        ad_images = image_data.get('result', {}).get('AdImages', [])
-        print(f"      📸 Всего изображений в данных: {len(ad_images)}")
-
-        # Ищем изображение по AdImageHash
-        for image in ad_images:
-            image_hash = image.get('AdImageHash')
-            if image_hash == ad_image_hash:
-                original_url = image.get('OriginalUrl')
-                if original_url:
-                    print(f"      ✅ Найдено изображение: {original_url}")
-                    return original_url
-                else:
-                    print(f"      ⚠ Нет OriginalUrl в найденном изображении")
-                    return None
+        image = index.image(ad_image_hash)
+        if image is None:
+            print(f"      ⚠ Изображение с хешем {ad_image_hash} не найдено")
+            return None
 
-        print(f"      ⚠ Изображение с хешем {ad_image_hash} не найдено")
+        original_url = image.get('OriginalUrl')
+        if original_url:
+            print(f"      ✅ Найдено изображение: {original_url}")
+            return original_url
+        print(f"      ⚠ Нет OriginalUrl в найденном изображении")
         return None
 
-    def _get_sitelinks_for_ad(self, ad_data: Dict, sitelinks_data: Dict) -> List[Dict]:
+    def _get_sitelinks_for_ad(self, ad_data: Dict, index: ReportIndex) -> List[Dict]:
         """Получить sitelinks для конкретного объявления"""
-        if not sitelinks_data:
+        if not index:
             print(f"      ⚠ Нет данных sitelinks")
             return []
 
@@ -720,36 +708,16 @@ class AdScreenshotsGenerator:
             print(f"      ⚠ У объявления нет SitelinkSetId")
             return []
 
-        # Ищем sitelinks по ID - проверяем структуру данных
-        print(f"      🔍 Структура sitelinks_data: {list(sitelinks_data.keys())}")
-
-        # Пробуем найти sitelinks в разных структурах
-        sitelinks_sets = []
-
-        # Вариант 1: прямая структура
-        if 'result' in sitelinks_data:
-            sitelinks_sets = sitelinks_data.get('result', {}).get('SitelinksSets', [])
-            print(f"      📋 Найдено наборов sitelinks (вариант 1): {len(sitelinks_sets)}")
-
-        # Вариант 2: структура с ID как ключ
-        if str(sitelink_set_id) in sitelinks_data:
-            sitelinks_data_by_id = sitelinks_data[str(sitelink_set_id)]
-            sitelinks_sets = sitelinks_data_by_id.get('result', {}).get('SitelinksSets', [])
-            print(f"      📋 Найдено наборов sitelinks (вариант 2): {len(sitelinks_sets)}")
-
-        for sitelinks_set in sitelinks_sets:
-            set_id = sitelinks_set.get('Id')
-            print(f"      🔍 Проверяем набор с ID: {set_id}")
-            if set_id == sitelink_set_id:
-                # Берем первые 4 sitelinks
-                sitelinks = sitelinks_set.get('Sitelinks', [])
-                print(f"      ✅ Найдены sitelinks: {len(sitelinks)} штук")
-                for i, sitelink in enumerate(sitelinks[:4]):
-                    print(f"        {i + 1}. {sitelink.get('Title', 'Без заголовка')}")
-                return sitelinks[:4]
+        # Берем первые 4 sitelinks набора
+        sitelinks = index.sitelinks(sitelink_set_id)
+        if not sitelinks:
+            print(f"      ❌ Sitelinks с ID {sitelink_set_id} не найдены")
+            return []
 
-        print(f"      ❌ Sitelinks с ID {sitelink_set_id} не найдены")
-        return []
+        print(f"      ✅ Найдены sitelinks: {len(sitelinks)} штук")
+        for i, sitelink in enumerate(sitelinks[:4]):
+            print(f"        {i + 1}. {sitelink.get('Title', 'Без заголовка')}")
+        return sitelinks[:4]
 
     def _create_multi_ad_html_content(self, ads_data: List[Dict]) -> str:
         """Создание HTML контента для нескольких объявлений на одном скриншоте"""
@@ -758,7 +726,7 @@ class AdScreenshotsGenerator:
         for i, ad_info in enumerate(ads_data):
             ad_data = ad_info['ad_data']
             sitelinks = ad_info.get('sitelinks', [])
-            extensions_data = ad_info.get('extensions_data')
+            callouts = ad_info.get('callouts', [])
             image_url = ad_info.get('image_url')
 
             # Получаем данные объявления
@@ -822,27 +790,14 @@ class AdScreenshotsGenerator:
             # Формируем HTML для изображения
             image_html = ""
             if image_url:
-                image_html = f'<div class="ad-image"><img src="{image_url}" alt="Ad Image"></div>'
+                image_src = get_image_cache().get_local_uri(text_ad.get('AdImageHash'), ORIGINAL, image_url)
+                image_html = f'<div class="ad-image"><img src="{image_src}" alt="Ad Image"></div>'
 
             # Формируем расширения (extensions)
             extensions_html = ""
-            if extensions_data:
-                ad_extensions = text_ad.get('AdExtensions', [])
-                if ad_extensions:
-                    extension_ids = [ext.get('AdExtensionId') for ext in ad_extensions if ext.get('AdExtensionId')]
-                    all_extensions = extensions_data.get('batch_1', {}).get('result', {}).get('AdExtensions', [])
-
-                    matching_extensions = []
-                    for ext in all_extensions:
-                        if ext.get('Id') in extension_ids:
-                            callout = ext.get('Callout', {})
-                            callout_text = callout.get('CalloutText', '')
-                            if callout_text:
-                                matching_extensions.append(callout_text)
-
-                    if matching_extensions:
-                        extensions_text = " · ".join(matching_extensions)
-                        extensions_html = f'<div id="extensions">{extensions_text}</div>'
+            if callouts:
+                extensions_text = " · ".join(callouts)
+                extensions_html = f'<div id="extensions">{extensions_text}</div>'
 
             # Добавляем HTML для одного объявления
             ads_html += f"""
@@ -861,7 +816,7 @@ class AdScreenshotsGenerator:
         return ads_html
 
     def _create_html_content(self, display_text: str, sitelinks: List[Dict] = None, ad_data: Dict = None,
-                             extensions_data: Dict = None, image_url: str = None) -> str:
+                             index: ReportIndex = None, image_url: str = None) -> str:
         """Создание HTML контента для скриншота"""
         # Экранируем HTML символы
         safe_text = display_text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
@@ -929,14 +884,16 @@ class AdScreenshotsGenerator:
         # Формируем HTML для изображения
         image_html = ""
         if image_url:
-            image_html = f'<div class="ad-image"><img src="{image_url}" alt="Ad Image"></div>'
+            image_hash = (ad_data or {}).get('TextAd', {}).get('AdImageHash')
+            image_src = get_image_cache().get_local_uri(image_hash, ORIGINAL, image_url)
+            image_html = f'<div class="ad-image"><img src="{image_src}" alt="Ad Image"></div>'
             print(f"      ✅ Добавлено изображение: {image_url}")
         else:
             print(f"      ⚠ Изображение не найдено")
 
         # Формируем расширения (extensions)
         extensions_html = ""
-        if ad_data and extensions_data:
+        if ad_data and index:
             # Получаем AdExtensionId из объявления
             text_ad = ad_data.get('TextAd', {})
             ad_extensions = text_ad.get('AdExtensions', [])
@@ -945,19 +902,8 @@ class AdScreenshotsGenerator:
                 extension_ids = [ext.get('AdExtensionId') for ext in ad_extensions if ext.get('AdExtensionId')]
                 print(f"      🔍 Найдены AdExtensionId: {extension_ids}")
 
-                # Получаем все расширения из extensions_data
-                all_extensions = extensions_data.get('batch_1', {}).get('result', {}).get('AdExtensions', [])
-                print(f"      📋 Всего расширений в данных: {len(all_extensions)}")
-
-                # Фильтруем расширения по ID
-                matching_extensions = []
-                for ext in all_extensions:
-                    if ext.get('Id') in extension_ids:
-                        callout = ext.get('Callout', {})
-                        callout_text = callout.get('CalloutText', '')
-                        if callout_text:
-                            matching_extensions.append(callout_text)
-                            print(f"        📝 Найдено расширение: {callout_text}")
+                # Тексты уточнений объявления из индекса отчета
+                matching_extensions = index.callouts_for_ad(ad_data)
 
                 if matching_extensions:
                     # Объединяем через символ "·" с пробелами
@@ -1318,6 +1264,9 @@ class AdScreenshotsGenerator:
         print(f"\nЗагрузка данных из MinIO...")
         data = self.load_data_from_minio(report['id'])
 
+        # Быстрые ссылки, уточнения и изображения объявлений берутся из индекса отчета
+        index = get_report_index(self.minio_client, self.bucket_name, report['id'])
+
         # Обрабатываем данные объявлений
         ads_report_key = f'ads_report_{report["id"]}.json'
         if data.get(ads_report_key):
@@ -1350,22 +1299,17 @@ class AdScreenshotsGenerator:
                 for j, ad in enumerate(ads_group):
                     print(f"  Объявление {j + 1}: ID {ad.get('Id')} - {ad.get('Type')}")
 
-                    # Получаем данные sitelinks, extensions и изображений
-                    sitelinks_data = data.get(f'sitelinks_{report["id"]}.json')
-                    extensions_data = data.get(f'extensions_{report["id"]}.json')
-                    image_data = data.get(f'image_hashes_report_{report["id"]}.json')
-
                     # Получаем sitelinks для объявления
-                    sitelinks = self._get_sitelinks_for_ad(ad, sitelinks_data)
+                    sitelinks = self._get_sitelinks_for_ad(ad, index)
 
                     # Получаем изображение для объявления
-                    image_url = self._get_image_for_ad(ad, image_data)
+                    image_url = self._get_image_for_ad(ad, index)
 
                     # Добавляем данные объявления в группу
                     ads_data.append({
                         'ad_data': ad,
                         'sitelinks': sitelinks,
-                        'extensions_data': extensions_data,
+                        'callouts': index.callouts_for_ad(ad) if index else [],
                         'image_url': image_url
                     })
 
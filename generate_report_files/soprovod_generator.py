@@ -7,7 +7,7 @@ from docx.shared import Inches, Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml.shared import OxmlElement, qn
 from dotenv import load_dotenv
-from minio import Minio
+from minio_factory import get_minio
 
 # Загружаем переменные из .env файла
 load_dotenv()
@@ -354,10 +354,5 @@ def generate_soprovod(report_id):
 
 
 if __name__ == "__main__":
-    minio_client = Minio(
-        endpoint=os.getenv('S3_ENDPOINT_URL', 'minio.upk-mos.ru'),
-        access_key=os.getenv('S3_ACCESS_KEY'),
-        secret_key=os.getenv('S3_SECRET_KEY'),
-        secure=os.getenv('S3_SECURE', 'False').lower() == 'true'
-    )
+    minio_client = get_minio()
     print(generate_soprovod(16, minio_client))
@@ -13,6 +13,9 @@ import zipfile
 import shutil
 import subprocess
 import psutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 from dotenv import load_dotenv
@@ -31,6 +34,8 @@ from webdriver_manager.chrome import ChromeDriverManager
 
 from database_manager import DatabaseManager
 from minio_client import MinIOClient
+from artifact_codec import decode_json
+from report_manifest import flush_manifest_writers
 
 # Загружаем переменные окружения
 load_dotenv('.env')
@@ -38,6 +43,46 @@ load_dotenv('.env')
 IS_WINDOWS = os.getenv("IS_WINDOWS", "False").lower() in ("1", "true", "yes")
 platform_suffix = "windows" if IS_WINDOWS else "linux"
 
+# Параллельный захват URL в отдельных экземплярах браузера
+SCREENSHOTS_PARALLEL = os.getenv("SCREENSHOTS_PARALLEL", "False").lower() in ("1", "true", "yes")
+SCREENSHOTS_WORKERS = int(os.getenv("SCREENSHOTS_WORKERS", "4"))
+# Бюджет времени на один URL (секунды)
+SCREENSHOT_URL_TIMEOUT = int(os.getenv("SCREENSHOT_URL_TIMEOUT", "300"))
+# Локальный кэш распакованных профилей между отчетами
+PROFILE_CACHE_DIR = os.getenv(
+    "PROFILE_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "profile_cache")
+)
+
+
+@contextmanager
+def _profile_cache_lock(cache_dir: str):
+    """Межпроцессная блокировка каталога кэша профиля (файл .lock в каталоге кэша)"""
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, '.lock'), 'a+b') as lock_file:
+        if IS_WINDOWS:
+            import msvcrt
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK сдается после 10 попыток - ждем дальше
+                    continue
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
 
 class ScreenshotGenerator:
     """Генератор скриншотов отчетов Яндекс.Директ"""
@@ -139,19 +184,12 @@ class ScreenshotGenerator:
     def load_urls_from_minio(self, report_id: int) -> Optional[Dict]:
         """Загружает URL из файла в MinIO"""
         try:
-            # Ищем файл report_urls_{report_id}.json в MinIO
-            prefix = f"gen_report_context_contracts/data_yandex_direct/{report_id}_результаты/"
-            objects = self.minio_client.list_objects(prefix)
-
-            # Фильтруем только файлы report_urls_
-            urls_files = [obj for obj in objects if f"report_urls_{report_id}.json" in obj]
+            # Ищем файл report_urls_{report_id}.json по манифесту отчета
+            latest_file = self.minio_client.find_report_file(report_id, f"report_urls_{report_id}.json")
 
-            if not urls_files:
+            if not latest_file:
                 print(f"❌ Файл report_urls_{report_id}.json не найден в MinIO")
                 return None
-
-            # Берем первый найденный файл
-            latest_file = urls_files[0]
             print(f"📁 Загружаем URL из файла в MinIO: {latest_file}")
 
             # Загружаем данные из MinIO
@@ -159,7 +197,7 @@ class ScreenshotGenerator:
                 self.minio_client.bucket_name,
                 latest_file
             )
-            data = json.loads(response.read().decode('utf-8'))
+            data = decode_json(response.read())
             response.close()
             response.release_conn()
 
@@ -187,8 +225,12 @@ class ScreenshotGenerator:
         except Exception as e:
             print(f"⚠️ Ошибка при завершении процессов Chrome: {e}")
 
-    def create_driver(self, user_id: int):
-        """Создает Chrome драйвер с настройками"""
+    def create_driver(self, user_id: int, profile_dir: Optional[str] = None):
+        """
+        Создает Chrome драйвер с настройками
+        :param user_id: ID пользователя
+        :param profile_dir: каталог профиля (по умолчанию users/user_{user_id})
+        """
         options = Options()
         options.add_argument("start-maximized")
         options.add_experimental_option("excludeSwitches", ["enable-automation"])
@@ -197,7 +239,7 @@ class ScreenshotGenerator:
 
         script_dir = os.path.dirname(os.path.abspath(__file__))
         base_directory = os.path.join(script_dir, 'users')
-        user_directory = os.path.join(base_directory, f'user_{user_id}')
+        user_directory = profile_dir or os.path.join(base_directory, f'user_{user_id}')
 
         options.add_argument(f'user-data-dir={user_directory}')
         options.add_argument('--disable-gpu')
@@ -222,18 +264,82 @@ class ScreenshotGenerator:
                 )
         return driver
 
+    def clone_user_profile(self, user_id: int, worker_index: int) -> str:
+        """
+        Копирует распакованный профиль для отдельного воркера браузера.
+        Chrome блокирует user-data-dir, поэтому каждому параллельному экземпляру нужна своя копия
+        :return: путь к копии профиля
+        """
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        base_directory = os.path.join(script_dir, 'users')
+        source_dir = os.path.join(base_directory, f'user_{user_id}')
+        worker_dir = os.path.join(base_directory, f'user_{user_id}_w{worker_index}')
+
+        if os.path.exists(worker_dir):
+            shutil.rmtree(worker_dir, ignore_errors=True)
+
+        # Файлы блокировки исходного профиля не копируем
+        shutil.copytree(source_dir, worker_dir,
+                        ignore=shutil.ignore_patterns('Singleton*', 'lockfile', '*.lock'))
+        print(f"📋 Профиль пользователя {user_id} скопирован для воркера {worker_index}")
+        return worker_dir
+
     def download_profile_from_minio(self, user_id: int):
-        """Загружает профиль пользователя из MinIO с повторными попытками"""
+        """
+        Подготавливает профиль пользователя для запуска.
+        Распакованный профиль хранится в локальном кэше и перезагружается из MinIO
+        только при изменении ETag/даты изменения архива; в users/ создается рабочая копия
+        """
         script_dir = os.path.dirname(os.path.abspath(__file__))
         user_dir = os.path.join(script_dir, "users")
         archive_name = f"user_{user_id}_{platform_suffix}.zip"
-        # archive_path = script_dir / archive_name
-        os.makedirs(user_dir, exist_ok=True)
-
-        # archive_name = f"user_{user_id}.zip"
-        archive_path = os.path.join(script_dir, archive_name)
         object_name = f"users_for_screenshots/{archive_name}"
 
+        cache_dir = os.path.join(PROFILE_CACHE_DIR, archive_name[:-len('.zip')])
+        cached_profile_dir = os.path.join(cache_dir, "profile")
+        meta_path = os.path.join(cache_dir, "meta.json")
+
+        remote_meta = self._get_profile_object_meta(object_name)
+
+        # Кэш общий для процессов на хосте: проверка, подмена и копирование профиля - под блокировкой,
+        # иначе один процесс удаляет каталог кэша, пока другой распаковывает или копирует его
+        with _profile_cache_lock(cache_dir):
+            cached_meta = self._read_profile_cache_meta(meta_path)
+            if remote_meta and cached_meta == remote_meta and os.path.isdir(cached_profile_dir):
+                print(f"✅ Профиль пользователя {user_id} актуален в локальном кэше (ETag {remote_meta['etag']})")
+            else:
+                self._refresh_profile_cache(object_name, cache_dir, cached_profile_dir)
+                if remote_meta:
+                    with open(meta_path, 'w', encoding='utf-8') as f:
+                        json.dump(remote_meta, f)
+
+            self._make_profile_working_copy(cached_profile_dir, user_dir)
+
+    def _get_profile_object_meta(self, object_name: str) -> Optional[Dict]:
+        """Возвращает ETag и дату изменения архива профиля в MinIO"""
+        try:
+            stat = self.minio_client.client.stat_object(self.minio_client.bucket_name, object_name)
+            return {
+                'etag': stat.etag,
+                'last_modified': stat.last_modified.isoformat() if stat.last_modified else None
+            }
+        except Exception as e:
+            print(f"⚠️ Не удалось получить метаданные профиля {object_name}: {e}")
+            return None
+
+    def _read_profile_cache_meta(self, meta_path: str) -> Optional[Dict]:
+        """Читает метаданные закэшированного профиля"""
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _refresh_profile_cache(self, object_name: str, cache_dir: str, cached_profile_dir: str):
+        """Загружает архив профиля из MinIO с повторными попытками и распаковывает его в кэш"""
+        os.makedirs(cache_dir, exist_ok=True)
+        archive_path = os.path.join(cache_dir, os.path.basename(object_name))
+
         # Настройки для повторных попыток
         max_retries = 3
         retry_delay = 5  # секунд между попытками
@@ -271,13 +377,18 @@ class ScreenshotGenerator:
                     print("❌ Все попытки загрузки профиля исчерпаны")
                     raise Exception(f"Не удалось загрузить профиль после {max_retries} попыток: {e}")
 
-        # Распаковываем архив
+        # Распаковываем архив во временную папку и подменяем кэш целиком
+        tmp_profile_dir = f"{cached_profile_dir}.tmp"
         try:
+            shutil.rmtree(tmp_profile_dir, ignore_errors=True)
             with zipfile.ZipFile(archive_path, "r") as zipf:
-                zipf.extractall(user_dir)
-            print("✅ Профиль распакован успешно")
+                zipf.extractall(tmp_profile_dir)
+            shutil.rmtree(cached_profile_dir, ignore_errors=True)
+            os.replace(tmp_profile_dir, cached_profile_dir)
+            print("✅ Профиль распакован в локальный кэш")
         except Exception as e:
             print(f"❌ Ошибка распаковки профиля: {e}")
+            shutil.rmtree(tmp_profile_dir, ignore_errors=True)
             raise
 
         # Удаляем архив
@@ -287,6 +398,31 @@ class ScreenshotGenerator:
         except Exception as e:
             print(f"⚠️ Не удалось удалить временный архив: {e}")
 
+    def _make_profile_working_copy(self, cached_profile_dir: str, user_dir: str):
+        """
+        Создает рабочую копию профиля в users/. На Linux используется cp --reflink=auto,
+        который на CoW-файловых системах копирует без дублирования данных
+        """
+        os.makedirs(user_dir, exist_ok=True)
+        for entry in os.listdir(cached_profile_dir):
+            source = os.path.join(cached_profile_dir, entry)
+            target = os.path.join(user_dir, entry)
+            if os.path.exists(target):
+                shutil.rmtree(target, ignore_errors=True)
+
+            if not IS_WINDOWS:
+                result = subprocess.run(['cp', '-a', '--reflink=auto', source, target],
+                                        capture_output=True)
+                if result.returncode == 0:
+                    continue
+                print(f"⚠️ cp --reflink недоступен, копируем средствами Python: {result.stderr.decode(errors='ignore')}")
+
+            if os.path.isdir(source):
+                shutil.copytree(source, target)
+            else:
+                shutil.copy2(source, target)
+        print("✅ Рабочая копия профиля подготовлена")
+
     def add_panel_with_time(self, img: Image.Image) -> Image.Image:
         """Добавляет панель с временем и датой к изображению"""
         try:
@@ -445,22 +581,27 @@ class ScreenshotGenerator:
 
             print(f"📤 Загружаем {len(screenshot_files)} скриншотов в MinIO для URL {url_index}...")
 
-            # Загружаем каждый скриншот в подпапку url_{url_index}
-            for screenshot_file in screenshot_files:
+            # Загружаем скриншоты в подпапку url_{url_index} параллельно через общий сервис загрузки
+            uploads = {}
+            for screenshot_file in sorted(screenshot_files):
                 local_path = os.path.join(screenshots_dir, screenshot_file)
                 minio_path = f"gen_report_context_contracts/data_yandex_direct/{report_id}_результаты/screenshots/url_{url_index}/{screenshot_file}"
+                uploads[screenshot_file] = (
+                    os.path.getsize(local_path),
+                    self.minio_client.uploads.submit_file(minio_path, local_path, content_type='image/png')
+                )
+
+            if not self.minio_client.uploads.wait([future for _, future in uploads.values()]):
+                print(f"❌ Не все скриншоты URL {url_index} загружены в MinIO")
+                return False
 
-                # Загружаем файл в MinIO
-                with open(local_path, 'rb') as file_data:
-                    self.minio_client.client.put_object(
-                        self.minio_client.bucket_name,
-                        minio_path,
-                        file_data,
-                        length=os.path.getsize(local_path),
-                        content_type='image/png'
-                    )
+            uploaded = {}
+            for screenshot_file, (size, future) in uploads.items():
+                uploaded[screenshot_file] = {'size': size, 'etag': future.result().etag}
+            print(f"✅ Загружено скриншотов: {len(uploaded)} (url_{url_index})")
 
-                print(f"✅ Загружен: url_{url_index}/{screenshot_file}")
+            # Количество скриншотов URL фиксируется в манифесте отчета
+            self.minio_client.record_screenshots(report_id, url_index, uploaded)
 
             # Удаляем локальную папку после загрузки
             shutil.rmtree(screenshots_dir)
@@ -482,62 +623,27 @@ class ScreenshotGenerator:
             print(f"❌ Ошибка при загрузке профиля: {e}")
             return "PROFILE_ERROR"
 
-        successful_urls = 0
-        failed_urls = 0
-
-        for i, url in enumerate(urls, start=1):
-            print(f"🌐 Обрабатываем URL {i}: {url[:50]}...")
-            driver = None
-
-            try:
+        if SCREENSHOTS_PARALLEL and len(urls) > 1:
+            results = self._capture_urls_parallel(user_id, urls, report_id)
+        else:
+            results = []
+            for i, url in enumerate(urls, start=1):
                 # Очищаем процессы Chrome перед каждым запуском
                 if i > 1:
                     print("🧹 Очищаем процессы Chrome...")
                     self.kill_chrome_processes()
 
-                driver = self.create_driver(user_id)
-                driver.get(url)
-                time.sleep(2)  # Увеличиваем время ожидания
+                result = self.capture_url(user_id, url, i, report_id)
+                results.append(result)
+                if result == "OLD_COOKIES":
+                    break
 
-                try:
-                    driver.find_element(By.NAME, "login")
-                    print("🔐 Найдено поле логина - требуются новые куки")
-                    if driver:
-                        driver.quit()
-                    self.cleanup_user_profile(user_id)
-                    return "OLD_COOKIES"
-                except NoSuchElementException:
-                    print("✅ Поле логина не найдено - продолжаем")
-
-                # Создаем папку для скриншотов
-                screenshots_dir = os.path.join(os.getcwd(), "temp_screenshots", f"site_{i}")
-                print(f"📁 Создаем папку для скриншотов: {screenshots_dir}")
-                success = self.scroll_and_screenshot(driver, screenshots_dir, i)
-
-                if driver:
-                    driver.quit()
-
-                if success:
-                    # Загружаем скриншоты в MinIO
-                    upload_success = self.upload_screenshots_to_minio(screenshots_dir, report_id, i)
-                    if upload_success:
-                        successful_urls += 1
-                        print(f"✅ URL {i} обработан успешно")
-                    else:
-                        failed_urls += 1
-                        print(f"❌ Ошибка загрузки скриншотов для URL {i}")
-                else:
-                    failed_urls += 1
-                    print(f"❌ Ошибка при создании скриншотов для URL {i}")
+        if "OLD_COOKIES" in results:
+            self.cleanup_user_profile(user_id)
+            return "OLD_COOKIES"
 
-            except Exception as e:
-                print(f"❌ Ошибка при обработке URL {i}: {e}")
-                failed_urls += 1
-                if driver:
-                    try:
-                        driver.quit()
-                    except:
-                        pass  # Игнорируем ошибки при закрытии
+        successful_urls = results.count("OK")
+        failed_urls = len(results) - successful_urls
 
         self.cleanup_user_profile(user_id)
         print(f"📊 Скрипт завершен. Успешно: {successful_urls}, Ошибок: {failed_urls}")
@@ -549,8 +655,119 @@ class ScreenshotGenerator:
         else:
             return "ALL_FAILED"
 
+    def capture_url(self, user_id: int, url: str, url_index: int, report_id: int,
+                    profile_dir: Optional[str] = None, timeout: Optional[int] = None) -> str:
+        """
+        Делает скриншоты одного URL и загружает их в screenshots/url_{url_index}/
+        :param profile_dir: каталог профиля Chrome (копия для параллельного режима)
+        :param timeout: бюджет времени на URL в секундах; по истечении браузер закрывается
+        :return: OK, FAILED или OLD_COOKIES
+        """
+        print(f"🌐 Обрабатываем URL {url_index}: {url[:50]}...")
+        driver = None
+        timer = None
+
+        try:
+            driver = self.create_driver(user_id, profile_dir)
+
+            if timeout:
+                driver.set_page_load_timeout(timeout)
+                # Закрываем браузер по истечении бюджета, чтобы прервать зависшие вызовы
+                timer = threading.Timer(timeout, self._quit_driver, args=(driver, url_index))
+                timer.daemon = True
+                timer.start()
+
+            driver.get(url)
+            time.sleep(2)  # Увеличиваем время ожидания
+
+            try:
+                driver.find_element(By.NAME, "login")
+                print("🔐 Найдено поле логина - требуются новые куки")
+                return "OLD_COOKIES"
+            except NoSuchElementException:
+                print("✅ Поле логина не найдено - продолжаем")
+
+            # Создаем папку для скриншотов
+            screenshots_dir = os.path.join(os.getcwd(), "temp_screenshots", f"site_{url_index}")
+            print(f"📁 Создаем папку для скриншотов: {screenshots_dir}")
+            success = self.scroll_and_screenshot(driver, screenshots_dir, url_index)
+
+            if timer:
+                timer.cancel()
+            self._quit_driver(driver)
+            driver = None
+
+            if not success:
+                print(f"❌ Ошибка при создании скриншотов для URL {url_index}")
+                return "FAILED"
+
+            # Загружаем скриншоты в MinIO
+            if self.upload_screenshots_to_minio(screenshots_dir, report_id, url_index):
+                print(f"✅ URL {url_index} обработан успешно")
+                return "OK"
+
+            print(f"❌ Ошибка загрузки скриншотов для URL {url_index}")
+            return "FAILED"
+
+        except Exception as e:
+            print(f"❌ Ошибка при обработке URL {url_index}: {e}")
+            return "FAILED"
+
+        finally:
+            if timer:
+                timer.cancel()
+            if driver:
+                self._quit_driver(driver)
+
+    def _quit_driver(self, driver, url_index: Optional[int] = None):
+        """Закрывает драйвер, игнорируя ошибки"""
+        if url_index is not None:
+            print(f"⏰ Истек бюджет времени для URL {url_index}, закрываем браузер")
+        try:
+            driver.quit()
+        except Exception:
+            pass  # Игнорируем ошибки при закрытии
+
+    def _capture_urls_parallel(self, user_id: int, urls: List[str], report_id: int) -> List[str]:
+        """
+        Параллельно обрабатывает URL в отдельных экземплярах браузера.
+        Каждый воркер работает со своей копией профиля и своим бюджетом времени
+        :return: список результатов capture_url в порядке URL
+        """
+        workers = max(1, min(SCREENSHOTS_WORKERS, len(urls)))
+        print(f"⚡ Параллельный режим: {len(urls)} URL, воркеров: {workers}, "
+              f"таймаут на URL: {SCREENSHOT_URL_TIMEOUT} сек")
+
+        profile_dirs = {}
+        try:
+            for i in range(1, len(urls) + 1):
+                profile_dirs[i] = self.clone_user_profile(user_id, i)
+        except Exception as e:
+            print(f"❌ Ошибка копирования профиля: {e}")
+            return ["FAILED"] * len(urls)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="screenshot") as executor:
+                futures = [
+                    executor.submit(self.capture_url, user_id, url, i, report_id,
+                                    profile_dirs[i], SCREENSHOT_URL_TIMEOUT)
+                    for i, url in enumerate(urls, start=1)
+                ]
+                results = []
+                for i, future in enumerate(futures, start=1):
+                    try:
+                        results.append(future.result())
+                    except Exception as e:
+                        print(f"❌ Ошибка воркера для URL {i}: {e}")
+                        results.append("FAILED")
+            return results
+
+        finally:
+            for profile_dir in profile_dirs.values():
+                shutil.rmtree(profile_dir, ignore_errors=True)
+
     def cleanup_user_profile(self, user_id: int):
-        """Очищает профиль пользователя"""
+        """Очищает рабочую копию профиля пользователя (локальный кэш сохраняется)"""
         script_dir = os.path.dirname(os.path.abspath(__file__))
         user_dir = os.path.join(script_dir, "users")
         if os.path.exists(user_dir):
@@ -584,6 +801,9 @@ def main():
             print("\n❌ Генерация скриншотов завершена с ошибками")
     except Exception as e:
         print(f"\n❌ Критическая ошибка: {e}")
+    finally:
+        # Скриншоты записываются в манифесты отчетов при завершении шага, вне main_processor - здесь
+        flush_manifest_writers()
 
 
 if __name__ == "__main__":
@@ -15,6 +15,8 @@ from typing import Dict, List, Optional, Any
 from database_manager import DatabaseManager
 from api_client import DirectAPIClient
 from minio_client import MinIOClient
+from report_tsv_parser import parse_report_tsv
+from stats_store import StatsTable
 
 class AdGroupStatsProcessor:
     """Обработчик для получения статистики по группам объявлений"""
@@ -283,72 +285,35 @@ class AdGroupStatsProcessor:
                 if report_format == 'TSV':
                     # Обрабатываем TSV формат
                     try:
-                        lines = report_content.strip().split('\n')
-                        if len(lines) < 3:  # Заголовок + названия колонок + данные
+                        columns = parse_report_tsv(report_content)
+                        if columns is None or not columns.row_count:
                             print("   Нет данных в отчете")
                             return
-                        
-                        # Пропускаем заголовок отчета и названия колонок (первые 2 строки)
-                        data_lines = lines[2:]
-                        
-                        # Удаляем последнюю строку с "Total rows: X" если есть
-                        if data_lines and data_lines[-1].startswith('Total rows:'):
-                            data_lines = data_lines[:-1]
-                        
-                        # Удаляем пустые строки
-                        data_lines = [line.strip() for line in data_lines if line.strip()]
-                        
-                        print(f"   Найдено записей: {len(data_lines)}")
-                        
-                        if data_lines:
+
+                        stats = StatsTable.from_report_columns(columns)
+                        print(f"   Найдено записей: {len(stats)}")
+
+                        if len(stats):
                             print(f"\n🔍 Первые 3 группы объявлений:")
-                            shown_adgroups = 0
-                            total_impressions = 0
-                            total_clicks = 0
-                            total_cost = 0.0
-                            
-                            for line in data_lines:
-                                if shown_adgroups >= 3:
-                                    break
-                                
-                                # Парсим TSV строку
-                                fields = line.split('\t')
-                                if len(fields) >= 11: # CampaignId, AdGroupId, AdGroupName, CampaignType, AdNetworkType, Impressions, Clicks, Ctr, BounceRate, Cost, AvgCpc
-                                    campaign_id = fields[0] if fields[0] else 'N/A'
-                                    adgroup_id = fields[1] if fields[1] else 'N/A'
-                                    adgroup_name = fields[2] if fields[2] else 'N/A'
-                                    campaign_type = fields[3] if fields[3] else 'N/A'
-                                    ad_network_type = fields[4] if fields[4] else 'N/A'
-                                    impressions = int(fields[5]) if fields[5].isdigit() else 0
-                                    clicks = int(fields[6]) if fields[6].isdigit() else 0
-                                    ctr = float(fields[7]) if fields[7].replace('.', '').isdigit() else 0
-                                    bounce_rate = float(fields[8]) if fields[8].replace('.', '').isdigit() else 0
-                                    cost = float(fields[9]) if fields[9].replace('.', '').isdigit() else 0
-                                    avg_cpc = float(fields[10]) if fields[10].replace('.', '').isdigit() else 0
-                                    
-                                    print(f"   {shown_adgroups + 1}. Группа объявлений ID: {adgroup_id}")
-                                    print(f"      Название: {adgroup_name}")
-                                    print(f"      Кампания ID: {campaign_id}, Тип кампании: {campaign_type}")
-                                    print(f"      Тип сети: {ad_network_type}")
-                                    print(f"      Показы: {impressions}, Клики: {clicks}")
-                                    print(f"      CTR: {ctr}%, Отказы: {bounce_rate}%")
-                                    print(f"      Стоимость: {cost:.2f} руб., Ср. стоимость клика: {avg_cpc:.2f} руб.")
-                                    
-                                    total_impressions += impressions
-                                    total_clicks += clicks
-                                    total_cost += cost
-                                    shown_adgroups += 1
-                            
+                            for index, row in enumerate(stats.records(range(min(3, len(stats))))):
+                                print(f"   {index + 1}. Группа объявлений ID: {row.get('AdGroupId') or 'N/A'}")
+                                print(f"      Название: {row.get('AdGroupName') or 'N/A'}")
+                                print(f"      Кампания ID: {row.get('CampaignId') or 'N/A'}, Тип кампании: {row.get('CampaignType') or 'N/A'}")
+                                print(f"      Тип сети: {row.get('AdNetworkType') or 'N/A'}")
+                                print(f"      Показы: {row.get('Impressions', 0)}, Клики: {row.get('Clicks', 0)}")
+                                print(f"      CTR: {row.get('Ctr', 0)}%, Отказы: {row.get('BounceRate', 0)}%")
+                                print(f"      Стоимость: {row.get('Cost', 0):.2f} руб., Ср. стоимость клика: {row.get('AvgCpc', 0):.2f} руб.")
+
+                            # Итоги считаются по всем строкам отчета
+                            totals = stats.totals(['Impressions', 'Clicks', 'Cost'])
                             print(f"\n📈 Общая статистика:")
-                            print(f"   Всего показов: {total_impressions}")
-                            print(f"   Всего кликов: {total_clicks}")
-                            print(f"   Общая стоимость: {total_cost:.2f} руб.")
-                            if total_impressions > 0:
-                                overall_ctr = (total_clicks / total_impressions) * 100
-                                print(f"   Общий CTR: {overall_ctr:.2f}%")
-                            if total_clicks > 0:
-                                overall_avg_cpc = total_cost / total_clicks
-                                print(f"   Общая средняя стоимость клика: {overall_avg_cpc:.2f} руб.")
+                            print(f"   Всего показов: {totals['Impressions']}")
+                            print(f"   Всего кликов: {totals['Clicks']}")
+                            print(f"   Общая стоимость: {totals['Cost']:.2f} руб.")
+                            if totals['Impressions'] > 0:
+                                print(f"   Общий CTR: {totals['Ctr']:.2f}%")
+                            if totals['Clicks'] > 0:
+                                print(f"   Общая средняя стоимость клика: {totals['AvgCpc']:.2f} руб.")
                         else:
                             print("   Нет данных в отчете")
                             
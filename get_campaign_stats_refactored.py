@@ -15,6 +15,8 @@ from typing import Dict, List, Optional, Any
 from database_manager import DatabaseManager
 from api_client import DirectAPIClient
 from minio_client import MinIOClient
+from report_tsv_parser import parse_report_tsv
+from stats_store import StatsTable
 
 class CampaignStatsProcessor:
     """Обработчик для получения статистики по кампаниям"""
@@ -345,83 +347,33 @@ class CampaignStatsProcessor:
                 if report_format == 'TSV':
                     # Обрабатываем TSV формат
                     try:
-                        lines = report_content.strip().split('\n')
-                        if len(lines) < 3:  # Заголовок + названия колонок + данные
+                        columns = parse_report_tsv(report_content)
+                        if columns is None or not columns.row_count:
                             print("   Нет данных в отчете")
                             return
-                        
-                        # Пропускаем заголовок отчета и названия колонок (первые 2 строки)
-                        data_lines = lines[2:]
-                        
-                        # Удаляем последнюю строку с "Total rows: X" если есть
-                        if data_lines and data_lines[-1].startswith('Total rows:'):
-                            data_lines = data_lines[:-1]
-                        
-                        # Удаляем пустые строки
-                        data_lines = [line.strip() for line in data_lines if line.strip()]
-                        
-                        print(f"   Найдено записей: {len(data_lines)}")
-                        
-                        if data_lines:
+
+                        stats = StatsTable.from_report_columns(columns)
+                        print(f"   Найдено записей: {len(stats)}")
+
+                        if len(stats):
                             print(f"\n🔍 Первые 3 кампании:")
-                            shown_campaigns = 0
-                            total_impressions = 0
-                            total_clicks = 0
-                            
-                            for line in data_lines:
-                                if shown_campaigns >= 3:
-                                    break
-                                
-                                # Парсим TSV строку
-                                fields = line.split('\t')
-                                if len(fields) >= 6: # CampaignId, CampaignName, Impressions, Clicks, Ctr, BounceRate
-                                    campaign_id = fields[0] if fields[0] else 'N/A'
-                                    campaign_name = fields[1] if fields[1] else 'N/A'
-                                    impressions = int(fields[2]) if fields[2].isdigit() else 0
-                                    clicks = int(fields[3]) if fields[3].isdigit() else 0
-                                    ctr = float(fields[4]) if fields[4].replace('.', '').isdigit() else 0
-                                    bounce_rate = float(fields[5]) if fields[5].replace('.', '').isdigit() else 0
-                                    
-                                    print(f"   {shown_campaigns + 1}. {campaign_name} (ID: {campaign_id})")
-                                    print(f"      Показы: {impressions}, Клики: {clicks}")
-                                    print(f"      CTR: {ctr}%, Отказы: {bounce_rate}%")
-                                    
-                                    total_impressions += impressions
-                                    total_clicks += clicks
-                                    shown_campaigns += 1
-                            
+                            for index, row in enumerate(stats.records(range(min(3, len(stats))))):
+                                print(f"   {index + 1}. {row.get('CampaignName') or 'N/A'} (ID: {row.get('CampaignId') or 'N/A'})")
+                                print(f"      Показы: {row.get('Impressions', 0)}, Клики: {row.get('Clicks', 0)}")
+                                print(f"      CTR: {row.get('Ctr', 0)}%, Отказы: {row.get('BounceRate', 0)}%")
+
+                            # Итоги считаются по всем строкам отчета
+                            totals = stats.totals(['Impressions', 'Clicks', 'Cost'])
                             print(f"\n📈 Общая статистика:")
-                            print(f"   Всего показов: {total_impressions}")
-                            print(f"   Всего кликов: {total_clicks}")
-                            if total_impressions > 0:
-                                overall_ctr = (total_clicks / total_impressions) * 100
-                                print(f"   Общий CTR: {overall_ctr:.2f}%")
-                            
-                            # Подсчитываем общую стоимость и среднюю стоимость клика
-                            total_cost = 0.0
-                            total_avg_cpc = 0.0
-                            campaigns_with_cost = 0
-                            
-                            for line in data_lines:
-                                fields = line.split('\t')
-                                if len(fields) >= 8:  # CampaignId, CampaignName, Impressions, Clicks, Ctr, BounceRate, Cost, AvgCpc
-                                    cost = float(fields[6]) if fields[6].replace('.', '').isdigit() else 0.0
-                                    avg_cpc = float(fields[7]) if fields[7].replace('.', '').isdigit() else 0.0
-                                    total_cost += cost
-                                    if avg_cpc > 0:
-                                        total_avg_cpc += avg_cpc
-                                        campaigns_with_cost += 1
-                            
-                            if total_cost > 0:
-                                print(f"   Общая стоимость: {total_cost:.2f} руб.")
-                            
-                            if campaigns_with_cost > 0:
-                                overall_avg_cpc = total_avg_cpc / campaigns_with_cost
-                                print(f"   Средняя стоимость клика: {overall_avg_cpc:.2f} руб.")
+                            print(f"   Всего показов: {totals['Impressions']}")
+                            print(f"   Всего кликов: {totals['Clicks']}")
+                            if totals['Impressions'] > 0:
+                                print(f"   Общий CTR: {totals['Ctr']:.2f}%")
                             
-                            if total_clicks > 0 and total_cost > 0:
-                                actual_avg_cpc = total_cost / total_clicks
-                                print(f"   Фактическая средняя стоимость клика: {actual_avg_cpc:.2f} руб.")
+                            if totals['Cost'] > 0:
+                                print(f"   Общая стоимость: {totals['Cost']:.2f} руб.")
+                            if totals['Clicks'] > 0 and totals['Cost'] > 0:
+                                print(f"   Фактическая средняя стоимость клика: {totals['AvgCpc']:.2f} руб.")
                         else:
                             print("   Нет данных в отчете")
                             
@@ -15,6 +15,7 @@ from typing import Dict, List, Set, Optional, Any
 from database_manager import DatabaseManager
 from api_client import DirectAPIClient
 from minio_client import MinIOClient
+from artifact_codec import decode_json
 
 class ExtensionsProcessor:
     """Обработчик для извлечения и скачивания расширений"""
@@ -164,7 +165,7 @@ class ExtensionsProcessor:
             )
             
             # Читаем и парсим JSON
-            data = json.loads(response.read().decode('utf-8'))
+            data = decode_json(response.read())
             response.close()
             response.release_conn()
             
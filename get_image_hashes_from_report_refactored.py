@@ -14,6 +14,7 @@ from typing import Dict, List, Set, Optional
 from database_manager import DatabaseManager
 from api_client import DirectAPIClient
 from minio_client import MinIOClient
+from artifact_codec import decode_json
 
 class ImageHashesProcessor:
     """Обработчик для извлечения хешей изображений и получения ссылок"""
@@ -150,7 +151,7 @@ class ImageHashesProcessor:
             )
             
             # Читаем и парсим JSON
-            data = json.loads(response.read().decode('utf-8'))
+            data = decode_json(response.read())
             response.close()
             response.release_conn()
             
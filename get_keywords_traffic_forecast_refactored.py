@@ -14,6 +14,7 @@ from typing import Dict, List, Optional, Any
 from database_manager import DatabaseManager
 from api_client import DirectAPIClient
 from minio_client import MinIOClient
+from artifact_codec import decode_json
 
 class KeywordsTrafficProcessor:
     """Обработчик данных ключевых фраз и прогнозов трафика"""
@@ -176,7 +177,7 @@ class KeywordsTrafficProcessor:
             )
             
             # Читаем и парсим JSON
-            data = json.loads(response.read().decode('utf-8'))
+            data = decode_json(response.read())
             response.close()
             response.release_conn()
             
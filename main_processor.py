@@ -7,7 +7,11 @@
 import io
 import os
 import json
+import signal
+import sys
+import threading
 import time
+from datetime import datetime
 from typing import Dict, List, Optional
 import logging
 
@@ -15,14 +19,23 @@ from dotenv import load_dotenv
 
 from database_manager import DatabaseManager
 from api_client import DirectAPIClient
-from minio_client import MinIOClient
+from minio_client import MinIOClient, AD_STATS_FIELDS, ADGROUP_STATS_FIELDS
 from get_campaigns_data_refactored import CampaignsDataProcessor
 from get_adgroups_data_refactored import AdGroupsDataProcessor
 from generate_report_urls_refactored import ReportURLGenerator
-from generate_screenshots_refactored import ScreenshotGenerator
-from ad_screenshots_very_good_generator import very_good_screenshot_generator
 
 from utils.postprocessing_report_file import FileFormatter, write_status
+from artifact_codec import decode_json
+from stats_warehouse import StatsWarehouse
+from entity_cache import EntityCache
+from report_sharding import run_sharded_report
+from upload_service import wait_all_uploads
+from minio_factory import log_pool_stats
+from report_index import ReportIndex, publish_report_index, report_index_filename, release_report_index
+from report_manifest import manifest_writer, release_manifest_writer, flush_manifest_writers
+from report_checkpoints import StageCheckpoints, inputs_fingerprint
+from report_listener import ReportListener, REPORTS_NOTIFY_CHANNEL, REPORTS_POLL_INTERVAL
+from task_queue import TaskQueue, TaskHeartbeat, STAGES, STAGE_API_FETCH, STAGE_BROWSER_CAPTURE, stage_channel
 
 # Загружаем переменные окружения
 load_dotenv('.env')
@@ -30,6 +43,23 @@ load_dotenv('.env')
 logging.basicConfig(level=logging.INFO, format='[{asctime}] #{levelname:4} {name}:{lineno} - {message}', style='{')
 logger = logging.getLogger('main_processor.py')
 
+# Потоковая загрузка отчетов по объявлениям и группам (без буферизации всего TSV в памяти)
+STREAM_REPORTS = os.getenv("STREAM_REPORTS", "True").lower() in ("1", "true", "yes")
+
+# Сборка статистики из хранилища дневной статистики (из API запрашиваются только недостающие дни)
+STATS_WAREHOUSE = os.getenv("STATS_WAREHOUSE", "False").lower() in ("1", "true", "yes")
+
+# Кэш объектов клиента (из API запрашиваются только кампании, изменившиеся по данным сервиса Changes)
+ENTITY_CACHE = os.getenv("ENTITY_CACHE", "False").lower() in ("1", "true", "yes")
+
+# Режим службы для WORKER_TYPE=all (процесс не завершается и ждет новых отчетов);
+# по умолчанию - однократный запуск: обработать отчеты в статусе 1 и завершиться
+SERVICE_MODE = os.getenv("SERVICE_MODE", "False").lower() in ("1", "true", "yes")
+
+# Тип процесса: all - все этапы отчета в одном процессе, либо один этап из очереди reporttasks
+# (api-fetch / browser-capture / doc-render, см. task_queue)
+WORKER_TYPE = os.getenv("WORKER_TYPE", "all")
+
 
 class MainProcessor:
     """Главный процессор для управления всеми скриптами"""
@@ -40,19 +70,32 @@ class MainProcessor:
         self.current_account = None
         self.current_client_login = None
         self.current_report_id = None
+        # Периоды, уже синхронизированные с хранилищем дневной статистики в этом запуске
+        self._warehouse_synced = set()
+        # Кэш объектов Директа текущего клиента
+        self.entity_cache = None
+        # Режим службы: соединения с БД и MinIO и веб-драйвер остаются открытыми между запусками
+        self.keep_alive = False
+        # Запрошена остановка службы: новые отчеты не берутся в обработку
+        self.stop_event = threading.Event()
+        # Текст последней ошибки этапа (записывается в задачу очереди)
+        self.last_error = None
 
     def run_all_scripts(self):
         """Запускает все скрипты по очереди"""
         print("🚀 Запуск централизованной обработки всех скриптов")
         print("=" * 80)
 
+        self._warehouse_synced = set()
+
         # Подключаемся к БД
-        if not self.db.connect():
+        connected = self.db.ensure_connected() if self.keep_alive else self.db.connect()
+        if not connected:
             print("❌ Не удалось подключиться к БД")
             return False
 
-        # Подключаемся к MinIO
-        if not self.minio_client.connect():
+        # Подключаемся к MinIO (клиент и пул соединений общие для процесса)
+        if not (self.keep_alive and self.minio_client.client) and not self.minio_client.connect():
             print("❌ Не удалось подключиться к MinIO")
             return False
 
@@ -73,6 +116,10 @@ class MainProcessor:
 
             # Обрабатываем каждый отчет
             for report in reports:
+                if self.stop_event.is_set():
+                    print("🛑 Остановка: оставшиеся отчеты будут обработаны при следующем запуске")
+                    break
+
                 print(f"\n📋 Обработка отчета ID: {report['id']}")
                 print("-" * 60)
 
@@ -80,6 +127,8 @@ class MainProcessor:
                 self.current_report_id = report['id']
 
                 success = self.process_single_report(report, yandex_accounts, wordstat_accounts)
+                if self.keep_alive:
+                    self.release_report(report['id'])
                 if not success:
                     print(f"❌ Ошибка обработки отчета {report['id']}")
                     continue
@@ -92,11 +141,97 @@ class MainProcessor:
             raise
 
         finally:
-            self.db.disconnect()
+            if self.keep_alive:
+                self.end_db_transaction()
+            else:
+                self.db.disconnect()
+
+    def run_stage_task(self, stage: str) -> bool:
+        """
+        Выполняет одну задачу этапа из очереди reporttasks
+        :return: True, если задача была (независимо от результата), False - очередь этапа пуста
+        """
+        if not self.db.ensure_connected():
+            print("❌ Не удалось подключиться к БД")
+            return False
+        if not self.minio_client.client and not self.minio_client.connect():
+            print("❌ Не удалось подключиться к MinIO")
+            return False
+
+        queue = TaskQueue(self.db.connection)
+        task = None
+        try:
+            if stage == STAGE_API_FETCH:
+                queue.enqueue_new_reports()
+            task = queue.claim(stage)
+            if task is None:
+                return False
+
+            report = task['report']
+            self.current_report_id = report['id']
+            self._warehouse_synced = set()
+            self.last_error = None
+            print(f"\n📋 Этап {stage} отчета ID: {report['id']} (попытка {task['attempts']})")
+            print("-" * 60)
+
+            # Пока этап выполняется, аренда задачи продлевается, и другие процессы ее не забирают
+            with TaskHeartbeat(task, queue.worker_id):
+                if stage == STAGE_API_FETCH:
+                    success = self.run_api_stage(report, self.db.get_yandex_accounts(),
+                                                 self.db.get_wordstat_accounts())
+                elif stage == STAGE_BROWSER_CAPTURE:
+                    success = self.run_browser_stage(report)
+                else:
+                    success = self.run_render_stage(report)
+
+            if success:
+                queue.complete(task, stage)
+                print(f"✅ Этап {stage} отчета {report['id']} выполнен")
+            else:
+                queue.fail(task, self.last_error or 'Этап завершился с ошибкой')
+            return True
+
+        finally:
+            if task is not None:
+                self.release_report(task['report']['id'])
+            self.end_db_transaction()
+
+    def end_db_transaction(self):
+        """Завершает транзакцию открытого соединения, чтобы оно не простаивало в транзакции между запусками"""
+        try:
+            if self.db.connection is not None and not self.db.connection.closed:
+                self.db.connection.rollback()
+        except Exception as e:
+            print(f"⚠️ Ошибка завершения транзакции: {e}")
+
+    def release_report(self, report_id):
+        """Освобождает данные отчета, которые процесс держит в памяти (индекс, манифест)"""
+        release_report_index(self.minio_client.bucket_name, report_id)
+        release_manifest_writer(self.minio_client.bucket_name, report_id)
+
+    def close(self):
+        """Закрывает соединения службы"""
+        self.db.disconnect()
+        # Веб-драйвер рендеринга есть, только если этап 13 выполнялся
+        very_good_generator = sys.modules.get('ad_screenshots_very_good_generator')
+        if very_good_generator is not None:
+            very_good_generator.close_shared_driver()
 
     def process_single_report(self, report: Dict, yandex_accounts: List[Dict],
                               wordstat_accounts: List[Dict]) -> bool:
         """Обрабатывает один отчет всеми скриптами по очереди"""
+        return (self.run_api_stage(report, yandex_accounts, wordstat_accounts)
+                and self.run_browser_stage(report)
+                and self.run_render_stage(report))
+
+    def fail_report(self, error: Exception):
+        """Отчет не обработан: статус 4 с текстом ошибки"""
+        print(f"❌ Ошибка обработки отчета: {error}")
+        self.last_error = str(error)
+        write_status(self.current_report_id, 4, str(error).replace("'", ''))
+
+    def run_api_stage(self, report: Dict, yandex_accounts: List[Dict], wordstat_accounts: List[Dict]) -> bool:
+        """Этап api-fetch: данные Директа и Wordstat, статистика, индекс отчета, URL (шаги 1-11)"""
         try:
             # Получаем данные заявки и договора
             request_data = self.db.get_request_data(report['id_requests'])
@@ -126,113 +261,205 @@ class MainProcessor:
             # статус отчёта 2 - в обработке
             write_status(report['id'], 2)
 
-            # 1. Получаем данные о кампаниях (get_campaigns_data)
-            print("\n🔹 Шаг 1: Получение данных о кампаниях")
-            campaigns_processor = CampaignsDataProcessor()
-            campaigns_processor.api_client = DirectAPIClient(
-                self.current_account['direct_api_token'],
-                self.current_client_login
-            )
-            campaigns_data = campaigns_processor.get_campaigns_data()
-            if not campaigns_data:
-                print("❌ Ошибка получения данных о кампаниях")
-                return False
+            # Кэш объектов клиента
+            self.entity_cache = self.open_entity_cache() if ENTITY_CACHE else None
 
-            # Сохраняем данные в MinIO
-            success = self.minio_client.upload_json_data(
-                campaigns_data,
-                "campaigns.json",
-                report['id']
+            # Контрольные точки шагов: повторный запуск продолжает с первого незавершенного шага
+            checkpoints = self.open_checkpoints(
+                report['id'], inputs_fingerprint(request_data, contract_data, self.current_client_login)
             )
-            if not success:
-                print("❌ Ошибка сохранения данных в MinIO")
+
+            # 1. Получаем данные о кампаниях (get_campaigns_data)
+            print("\n🔹 Шаг 1: Получение данных о кампаниях")
+            if not checkpoints.run('campaigns', lambda: self.fetch_campaigns(report)):
                 return False
 
             # 2. Получаем группы объявлений (get_adgroups_data)
             print("\n🔹 Шаг 2: Получение групп объявлений")
-            adgroups_processor = AdGroupsDataProcessor()
-            adgroups_processor.api_client = DirectAPIClient(
-                self.current_account['direct_api_token'],
-                self.current_client_login
-            )
-            adgroups_processor.minio_client = self.minio_client
-
-            # Получаем удаленные группы для исключения
-            deleted_group_ids = self.get_deleted_groups(request_data)
-
-            adgroups_data = adgroups_processor.get_adgroups_data(campaign_ids, deleted_group_ids)
-            if not adgroups_data:
-                print("❌ Ошибка получения данных о группах")
+            if not checkpoints.run('adgroups', lambda: self.fetch_adgroups(report, request_data, campaign_ids)):
                 return False
 
-            # Сохраняем данные в MinIO
-            adgroups_processor.save_adgroups_data(adgroups_data, report)
-
             # 3. Получаем объявления (get_campaign_ads)
             print("\n🔹 Шаг 3: Получение объявлений")
-            ads_success = self.get_campaign_ads(campaign_ids, report, request_data, contract_data)
+            ads_success = checkpoints.run(
+                'ads', lambda: self.get_campaign_ads(campaign_ids, report, request_data, contract_data)
+            )
             if not ads_success:
                 print("❌ Ошибка получения объявлений")
                 return False
 
             # 4. Получаем расширения и быстрые ссылки (get_extensions_and_sitelinks)
             print("\n🔹 Шаг 4: Получение расширений и быстрых ссылок")
-            extensions_success = self.get_extensions_and_sitelinks(report)
+            extensions_success = checkpoints.run('extensions', lambda: self.get_extensions_and_sitelinks(report))
             if not extensions_success:
                 print("⚠️ Ошибка получения расширений, продолжаем...")
 
             # 5. Получаем хеши изображений (get_image_hashes_from_report)
             print("\n🔹 Шаг 5: Получение хешей изображений")
-            images_success = self.get_image_hashes_from_report(report)
+            images_success = checkpoints.run('images', lambda: self.get_image_hashes_from_report(report))
             if not images_success:
                 print("⚠️ Ошибка получения хешей изображений, продолжаем...")
 
+            # Сохраняем кэш объектов с меткой времени текущей синхронизации
+            if self.entity_cache:
+                self.entity_cache.save()
+
             # 6. Получаем прогнозы трафика (get_keywords_traffic_forecast)
             print("\n🔹 Шаг 6: Получение прогнозов трафика")
-            keywords_success = self.get_keywords_traffic_forecast(campaign_ids, report, request_data, contract_data)
+            keywords_success = checkpoints.run(
+                'keywords_forecast',
+                lambda: self.get_keywords_traffic_forecast(campaign_ids, report, request_data, contract_data)
+            )
             if not keywords_success:
                 print("⚠️ Ошибка получения прогнозов трафика, продолжаем...")
 
             # 7. Получаем статистику по кампаниям (get_campaign_stats)
             print("\n🔹 Шаг 7: Получение статистики по кампаниям")
-            stats_success = self.get_campaign_stats(campaign_ids, report, request_data, contract_data)
+            stats_success = checkpoints.run(
+                'campaign_stats', lambda: self.get_campaign_stats(campaign_ids, report, request_data, contract_data)
+            )
             if not stats_success:
                 print("⚠️ Ошибка получения статистики по кампаниям, продолжаем...")
 
             # 8. Получаем статистику по объявлениям (get_ad_stats)
             print("\n🔹 Шаг 8: Получение статистики по объявлениям")
-            ad_stats_success = self.get_ad_stats(campaign_ids, report, request_data, contract_data)
+            ad_stats_success = checkpoints.run(
+                'ad_stats', lambda: self.get_ad_stats(campaign_ids, report, request_data, contract_data)
+            )
             if not ad_stats_success:
                 print("⚠️ Ошибка получения статистики по объявлениям, продолжаем...")
 
             # 9. Получаем статистику по группам объявлений (get_adgroup_stats)
             print("\n🔹 Шаг 9: Получение статистики по группам объявлений")
-            adgroup_stats_success = self.get_adgroup_stats(campaign_ids, report, request_data, contract_data)
+            adgroup_stats_success = checkpoints.run(
+                'adgroup_stats', lambda: self.get_adgroup_stats(campaign_ids, report, request_data, contract_data)
+            )
             if not adgroup_stats_success:
                 print("⚠️ Ошибка получения статистики по группам объявлений, продолжаем...")
 
+            # Индекс связей данных отчета для генераторов документов
+            print("\n🔹 Построение индекса отчета")
+            if not checkpoints.run('report_index', lambda: self.build_report_index(report)):
+                print("⚠️ Ошибка построения индекса отчета, продолжаем...")
+
             # 10. Обрабатываем Wordstat данные (get_wordstat_data)
             print("\n🔹 Шаг 10: Обработка Wordstat данных")
-            wordstat_success = self.get_wordstat_data(wordstat_accounts)
+            wordstat_success = checkpoints.run('wordstat', lambda: self.get_wordstat_data(wordstat_accounts))
             if not wordstat_success:
                 print("⚠️ Ошибка обработки Wordstat данных, продолжаем...")
 
             # 11. Генерируем URL отчетов (generate_report_urls)
             print("\n🔹 Шаг 11: Генерация URL отчетов")
-            urls_success = self.generate_report_urls(report, request_data, contract_data, campaign_ids)
+            urls_success = checkpoints.run(
+                'report_urls',
+                lambda: self.generate_report_urls(report, request_data, contract_data, campaign_ids)
+            )
             if not urls_success:
                 print("⚠️ Ошибка генерации URL отчетов, продолжаем...")
 
+            # Следующие этапы читают артефакты из MinIO: дожидаемся фоновых загрузок
+            if not wait_all_uploads():
+                print("⚠️ Часть артефактов отчета не загружена в MinIO, продолжаем...")
+                checkpoints.invalidate_completed()
+            # Объекты, загруженные после завершения своих шагов, записываются в манифест одним PUT
+            flush_manifest_writers()
+            return True
+
+        except Exception as e:
+            self.fail_report(e)
+            return False
+
+    def open_checkpoints(self, report_id, fingerprint: Optional[str] = None) -> StageCheckpoints:
+        """Контрольные точки шагов отчета (в манифесте отчета)"""
+        manifest = manifest_writer(self.minio_client.client, self.minio_client.bucket_name, report_id)
+        return StageCheckpoints(manifest, fingerprint)
+
+    def fetch_campaigns(self, report: Dict) -> bool:
+        """Шаг 1: данные о кампаниях"""
+        campaigns_processor = CampaignsDataProcessor()
+        campaigns_processor.api_client = DirectAPIClient(
+            self.current_account['direct_api_token'],
+            self.current_client_login
+        )
+        # Кампании запрашиваются всегда, в кэш объектов они не попадают (см. entity_cache)
+        campaigns_data = campaigns_processor.get_campaigns_data()
+        if not campaigns_data:
+            print("❌ Ошибка получения данных о кампаниях")
+            return False
+
+        # Сохраняем данные в MinIO
+        success = self.minio_client.upload_json_data(
+            campaigns_data,
+            "campaigns.json",
+            report['id']
+        )
+        if not success:
+            print("❌ Ошибка сохранения данных в MinIO")
+            return False
+        return True
+
+    def fetch_adgroups(self, report: Dict, request_data: Dict, campaign_ids: List[int]) -> bool:
+        """Шаг 2: группы объявлений"""
+        adgroups_processor = AdGroupsDataProcessor()
+        adgroups_processor.api_client = DirectAPIClient(
+            self.current_account['direct_api_token'],
+            self.current_client_login
+        )
+        adgroups_processor.minio_client = self.minio_client
+
+        # Получаем удаленные группы для исключения
+        deleted_group_ids = self.get_deleted_groups(request_data)
+
+        if self.entity_cache:
+            adgroups_data = self.get_cached_adgroups(adgroups_processor, campaign_ids, deleted_group_ids)
+        else:
+            adgroups_data = adgroups_processor.get_adgroups_data(campaign_ids, deleted_group_ids)
+        if not adgroups_data:
+            print("❌ Ошибка получения данных о группах")
+            return False
+
+        # Сохраняем данные в MinIO
+        adgroups_processor.save_adgroups_data(adgroups_data, report)
+        return True
+
+    def run_browser_stage(self, report: Dict) -> bool:
+        """Этап browser-capture: скриншоты отчетов и объявлений в Chrome (шаги 12-13)"""
+        try:
+            # Входные данные - отпечаток, записанный этапом api-fetch
+            checkpoints = self.open_checkpoints(report['id'])
+
             # 12. Генерируем скриншоты отчетов (generate_screenshots)
             print("\n🔹 Шаг 12: Генерация скриншотов отчетов")
-            screenshots_success = self.generate_screenshots(report)
+            screenshots_success = checkpoints.run('screenshots', lambda: self.generate_screenshots(report))
             if not screenshots_success:
                 print("⚠️ Ошибка генерации скриншотов, продолжаем...")
 
             # 13. Генерация very_good_ads
             logger.info('Шаг 13: Исполнение ad_screenshots_very_good_generator.py...')
-            very_good_screenshot_generator(self.current_report_id)
+            # Шаг выполнен, только если в манифест записан хотя бы один скриншот
+            if not checkpoints.run('top_ads_screenshots', self.generate_top_ads_screenshots, require_outputs=True):
+                print("⚠️ Скриншоты топ объявлений не созданы, продолжаем...")
+
+            # Генераторы файлов читают артефакты из MinIO: дожидаемся фоновых загрузок
+            if not wait_all_uploads():
+                print("⚠️ Часть артефактов отчета не загружена в MinIO, продолжаем...")
+                checkpoints.invalidate_completed()
+            # Объекты, загруженные после завершения своих шагов, записываются в манифест одним PUT
+            flush_manifest_writers()
+            return True
+
+        except Exception as e:
+            self.fail_report(e)
+            return False
 
+    def generate_top_ads_screenshots(self) -> bool:
+        """Шаг 13: скриншоты топ объявлений"""
+        from ad_screenshots_very_good_generator import very_good_screenshot_generator
+        return very_good_screenshot_generator(self.current_report_id, keep_driver=self.keep_alive)
+
+    def run_render_stage(self, report: Dict) -> bool:
+        """Этап doc-render: формирование файлов-отчетов (шаг 14)"""
+        try:
             # 14. Генерация файлов-отчётов
             # print('Формирование файлов отчёта...')
             logger.info('Шаг 14: Формирую файлы отчётов...')
@@ -244,6 +471,8 @@ class MainProcessor:
             finally:
                 file_formatter.close_connect()
 
+            log_pool_stats()
+
             # статус обработки 3 - завершено
             write_status(self.current_report_id, 3, 'Успешно обработан')
 
@@ -251,8 +480,7 @@ class MainProcessor:
             return True
 
         except Exception as e:
-            print(f"❌ Ошибка обработки отчета: {e}")
-            write_status(self.current_report_id, 4, str(e).replace("'", ''))
+            self.fail_report(e)
             return False
 
     def setup_api_client(self, accounts: List[Dict], contract_data: Dict) -> bool:
@@ -302,6 +530,51 @@ class MainProcessor:
             print(f"❌ Ошибка настройки API клиента: {e}")
             return False
 
+    def open_entity_cache(self) -> Optional[EntityCache]:
+        """Загружает кэш объектов текущего клиента и определяет изменения с прошлой синхронизации"""
+        try:
+            cache = EntityCache(self.minio_client, self.current_client_login)
+            if cache.load():
+                print(f"📦 Загружен кэш объектов клиента {self.current_client_login}")
+            else:
+                print(f"📦 Кэш объектов клиента {self.current_client_login} не найден, будет создан")
+
+            api_client = DirectAPIClient(
+                self.current_account['direct_api_token'],
+                self.current_client_login
+            )
+            cache.sync(api_client)
+            return cache
+
+        except Exception as e:
+            print(f"⚠️ Ошибка загрузки кэша объектов, данные будут запрошены из API: {e}")
+            return None
+
+    def get_cached_adgroups(self, adgroups_processor: AdGroupsDataProcessor, campaign_ids: List[int],
+                            deleted_group_ids: List[int]) -> Optional[Dict]:
+        """Получает группы объявлений через кэш объектов (из API - только для изменившихся кампаний)"""
+        campaign_ids = [int(campaign_id) for campaign_id in campaign_ids]
+        adgroups = self.entity_cache.get_campaign_entities(
+            'adgroups', campaign_ids, adgroups_processor.get_adgroups_data, 'AdGroups'
+        )
+        if deleted_group_ids:
+            adgroups = [adgroup for adgroup in adgroups if adgroup.get('Id') not in deleted_group_ids]
+        if not adgroups:
+            return None
+
+        print(f"✅ Итого групп: {len(adgroups)}")
+        return {
+            "result": {
+                "AdGroups": adgroups
+            },
+            "_meta": {
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "api_method": "adgroups.get",
+                "api_version": "v5",
+                "source": "entity_cache"
+            }
+        }
+
     def get_campaign_ads(self, campaign_ids: List[int], report: Dict,
                          request_data: Dict, contract_data: Dict) -> bool:
         """Получает объявления по кампаниям"""
@@ -312,8 +585,24 @@ class MainProcessor:
                 self.current_client_login
             )
 
-            # Получаем объявления
-            ads_data = api_client.get_ads_by_campaigns(campaign_ids)
+            # Получаем объявления (через кэш - только для изменившихся кампаний)
+            if self.entity_cache:
+                ads = self.entity_cache.get_campaign_entities(
+                    'ads', campaign_ids, api_client.get_ads_by_campaigns, 'Ads'
+                )
+                ads_data = {
+                    'result': {
+                        'Ads': ads
+                    },
+                    '_meta': {
+                        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        'api_method': 'ads.get',
+                        'api_version': 'v5',
+                        'source': 'entity_cache'
+                    }
+                } if ads else None
+            else:
+                ads_data = api_client.get_ads_by_campaigns(campaign_ids)
             if not ads_data:
                 print("❌ Не удалось получить объявления")
                 return False
@@ -359,14 +648,35 @@ class MainProcessor:
             # Скачиваем быстрые ссылки
             sitelinks_data = {}
             if sitelink_set_ids:
-                for sitelink_id in sitelink_set_ids:
-                    sitelink_data = api_client.get_sitelinks_by_set_id(sitelink_id)
-                    if sitelink_data:
-                        sitelinks_data[sitelink_id] = sitelink_data
+                if self.entity_cache:
+                    sitelinks_data = self.entity_cache.get_by_ids(
+                        'sitelinks', sitelink_set_ids, lambda ids: self.fetch_sitelinks(api_client, ids)
+                    )
+                else:
+                    sitelinks_data = self.fetch_sitelinks(api_client, sitelink_set_ids)
 
             # Скачиваем расширения
             extensions_data = {}
-            if extension_ids:
+            if extension_ids and self.entity_cache:
+                extensions = self.entity_cache.get_by_ids(
+                    'extensions', extension_ids, lambda ids: self.fetch_extensions(api_client, ids)
+                )
+                extensions_list = list(extensions.values())
+                batch_size = 1000
+                for i in range(0, len(extensions_list), batch_size):
+                    batch = extensions_list[i:i + batch_size]
+                    extensions_data[f'batch_{i // batch_size + 1}'] = {
+                        "result": {
+                            "AdExtensions": batch
+                        },
+                        "_meta": {
+                            "total_extensions": len(batch),
+                            "requested_ids": len(batch),
+                            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            "source": "entity_cache"
+                        }
+                    }
+            elif extension_ids:
                 # Разбиваем на батчи по 1000 ID
                 extension_ids_list = list(extension_ids)
                 batch_size = 1000
@@ -389,6 +699,34 @@ class MainProcessor:
             print(f"❌ Ошибка получения расширений: {e}")
             return False
 
+    def fetch_sitelinks(self, api_client: DirectAPIClient, sitelink_set_ids) -> Dict:
+        """Скачивает наборы быстрых ссылок: ID набора -> ответ API"""
+        sitelinks_data = {}
+        for sitelink_id in sitelink_set_ids:
+            sitelink_data = api_client.get_sitelinks_by_set_id(sitelink_id)
+            if sitelink_data:
+                sitelinks_data[sitelink_id] = sitelink_data
+        return sitelinks_data
+
+    def fetch_extensions(self, api_client: DirectAPIClient, extension_ids) -> Dict:
+        """Скачивает расширения батчами по 1000 ID: ID расширения -> расширение"""
+        extensions = {}
+        extension_ids_list = list(extension_ids)
+        batch_size = 1000
+        for i in range(0, len(extension_ids_list), batch_size):
+            batch_data = api_client.get_extensions_by_ids(extension_ids_list[i:i + batch_size])
+            if batch_data:
+                for extension in batch_data['result']['AdExtensions']:
+                    extensions[extension['Id']] = extension
+        return extensions
+
+    def fetch_images(self, api_client: DirectAPIClient, image_hashes) -> Dict:
+        """Скачивает данные изображений: хеш -> изображение"""
+        image_data = api_client.get_image_urls_by_hashes(list(image_hashes))
+        if not image_data:
+            return {}
+        return {image['AdImageHash']: image for image in image_data['result']['AdImages']}
+
     def get_image_hashes_from_report(self, report: Dict) -> bool:
         """Получает хеши изображений из отчета"""
         try:
@@ -413,7 +751,23 @@ class MainProcessor:
             )
 
             # Получаем данные изображений
-            image_data = api_client.get_image_urls_by_hashes(list(unique_hashes))
+            if self.entity_cache:
+                images = self.entity_cache.get_by_ids(
+                    'images', unique_hashes, lambda hashes: self.fetch_images(api_client, hashes)
+                )
+                image_data = {
+                    "result": {
+                        "AdImages": list(images.values())
+                    },
+                    "_meta": {
+                        "total_images": len(images),
+                        "total_hashes": len(unique_hashes),
+                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                        "source": "entity_cache"
+                    }
+                }
+            else:
+                image_data = api_client.get_image_urls_by_hashes(list(unique_hashes))
             if not image_data:
                 print("❌ Не удалось получить данные изображений")
                 return False
@@ -439,7 +793,7 @@ class MainProcessor:
                     self.minio_client.bucket_name,
                     adgroups_file
                 )
-                adgroups_data = json.loads(response.read().decode('utf-8'))
+                adgroups_data = decode_json(response.read())
                 response.close()
                 response.release_conn()
             except Exception as e:
@@ -499,16 +853,32 @@ class MainProcessor:
             # Получаем удаленные группы для исключения
             deleted_group_ids = self.get_deleted_groups(request_data)
 
+            # Собираем статистику из хранилища дневной статистики
+            warehouse_data = self.get_stats_from_warehouse(
+                'campaign', api_client, campaign_ids, start_date, end_date, deleted_group_ids
+            )
+            if warehouse_data:
+                summary_data = self.get_stats_from_warehouse(
+                    'summary', api_client, campaign_ids, start_date, end_date, deleted_group_ids
+                )
+                if (summary_data
+                        and self.minio_client.upload_campaign_stats_data(warehouse_data, report['id'])
+                        and self.minio_client.upload_campaign_stats_summary_data(summary_data, report['id'])):
+                    print(f"💾 Статистика кампаний из хранилища сохранена в MinIO для отчета {report['id']}")
+                    return True
+                print("⚠️ Не удалось собрать статистику кампаний из хранилища, запрашиваем отчеты из API")
+
             # Создаем основной отчет с учетом удаленных групп
             if deleted_group_ids:
                 print(f"🔧 Используем кастомный отчет с фильтрацией по группам")
-                report_data = api_client.create_custom_campaign_report_with_group_filter(
-                    campaign_ids, start_date, end_date, deleted_group_ids
+                report_data = run_sharded_report(
+                    api_client, 'create_custom_campaign_report_with_group_filter',
+                    campaign_ids, start_date, end_date, deleted_group_ids=deleted_group_ids
                 )
             else:
                 print(f"🔧 Используем стандартный отчет по кампаниям")
-                report_data = api_client.create_campaign_performance_report(
-                    campaign_ids, start_date, end_date
+                report_data = run_sharded_report(
+                    api_client, 'create_campaign_performance_report', campaign_ids, start_date, end_date
                 )
 
             if not report_data:
@@ -576,17 +946,38 @@ class MainProcessor:
             # Получаем удаленные группы для исключения
             deleted_group_ids = self.get_deleted_groups(request_data)
 
+            # Собираем статистику из хранилища дневной статистики
+            warehouse_data = self.get_stats_from_warehouse(
+                'ad', api_client, campaign_ids, start_date, end_date, deleted_group_ids
+            )
+            if warehouse_data and self.minio_client.upload_ad_stats_data(warehouse_data, report['id']):
+                print(f"💾 Статистика объявлений из хранилища сохранена в MinIO для отчета {report['id']}")
+                return True
+            if warehouse_data:
+                print("⚠️ Не удалось сохранить статистику объявлений из хранилища, запрашиваем отчет из API")
+
             # Создаем отчет с учетом удаленных групп
-            report_data = api_client.create_ad_performance_report(
-                campaign_ids, start_date, end_date, deleted_group_ids
+            sink = self.minio_client.open_report_stream(
+                f"ad_stats_{report['id']}.tsv", report['id'], AD_STATS_FIELDS, "AD_PERFORMANCE_REPORT",
+                f"ad_stats_{report['id']}.json"
+            ) if STREAM_REPORTS else None
+            report_data = run_sharded_report(
+                api_client, 'create_ad_performance_report', campaign_ids, start_date, end_date,
+                sink=sink, deleted_group_ids=deleted_group_ids
             )
 
             if not report_data:
+                if sink:
+                    sink.abort()
                 print("❌ Не удалось создать отчет по объявлениям")
                 return False
 
-            # Данные уже обработаны API, сохраняем их напрямую
-            success = self.minio_client.upload_ad_stats_data(report_data, report['id'])
+            if sink:
+                # TSV и JSON-представление записаны потоково, завершаем загрузки
+                success = self.minio_client.finish_stats_stream(sink, report['id'])
+            else:
+                # Данные уже обработаны API, сохраняем их напрямую
+                success = self.minio_client.upload_ad_stats_data(report_data, report['id'])
             if success:
                 print(f"💾 Данные статистики объявлений сохранены в MinIO для отчета {report['id']}")
                 return True
@@ -619,17 +1010,38 @@ class MainProcessor:
             # Получаем удаленные группы для исключения
             deleted_group_ids = self.get_deleted_groups(request_data)
 
+            # Собираем статистику из хранилища дневной статистики
+            warehouse_data = self.get_stats_from_warehouse(
+                'adgroup', api_client, campaign_ids, start_date, end_date, deleted_group_ids
+            )
+            if warehouse_data and self.minio_client.upload_adgroup_stats_data(warehouse_data, report['id']):
+                print(f"💾 Статистика групп объявлений из хранилища сохранена в MinIO для отчета {report['id']}")
+                return True
+            if warehouse_data:
+                print("⚠️ Не удалось сохранить статистику групп объявлений из хранилища, запрашиваем отчет из API")
+
             # Создаем отчет с учетом удаленных групп
-            report_data = api_client.create_adgroup_performance_report(
-                campaign_ids, start_date, end_date, deleted_group_ids
+            sink = self.minio_client.open_report_stream(
+                f"adgroup_stats_{report['id']}.tsv", report['id'], ADGROUP_STATS_FIELDS, "ADGROUP_PERFORMANCE_REPORT",
+                f"adgroup_stats_{report['id']}.json"
+            ) if STREAM_REPORTS else None
+            report_data = run_sharded_report(
+                api_client, 'create_adgroup_performance_report', campaign_ids, start_date, end_date,
+                sink=sink, deleted_group_ids=deleted_group_ids
             )
 
             if not report_data:
+                if sink:
+                    sink.abort()
                 print("❌ Не удалось создать отчет по группам объявлений")
                 return False
 
-            # Данные уже обработаны API, сохраняем их напрямую
-            success = self.minio_client.upload_adgroup_stats_data(report_data, report['id'])
+            if sink:
+                # TSV и JSON-представление записаны потоково, завершаем загрузки
+                success = self.minio_client.finish_stats_stream(sink, report['id'])
+            else:
+                # Данные уже обработаны API, сохраняем их напрямую
+                success = self.minio_client.upload_adgroup_stats_data(report_data, report['id'])
             if success:
                 print(f"💾 Данные статистики групп объявлений сохранены в MinIO для отчета {report['id']}")
                 return True
@@ -641,6 +1053,32 @@ class MainProcessor:
             print(f"❌ Ошибка получения статистики по группам объявлений: {e}")
             return False
 
+    def get_stats_from_warehouse(self, kind: str, api_client: DirectAPIClient, campaign_ids: List[int],
+                                 start_date: str, end_date: str, deleted_group_ids: List[int]) -> Optional[Dict]:
+        """
+        Собирает отчет статистики из хранилища дневной статистики.
+        Перед первой сборкой за период из API дозагружаются недостающие и неокончательные дни
+        :param kind: campaign / summary / ad / adgroup
+        :return: данные в формате ответа DirectAPIClient или None (хранилище выключено или недоступно)
+        """
+        if not STATS_WAREHOUSE:
+            return None
+
+        try:
+            client_login = self.current_client_login or ''
+            warehouse = StatsWarehouse(self.db.connection)
+            key = (client_login, tuple(sorted(campaign_ids)), start_date, end_date)
+            if key not in self._warehouse_synced:
+                if not warehouse.sync(api_client, client_login, campaign_ids, start_date, end_date):
+                    return None
+                self._warehouse_synced.add(key)
+
+            return warehouse.build_report(kind, client_login, campaign_ids, start_date, end_date, deleted_group_ids)
+
+        except Exception as e:
+            print(f"❌ Ошибка получения статистики из хранилища: {e}")
+            return None
+
     def get_report_dates(self, request_data: Dict) -> tuple:
         """Получает даты начала и окончания из данных заявки"""
         try:
@@ -747,6 +1185,23 @@ class MainProcessor:
             print(f"❌ Ошибка фильтрации объявлений: {e}")
             return ads_data
 
+    def build_report_index(self, report: Dict) -> bool:
+        """Строит индекс связей данных отчета и сохраняет его в папку отчета"""
+        try:
+            index = ReportIndex.from_minio(self.minio_client.client, self.minio_client.bucket_name, report['id'])
+            if index is None:
+                return False
+            publish_report_index(self.minio_client.bucket_name, report['id'], index)
+            print(f"🗂️ Индекс отчета: кампаний {len(index.campaigns())}, "
+                  f"наборов быстрых ссылок {len(index.data['sitelink_sets'])}, "
+                  f"изображений {len(index.data['images'])}")
+            return self.minio_client.upload_json_data(index.to_dict(), report_index_filename(report['id']),
+                                                      report['id'])
+
+        except Exception as e:
+            print(f"❌ Ошибка построения индекса отчета: {e}")
+            return False
+
     def get_wordstat_data(self, wordstat_accounts: List[Dict]) -> bool:
         """Обрабатывает данные Wordstat с проверкой свежести"""
         # ВРЕМЕННО ОТКЛЮЧЕНО: Весь функционал закомментирован для пропуска обработки Wordstat данных
@@ -832,31 +1287,19 @@ class MainProcessor:
     def find_latest_ads_report(self, report_id: int) -> Optional[Dict]:
         """Находит файл ads_report в MinIO для указанного отчета"""
         try:
-            # Получаем список объектов с префиксом для указанного отчета
-            prefix = f"gen_report_context_contracts/data_yandex_direct/{report_id}_результаты/"
-            print(f"🔍 Поиск файлов с префиксом: {prefix}")
-            objects = self.minio_client.list_objects(prefix)
-            print(f"📁 Найдено объектов в MinIO: {len(objects)}")
-
-            # Фильтруем только файлы ads_report
-            ads_files = [obj for obj in objects if f"ads_report_{report_id}.json" in obj]
-            print(f"📄 Найдено файлов ads_report: {len(ads_files)}")
-
-            if not ads_files:
+            # Находим файл по манифесту отчета
+            latest_file = self.minio_client.find_report_file(report_id, f"ads_report_{report_id}.json")
+            if not latest_file:
                 print(f"❌ Файл ads_report_{report_id}.json не найден")
-                print(f"📋 Доступные файлы: {objects}")
                 return None
 
-            # Берем первый найденный файл (должен быть только один)
-            latest_file = ads_files[0]
-
             # Загружаем данные из MinIO
             try:
                 response = self.minio_client.client.get_object(
                     self.minio_client.bucket_name,
                     latest_file
                 )
-                data = json.loads(response.read().decode('utf-8'))
+                data = decode_json(response.read())
                 response.close()
                 response.release_conn()
                 return data
@@ -1090,6 +1533,9 @@ class MainProcessor:
     def generate_screenshots(self, report: Dict) -> bool:
         """Генерирует скриншоты отчетов"""
         try:
+            # Selenium, webdriver_manager и PIL загружаются только на этапе скриншотов
+            from generate_screenshots_refactored import ScreenshotGenerator
+
             # Создаем генератор скриншотов
             screenshot_generator = ScreenshotGenerator()
             screenshot_generator.db = self.db
@@ -1121,20 +1567,98 @@ def main():
         print("Проверьте файл .env")
         return
 
-    while True:
-        # Создаем и запускаем главный процессор
-        processor = MainProcessor()
-
-        try:
-            success = processor.run_all_scripts()
-            if success:
-                print("\n✅ Все скрипты выполнены успешно")
-            else:
-                print("\n❌ Обработка завершена с ошибками")
-        except Exception as e:
-            print(f"\n❌ Критическая ошибка: {e}")
-
-        time.sleep(60)
+    if WORKER_TYPE == 'all':
+        if SERVICE_MODE:
+            run_service()
+        else:
+            run_processor(MainProcessor())
+    elif WORKER_TYPE in STAGES:
+        run_stage_worker(WORKER_TYPE)
+    else:
+        print(f"❌ Неизвестный WORKER_TYPE: {WORKER_TYPE} (допустимо: all, {', '.join(STAGES)})")
+
+
+def run_processor(processor: MainProcessor) -> bool:
+    """Один запуск обработки отчетов в статусе 1"""
+    try:
+        success = processor.run_all_scripts()
+        if success:
+            print("\n✅ Все скрипты выполнены успешно")
+        else:
+            print("\n❌ Обработка завершена с ошибками")
+        return success
+    except Exception as e:
+        print(f"\n❌ Критическая ошибка: {e}")
+        return False
+
+
+def run_service():
+    """
+    Режим службы: процесс держит открытыми соединения с БД и MinIO и веб-драйвер,
+    просыпается по уведомлению о новом отчете (LISTEN/NOTIFY) или по таймауту опроса.
+    SIGTERM/SIGINT останавливают службу после текущего отчета
+    """
+    processor = MainProcessor()
+    processor.keep_alive = True
+    listener = ReportListener()
+    handle_stop_signals(processor)
+
+    # Подписываемся до первого опроса, чтобы не пропустить отчеты, поставленные во время обработки
+    listener.connect()
+    try:
+        while not processor.stop_event.is_set():
+            run_processor(processor)
+            report_ids = listener.wait(REPORTS_POLL_INTERVAL, processor.stop_event)
+            if report_ids:
+                print(f"\n🔔 Новые отчеты: {', '.join(sorted(report_ids))}")
+    finally:
+        listener.close()
+        processor.close()
+        print("👋 Служба остановлена")
+
+
+
+def handle_stop_signals(processor: MainProcessor):
+    """SIGTERM/SIGINT останавливают службу после текущего отчета (этапа)"""
+
+    def request_stop(signum, frame):
+        if processor.stop_event.is_set():
+            return
+        print(f"\n🛑 Получен сигнал {signal.Signals(signum).name}, завершение после текущего отчета")
+        processor.stop_event.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+
+def run_stage_worker(stage: str):
+    """
+    Процесс одного этапа: забирает задачи этапа из очереди reporttasks, пока они есть,
+    затем ждет уведомления о новой задаче (процессы api-fetch - и о новом отчете)
+    """
+    print(f"🧩 Процесс этапа {stage}")
+    processor = MainProcessor()
+    processor.keep_alive = True
+    channels = [stage_channel(stage)]
+    if stage == STAGE_API_FETCH:
+        channels.append(REPORTS_NOTIFY_CHANNEL)
+    listener = ReportListener(*channels)
+    handle_stop_signals(processor)
+
+    listener.connect()
+    try:
+        while not processor.stop_event.is_set():
+            try:
+                has_task = processor.run_stage_task(stage)
+            except Exception as e:
+                print(f"\n❌ Критическая ошибка: {e}")
+                has_task = False
+            if not has_task:
+                listener.wait(REPORTS_POLL_INTERVAL, processor.stop_event)
+    finally:
+        listener.close()
+        processor.close()
+        print("👋 Служба остановлена")
 
 
 if __name__ == "__main__":
@@ -8,15 +8,255 @@
 import os
 import json
 import io
+import queue
+import threading
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Any
 from dotenv import load_dotenv
 from minio import Minio
 from minio.error import S3Error
 
+from report_tsv_parser import ReportTSVParser, ReportColumns, tsv_records_and_columns, tsv_to_records
+from stats_store import StatsTable, StatsTableWriter, stats_table_filename, load_stats_table
+from artifact_codec import decode_json, encode_json, new_compressor, columns_metadata, CODEC_METADATA_KEY, JSON_GZIP, JSON_PLAIN
+from report_manifest import manifest_writer, load_manifest, find_artifact, report_folder
+from upload_service import UploadService, get_upload_service
+from minio_factory import get_minio
+
+# Поля JSON-представления отчетов статистики (значения берутся по строке FieldNames отчета)
+CAMPAIGN_STATS_FIELDS = ["CampaignId", "CampaignName", "Impressions", "Clicks", "Ctr", "BounceRate"]
+SUMMARY_STATS_FIELDS = ["Impressions", "Clicks", "Ctr", "BounceRate", "Cost", "AvgCpc"]
+AD_STATS_FIELDS = ["CampaignId", "AdId", "Impressions", "Clicks", "Ctr", "BounceRate", "Cost", "AvgCpc"]
+ADGROUP_STATS_FIELDS = ["CampaignId", "AdGroupId", "AdGroupName", "CampaignType", "AdNetworkType",
+                        "Impressions", "Clicks", "Ctr", "BounceRate", "Cost", "AvgCpc"]
+
 # Загружаем переменные окружения
 load_dotenv('.env')
 
+# Размер части multipart-загрузки при потоковой выгрузке (минимум для S3 - 5 МБ)
+STREAM_UPLOAD_PART_SIZE = int(os.getenv('STREAM_UPLOAD_PART_SIZE', str(10 * 1024 * 1024)))
+# Количество частей, загружаемых параллельно
+STREAM_UPLOAD_PARALLEL = int(os.getenv('STREAM_UPLOAD_PARALLEL', '3'))
+
+
+# Маркер отмены потоковой загрузки
+_ABORT = object()
+
+
+class _QueueReader:
+    """Файлоподобный объект, читающий байты из очереди (для put_object)"""
+
+    def __init__(self, chunks: queue.Queue):
+        self._chunks = chunks
+        self._buffer = bytearray()
+        self._eof = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._chunks.get()
+            if chunk is _ABORT:
+                raise IOError("Потоковая загрузка отменена")
+            if chunk is None:
+                self._eof = True
+                break
+            self._buffer.extend(chunk)
+
+        if size < 0 or size >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+
+class StreamingUpload:
+    """
+    Потоковая загрузка объекта в MinIO.
+    Данные пишутся по частям, в фоне выполняется multipart-загрузка с параллельной отправкой
+    частей; объем памяти ограничен размером очереди и частей, а не размером файла
+    """
+
+    def __init__(self, client: Minio, bucket_name: str, object_name: str, content_type: str,
+                 chunk_size: int = 256 * 1024, queue_size: int = 16, metadata: Optional[Dict] = None,
+                 compressor=None):
+        self.object_name = object_name
+        self._chunk_size = chunk_size
+        # Потоковый компрессор (zlib.compressobj), данные сжимаются перед отправкой
+        self._compressor = compressor
+        self._pending = bytearray()
+        self._chunks = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._closed = False
+        self.bytes_written = 0
+        # Размер объекта в MinIO (после сжатия) и его ETag
+        self.bytes_stored = 0
+        self.etag = None
+
+        self._thread = threading.Thread(
+            target=self._upload,
+            args=(client, bucket_name, object_name, content_type, metadata),
+            daemon=True
+        )
+        self._thread.start()
+
+    def _upload(self, client: Minio, bucket_name: str, object_name: str, content_type: str,
+                metadata: Optional[Dict]):
+        try:
+            result = client.put_object(
+                bucket_name,
+                object_name,
+                _QueueReader(self._chunks),
+                length=-1,
+                part_size=STREAM_UPLOAD_PART_SIZE,
+                content_type=content_type,
+                metadata=metadata,
+                num_parallel_uploads=STREAM_UPLOAD_PARALLEL
+            )
+            self.etag = result.etag
+        except Exception as e:
+            self._error = e
+            # Освобождаем писателя, если он ждет места в очереди
+            while True:
+                try:
+                    self._chunks.get_nowait()
+                except queue.Empty:
+                    break
+
+    def _put(self, chunk):
+        while True:
+            if self._error:
+                raise self._error
+            try:
+                self._chunks.put(chunk, timeout=1)
+                if isinstance(chunk, bytes):
+                    self.bytes_stored += len(chunk)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data: bytes):
+        """Добавляет данные в загрузку"""
+        self.bytes_written += len(data)
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self._pending.extend(data)
+        if len(self._pending) >= self._chunk_size:
+            self._put(bytes(self._pending))
+            self._pending.clear()
+
+    def close(self) -> bool:
+        """Завершает загрузку и ждет её окончания"""
+        if self._closed:
+            return self._error is None
+        self._closed = True
+        try:
+            if self._compressor is not None:
+                self._pending.extend(self._compressor.flush())
+            if self._pending:
+                self._put(bytes(self._pending))
+                self._pending.clear()
+            self._put(None)
+        except Exception:
+            pass
+        self._thread.join()
+        if self._error:
+            print(f"❌ Ошибка потоковой загрузки {self.object_name}: {self._error}")
+            return False
+        print(f"💾 Данные сохранены в MinIO: {self.object_name} ({self.bytes_written} байт)")
+        return True
+
+    def abort(self):
+        """Отменяет загрузку; объект в MinIO не создается"""
+        if self._closed:
+            return
+        self._closed = True
+        self._pending.clear()
+        try:
+            self._put(_ABORT)
+        except Exception:
+            pass
+        self._thread.join()
+
+
+class JSONRowsWriter:
+    """
+    Потоковая запись JSON вида {"result": {"rows": [...]}, "_meta": {...}} в StreamingUpload.
+    Строки сериализуются по одной, итоговая JSON-строка целиком в памяти не собирается
+    """
+
+    def __init__(self, upload: StreamingUpload):
+        self.upload = upload
+        self.total_rows = 0
+        upload.write(b'{\n  "result": {\n    "rows": [')
+
+    def write_rows(self, rows: Iterable[Dict]):
+        """Дописывает строки в список result.rows"""
+        for row in rows:
+            prefix = b'\n      ' if self.total_rows == 0 else b',\n      '
+            self.upload.write(prefix + json.dumps(row, ensure_ascii=False).encode('utf-8'))
+            self.total_rows += 1
+
+    def close(self, meta: Dict) -> bool:
+        """Дописывает _meta (с total_rows) и завершает загрузку"""
+        self.upload.write(b'\n    ]\n  },\n  "_meta": ')
+        self.upload.write(json.dumps(dict(meta, total_rows=self.total_rows), ensure_ascii=False).encode('utf-8'))
+        self.upload.write(b'\n}\n')
+        return self.upload.close()
+
+    def abort(self):
+        """Отменяет загрузку JSON"""
+        self.upload.abort()
+
+
+class ReportStreamSink:
+    """
+    Приемник строк отчета Reports API: каждая строка пишется в потоковую загрузку исходного TSV
+    и разбирается парсером. Разобранные пачки сразу дописываются в потоковую загрузку
+    JSON-представления и во временные файлы колоночного представления (StatsTableWriter)
+    и освобождаются, поэтому память не зависит от размера отчета
+    """
+
+    def __init__(self, upload: StreamingUpload, json_writer: JSONRowsWriter, fields: List[str], meta: Dict):
+        self.upload = upload
+        self.json_writer = json_writer
+        self.table_writer = StatsTableWriter(fields)
+        self.fields = fields
+        self.meta = meta
+        self.parser = ReportTSVParser(on_batch=self._write_batch)
+        self.lines = 0
+
+    def _write_batch(self, columns: ReportColumns):
+        self.json_writer.write_rows(columns.iter_records(self.fields))
+        self.table_writer.write(columns)
+
+    def feed(self, line: str):
+        """Принимает одну строку отчета (без перевода строки)"""
+        self.parser.feed(line)
+        self.upload.write(line.encode('utf-8') + b'\n')
+        self.lines += 1
+
+    def close(self) -> bool:
+        """
+        Завершает загрузку TSV и разбор (последняя пачка дописывается в JSON и колонки)
+        :return: False, если TSV не загружен или в отчете не найдена строка с названиями полей
+        """
+        uploaded = self.upload.close()
+        columns = self.parser.close()
+        if not uploaded or columns is None:
+            return False
+        # Пачка без строк: состав полей колоночного представления для отчета без данных
+        self.table_writer.write(columns)
+        return True
+
+    def abort(self):
+        """Отменяет загрузки (например, если API не вернул отчет) и удаляет временные файлы"""
+        self.upload.abort()
+        self.json_writer.abort()
+        self.table_writer.close()
+
+
 class MinIOClient:
     """Клиент для работы с MinIO"""
 
@@ -38,26 +278,8 @@ class MinIOClient:
     def connect(self) -> bool:
         """Подключается к MinIO"""
         try:
-            # Импортируем urllib3 для настройки таймаутов
-            import urllib3
-
-            # Настраиваем пул соединений с увеличенными таймаутами
-            http_client = urllib3.PoolManager(
-                timeout=urllib3.Timeout(connect=30, read=300),  # 30 сек на подключение, 5 мин на чтение
-                retries=urllib3.Retry(
-                    total=3,
-                    backoff_factor=1,
-                    status_forcelist=[500, 502, 503, 504]
-                )
-            )
-
-            self.client = Minio(
-                self.endpoint,
-                access_key=self.access_key,
-                secret_key=self.secret_key,
-                secure=self.secure,
-                http_client=http_client
-            )
+            # Общий клиент процесса с настроенным пулом соединений (см. minio_factory)
+            self.client = get_minio(self.endpoint, self.access_key, self.secret_key, self.secure)
 
             # Проверяем существование bucket
             if not self.client.bucket_exists(self.bucket_name):
@@ -73,38 +295,45 @@ class MinIOClient:
             print(f"❌ Ошибка подключения к MinIO: {e}")
             return False
 
+    @property
+    def uploads(self) -> UploadService:
+        """Общий сервис загрузки (пул потоков с очередью и повторами)"""
+        return get_upload_service(self.client, self.bucket_name)
+
+    def submit_report_object(self, data: bytes, filename: str, report_id: int, content_type: str,
+                             metadata: Optional[Dict] = None) -> Future:
+        """
+        Ставит в очередь загрузку файла в папку отчета; после загрузки файл отмечается в манифесте
+        :return: Future загрузки (см. UploadService)
+        """
+        object_name = f"{self.base_path}/{report_id}_результаты/{filename}"
+        # Объект относится к шагу, поставившему загрузку, даже если загрузка завершится во время следующего
+        stage = manifest_writer(self.client, self.bucket_name, report_id).active_stage
+
+        def on_done(result):
+            self.record_artifact(report_id, object_name, len(data), result.etag, stage)
+            print(f"💾 Данные сохранены в MinIO: {object_name}")
+
+        return self.uploads.submit_bytes(object_name, data, content_type, metadata, on_done=on_done)
+
+    def submit_json_data(self, data: Dict, filename: str, report_id: int) -> Future:
+        """Ставит в очередь загрузку JSON данных (компактный JSON + gzip, см. ARTIFACT_CODEC)"""
+        json_bytes, metadata = encode_json(data)
+        return self.submit_report_object(json_bytes, filename, report_id, 'application/json', metadata)
+
+    def submit_tsv_data(self, tsv_content: str, filename: str, report_id: int) -> Future:
+        """Ставит в очередь загрузку TSV данных"""
+        return self.submit_report_object(tsv_content.encode('utf-8'), filename, report_id,
+                                         'text/tab-separated-values')
+
     def upload_json_data(self, data: Dict, filename: str, report_id: int) -> bool:
         """Загружает JSON данные в MinIO"""
         try:
             if not self.client:
                 print("❌ MinIO клиент не инициализирован")
                 return False
+            return self.uploads.wait([self.submit_json_data(data, filename, report_id)])
 
-            # Создаем путь к файлу - используем фиксированную папку для отчета
-            object_name = f"{self.base_path}/{report_id}_результаты/{filename}"
-
-            # Конвертируем данные в JSON строку
-            json_str = json.dumps(data, ensure_ascii=False, indent=2)
-            json_bytes = json_str.encode('utf-8')
-
-            # Создаем поток данных
-            data_stream = io.BytesIO(json_bytes)
-
-            # Загружаем в MinIO
-            self.client.put_object(
-                bucket_name=self.bucket_name,
-                object_name=object_name,
-                data=data_stream,
-                length=len(json_bytes),
-                content_type='application/json'
-            )
-
-            print(f"💾 Данные сохранены в MinIO: {object_name}")
-            return True
-
-        except S3Error as e:
-            print(f"❌ Ошибка S3 при загрузке файла: {e}")
-            return False
         except Exception as e:
             print(f"❌ Ошибка загрузки файла в MinIO: {e}")
             return False
@@ -115,31 +344,8 @@ class MinIOClient:
             if not self.client:
                 print("❌ MinIO клиент не инициализирован")
                 return False
+            return self.uploads.wait([self.submit_tsv_data(tsv_content, filename, report_id)])
 
-            # Создаем путь к файлу - используем фиксированную папку для отчета
-            object_name = f"{self.base_path}/{report_id}_результаты/{filename}"
-
-            # Конвертируем TSV в байты
-            tsv_bytes = tsv_content.encode('utf-8')
-
-            # Создаем поток данных
-            data_stream = io.BytesIO(tsv_bytes)
-
-            # Загружаем в MinIO
-            self.client.put_object(
-                bucket_name=self.bucket_name,
-                object_name=object_name,
-                data=data_stream,
-                length=len(tsv_bytes),
-                content_type='text/tab-separated-values'
-            )
-
-            print(f"💾 TSV данные сохранены в MinIO: {object_name}")
-            return True
-
-        except S3Error as e:
-            print(f"❌ Ошибка S3 при загрузке TSV файла: {e}")
-            return False
         except Exception as e:
             print(f"❌ Ошибка загрузки TSV файла в MinIO: {e}")
             return False
@@ -201,19 +407,23 @@ class MinIOClient:
             # Определяем формат файла
             report_format = stats_data.get('_meta', {}).get('format', 'TSV')
             success = True
+            uploads = []
 
             if report_format == 'TSV':
                 # Сохраняем TSV файл
                 tsv_filename = f"campaign_stats_{report_id}.tsv"
-                tsv_result = self.upload_tsv_data(report_content, tsv_filename, report_id)
-                success = success and tsv_result
+                # TSV загружается в фоне, пока строится JSON-представление
+                uploads.append(self.submit_tsv_data(report_content, tsv_filename, report_id))
 
-                # Преобразуем TSV в JSON и сохраняем
-                json_data = self.convert_tsv_to_json(report_content)
+                # Преобразуем TSV в JSON и сохраняем (рядом - колоночное представление)
+                rows, columns = tsv_records_and_columns(report_content, CAMPAIGN_STATS_FIELDS)
+                json_data = self.convert_tsv_to_json(report_content, rows)
                 if json_data:
                     json_filename = f"campaign_stats_{report_id}.json"
-                    json_result = self.upload_json_data(json_data, json_filename, report_id)
-                    success = success and json_result
+                    uploads.append(self.submit_json_data(json_data, json_filename, report_id))
+                    if columns is not None:
+                        self.upload_stats_table(StatsTable.from_report_columns(columns, CAMPAIGN_STATS_FIELDS),
+                                                stats_table_filename(json_filename), report_id)
                 else:
                     print("⚠️ Не удалось преобразовать TSV в JSON")
                     success = False
@@ -222,45 +432,21 @@ class MinIOClient:
                 filename = f"campaign_stats_{report_id}.json"
                 success = self.upload_json_data(stats_data, filename, report_id)
 
-            return success
+            return self.uploads.wait(uploads) and success
 
         except Exception as e:
             print(f"❌ Ошибка загрузки данных статистики кампаний: {e}")
             return False
 
-    def upload_memory_file(self, file_name: str, data: str, length: int):
-        self.client.put_object(self.bucket_name, file_name, data, length)
+    def submit_memory_file(self, file_name: str, data: io.BytesIO) -> Future:
+        """Ставит в очередь загрузку файла из памяти по полному имени объекта"""
+        return self.uploads.submit_bytes(file_name, data.getvalue())
 
-    def convert_tsv_to_json(self, tsv_content: str) -> Dict:
+    def convert_tsv_to_json(self, tsv_content: str, rows: Optional[List[Dict]] = None) -> Dict:
         """Преобразует TSV содержимое в JSON структуру"""
         try:
-            lines = tsv_content.strip().split('\n')
-
-            # Пропускаем первую строку с заголовком отчета
-            # Пропускаем вторую строку с названиями колонок
-            data_lines = lines[2:]  # Начинаем с третьей строки
-
-            # Удаляем последнюю строку с "Total rows: X" если есть
-            if data_lines and data_lines[-1].startswith('Total rows:'):
-                data_lines = data_lines[:-1]
-
-            # Удаляем пустые строки
-            data_lines = [line.strip() for line in data_lines if line.strip()]
-
-            # Парсим данные
-            rows = []
-            for line in data_lines:
-                fields = line.split('\t')
-                if len(fields) >= 6:  # CampaignId, CampaignName, Impressions, Clicks, Ctr, BounceRate
-                    row = {
-                        "CampaignId": int(fields[0]) if fields[0].isdigit() else None,
-                        "CampaignName": fields[1],
-                        "Impressions": int(fields[2]) if fields[2].isdigit() else 0,
-                        "Clicks": int(fields[3]) if fields[3].isdigit() else 0,
-                        "Ctr": float(fields[4]) if fields[4].replace('.', '').isdigit() else 0.0,
-                        "BounceRate": float(fields[5]) if fields[5].replace('.', '').isdigit() else 0.0
-                    }
-                    rows.append(row)
+            if rows is None:
+                rows = tsv_to_records(tsv_content, CAMPAIGN_STATS_FIELDS)
 
             # Создаем JSON структуру
             result = {
@@ -333,19 +519,19 @@ class MinIOClient:
             # Определяем формат файла
             report_format = summary_data.get('_meta', {}).get('format', 'TSV')
             success = True
+            uploads = []
 
             if report_format == 'TSV':
                 # Сохраняем TSV файл
                 tsv_filename = f"campaign_stats_summary_{report_id}.tsv"
-                tsv_result = self.upload_tsv_data(report_content, tsv_filename, report_id)
-                success = success and tsv_result
+                # TSV загружается в фоне, пока строится JSON-представление
+                uploads.append(self.submit_tsv_data(report_content, tsv_filename, report_id))
 
                 # Преобразуем TSV в JSON и сохраняем
                 json_data = self.convert_tsv_summary_to_json(report_content)
                 if json_data:
                     json_filename = f"campaign_stats_summary_{report_id}.json"
-                    json_result = self.upload_json_data(json_data, json_filename, report_id)
-                    success = success and json_result
+                    uploads.append(self.submit_json_data(json_data, json_filename, report_id))
                 else:
                     print("⚠️ Не удалось преобразовать сводный TSV в JSON")
                     success = False
@@ -354,53 +540,18 @@ class MinIOClient:
                 filename = f"campaign_stats_summary_{report_id}.json"
                 success = self.upload_json_data(summary_data, filename, report_id)
 
-            return success
+            return self.uploads.wait(uploads) and success
 
         except Exception as e:
             print(f"❌ Ошибка загрузки сводных данных статистики кампаний: {e}")
             return False
 
-    def _is_numeric(self, value: str) -> bool:
-        """Проверяет, является ли строка числом (включая десятичные)"""
-        if not value or value == '--':
-            return False
-        try:
-            float(value)
-            return True
-        except ValueError:
-            return False
-
     def convert_tsv_summary_to_json(self, tsv_content: str) -> Dict:
         """Преобразует сводное TSV содержимое в JSON структуру"""
         try:
-            lines = tsv_content.strip().split('\n')
-
-            # Пропускаем первую строку с заголовком отчета
-            # Пропускаем вторую строку с названиями колонок
-            data_lines = lines[2:]  # Начинаем с третьей строки
-
-            # Удаляем последнюю строку с "Total rows: X" если есть
-            if data_lines and data_lines[-1].startswith('Total rows:'):
-                data_lines = data_lines[:-1]
-
-            # Удаляем пустые строки
-            data_lines = [line.strip() for line in data_lines if line.strip()]
-
-            # Парсим данные (сводный отчет по аккаунту - одна строка с агрегированными данными)
-            summary_row = None
-
-            if data_lines:
-                # Парсим единственную строку с агрегированными данными по аккаунту
-                fields = data_lines[0].split('\t')
-                if len(fields) >= 6:  # Impressions, Clicks, Ctr, BounceRate, Cost, AvgCpc
-                    summary_row = {
-                        "Impressions": int(fields[0]) if fields[0].isdigit() else 0,
-                        "Clicks": int(fields[1]) if fields[1].isdigit() else 0,
-                        "Ctr": float(fields[2]) if self._is_numeric(fields[2]) else 0.0,
-                        "BounceRate": float(fields[3]) if self._is_numeric(fields[3]) else 0.0,
-                        "Cost": float(fields[4]) if self._is_numeric(fields[4]) else 0.0,
-                        "AvgCpc": float(fields[5]) if self._is_numeric(fields[5]) else 0.0
-                    }
+            # Сводный отчет по аккаунту - одна строка с агрегированными данными
+            rows = tsv_to_records(tsv_content, SUMMARY_STATS_FIELDS)
+            summary_row = rows[0] if rows else None
 
             # Создаем JSON структуру
             result = {
@@ -431,19 +582,23 @@ class MinIOClient:
             # Определяем формат файла
             report_format = stats_data.get('_meta', {}).get('format', 'TSV')
             success = True
+            uploads = []
 
             if report_format == 'TSV':
                 # Сохраняем TSV файл
                 tsv_filename = f"ad_stats_{report_id}.tsv"
-                tsv_result = self.upload_tsv_data(report_content, tsv_filename, report_id)
-                success = success and tsv_result
+                # TSV загружается в фоне, пока строится JSON-представление
+                uploads.append(self.submit_tsv_data(report_content, tsv_filename, report_id))
 
-                # Преобразуем TSV в JSON и сохраняем
-                json_data = self.convert_ad_stats_tsv_to_json(report_content)
+                # Преобразуем TSV в JSON и сохраняем (рядом - колоночное представление)
+                rows, columns = tsv_records_and_columns(report_content, AD_STATS_FIELDS)
+                json_data = self.convert_ad_stats_tsv_to_json(report_content, rows)
                 if json_data:
                     json_filename = f"ad_stats_{report_id}.json"
-                    json_result = self.upload_json_data(json_data, json_filename, report_id)
-                    success = success and json_result
+                    uploads.append(self.submit_json_data(json_data, json_filename, report_id))
+                    if columns is not None:
+                        self.upload_stats_table(StatsTable.from_report_columns(columns, AD_STATS_FIELDS),
+                                                stats_table_filename(json_filename), report_id)
                 else:
                     print("⚠️ Не удалось преобразовать TSV отчета по объявлениям в JSON")
                     success = False
@@ -452,44 +607,17 @@ class MinIOClient:
                 filename = f"ad_stats_{report_id}.json"
                 success = self.upload_json_data(stats_data, filename, report_id)
 
-            return success
+            return self.uploads.wait(uploads) and success
 
         except Exception as e:
             print(f"❌ Ошибка загрузки данных статистики объявлений: {e}")
             return False
 
-    def convert_ad_stats_tsv_to_json(self, tsv_content: str) -> Dict:
+    def convert_ad_stats_tsv_to_json(self, tsv_content: str, rows: Optional[List[Dict]] = None) -> Dict:
         """Преобразует TSV содержимое отчета по объявлениям в JSON структуру"""
         try:
-            lines = tsv_content.strip().split('\n')
-
-            # Пропускаем первую строку с заголовком отчета
-            # Пропускаем вторую строку с названиями колонок
-            data_lines = lines[2:]  # Начинаем с третьей строки
-
-            # Удаляем последнюю строку с "Total rows: X" если есть
-            if data_lines and data_lines[-1].startswith('Total rows:'):
-                data_lines = data_lines[:-1]
-
-            # Удаляем пустые строки
-            data_lines = [line.strip() for line in data_lines if line.strip()]
-
-            # Парсим данные
-            rows = []
-            for line in data_lines:
-                fields = line.split('\t')
-                if len(fields) >= 8:  # CampaignId, AdId, Impressions, Clicks, Ctr, BounceRate, Cost, AvgCpc
-                    row = {
-                        "CampaignId": int(fields[0]) if fields[0].isdigit() else None,
-                        "AdId": int(fields[1]) if fields[1].isdigit() else None,
-                        "Impressions": int(fields[2]) if fields[2].isdigit() else 0,
-                        "Clicks": int(fields[3]) if fields[3].isdigit() else 0,
-                        "Ctr": float(fields[4]) if self._is_numeric(fields[4]) else 0.0,
-                        "BounceRate": float(fields[5]) if self._is_numeric(fields[5]) else 0.0,
-                        "Cost": float(fields[6]) if self._is_numeric(fields[6]) else 0.0,
-                        "AvgCpc": float(fields[7]) if self._is_numeric(fields[7]) else 0.0
-                    }
-                    rows.append(row)
+            if rows is None:
+                rows = tsv_to_records(tsv_content, AD_STATS_FIELDS)
 
             # Создаем JSON структуру
             result = {
@@ -522,19 +650,23 @@ class MinIOClient:
             # Определяем формат файла
             report_format = stats_data.get('_meta', {}).get('format', 'TSV')
             success = True
+            uploads = []
 
             if report_format == 'TSV':
                 # Сохраняем TSV файл
                 tsv_filename = f"adgroup_stats_{report_id}.tsv"
-                tsv_result = self.upload_tsv_data(report_content, tsv_filename, report_id)
-                success = success and tsv_result
+                # TSV загружается в фоне, пока строится JSON-представление
+                uploads.append(self.submit_tsv_data(report_content, tsv_filename, report_id))
 
-                # Преобразуем TSV в JSON и сохраняем
-                json_data = self.convert_adgroup_stats_tsv_to_json(report_content)
+                # Преобразуем TSV в JSON и сохраняем (рядом - колоночное представление)
+                rows, columns = tsv_records_and_columns(report_content, ADGROUP_STATS_FIELDS)
+                json_data = self.convert_adgroup_stats_tsv_to_json(report_content, rows)
                 if json_data:
                     json_filename = f"adgroup_stats_{report_id}.json"
-                    json_result = self.upload_json_data(json_data, json_filename, report_id)
-                    success = success and json_result
+                    uploads.append(self.submit_json_data(json_data, json_filename, report_id))
+                    if columns is not None:
+                        self.upload_stats_table(StatsTable.from_report_columns(columns, ADGROUP_STATS_FIELDS),
+                                                stats_table_filename(json_filename), report_id)
                 else:
                     print("⚠️ Не удалось преобразовать TSV отчета по группам объявлений в JSON")
                     success = False
@@ -543,47 +675,17 @@ class MinIOClient:
                 filename = f"adgroup_stats_{report_id}.json"
                 success = self.upload_json_data(stats_data, filename, report_id)
 
-            return success
+            return self.uploads.wait(uploads) and success
 
         except Exception as e:
             print(f"❌ Ошибка загрузки данных статистики групп объявлений: {e}")
             return False
 
-    def convert_adgroup_stats_tsv_to_json(self, tsv_content: str) -> Dict:
+    def convert_adgroup_stats_tsv_to_json(self, tsv_content: str, rows: Optional[List[Dict]] = None) -> Dict:
         """Преобразует TSV содержимое отчета по группам объявлений в JSON структуру"""
         try:
-            lines = tsv_content.strip().split('\n')
-
-            # Пропускаем первую строку с заголовком отчета
-            # Пропускаем вторую строку с названиями колонок
-            data_lines = lines[2:]  # Начинаем с третьей строки
-
-            # Удаляем последнюю строку с "Total rows: X" если есть
-            if data_lines and data_lines[-1].startswith('Total rows:'):
-                data_lines = data_lines[:-1]
-
-            # Удаляем пустые строки
-            data_lines = [line.strip() for line in data_lines if line.strip()]
-
-            # Парсим данные
-            rows = []
-            for line in data_lines:
-                fields = line.split('\t')
-                if len(fields) >= 11:  # CampaignId, AdGroupId, AdGroupName, CampaignType, AdNetworkType, Impressions, Clicks, Ctr, BounceRate, Cost, AvgCpc
-                    row = {
-                        "CampaignId": int(fields[0]) if fields[0].isdigit() else None,
-                        "AdGroupId": int(fields[1]) if fields[1].isdigit() else None,
-                        "AdGroupName": fields[2] if fields[2] else "",
-                        "CampaignType": fields[3] if fields[3] else "",
-                        "AdNetworkType": fields[4] if fields[4] else "",
-                        "Impressions": int(fields[5]) if fields[5].isdigit() else 0,
-                        "Clicks": int(fields[6]) if fields[6].isdigit() else 0,
-                        "Ctr": float(fields[7]) if self._is_numeric(fields[7]) else 0.0,
-                        "BounceRate": float(fields[8]) if self._is_numeric(fields[8]) else 0.0,
-                        "Cost": float(fields[9]) if self._is_numeric(fields[9]) else 0.0,
-                        "AvgCpc": float(fields[10]) if self._is_numeric(fields[10]) else 0.0
-                    }
-                    rows.append(row)
+            if rows is None:
+                rows = tsv_to_records(tsv_content, ADGROUP_STATS_FIELDS)
 
             # Создаем JSON структуру
             result = {
@@ -604,6 +706,147 @@ class MinIOClient:
             print(f"❌ Ошибка преобразования TSV отчета по группам объявлений в JSON: {e}")
             return None
 
+    def open_report_stream(self, filename: str, report_id: int, fields: List[str], report_type: str,
+                           json_filename: str) -> ReportStreamSink:
+        """
+        Открывает потоковую загрузку TSV отчета статистики и его JSON-представления в папку отчета
+        :param fields: поля JSON-строк
+        :param report_type: тип отчета для _meta
+        :param json_filename: имя JSON файла
+        """
+        object_name = f"{self.base_path}/{report_id}_результаты/{filename}"
+        upload = StreamingUpload(self.client, self.bucket_name, object_name, 'text/tab-separated-values')
+        meta = {
+            "format": "JSON",
+            "source": "TSV",
+            "report_type": report_type
+        }
+        return ReportStreamSink(upload, JSONRowsWriter(self._open_json_upload(json_filename, report_id)),
+                                fields, meta)
+
+    def _open_json_upload(self, filename: str, report_id: int) -> StreamingUpload:
+        """Потоковая загрузка JSON в папку отчета (сжатие по ARTIFACT_CODEC)"""
+        object_name = f"{self.base_path}/{report_id}_результаты/{filename}"
+        compressor = new_compressor()
+        codec = JSON_GZIP if compressor is not None else JSON_PLAIN
+        return StreamingUpload(self.client, self.bucket_name, object_name, 'application/json',
+                               metadata={CODEC_METADATA_KEY: codec}, compressor=compressor)
+
+    def upload_json_rows_stream(self, rows: Iterable[Dict], meta: Dict, filename: str, report_id: int) -> bool:
+        """
+        Потоково загружает JSON вида {"result": {"rows": [...]}, "_meta": {...}}.
+        Строки сериализуются по одной, итоговая JSON-строка целиком в памяти не собирается
+        """
+        writer = None
+        try:
+            writer = JSONRowsWriter(self._open_json_upload(filename, report_id))
+            writer.write_rows(rows)
+            return self._close_json_writer(writer, meta, report_id)
+
+        except Exception as e:
+            print(f"❌ Ошибка потоковой загрузки JSON в MinIO: {e}")
+            if writer is not None:
+                # Останавливаем фоновую загрузку, незавершенная multipart-загрузка отменяется
+                writer.abort()
+            return False
+
+    def _close_json_writer(self, writer: JSONRowsWriter, meta: Dict, report_id: int) -> bool:
+        if not writer.close(meta):
+            return False
+        upload = writer.upload
+        self.record_artifact(report_id, upload.object_name, upload.bytes_stored, upload.etag)
+        return True
+
+    def finish_stats_stream(self, sink: ReportStreamSink, report_id: int) -> bool:
+        """
+        Завершает потоковые загрузки отчета статистики: TSV, JSON-представление
+        и колоночное представление (*.cols) рядом с JSON
+        :param sink: приемник, открытый open_report_stream и заполненный DirectAPIClient
+        """
+        try:
+            if not sink.close():
+                print("❌ Не удалось сохранить или разобрать TSV отчета")
+                sink.abort()
+                return False
+            upload = sink.upload
+            self.record_artifact(report_id, upload.object_name, upload.bytes_stored, upload.etag)
+
+            if not self._close_json_writer(sink.json_writer, sink.meta, report_id):
+                sink.table_writer.close()
+                return False
+            json_filename = sink.json_writer.upload.object_name.rsplit('/', 1)[-1]
+            self.upload_stats_writer(sink.table_writer, stats_table_filename(json_filename), report_id)
+            return True
+
+        except Exception as e:
+            print(f"❌ Ошибка завершения потоковой загрузки отчета: {e}")
+            sink.abort()
+            return False
+
+    def upload_stats_writer(self, writer: StatsTableWriter, filename: str, report_id: int) -> bool:
+        """Потоково сохраняет колоночное представление, накопленное StatsTableWriter, и удаляет его временные файлы"""
+        upload = None
+        try:
+            object_name = f"{self.base_path}/{report_id}_результаты/{filename}"
+            compressor = new_compressor()
+            upload = StreamingUpload(self.client, self.bucket_name, object_name, 'application/octet-stream',
+                                     metadata=columns_metadata(compressor is not None), compressor=compressor)
+            writer.finish(upload)
+            if not upload.close():
+                return False
+            self.record_artifact(report_id, object_name, upload.bytes_stored, upload.etag)
+            return True
+
+        except Exception as e:
+            print(f"❌ Ошибка потоковой загрузки колоночной статистики в MinIO: {e}")
+            if upload is not None:
+                upload.abort()
+            return False
+        finally:
+            writer.close()
+
+    def upload_stats_table(self, table: StatsTable, filename: str, report_id: int) -> bool:
+        """Сохраняет колоночное представление статистики (*.cols) в папку отчета"""
+        data, metadata = table.encode()
+        return self.uploads.wait([
+            self.submit_report_object(data, filename, report_id, 'application/octet-stream', metadata)
+        ])
+
+    def load_stats_table(self, filename: str, report_id: int) -> Optional[StatsTable]:
+        """Загружает колоночное представление статистики (None, если его нет)"""
+        object_name = f"{self.base_path}/{report_id}_результаты/{filename}"
+        return load_stats_table(self.client, self.bucket_name, object_name)
+
+    def record_artifact(self, report_id: int, object_name: str, size: int, etag: Optional[str] = None,
+                        stage: Optional[str] = None) -> bool:
+        """Отмечает записанный объект папки отчета в манифесте отчета (stage - шаг обработки, см. report_checkpoints)"""
+        return manifest_writer(self.client, self.bucket_name, report_id).record(object_name, size, etag, stage)
+
+    def record_screenshots(self, report_id: int, url_index: int, files: Dict[str, Dict]) -> bool:
+        """Отмечает загруженные скриншоты URL в манифесте отчета (имя файла -> size / etag)"""
+        return manifest_writer(self.client, self.bucket_name, report_id).record_screenshots(url_index, files)
+
+    def find_report_file(self, report_id: int, filename: str) -> Optional[str]:
+        """
+        Полное имя файла в папке отчета.
+        Ищется по манифесту отчета; если в манифесте файла нет (объект записан не через
+        record_artifact) - запросом объекта, для отчетов без манифеста - по списку объектов папки
+        """
+        manifest = load_manifest(self.client, self.bucket_name, report_id)
+        if manifest is not None:
+            object_name = find_artifact(manifest, report_id, filename)
+            if object_name is not None:
+                return object_name
+            object_name = f"{report_folder(report_id)}{filename}"
+            try:
+                self.client.stat_object(self.bucket_name, object_name)
+                return object_name
+            except S3Error:
+                return None
+        objects = self.list_objects(report_folder(report_id))
+        matches = [obj for obj in objects if obj.endswith(f"/{filename}")]
+        return matches[0] if matches else None
+
     def download_ads_report_json(self, report_id: str) -> Optional[Dict]:
         """Скачивает JSON файл с данными объявлений из MinIO"""
         try:
@@ -629,15 +872,30 @@ class MinIOClient:
 
             # Скачиваем файл
             response = self.client.get_object(self.bucket_name, json_file)
-            content = response.read().decode('utf-8')
+            content = response.read()
             response.close()
             response.release_conn()
 
             # Парсим JSON
-            data = json.loads(content)
+            data = decode_json(content)
             print(f"✅ JSON файл с объявлениями скачан: {json_file}")
             return data
 
         except Exception as e:
             print(f"❌ Ошибка скачивания JSON файла с объявлениями: {e}")
-            return None
\ No newline at end of file
+            return None
+
+_shared_client: Optional[MinIOClient] = None
+_shared_client_lock = threading.Lock()
+
+
+def get_minio_client() -> Optional[MinIOClient]:
+    """Подключенный MinIOClient процесса (None, если подключиться не удалось)"""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            client = MinIOClient()
+            if not client.connect():
+                return None
+            _shared_client = client
+        return _shared_client
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Единая фабрика клиентов MinIO
+Все модули процесса используют один клиент Minio с общим пулом соединений:
+размер пула рассчитан на параллельные этапы (загрузки, формирование частей отчетов,
+генерация документов), соединения переиспользуются (keep-alive), а при исчерпании
+пула поток ждет освободившееся соединение. Пул собирает метрики загрузки
+(занятые соединения, ожидания свободного соединения) - см. pool_stats
+"""
+
+import os
+import socket
+import threading
+import time
+from typing import Dict, Optional
+
+import urllib3
+from dotenv import load_dotenv
+from minio import Minio
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+load_dotenv('.env')
+
+# Максимум соединений с MinIO на процесс
+MINIO_POOL_MAXSIZE = int(os.getenv('MINIO_POOL_MAXSIZE', '64'))
+# Таймауты подключения и чтения, сек
+MINIO_CONNECT_TIMEOUT = float(os.getenv('MINIO_CONNECT_TIMEOUT', '30'))
+MINIO_READ_TIMEOUT = float(os.getenv('MINIO_READ_TIMEOUT', '300'))
+
+
+class _PoolMetrics:
+    """Счетчики использования пула соединений"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.requests = 0
+        # Запросы, которым пришлось ждать свободное соединение
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def acquired(self, waited: bool, wait_time: float):
+        with self.lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.requests += 1
+            if waited:
+                self.waits += 1
+                self.wait_time += wait_time
+
+    def released(self):
+        with self.lock:
+            self.in_use = max(0, self.in_use - 1)
+
+
+_metrics = _PoolMetrics()
+
+
+class _MeteredPoolMixin:
+    """Пул соединений urllib3, учитывающий занятые соединения и ожидания"""
+
+    def _get_conn(self, timeout=None):
+        # В очереди пула нет ни свободных соединений, ни мест под новые - придется ждать
+        waited = self.pool is not None and self.pool.empty()
+        started = time.monotonic()
+        conn = super()._get_conn(timeout)
+        _metrics.acquired(waited, time.monotonic() - started)
+        return conn
+
+    def _put_conn(self, conn):
+        _metrics.released()
+        super()._put_conn(conn)
+
+
+class _MeteredHTTPConnectionPool(_MeteredPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _MeteredHTTPSConnectionPool(_MeteredPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+def _create_http_client() -> urllib3.PoolManager:
+    """Общий пул соединений: увеличенные таймауты, повторы, TCP keep-alive, ожидание при исчерпании"""
+    http_client = urllib3.PoolManager(
+        num_pools=4,
+        maxsize=MINIO_POOL_MAXSIZE,
+        block=True,
+        timeout=urllib3.Timeout(connect=MINIO_CONNECT_TIMEOUT, read=MINIO_READ_TIMEOUT),
+        retries=urllib3.Retry(
+            total=3,
+            backoff_factor=1,
+            status_forcelist=[500, 502, 503, 504]
+        ),
+        socket_options=HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    )
+    http_client.pool_classes_by_scheme = {
+        'http': _MeteredHTTPConnectionPool,
+        'https': _MeteredHTTPSConnectionPool
+    }
+    return http_client
+
+
+_clients: Dict[tuple, Minio] = {}
+_clients_lock = threading.Lock()
+
+
+def get_minio(endpoint: Optional[str] = None, access_key: Optional[str] = None,
+              secret_key: Optional[str] = None, secure: Optional[bool] = None) -> Minio:
+    """
+    Клиент Minio процесса (один на набор параметров подключения)
+    Параметры по умолчанию берутся из S3_ENDPOINT_URL / S3_ACCESS_KEY / S3_SECRET_KEY / S3_SECURE
+    """
+    endpoint = endpoint or os.getenv('S3_ENDPOINT_URL', 'minio.upk-mos.ru')
+    access_key = access_key or os.getenv('S3_ACCESS_KEY')
+    secret_key = secret_key or os.getenv('S3_SECRET_KEY')
+    if secure is None:
+        secure = os.getenv('S3_SECURE', 'False').lower() == 'true'
+
+    key = (endpoint, access_key, secure)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = Minio(
+                endpoint,
+                access_key=access_key,
+                secret_key=secret_key,
+                secure=secure,
+                http_client=_create_http_client()
+            )
+        return client
+
+
+def pool_stats() -> Dict:
+    """Метрики пула соединений MinIO (по всем клиентам процесса)"""
+    with _metrics.lock:
+        return {
+            'maxsize': MINIO_POOL_MAXSIZE,
+            'in_use': _metrics.in_use,
+            'peak_in_use': _metrics.peak_in_use,
+            'requests': _metrics.requests,
+            'waits': _metrics.waits,
+            'wait_time': round(_metrics.wait_time, 3)
+        }
+
+
+def log_pool_stats():
+    """Выводит метрики пула; частые ожидания означают, что MINIO_POOL_MAXSIZE мал для параллельных этапов"""
+    stats = pool_stats()
+    print(f"🔗 Пул MinIO: запросов {stats['requests']}, пик занятых соединений "
+          f"{stats['peak_in_use']}/{stats['maxsize']}, ожиданий {stats['waits']} ({stats['wait_time']} сек)")
+    if stats['waits']:
+        print("⚠️ Пул соединений MinIO исчерпывался, имеет смысл увеличить MINIO_POOL_MAXSIZE")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Контрольные точки шагов обработки отчета
+Для каждого шага в манифесте отчета хранится отпечаток входных данных отчета
+(заявка, договор, логин клиента), время завершения и выходные объекты папки отчета.
+При повторном запуске (например, после ошибки скриншотов) шаги, выполненные с теми же
+входными данными не раньше CHECKPOINT_MAX_AGE часов назад и чьи объекты на месте,
+пропускаются, а обработка продолжается с первого незавершенного шага: повторное
+выполнение шага делает незавершенными все последующие шаги
+"""
+
+import hashlib
+import json
+import os
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from report_manifest import ReportManifest
+
+load_dotenv('.env')
+
+# Возобновление обработки с первого незавершенного шага
+REPORT_CHECKPOINTS = int(os.getenv('REPORT_CHECKPOINTS', '1'))
+# Срок, в течение которого результаты шага используются повторно, часов
+CHECKPOINT_MAX_AGE = float(os.getenv('CHECKPOINT_MAX_AGE', '24'))
+
+# Версия формата шагов: при изменении состава шагов прежние контрольные точки не используются
+CHECKPOINT_VERSION = 1
+
+# Шаги в порядке выполнения
+CHECKPOINT_STAGES = (
+    'campaigns',
+    'adgroups',
+    'ads',
+    'extensions',
+    'images',
+    'keywords_forecast',
+    'campaign_stats',
+    'ad_stats',
+    'adgroup_stats',
+    'report_index',
+    'wordstat',
+    'report_urls',
+    'screenshots',
+    'top_ads_screenshots',
+)
+
+
+def inputs_fingerprint(request_data: Dict, contract_data: Dict, client_login: Optional[str]) -> str:
+    """Отпечаток входных данных отчета"""
+    data = {
+        'version': CHECKPOINT_VERSION,
+        'request': request_data,
+        'contract': contract_data,
+        'client_login': client_login
+    }
+    return hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+
+class StageCheckpoints:
+    """Выполнение шагов отчета с контрольными точками в манифесте"""
+
+    def __init__(self, manifest: ReportManifest, fingerprint: Optional[str], enabled: bool = bool(REPORT_CHECKPOINTS)):
+        """
+        :param fingerprint: отпечаток входных данных; None - отпечаток последнего запуска
+            из манифеста (для шагов, выполняемых отдельным процессом этапа)
+        """
+        self.manifest = manifest
+        if fingerprint is None:
+            fingerprint = manifest.data.get('inputs_fingerprint')
+        elif manifest.data.get('inputs_fingerprint') != fingerprint:
+            with manifest.lock:
+                manifest.data['inputs_fingerprint'] = fingerprint
+        self.fingerprint = fingerprint
+        self.enabled = enabled and fingerprint is not None
+        self.max_age = timedelta(hours=CHECKPOINT_MAX_AGE)
+        # Шаги, выполненные в этом запуске
+        self.completed: List[str] = []
+
+    def run(self, stage: str, func: Callable, require_outputs: bool = False):
+        """
+        Выполняет шаг, если он не выполнен ранее с теми же входными данными
+        :param func: шаг; ложный результат - шаг не выполнен (контрольная точка не ставится)
+        :param require_outputs: шаг без записанных выходных объектов не считается выполненным
+        :return: результат шага или True для пропущенного шага
+        """
+        if self.enabled and self.manifest.completed_stage(stage, self.fingerprint, self.max_age):
+            print(f"⏭️ Шаг {stage} уже выполнен с теми же входными данными, используем сохраненные данные")
+            return True
+
+        later_stages = CHECKPOINT_STAGES[CHECKPOINT_STAGES.index(stage) + 1:]
+        self.manifest.begin_stage(stage, self.fingerprint or '', later_stages, require_outputs)
+        try:
+            result = func()
+        finally:
+            self.manifest.end_stage(stage)
+        if result:
+            self.manifest.complete_stage(stage)
+            self.completed.append(stage)
+        return result
+
+    def invalidate_completed(self):
+        """Отменяет контрольные точки шагов этого запуска (например, если часть их объектов не загрузилась)"""
+        if self.completed:
+            self.manifest.invalidate_stages(self.completed)
+            self.completed = []
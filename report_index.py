@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Индекс связей данных отчета
+Строится один раз после получения данных из API и сохраняется в папку отчета
+(report_index_{id}.json). Генераторы документов вместо повторных проходов по всем
+объявлениям для каждой кампании и линейного поиска изображений / быстрых ссылок
+получают связанные объекты из словарей индекса:
+кампания -> объявления, группы, ключевые фразы, уточнения, наборы быстрых ссылок;
+набор быстрых ссылок -> ссылки; хеш -> изображение; объявление -> статистика
+"""
+
+import threading
+from typing import Dict, List, Optional
+
+from minio.error import S3Error
+
+from artifact_codec import decode_json
+from report_manifest import report_folder
+from stats_store import StatsTable, stats_table_filename, load_stats_table
+
+INDEX_VERSION = 1
+
+# Ключевые фразы автотаргетинга не считаются ключами кампании
+AUTOTARGETING_KEYWORD = '---autotargeting'
+
+
+def report_index_filename(report_id) -> str:
+    return f"report_index_{report_id}.json"
+
+
+def _empty_index(report_id) -> Dict:
+    return {
+        'version': INDEX_VERSION,
+        'report_id': report_id,
+        'campaigns': {},
+        'ads_by_campaign': {},
+        'adgroups_by_campaign': {},
+        'keywords_by_campaign': {},
+        'extensions': {},
+        'callouts_by_campaign': {},
+        'sitelink_sets': {},
+        'sitelink_sets_by_campaign': {},
+        'images': {},
+        'ad_stats': {}
+    }
+
+
+def _result_items(data: Optional[Dict], key: str) -> List[Dict]:
+    if not data or not isinstance(data, dict):
+        return []
+    return (data.get('result') or {}).get(key, []) or []
+
+
+def _extensions_items(extensions_data: Optional[Dict]) -> List[Dict]:
+    """Расширения из файла extensions (пакеты batch_N или прямой ответ API)"""
+    if not extensions_data or not isinstance(extensions_data, dict):
+        return []
+    if 'result' in extensions_data:
+        return _result_items(extensions_data, 'AdExtensions')
+    items = []
+    for batch in extensions_data.values():
+        items.extend(_result_items(batch, 'AdExtensions'))
+    return items
+
+
+def _sitelinks_sets(sitelinks_data: Optional[Dict]) -> List[Dict]:
+    """Наборы быстрых ссылок из файла sitelinks (ответы API по ID набора или прямой ответ)"""
+    if not sitelinks_data or not isinstance(sitelinks_data, dict):
+        return []
+    if 'result' in sitelinks_data:
+        return _result_items(sitelinks_data, 'SitelinksSets')
+    sets = []
+    for set_data in sitelinks_data.values():
+        sets.extend(item for item in _result_items(set_data, 'SitelinksSets') if isinstance(item, dict))
+    return sets
+
+
+class ReportIndex:
+    """Словари связей данных отчета (ключи - строковые ID, как после сохранения в JSON)"""
+
+    def __init__(self, data: Dict):
+        self.data = data
+        # Производные словари не сохраняются, а строятся при загрузке
+        self._ads = {}
+        for ads in data['ads_by_campaign'].values():
+            for ad in ads:
+                self._ads.setdefault(str(ad.get('Id')), ad)
+        self._extension_positions = {ext_id: position for position, ext_id in enumerate(data['extensions'])}
+        self._callout_texts = {
+            ext_id: ext['Callout']['CalloutText']
+            for ext_id, ext in data['extensions'].items()
+            if ext.get('Type') == 'CALLOUT' and (ext.get('Callout') or {}).get('CalloutText')
+        }
+
+    # ---------- Построение ----------
+
+    @classmethod
+    def build(cls, report_id, campaigns_data: Optional[Dict], ads_data: Optional[Dict],
+              adgroups_data: Optional[Dict] = None, keywords_data: Optional[Dict] = None,
+              extensions_data: Optional[Dict] = None, sitelinks_data: Optional[Dict] = None,
+              image_data: Optional[Dict] = None, ad_stats: Optional[StatsTable] = None) -> 'ReportIndex':
+        """Строит индекс из исходных файлов отчета (формат файлов в папке {id}_результаты)"""
+        index = _empty_index(report_id)
+
+        for campaign in _result_items(campaigns_data, 'Campaigns'):
+            index['campaigns'][str(campaign.get('Id'))] = campaign
+
+        for ad in _result_items(ads_data, 'Ads'):
+            index['ads_by_campaign'].setdefault(str(ad.get('CampaignId')), []).append(ad)
+
+        for group in _result_items(adgroups_data, 'AdGroups'):
+            index['adgroups_by_campaign'].setdefault(str(group.get('CampaignId')), []).append(group)
+
+        for keyword in _result_items(keywords_data, 'Keywords'):
+            index['keywords_by_campaign'].setdefault(str(keyword.get('CampaignId')), []).append(keyword)
+
+        for ext in _extensions_items(extensions_data):
+            index['extensions'].setdefault(str(ext.get('Id')), ext)
+
+        for sitelinks_set in _sitelinks_sets(sitelinks_data):
+            index['sitelink_sets'].setdefault(str(sitelinks_set.get('Id')), sitelinks_set.get('Sitelinks') or [])
+
+        for image in _result_items(image_data, 'AdImages'):
+            index['images'].setdefault(image.get('AdImageHash'), image)
+
+        if ad_stats is not None:
+            for row in ad_stats.records():
+                index['ad_stats'].setdefault(str(row.get('AdId')), row)
+
+        # Уточнения и наборы быстрых ссылок кампаний - в порядке следования в исходных файлах
+        extension_order = {ext_id: position for position, ext_id in enumerate(index['extensions'])}
+        sitelink_order = {set_id: position for position, set_id in enumerate(index['sitelink_sets'])}
+        for campaign_key, ads in index['ads_by_campaign'].items():
+            callout_ids = set()
+            set_ids = set()
+            for ad in ads:
+                text_ad = ad.get('TextAd') or {}
+                for ad_ext in text_ad.get('AdExtensions') or []:
+                    ext_id = str(ad_ext.get('AdExtensionId'))
+                    if ad_ext.get('Type') == 'CALLOUT' and ext_id in extension_order:
+                        callout_ids.add(ext_id)
+                set_id = str(text_ad.get('SitelinkSetId'))
+                if text_ad.get('SitelinkSetId') and set_id in sitelink_order:
+                    set_ids.add(set_id)
+            if callout_ids:
+                index['callouts_by_campaign'][campaign_key] = sorted(callout_ids, key=extension_order.get)
+            if set_ids:
+                index['sitelink_sets_by_campaign'][campaign_key] = sorted(set_ids, key=sitelink_order.get)
+
+        return cls(index)
+
+    @classmethod
+    def from_minio(cls, minio, bucket_name: str, report_id) -> Optional['ReportIndex']:
+        """
+        Строит индекс по исходным файлам отчета в MinIO
+        :param minio: клиент Minio
+        :return: индекс или None, если нет данных о кампаниях или объявлениях
+        """
+        try:
+            return cls._from_minio(minio, bucket_name, report_id)
+        except Exception as e:
+            # Индекс без части данных не строится: генераторы приняли бы его за полный
+            print(f"❌ Ошибка загрузки данных для индекса отчета {report_id}: {e}")
+            return None
+
+    @classmethod
+    def _from_minio(cls, minio, bucket_name: str, report_id) -> Optional['ReportIndex']:
+        def load(filename: str) -> Optional[Dict]:
+            return _load_json(minio, bucket_name, f"{report_folder(report_id)}{filename}")
+
+        campaigns_data = load('campaigns.json')
+        ads_data = load(f'ads_report_{report_id}.json')
+        if not campaigns_data or not ads_data:
+            print(f"⚠️ Нет данных для индекса отчета {report_id}")
+            return None
+
+        ad_stats_filename = f'ad_stats_{report_id}.json'
+        ad_stats = load_stats_table(minio, bucket_name,
+                                    f"{report_folder(report_id)}{stats_table_filename(ad_stats_filename)}")
+        if ad_stats is None:
+            ad_stats_data = load(ad_stats_filename)
+            if ad_stats_data:
+                ad_stats = StatsTable.from_rows(_result_items(ad_stats_data, 'rows'))
+
+        return cls.build(
+            report_id,
+            campaigns_data,
+            ads_data,
+            adgroups_data=load(f'adgroups_{report_id}.json'),
+            keywords_data=load(f'keywords_traffic_forecast_{report_id}.json'),
+            extensions_data=load(f'extensions_{report_id}.json'),
+            sitelinks_data=load(f'sitelinks_{report_id}.json'),
+            image_data=load(f'image_hashes_report_{report_id}.json'),
+            ad_stats=ad_stats
+        )
+
+    def to_dict(self) -> Dict:
+        return self.data
+
+    # ---------- Кампании ----------
+
+    def campaigns(self) -> List[Dict]:
+        """Кампании в порядке campaigns.json"""
+        return list(self.data['campaigns'].values())
+
+    def campaign(self, campaign_id) -> Optional[Dict]:
+        return self.data['campaigns'].get(str(campaign_id))
+
+    def ads_for_campaign(self, campaign_id) -> List[Dict]:
+        return self.data['ads_by_campaign'].get(str(campaign_id), [])
+
+    def adgroups_for_campaign(self, campaign_id) -> List[Dict]:
+        return self.data['adgroups_by_campaign'].get(str(campaign_id), [])
+
+    def keywords_for_campaign(self, campaign_id) -> List[Dict]:
+        return self.data['keywords_by_campaign'].get(str(campaign_id), [])
+
+    def has_keywords(self, campaign_id) -> bool:
+        """Есть ли у кампании ключевые фразы (кроме автотаргетинга)"""
+        return any(
+            keyword.get('Keyword') and AUTOTARGETING_KEYWORD not in keyword.get('Keyword', '')
+            for keyword in self.keywords_for_campaign(campaign_id)
+        )
+
+    def callouts_for_campaign(self, campaign_id) -> List[str]:
+        """Уникальные тексты уточнений объявлений кампании (в порядке файла расширений)"""
+        texts = []
+        for ext_id in self.data['callouts_by_campaign'].get(str(campaign_id), []):
+            text = self._callout_texts.get(ext_id)
+            if text and text not in texts:
+                texts.append(text)
+        return texts
+
+    def sitelink_sets_for_campaign(self, campaign_id) -> List[List[Dict]]:
+        """Наборы быстрых ссылок объявлений кампании (в порядке файла быстрых ссылок)"""
+        return [self.data['sitelink_sets'][set_id]
+                for set_id in self.data['sitelink_sets_by_campaign'].get(str(campaign_id), [])]
+
+    # ---------- Объекты по ID ----------
+
+    def ad(self, ad_id) -> Optional[Dict]:
+        return self._ads.get(str(ad_id))
+
+    def callout_text(self, extension_id) -> Optional[str]:
+        return self._callout_texts.get(str(extension_id))
+
+    def callouts_for_ad(self, ad: Dict) -> List[str]:
+        """Тексты уточнений объявления (в порядке файла расширений)"""
+        ext_ids = {str(ad_ext.get('AdExtensionId'))
+                   for ad_ext in (ad.get('TextAd') or {}).get('AdExtensions') or []
+                   if ad_ext.get('AdExtensionId')}
+        ext_ids = [ext_id for ext_id in ext_ids if ext_id in self._callout_texts]
+        return [self._callout_texts[ext_id] for ext_id in sorted(ext_ids, key=self._extension_positions.get)]
+
+    def sitelinks(self, sitelink_set_id) -> List[Dict]:
+        if not sitelink_set_id:
+            return []
+        return self.data['sitelink_sets'].get(str(sitelink_set_id), [])
+
+    def image(self, image_hash: Optional[str]) -> Optional[Dict]:
+        return self.data['images'].get(image_hash) if image_hash else None
+
+    def image_url(self, image_hash: Optional[str]) -> Optional[str]:
+        image = self.image(image_hash)
+        return image.get('OriginalUrl') if image else None
+
+    def ad_stats(self, ad_id) -> Optional[Dict]:
+        return self.data['ad_stats'].get(str(ad_id))
+
+
+def _load_json(minio, bucket_name: str, object_name: str) -> Optional[Dict]:
+    """
+    Загружает JSON-файл отчета
+    :return: данные или None, если объекта нет (NoSuchKey); остальные ошибки пробрасываются
+    """
+    response = None
+    try:
+        response = minio.get_object(bucket_name, object_name)
+        return decode_json(response.read())
+    except S3Error as e:
+        if e.code == 'NoSuchKey':
+            return None
+        raise
+    finally:
+        if response:
+            response.close()
+            response.release_conn()
+
+
+def load_report_index(minio, bucket_name: str, report_id) -> Optional[ReportIndex]:
+    """
+    Загружает сохраненный индекс отчета
+    :return: индекс или None, если его нет (или он прежней версии); ошибки загрузки пробрасываются
+    """
+    data = _load_json(minio, bucket_name, f"{report_folder(report_id)}{report_index_filename(report_id)}")
+    return ReportIndex(data) if data and data.get('version') == INDEX_VERSION else None
+
+
+# Индексы отчетов, уже загруженные или построенные в этом процессе
+_indexes: Dict[str, ReportIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def publish_report_index(bucket_name: str, report_id, index: ReportIndex):
+    """Делает индекс доступным генераторам процесса (заменяет прежний индекс отчета)"""
+    with _indexes_lock:
+        _indexes[f"{bucket_name}/{report_id}"] = index
+
+
+def get_report_index(minio, bucket_name: str, report_id) -> Optional[ReportIndex]:
+    """
+    Индекс отчета для генераторов документов: из памяти процесса, из MinIO или,
+    для отчетов, сформированных до появления индекса, построенный по исходным файлам
+    """
+    key = f"{bucket_name}/{report_id}"
+    with _indexes_lock:
+        index = _indexes.get(key)
+    if index is not None:
+        return index
+
+    try:
+        index = load_report_index(minio, bucket_name, report_id)
+    except Exception as e:
+        # Сохраненный индекс есть, но не прочитан: по исходным файлам не строим и не кэшируем
+        print(f"❌ Ошибка загрузки индекса отчета {report_id}: {e}")
+        return None
+    if index is None:
+        print(f"⚠️ Индекс отчета {report_id} не найден, строим по исходным файлам")
+        index = ReportIndex.from_minio(minio, bucket_name, report_id)
+    if index is not None:
+        publish_report_index(bucket_name, report_id, index)
+    return index
+
+
+def release_report_index(bucket_name: str, report_id):
+    """Убирает индекс отчета из памяти процесса (после завершения обработки отчета)"""
+    with _indexes_lock:
+        _indexes.pop(f"{bucket_name}/{report_id}", None)
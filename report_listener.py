@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ожидание новых отчетов через LISTEN/NOTIFY PostgreSQL
+Триггер на таблице reports (см. script.sql) при постановке отчета в статус 1
+вызывает pg_notify(REPORTS_NOTIFY_CHANNEL, id отчета). Процесс-служба держит
+отдельное соединение в режиме autocommit с LISTEN на этот канал и просыпается
+сразу после уведомления; если уведомлений нет (или соединение потеряно),
+очередной опрос таблицы выполняется по таймауту REPORTS_POLL_INTERVAL
+"""
+
+import os
+import select
+import threading
+import time
+from typing import Optional, Set
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from dotenv import load_dotenv
+
+load_dotenv('.env')
+
+# Канал уведомлений о новых отчетах (совпадает с каналом в триггере notify_report_queued)
+REPORTS_NOTIFY_CHANNEL = os.getenv('REPORTS_NOTIFY_CHANNEL', 'reports_queued')
+# Интервал опроса таблицы отчетов без уведомлений, сек
+REPORTS_POLL_INTERVAL = float(os.getenv('REPORTS_POLL_INTERVAL', '300'))
+# Пауза перед повторным подключением слушателя, сек
+REPORTS_LISTEN_RETRY = float(os.getenv('REPORTS_LISTEN_RETRY', '30'))
+
+# Шаг ожидания: остановка службы проверяется не реже этого интервала, сек
+_WAIT_STEP = 1.0
+
+
+class ReportListener:
+    """Соединение с LISTEN на канал новых отчетов (и каналы задач этапов, см. task_queue)"""
+
+    def __init__(self, *channels: str):
+        """:param channels: каналы уведомлений (по умолчанию - канал новых отчетов)"""
+        self.channels = channels or (REPORTS_NOTIFY_CHANNEL,)
+        self.connection = None
+        # Время последней неудачной попытки подключения
+        self._failed_at = 0.0
+
+    def connect(self) -> bool:
+        """Подключается к БД и подписывается на канал"""
+        self.close()
+        try:
+            self.connection = psycopg2.connect(
+                host=os.getenv('DB_HOST'),
+                port=os.getenv('DB_PORT'),
+                database=os.getenv('DB_NAME'),
+                user=os.getenv('DB_USER'),
+                password=os.getenv('DB_PASSWORD')
+            )
+            self.connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with self.connection.cursor() as cursor:
+                for channel in self.channels:
+                    cursor.execute(f'LISTEN "{channel}";')
+            print(f"👂 Ожидание уведомлений о новых отчетах (каналы: {', '.join(self.channels)})")
+            return True
+        except Exception as e:
+            print(f"⚠️ Не удалось подписаться на уведомления о новых отчетах: {e}")
+            self.connection = None
+            self._failed_at = time.monotonic()
+            return False
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def _ensure_connected(self) -> bool:
+        if self.connection is not None and not self.connection.closed:
+            return True
+        if time.monotonic() - self._failed_at < REPORTS_LISTEN_RETRY:
+            return False
+        return self.connect()
+
+    def _drain(self) -> Set[str]:
+        """Забирает пришедшие уведомления (payload - id отчетов)"""
+        self.connection.poll()
+        payloads = {notify.payload for notify in self.connection.notifies}
+        self.connection.notifies.clear()
+        return payloads
+
+    def wait(self, timeout: float = REPORTS_POLL_INTERVAL,
+             stop_event: Optional[threading.Event] = None) -> Set[str]:
+        """
+        Ждет уведомления о новых отчетах не дольше timeout
+        :param stop_event: прерывает ожидание при остановке службы
+        :return: id отчетов из уведомлений (пустое множество - истек таймаут или остановка)
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                return set()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return set()
+            step = min(remaining, _WAIT_STEP)
+
+            if not self._ensure_connected():
+                # Без уведомлений остается опрос по таймауту
+                time.sleep(step)
+                continue
+
+            try:
+                ready, _, _ = select.select([self.connection], [], [], step)
+                if ready:
+                    payloads = self._drain()
+                    if payloads:
+                        return payloads
+            except Exception as e:
+                print(f"⚠️ Соединение для уведомлений потеряно: {e}")
+                self.close()
+                self._failed_at = time.monotonic()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Манифест артефактов отчета в MinIO
+В папке {id}_результаты хранится manifest.json со списком записанных объектов
+(имя, размер, ETag) и количеством скриншотов по каждому URL. Читающая сторона
+находит файлы по манифесту одним небольшим GET вместо перебора списка объектов папки
+и проверок screenshot_001.png, screenshot_002.png, ... до NoSuchKey.
+В манифесте также хранятся контрольные точки шагов обработки (см. report_checkpoints)
+"""
+
+import io
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from artifact_codec import decode_json, encode_json
+
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+REPORTS_BASE_PATH = 'gen_report_context_contracts/data_yandex_direct'
+
+
+def report_folder(report_id) -> str:
+    """Папка результатов отчета в bucket"""
+    return f"{REPORTS_BASE_PATH}/{report_id}_результаты/"
+
+
+def manifest_object_name(report_id) -> str:
+    return f"{report_folder(report_id)}{MANIFEST_FILENAME}"
+
+
+def _empty_manifest(report_id) -> Dict:
+    return {'version': MANIFEST_VERSION, 'report_id': report_id, 'artifacts': {}, 'screenshots': {},
+            'checkpoints': {}}
+
+
+def load_manifest(minio, bucket_name: str, report_id) -> Optional[Dict]:
+    """
+    Загружает манифест отчета
+    :param minio: клиент Minio
+    :return: манифест или None, если его нет (отчеты, сформированные до появления манифеста)
+    """
+    response = None
+    try:
+        response = minio.get_object(bucket_name, manifest_object_name(report_id))
+        manifest = decode_json(response.read())
+        return manifest if manifest.get('version') == MANIFEST_VERSION else None
+    except Exception:
+        return None
+    finally:
+        if response:
+            response.close()
+            response.release_conn()
+
+
+def find_artifact(manifest: Optional[Dict], report_id, filename: str) -> Optional[str]:
+    """Полное имя объекта по имени файла в папке отчета (None, если в манифесте его нет)"""
+    if not manifest:
+        return None
+    if filename in manifest['artifacts']:
+        return f"{report_folder(report_id)}{filename}"
+    return None
+
+
+def screenshot_count(manifest: Optional[Dict], url_index: int) -> Optional[int]:
+    """Количество скриншотов URL по манифесту (None, если манифеста нет)"""
+    if not manifest:
+        return None
+    return manifest['screenshots'].get(f"url_{url_index}", 0)
+
+
+class ReportManifest:
+    """
+    Манифест отчета на стороне записи.
+    Изменения применяются под блокировкой к копии в памяти, манифест целиком перезаписывается
+    одним PUT: читатели видят либо прежнюю, либо новую версию. Записанные объекты копятся
+    в памяти и сохраняются на границах шагов (begin_stage / complete_stage / end_stage)
+    или вызовом flush(), а не отдельным PUT на каждый объект
+    """
+
+    def __init__(self, minio, bucket_name: str, report_id):
+        self.minio = minio
+        self.bucket_name = bucket_name
+        self.report_id = report_id
+        self.lock = threading.Lock()
+        self.data = load_manifest(minio, bucket_name, report_id) or _empty_manifest(report_id)
+        self.data.setdefault('checkpoints', {})
+        # Выполняемый шаг обработки: записанные объекты относятся к его выходным данным
+        self.active_stage: Optional[str] = None
+        # Есть изменения, еще не сохраненные в MinIO
+        self._dirty = False
+
+    def record(self, object_name: str, size: int, etag: Optional[str] = None,
+               stage: Optional[str] = None) -> bool:
+        """
+        Добавляет (обновляет) объект папки отчета в манифесте (сохраняется на границе шага, см. flush)
+        :param stage: шаг обработки, записавший объект (по умолчанию - выполняемый шаг)
+        """
+        folder = report_folder(self.report_id)
+        if not object_name.startswith(folder):
+            return False
+        with self.lock:
+            name = object_name[len(folder):]
+            self.data['artifacts'][name] = {
+                'size': size,
+                'etag': etag,
+                'updated_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            self._add_outputs(stage or self.active_stage, [name])
+            self._dirty = True
+            return True
+
+    def record_screenshots(self, url_index: int, files: Dict[str, Dict]) -> bool:
+        """
+        Записывает скриншоты URL (заменяя прежние; сохраняется на границе шага, см. flush)
+        :param files: имя файла в папке url_N -> {'size', 'etag'}
+        """
+        prefix = f"screenshots/url_{url_index}/"
+        with self.lock:
+            self._add_outputs(self.active_stage, [f"{prefix}{filename}" for filename in files])
+            artifacts = self.data['artifacts']
+            for name in [name for name in artifacts if name.startswith(prefix)]:
+                del artifacts[name]
+            updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            for filename, info in files.items():
+                artifacts[f"{prefix}{filename}"] = dict(info, updated_at=updated_at)
+            self.data['screenshots'][f"url_{url_index}"] = len(files)
+            self._dirty = True
+            return True
+
+    def flush(self) -> bool:
+        """Сохраняет накопленные изменения манифеста (если они есть)"""
+        with self.lock:
+            return self._save() if self._dirty else True
+
+    # ---------- Контрольные точки шагов ----------
+
+    def _add_outputs(self, stage: Optional[str], names: List[str]):
+        checkpoint = self.data['checkpoints'].get(stage) if stage else None
+        if checkpoint is not None:
+            checkpoint['outputs'] = sorted(set(checkpoint['outputs']).union(names))
+
+    def begin_stage(self, stage: str, fingerprint: str, later_stages: Iterable[str] = (),
+                    require_outputs: bool = False) -> bool:
+        """
+        Начинает шаг: контрольная точка шага и последующих шагов становится незавершенной
+        :param later_stages: шаги, зависящие от результата этого шага
+        :param require_outputs: шаг без выходных объектов не считается выполненным
+        """
+        with self.lock:
+            checkpoints = self.data['checkpoints']
+            checkpoints[stage] = {'fingerprint': fingerprint, 'outputs': [], 'completed_at': None}
+            if require_outputs:
+                checkpoints[stage]['require_outputs'] = True
+            for later in later_stages:
+                if later in checkpoints:
+                    checkpoints[later]['completed_at'] = None
+            self.active_stage = stage
+            return self._save()
+
+    def complete_stage(self, stage: str) -> bool:
+        """Отмечает шаг выполненным"""
+        with self.lock:
+            if self.active_stage == stage:
+                self.active_stage = None
+            checkpoint = self.data['checkpoints'].get(stage)
+            if checkpoint is None:
+                return False
+            checkpoint['completed_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            return self._save()
+
+    def end_stage(self, stage: str):
+        """
+        Шаг завершился (в т.ч. ошибкой): новые объекты к нему больше не относятся,
+        объекты, записанные во время шага, сохраняются
+        """
+        with self.lock:
+            if self.active_stage == stage:
+                self.active_stage = None
+            if self._dirty:
+                self._save()
+
+    def invalidate_stages(self, stages: Iterable[str]) -> bool:
+        """Делает контрольные точки шагов незавершенными (например, если не загрузились их объекты)"""
+        with self.lock:
+            for stage in stages:
+                checkpoint = self.data['checkpoints'].get(stage)
+                if checkpoint is not None:
+                    checkpoint['completed_at'] = None
+            return self._save()
+
+    def completed_stage(self, stage: str, fingerprint: str, max_age: Optional[timedelta] = None) -> bool:
+        """
+        Шаг выполнен с теми же входными данными, не раньше max_age назад,
+        и все его выходные объекты есть в манифесте (для шага с require_outputs - хотя бы один)
+        """
+        with self.lock:
+            checkpoint = self.data['checkpoints'].get(stage)
+            if not checkpoint or not checkpoint.get('completed_at') or checkpoint.get('fingerprint') != fingerprint:
+                return False
+            completed_at = datetime.strptime(checkpoint['completed_at'], "%Y-%m-%d %H:%M:%S")
+            if max_age is not None and datetime.now() - completed_at > max_age:
+                return False
+            if checkpoint.get('require_outputs') and not checkpoint['outputs']:
+                return False
+            artifacts = self.data['artifacts']
+            return all(name in artifacts for name in checkpoint['outputs'])
+
+    def _save(self) -> bool:
+        try:
+            data, metadata = encode_json(self.data)
+            self.minio.put_object(
+                self.bucket_name,
+                manifest_object_name(self.report_id),
+                io.BytesIO(data),
+                length=len(data),
+                content_type='application/json',
+                metadata=metadata
+            )
+            self._dirty = False
+            return True
+        except Exception as e:
+            # Изменения остаются несохраненными и будут записаны при следующем сохранении
+            print(f"⚠️ Ошибка обновления манифеста отчета {self.report_id}: {e}")
+            return False
+
+
+# Манифесты, открытые на запись в этом процессе (общие для всех экземпляров MinIOClient)
+_writers: Dict[str, ReportManifest] = {}
+_writers_lock = threading.Lock()
+
+
+def manifest_writer(minio, bucket_name: str, report_id) -> ReportManifest:
+    """Манифест отчета для записи (один объект на отчет в пределах процесса)"""
+    key = f"{bucket_name}/{report_id}"
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = ReportManifest(minio, bucket_name, report_id)
+        return writer
+
+
+def flush_manifest_writers() -> bool:
+    """Сохраняет накопленные изменения всех манифестов процесса (после точки синхронизации загрузок)"""
+    with _writers_lock:
+        writers = list(_writers.values())
+    return all([writer.flush() for writer in writers])
+
+
+def release_manifest_writer(bucket_name: str, report_id):
+    """Сохраняет и убирает манифест отчета из памяти процесса (после завершения обработки отчета)"""
+    with _writers_lock:
+        writer = _writers.pop(f"{bucket_name}/{report_id}", None)
+    if writer is not None:
+        writer.flush()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Разбиение запросов Reports API на части для крупных аккаунтов
+Если отчет не укладывается в серверное ограничение по времени (HTTP 502) или заранее
+превышает порог по количеству кампаний / дней, он запрашивается частями по кампаниям
+и периоду. Части формируются параллельно (в пределах очереди офлайн-отчетов) под
+уникальными именами, TSV частей объединяется в один отчет того же формата.
+Строки готовых частей до объединения хранятся во временных файлах, а не в памяти
+"""
+
+import copy
+import inspect
+import os
+import tempfile
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from report_tsv_parser import TOTAL_ROWS_PREFIX
+
+load_dotenv('.env')
+
+# Максимум кампаний в одном запросе отчета (больше - отчет сразу запрашивается частями)
+REPORT_SHARD_MAX_CAMPAIGNS = int(os.getenv('REPORT_SHARD_MAX_CAMPAIGNS', '50'))
+# Максимум дней в одном запросе отчета с разбивкой по датам
+REPORT_SHARD_MAX_DAYS = int(os.getenv('REPORT_SHARD_MAX_DAYS', '92'))
+# Количество частей, формируемых одновременно (лимит очереди офлайн-отчетов - 5)
+REPORT_SHARD_PARALLEL = int(os.getenv('REPORT_SHARD_PARALLEL', '5'))
+# Максимальная глубина повторного деления части после ошибки
+REPORT_SHARD_MAX_DEPTH = int(os.getenv('REPORT_SHARD_MAX_DEPTH', '4'))
+
+# Коды ответа Reports API, после которых запрос делится на части
+SPLIT_STATUSES = (502,)
+
+Shard = Tuple[List[int], str, str]
+
+
+def _parse_date(value: str):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _chunks(items: List, size: int) -> List[List]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def split_period(start_date: str, end_date: str, max_days: int) -> List[Tuple[str, str]]:
+    """Делит период на непрерывные отрезки не длиннее max_days дней"""
+    start, end = _parse_date(start_date), _parse_date(end_date)
+    periods = []
+    while start <= end:
+        period_end = min(start + timedelta(days=max_days - 1), end)
+        periods.append((start.strftime("%Y-%m-%d"), period_end.strftime("%Y-%m-%d")))
+        start = period_end + timedelta(days=1)
+    return periods
+
+
+def initial_shards(campaign_ids: List[int], start_date: str, end_date: str, split_dates: bool) -> List[Shard]:
+    """Части отчета по порогам REPORT_SHARD_MAX_CAMPAIGNS / REPORT_SHARD_MAX_DAYS"""
+    periods = split_period(start_date, end_date, REPORT_SHARD_MAX_DAYS) if split_dates \
+        else [(start_date, end_date)]
+    return [(chunk, period_start, period_end)
+            for chunk in _chunks(list(campaign_ids), REPORT_SHARD_MAX_CAMPAIGNS)
+            for period_start, period_end in periods]
+
+
+def split_shard(shard: Shard, split_dates: bool) -> Optional[List[Shard]]:
+    """
+    Делит часть пополам: сначала по кампаниям, затем (для отчетов с разбивкой по датам) по периоду
+    :return: две части или None, если делить больше нечего
+    """
+    campaign_ids, start_date, end_date = shard
+    if len(campaign_ids) > 1:
+        middle = len(campaign_ids) // 2
+        return [(campaign_ids[:middle], start_date, end_date), (campaign_ids[middle:], start_date, end_date)]
+
+    days = (_parse_date(end_date) - _parse_date(start_date)).days + 1
+    if split_dates and days > 1:
+        return [(campaign_ids, period_start, period_end)
+                for period_start, period_end in split_period(start_date, end_date, (days + 1) // 2)]
+    return None
+
+
+def merge_report_lines(parts: Iterable[List[str]]) -> Iterator[str]:
+    """
+    Объединяет строки частей отчета (части читаются по мере объединения): заголовок отчета
+    и строка полей берутся из первой части, строки данных - из всех частей,
+    итоговая строка Total rows пересчитывается и выдается последней
+    """
+    title_seen = False
+    header_seen = False
+    rows = 0
+    for lines in parts:
+        part_header_seen = False
+        for line in lines:
+            if not line.strip() or line.startswith(TOTAL_ROWS_PREFIX):
+                continue
+            if not part_header_seen:
+                if '\t' not in line and not title_seen and not header_seen:
+                    # Заголовок отчета (имя отчета) первой части
+                    title_seen = True
+                    yield line
+                    continue
+                if '\t' not in line:
+                    continue
+                part_header_seen = True
+                if not header_seen:
+                    header_seen = True
+                    yield line
+                continue
+            rows += 1
+            yield line
+    yield f"{TOTAL_ROWS_PREFIX} {rows}"
+
+
+def merge_report_tsv(reports: List[str]) -> str:
+    """Объединяет TSV частей отчета в один отчет того же формата (см. merge_report_lines)"""
+    return "\n".join(merge_report_lines(text.splitlines() for text in reports)) + "\n"
+
+
+class _ShardSpool:
+    """Строки части отчета во временном файле (приемник sink для методов, читающих ответ потоково)"""
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile('w+', encoding='utf-8', newline='\n')
+
+    def feed(self, line: str):
+        self.file.write(line)
+        self.file.write('\n')
+
+    def lines(self) -> Iterator[str]:
+        """Строки части (файл читается с начала)"""
+        self.file.seek(0)
+        for line in self.file:
+            yield line[:-1] if line.endswith('\n') else line
+
+    def close(self):
+        self.file.close()
+
+
+def _close_spools(spools: Iterable[_ShardSpool]):
+    for spool in spools:
+        spool.close()
+
+
+def _discard_parts(future: Future):
+    """Удаляет файлы части, результат которой не будет объединен (после ошибки другой части)"""
+    if not future.cancelled() and future.exception() is None and future.result():
+        _close_spools(future.result())
+
+
+def _accepts(method, parameter: str) -> bool:
+    return parameter in inspect.signature(method).parameters
+
+
+def _shard_report_name(method_name: str) -> str:
+    """
+    Уникальное имя отчета для части: части, запрошенные в одну секунду с разными параметрами,
+    иначе получат одинаковое имя, и Reports API отклонит их с HTTP 400
+    """
+    return f"{method_name} {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {uuid.uuid4().hex[:12]}"
+
+
+def _fetch_shard(api_client, method_name: str, shard: Shard, kwargs: Dict, split_dates: bool,
+                 depth: int = 0) -> Optional[List[_ShardSpool]]:
+    """Запрашивает часть отчета, при HTTP 502 делит ее дальше; возвращает файлы строк TSV частей"""
+    # Копия клиента: код ответа последнего запроса хранится в клиенте
+    client = copy.copy(api_client)
+    client.last_report_status = None
+    campaign_ids, start_date, end_date = shard
+    method = getattr(client, method_name)
+    call_kwargs = dict(kwargs)
+    spool = _ShardSpool()
+    streamed = _accepts(method, 'sink')
+    if streamed:
+        call_kwargs['sink'] = spool
+    if _accepts(method, 'report_name'):
+        call_kwargs['report_name'] = _shard_report_name(method_name)
+    try:
+        result = method(campaign_ids, start_date, end_date, **call_kwargs)
+        if result and not streamed and isinstance(result.get('report'), str):
+            # Текст части переносится в файл, ответ метода не удерживается до объединения
+            for line in result['report'].splitlines():
+                spool.feed(line)
+            streamed = True
+    except BaseException:
+        spool.close()
+        raise
+    if result and streamed:
+        return [spool]
+    spool.close()
+
+    if client.last_report_status not in SPLIT_STATUSES or depth >= REPORT_SHARD_MAX_DEPTH:
+        return None
+    parts = split_shard(shard, split_dates)
+    if not parts:
+        print(f"❌ Часть отчета ({len(campaign_ids)} кампаний, {start_date} - {end_date}) делить больше нельзя")
+        return None
+
+    print(f"✂️ Часть отчета превысила ограничение по времени, делим на {len(parts)} части")
+    reports = []
+    for part in parts:
+        part_reports = _fetch_shard(api_client, method_name, part, kwargs, split_dates, depth + 1)
+        if part_reports is None:
+            _close_spools(reports)
+            return None
+        reports.extend(part_reports)
+    return reports
+
+
+class _ShardFailed(Exception):
+    pass
+
+
+def _completed_parts(futures: List[Future], received: List[_ShardSpool]) -> Iterator[Iterator[str]]:
+    """
+    Строки частей в порядке частей по мере готовности; файл части удаляется после ее чтения
+    :param futures: части; полученные части удаляются из списка
+    :param received: сюда добавляются прочитанные части (файлы к этому времени закрыты)
+    """
+    while futures:
+        spools = futures.pop(0).result()
+        if spools is None:
+            raise _ShardFailed()
+        try:
+            for spool in spools:
+                received.append(spool)
+                yield spool.lines()
+        finally:
+            _close_spools(spools)
+
+
+def run_sharded_report(api_client, method_name: str, campaign_ids: List[int], start_date: str, end_date: str,
+                       sink=None, split_dates: bool = False, **kwargs) -> Optional[Dict]:
+    """
+    Запрашивает отчет методом DirectAPIClient, при необходимости частями
+    :param method_name: имя метода create_*_report (строки отчета должны различаться по CampaignId,
+        для split_dates - еще и по Date)
+    :param sink: приемник строк отчета; строки частей передаются в него по мере готовности частей
+        (при ошибке часть строк уже передана - приемник нужно отменить)
+    :param split_dates: можно ли делить период (отчеты с разбивкой по датам)
+    :return: ответ в формате метода DirectAPIClient или None
+    """
+    shards = initial_shards(campaign_ids, start_date, end_date, split_dates)
+    method = getattr(api_client, method_name)
+
+    if len(shards) == 1:
+        call_kwargs = dict(kwargs, sink=sink) if sink is not None else kwargs
+        api_client.last_report_status = None
+        result = method(campaign_ids, start_date, end_date, **call_kwargs)
+        if result or api_client.last_report_status not in SPLIT_STATUSES:
+            return result
+        shards = split_shard(shards[0], split_dates)
+        if not shards:
+            return None
+        print("✂️ Отчет превысил серверное ограничение по времени, запрашиваем частями")
+
+    print(f"✂️ Отчет запрашивается частями: {len(shards)} (одновременно до {REPORT_SHARD_PARALLEL})")
+    executor = ThreadPoolExecutor(max_workers=REPORT_SHARD_PARALLEL)
+    futures = [executor.submit(_fetch_shard, api_client, method_name, shard, kwargs, split_dates)
+               for shard in shards]
+    merged = None
+    received = []
+    failed = True
+    try:
+        lines = merge_report_lines(_completed_parts(futures, received))
+        if sink is not None:
+            for line in lines:
+                sink.feed(line)
+        else:
+            merged = "\n".join(lines) + "\n"
+        failed = False
+    except _ShardFailed:
+        print("❌ Не удалось получить все части отчета")
+        return None
+    finally:
+        if failed:
+            # Выполняющиеся части не ждем: их файлы удаляются, когда части завершатся
+            for future in futures:
+                future.add_done_callback(_discard_parts)
+        executor.shutdown(wait=not failed, cancel_futures=True)
+    print(f"✅ Отчет собран из частей: {len(received)}")
+
+    return {
+        'report': merged,
+        'status': 'completed',
+        '_meta': {
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'api_method': 'reports.post',
+            'api_version': 'v5',
+            'format': 'TSV',
+            'method': method_name,
+            'shards': len(received),
+            'streamed': sink is not None
+        }
+    }
@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Модуль для разбора TSV отчетов Reports API Яндекс.Директ
+Колонки определяются по строке с названиями полей (FieldNames), значения раскладываются
+по типизированным массивам (модуль array) целыми колонками, а не построчными словарями
+"""
+
+from array import array
+from itertools import compress, islice, repeat
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# Типы колонок
+ID = 'id'  # идентификатор, отсутствующее значение -> None
+INT = 'int'  # счетчик, отсутствующее значение -> 0
+FLOAT = 'float'  # дробное значение, отсутствующее значение -> 0.0
+STR = 'str'  # строка
+
+# Типы известных полей отчетов. Поля, которых нет в словаре, считаются строковыми
+FIELD_TYPES = {
+    'CampaignId': ID,
+    'AdGroupId': ID,
+    'AdId': ID,
+    'CriterionId': ID,
+    'Impressions': INT,
+    'Clicks': INT,
+    'Conversions': INT,
+    'Sessions': INT,
+    'Bounces': INT,
+    'Ctr': FLOAT,
+    'BounceRate': FLOAT,
+    'Cost': FLOAT,
+    'AvgCpc': FLOAT,
+    'AvgImpressionPosition': FLOAT,
+    'AvgClickPosition': FLOAT,
+    'AvgPageviews': FLOAT,
+    'ConversionRate': FLOAT,
+    'CostPerConversion': FLOAT,
+    'CampaignName': STR,
+    'AdGroupName': STR,
+    'CampaignType': STR,
+    'AdNetworkType': STR,
+    'Date': STR,
+    'Query': STR,
+}
+
+# Значение, которым Reports API обозначает отсутствие данных
+MISSING_VALUE = '--'
+
+TOTAL_ROWS_PREFIX = 'Total rows:'
+
+_ARRAY_TYPECODES = {ID: 'q', INT: 'q', FLOAT: 'd'}
+_DEFAULTS = {ID: None, INT: 0, FLOAT: 0.0, STR: ''}
+
+
+def _parse_int(value: str) -> Optional[int]:
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return int(float(value))
+        except ValueError:
+            return None
+
+
+def _parse_float(value: str) -> Optional[float]:
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class ReportColumns:
+    """Результат разбора отчета: колонки в виде типизированных массивов"""
+
+    def __init__(self, field_names: List[str], field_types: Dict[str, str]):
+        self.field_names = field_names
+        self.field_types = field_types
+        self.columns: Dict[str, Union[array, List[str]]] = {}
+        # Маска отсутствующих значений для числовых колонок (1 - значение отсутствует)
+        self.nulls: Dict[str, bytearray] = {}
+        self.row_count = 0
+        # Значение из строки "Total rows: N", если она была в отчете
+        self.total_rows_reported: Optional[int] = None
+
+        for name in field_names:
+            field_type = field_types[name]
+            if field_type == STR:
+                self.columns[name] = []
+            else:
+                self.columns[name] = array(_ARRAY_TYPECODES[field_type])
+                self.nulls[name] = bytearray()
+
+    def column(self, name: str):
+        """Колонка по имени поля (None, если поля нет в отчете)"""
+        return self.columns.get(name)
+
+    def value(self, name: str, index: int):
+        """Значение поля в строке с учетом отсутствующих значений"""
+        column = self.columns.get(name)
+        field_type = self.field_types.get(name, STR)
+        if column is None:
+            return _DEFAULTS[field_type]
+        if field_type != STR and self.nulls[name][index]:
+            return _DEFAULTS[field_type]
+        return column[index]
+
+    def _record_column(self, name: str) -> Iterable:
+        """Значения поля для построения строк: отсутствующие значения заменены значением по умолчанию"""
+        field_type = self.field_types.get(name, FIELD_TYPES.get(name, STR))
+        default = _DEFAULTS[field_type]
+        column = self.columns.get(name)
+        if column is None:
+            return repeat(default, self.row_count)
+        if field_type == STR:
+            return column
+        values = column.tolist()
+        nulls = self.nulls[name]
+        if nulls.find(1) >= 0:
+            for index in compress(range(self.row_count), nulls):
+                values[index] = default
+        return values
+
+    def iter_records(self, fields: Optional[List[str]] = None) -> Iterator[Dict]:
+        """
+        Генератор строк отчета в виде словарей
+        :param fields: поля в нужном порядке; отсутствующие в отчете поля получают значение по умолчанию
+        """
+        fields = list(fields or self.field_names)
+        columns = [self._record_column(name) for name in fields]
+        for values in zip(*columns):
+            yield dict(zip(fields, values))
+
+    def to_records(self, fields: Optional[List[str]] = None) -> List[Dict]:
+        """Список строк отчета в виде словарей (см. iter_records)"""
+        return list(self.iter_records(fields))
+
+
+class ReportTSVParser:
+    """
+    Инкрементальный парсер TSV отчета.
+    Строки накапливаются пачками и переводятся в колонки целиком, поэтому парсер можно
+    кормить построчно при потоковом чтении ответа API
+    """
+
+    def __init__(self, field_types: Optional[Dict[str, str]] = None, batch_size: int = 10000,
+                 on_batch: Optional[Callable[[ReportColumns], None]] = None):
+        """
+        :param on_batch: получатель колонок каждой разобранной пачки. Если задан, колонки
+            не накапливаются: после вызова пачка освобождается, и close() возвращает
+            колонки без строк (названия полей и total_rows_reported)
+        """
+        self.field_types = dict(FIELD_TYPES)
+        if field_types:
+            self.field_types.update(field_types)
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+        self.result: Optional[ReportColumns] = None
+        # Количество разобранных строк данных (в том числе переданных в on_batch)
+        self.rows_parsed = 0
+        self._batch: List[List[str]] = []
+        self._lines_seen = 0
+
+    def feed(self, line: str):
+        """Обрабатывает одну строку отчета"""
+        line = line.rstrip('\r\n')
+        self._lines_seen += 1
+        if not line.strip():
+            return
+
+        if self.result is None:
+            # Первая строка может быть заголовком отчета (имя отчета) - строка без табуляции
+            if self._lines_seen == 1 and '\t' not in line:
+                return
+            fields = line.split('\t')
+            for name in fields:
+                self.field_types.setdefault(name, STR)
+            self.result = ReportColumns(fields, self.field_types)
+            return
+
+        if line.startswith(TOTAL_ROWS_PREFIX):
+            self.result.total_rows_reported = _parse_int(line[len(TOTAL_ROWS_PREFIX):].strip())
+            return
+
+        fields = line.split('\t')
+        if len(fields) < len(self.result.field_names):
+            return
+        self._batch.append(fields)
+        if len(self._batch) >= self.batch_size:
+            self._flush()
+
+    def feed_lines(self, lines: Iterable[str]):
+        """Обрабатывает последовательность строк"""
+        lines = iter(lines)
+        # Строки до названий полей - через feed, строки данных - без вызова feed на каждую
+        for line in lines:
+            self.feed(line)
+            if self.result is not None:
+                break
+        if self.result is None or len(self.result.field_names) < 2:
+            for line in lines:
+                self.feed(line)
+            return
+
+        field_count = len(self.result.field_names)
+        self._flush()
+        while True:
+            chunk = list(islice(lines, self.batch_size))
+            if not chunk:
+                break
+            self._lines_seen += len(chunk)
+            rows = [line.rstrip('\r\n').split('\t') for line in chunk]
+            if min(map(len, rows)) < field_count:
+                # Пустые строки, строка Total rows
+                for fields in rows:
+                    if len(fields) < field_count and fields[0].startswith(TOTAL_ROWS_PREFIX):
+                        self.result.total_rows_reported = _parse_int(fields[0][len(TOTAL_ROWS_PREFIX):].strip())
+                rows = [fields for fields in rows if len(fields) >= field_count]
+            self._batch = rows
+            self._flush()
+
+    def close(self) -> Optional[ReportColumns]:
+        """Завершает разбор и возвращает колонки (None, если не найдена строка с полями)"""
+        self._flush()
+        return self.result
+
+    def _flush(self):
+        if not self._batch or self.result is None:
+            self._batch = []
+            return
+
+        result = self.result
+        # Транспонируем пачку строк в колонки
+        raw_columns = list(zip(*self._batch))
+        batch_len = len(self._batch)
+        self._batch = []
+
+        for index, name in enumerate(result.field_names):
+            raw = raw_columns[index]
+            field_type = result.field_types[name]
+            column = result.columns[name]
+
+            if field_type == STR:
+                column.extend(raw)
+                continue
+
+            nulls = result.nulls[name]
+            converter = int if field_type in (ID, INT) else float
+            values = raw
+            mask = None
+            if MISSING_VALUE in raw:
+                # Пропуски ('--') заменяются нулем и отмечаются в маске
+                mask = bytes(map(MISSING_VALUE.__eq__, raw))
+                values = list(raw)
+                for position in compress(range(batch_len), mask):
+                    values[position] = '0'
+            try:
+                # Быстрый путь: все значения колонки пачки корректны
+                column.extend(array(column.typecode, map(converter, values)))
+                nulls.extend(mask if mask is not None else bytes(batch_len))
+            except (ValueError, OverflowError):
+                parse = _parse_int if field_type in (ID, INT) else _parse_float
+                for value in raw:
+                    parsed = parse(value) if value != MISSING_VALUE else None
+                    if parsed is None:
+                        column.append(0)
+                        nulls.append(1)
+                    else:
+                        column.append(parsed)
+                        nulls.append(0)
+
+        result.row_count += batch_len
+        self.rows_parsed += batch_len
+        if self.on_batch is not None:
+            self.on_batch(result)
+            # Следующая пачка собирается в новые колонки, переданные получателю не хранятся
+            self.result = ReportColumns(result.field_names, result.field_types)
+            self.result.total_rows_reported = result.total_rows_reported
+
+
+def parse_report_tsv(tsv_content: str, field_types: Optional[Dict[str, str]] = None) -> Optional[ReportColumns]:
+    """
+    Разбирает TSV отчет Reports API целиком
+    :param tsv_content: текст отчета
+    :param field_types: дополнительные типы полей
+    :return: колонки отчета или None, если не найдена строка с названиями полей
+    """
+    parser = ReportTSVParser(field_types)
+    parser.feed_lines(tsv_content.splitlines())
+    return parser.close()
+
+
+def _header_fields(lines: Iterator[str]) -> Optional[List[str]]:
+    """Названия полей; первая строка без табуляции - заголовок отчета (имя отчета)"""
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            continue
+        if number == 1 and '\t' not in line:
+            continue
+        return line.split('\t')
+    return None
+
+
+def _parse_records(tsv_content: str, fields: List[str],
+                   collect_columns: bool) -> Tuple[List[Dict], Optional[ReportColumns]]:
+    """
+    Построчный разбор отчета в словари (без промежуточных колонок)
+    :param collect_columns: собирать ли в том же проходе колонки полей fields, которые есть в отчете
+    """
+    lines = iter(tsv_content.splitlines())
+    header = _header_fields(lines)
+    if header is None:
+        return [], None
+    positions = {name: index for index, name in enumerate(header)}
+    field_types = dict(FIELD_TYPES)
+    for name in header:
+        field_types.setdefault(name, STR)
+
+    # (поле, позиция в строке, преобразование, разбор некорректного значения, значение по умолчанию,
+    # собираемая колонка, строки с пропуском)
+    getters = []
+    for name in fields:
+        field_type = field_types.get(name, STR)
+        position = positions.get(name)
+        if position is None:
+            # поля нет в отчете - в строке остается значение по умолчанию
+            getters.append((name, None, None, None, _DEFAULTS[field_type], None, None))
+            continue
+        if field_type == STR:
+            converter, parse = str, None
+        elif field_type in (ID, INT):
+            converter, parse = int, _parse_int
+        else:
+            converter, parse = float, _parse_float
+        getters.append((name, position, converter, parse, _DEFAULTS[field_type], [], []))
+
+    records = []
+    total_rows_reported = None
+    field_count = len(header)
+    for line in lines:
+        values = line.rstrip('\r\n').split('\t')
+        if len(values) < field_count:
+            if values[0].startswith(TOTAL_ROWS_PREFIX):
+                total_rows_reported = _parse_int(values[0][len(TOTAL_ROWS_PREFIX):].strip())
+            continue
+        record = {}
+        for name, position, converter, parse, default, column, nulls in getters:
+            if position is None:
+                record[name] = default
+                continue
+            value = values[position]
+            try:
+                parsed = converter(value)
+            except ValueError:
+                parsed = parse(value) if value != MISSING_VALUE else None
+                if parsed is None:
+                    parsed = default
+                    nulls.append(len(records))
+            record[name] = parsed
+            if collect_columns:
+                column.append(parsed)
+        records.append(record)
+
+    if not collect_columns:
+        return records, None
+
+    getters = [getter for getter in getters if getter[1] is not None]
+    result = ReportColumns([getter[0] for getter in getters], field_types)
+    result.row_count = len(records)
+    result.total_rows_reported = total_rows_reported
+    for name, _, converter, _, _, column, nulls in getters:
+        if converter is str:
+            result.columns[name] = column
+            continue
+        for position in nulls:
+            column[position] = 0
+        result.columns[name].extend(array(result.columns[name].typecode, column))
+        mask = bytearray(len(column))
+        for position in nulls:
+            mask[position] = 1
+        result.nulls[name] = mask
+    return records, result
+
+
+def tsv_to_records(tsv_content: str, fields: List[str]) -> List[Dict]:
+    """Разбирает отчет построчно и возвращает строки со значениями указанных полей"""
+    return _parse_records(tsv_content, fields, collect_columns=False)[0]
+
+
+def tsv_records_and_columns(tsv_content: str, fields: List[str]) -> Tuple[List[Dict], Optional[ReportColumns]]:
+    """
+    Строки отчета со значениями указанных полей и колонки этих полей за один построчный проход
+    (для JSON-представления и колоночной статистики одного отчета)
+    :return: (строки, колонки или None, если не найдена строка с названиями полей)
+    """
+    return _parse_records(tsv_content, fields, collect_columns=True)
+
+
+def _benchmark(rows: int = 1_000_000, repeats: int = 3):
+    """
+    Сравнение с прежним построчным разбором (convert_ad_stats_tsv_to_json до перехода на парсер)
+    на синтетическом отчете AD_PERFORMANCE_REPORT из rows строк.
+    Для каждого способа печатается лучшее время из repeats запусков со сборщиком мусора,
+    отключенным на время замера (как в timeit): иначе разброс из-за сборки мусора
+    на миллионе словарей больше, чем разница между способами
+    """
+    import gc
+    import random
+    import time
+
+    fields = ['CampaignId', 'AdId', 'Impressions', 'Clicks', 'Ctr', 'BounceRate', 'Cost', 'AvgCpc']
+    random.seed(0)
+    lines = ['"AD_PERFORMANCE_REPORT"', '\t'.join(fields)]
+    for i in range(rows):
+        clicks = random.randint(0, 50)
+        lines.append('\t'.join((
+            str(1000 + i % 200), str(100000 + i), str(random.randint(0, 5000)), str(clicks),
+            f"{random.random() * 10:.2f}", f"{random.random() * 100:.2f}" if clicks else MISSING_VALUE,
+            f"{random.random() * 1000:.2f}", f"{random.random() * 50:.2f}" if clicks else MISSING_VALUE
+        )))
+    lines.append(f"{TOTAL_ROWS_PREFIX} {rows}")
+    tsv_content = '\n'.join(lines)
+    del lines
+
+    def is_numeric(value: str) -> bool:
+        if not value or value == MISSING_VALUE:
+            return False
+        try:
+            float(value)
+            return True
+        except ValueError:
+            return False
+
+    def legacy_parse(content: str) -> List[Dict]:
+        data_lines = content.strip().split('\n')[2:]
+        if data_lines and data_lines[-1].startswith(TOTAL_ROWS_PREFIX):
+            data_lines = data_lines[:-1]
+        data_lines = [line.strip() for line in data_lines if line.strip()]
+        records = []
+        for line in data_lines:
+            values = line.split('\t')
+            if len(values) >= 8:
+                records.append({
+                    "CampaignId": int(values[0]) if values[0].isdigit() else None,
+                    "AdId": int(values[1]) if values[1].isdigit() else None,
+                    "Impressions": int(values[2]) if values[2].isdigit() else 0,
+                    "Clicks": int(values[3]) if values[3].isdigit() else 0,
+                    "Ctr": float(values[4]) if is_numeric(values[4]) else 0.0,
+                    "BounceRate": float(values[5]) if is_numeric(values[5]) else 0.0,
+                    "Cost": float(values[6]) if is_numeric(values[6]) else 0.0,
+                    "AvgCpc": float(values[7]) if is_numeric(values[7]) else 0.0
+                })
+        return records
+
+    methods = [
+        ('Построчный разбор (прежний)', legacy_parse),
+        ('tsv_to_records', lambda content: tsv_to_records(content, fields)),
+        ('tsv_records_and_columns', lambda content: tsv_records_and_columns(content, fields)),
+        ('parse_report_tsv (только колонки)', parse_report_tsv),
+        ('parse_report_tsv + to_records', lambda content: parse_report_tsv(content).to_records(fields)),
+    ]
+    expected = legacy_parse(tsv_content)
+    timings = {}
+    for name, method in methods:
+        best = None
+        for _ in range(repeats):
+            gc.collect()
+            gc.disable()
+            try:
+                started = time.perf_counter()
+                result = method(tsv_content)
+                elapsed = time.perf_counter() - started
+            finally:
+                gc.enable()
+            records = result[0] if isinstance(result, tuple) else result
+            if isinstance(records, list) and records != expected:
+                print(f"❌ {name}: записи не совпадают с прежним разбором")
+            del result, records
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+
+    baseline = timings['Построчный разбор (прежний)']
+    print(f"Отчет из {rows} строк, лучшее из {repeats} запусков:")
+    for name, elapsed in timings.items():
+        print(f"   {elapsed:6.2f} сек  {baseline / elapsed:4.2f}x  {name}")
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -755,6 +755,101 @@ create index idx_projects_is_deleted
 create index idx_projects_create_entry
     on projects (create_entry);
 
+create table dailystats
+(
+    client_login    varchar(255)     not null,
+    campaign_id     bigint           not null,
+    adgroup_id      bigint           not null,
+    ad_id           bigint           not null,
+    ad_network_type varchar(32)      not null,
+    stat_date       date             not null,
+    campaign_name   text,
+    campaign_type   varchar(64),
+    adgroup_name    text,
+    impressions     bigint           default 0,
+    clicks          bigint           default 0,
+    cost            double precision default 0,
+    sessions        bigint           default 0,
+    bounces         bigint           default 0,
+    primary key (client_login, campaign_id, adgroup_id, ad_id, ad_network_type, stat_date)
+);
+
+comment on table dailystats is 'Дневная статистика объявлений Яндекс.Директ (хранилище для инкрементальной загрузки)';
+
+comment on column dailystats.client_login is 'Логин клиента Яндекс.Директ';
+
+comment on column dailystats.ad_network_type is 'Тип площадки (SEARCH / AD_NETWORK)';
+
+comment on column dailystats.stat_date is 'Дата статистики';
+
+comment on column dailystats.sessions is 'Количество визитов (для расчета отказов)';
+
+comment on column dailystats.bounces is 'Количество отказов';
+
+alter table dailystats
+    owner to svitekas;
+
+create index idx_dailystats_client_date
+    on dailystats (client_login, stat_date);
+
+create table dailystatscoverage
+(
+    client_login varchar(255) not null,
+    campaign_id  bigint       not null,
+    stat_date    date         not null,
+    loaded_at    timestamp default CURRENT_TIMESTAMP,
+    primary key (client_login, campaign_id, stat_date)
+);
+
+comment on table dailystatscoverage is 'Дни, за которые статистика кампании загружена в dailystats';
+
+comment on column dailystatscoverage.loaded_at is 'Дата и время загрузки (по ней определяется, окончательна ли статистика за день)';
+
+alter table dailystatscoverage
+    owner to svitekas;
+
+create table reporttasks
+(
+    id          serial
+        primary key,
+    id_reports  integer                                not null
+        constraint fk_reporttasks_reports
+            references reports,
+    stage       varchar(32)                            not null,
+    status      varchar(16) default 'queued'           not null,
+    payload     jsonb                                  not null,
+    attempts    integer     default 0                  not null,
+    worker      varchar(255),
+    error       text,
+    created_at  timestamp   default CURRENT_TIMESTAMP,
+    started_at  timestamp,
+    heartbeat_at timestamp,
+    finished_at timestamp
+);
+
+comment on table reporttasks is 'Очередь этапов обработки отчетов (api-fetch / browser-capture / doc-render)';
+
+comment on column reporttasks.stage is 'Этап обработки';
+
+comment on column reporttasks.status is 'Статус задачи (queued / running / done / failed)';
+
+comment on column reporttasks.payload is 'Строка отчета, передаваемая этапу';
+
+comment on column reporttasks.worker is 'Процесс, выполняющий задачу (hostname:pid)';
+
+comment on column reporttasks.attempts is 'Количество запусков задачи (не более TASK_MAX_ATTEMPTS)';
+
+comment on column reporttasks.heartbeat_at is 'Последнее продление аренды задачи выполняющим процессом';
+
+alter table reporttasks
+    owner to svitekas;
+
+create index idx_reporttasks_stage_status
+    on reporttasks (stage, status, id);
+
+create index idx_reporttasks_reports
+    on reporttasks (id_reports);
+
 create function update_yandex_direct_accounts_timestamp() returns trigger
     language plpgsql
 as
@@ -791,3 +886,23 @@ create trigger update_wordstat_api_accounts_timestamp
     for each row
 execute procedure update_wordstat_api_accounts_timestamp();
 
+
+create function notify_report_queued() returns trigger
+    language plpgsql
+as
+$$
+BEGIN
+    IF NEW.id_status = 1 AND (TG_OP = 'INSERT' OR OLD.id_status IS DISTINCT FROM NEW.id_status) THEN
+        PERFORM pg_notify('reports_queued', NEW.id::text);
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+alter function notify_report_queued() owner to svitekas;
+
+create trigger notify_report_queued
+    after insert or update of id_status
+    on reports
+    for each row
+execute procedure notify_report_queued();
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Колоночное хранилище статистики отчетов (кампании, группы, объявления)
+Статистика хранится в типизированных массивах (модуль array), рядом с JSON-файлом в MinIO
+сохраняется бинарное колоночное представление (*.cols). Агрегации (итоги,
+топ по кликам с фильтром по отказам) выполняются по колонкам без построчных словарей
+"""
+
+import heapq
+import json
+import shutil
+import struct
+import tempfile
+from array import array
+from itertools import compress
+from typing import Dict, Iterable, List, Optional, Union
+
+from artifact_codec import columns_metadata, decode_bytes, new_compressor
+from report_tsv_parser import ReportColumns, FIELD_TYPES, ID, INT, FLOAT, STR
+
+# Сигнатура и версия бинарного формата
+STATS_MAGIC = b'STC1'
+STATS_EXTENSION = 'cols'
+
+# Суммируемые поля статистики
+SUM_FIELDS = ['Impressions', 'Clicks', 'Cost', 'Conversions']
+
+_TYPECODES = {ID: 'q', INT: 'q', FLOAT: 'd'}
+_DEFAULTS = {ID: None, INT: 0, FLOAT: 0.0, STR: ''}
+
+
+def stats_table_filename(json_filename: str) -> str:
+    """Имя файла колоночного представления для JSON-файла статистики"""
+    base = json_filename[:-len('.json')] if json_filename.endswith('.json') else json_filename
+    return f"{base}.{STATS_EXTENSION}"
+
+
+def derive_metrics(values: Dict) -> Dict:
+    """
+    Пересчитывает производные метрики по суммам:
+    Ctr = Clicks / Impressions * 100, AvgCpc = Cost / Clicks
+    """
+    impressions = values.get('Impressions', 0)
+    clicks = values.get('Clicks', 0)
+    if 'Impressions' in values and 'Clicks' in values:
+        values['Ctr'] = round(clicks / impressions * 100, 2) if impressions else 0.0
+    if 'Cost' in values and 'Clicks' in values:
+        values['AvgCpc'] = round(values['Cost'] / clicks, 2) if clicks else 0.0
+    return values
+
+
+class StatsTable:
+    """Таблица статистики в колоночном виде"""
+
+    def __init__(self, field_names: List[str], field_types: Dict[str, str],
+                 columns: Dict[str, Union[array, List[str]]], row_count: int,
+                 nulls: Optional[Dict[str, bytearray]] = None):
+        self.field_names = field_names
+        self.field_types = field_types
+        self.columns = columns
+        self.row_count = row_count
+        # Маски отсутствующих значений (только для колонок, где они есть)
+        self.nulls = nulls or {}
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    # ---------- Построение ----------
+
+    @classmethod
+    def from_report_columns(cls, report: ReportColumns, fields: Optional[List[str]] = None) -> 'StatsTable':
+        """Таблица из результата разбора TSV отчета (колонки используются без копирования)"""
+        fields = [name for name in (fields or report.field_names) if name in report.columns]
+        field_types = {name: report.field_types[name] for name in fields}
+        nulls = {name: report.nulls[name] for name in fields
+                 if name in report.nulls and any(report.nulls[name])}
+        return cls(fields, field_types, {name: report.columns[name] for name in fields}, report.row_count, nulls)
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict], fields: Optional[List[str]] = None) -> 'StatsTable':
+        """Таблица из списка строк JSON-представления (result.rows)"""
+        if fields is None:
+            fields = list(rows[0].keys()) if rows else []
+        field_types = {name: FIELD_TYPES.get(name, STR) for name in fields}
+        columns = {}
+        nulls = {}
+        for name in fields:
+            field_type = field_types[name]
+            values = [row.get(name) for row in rows]
+            if field_type == STR:
+                columns[name] = ['' if value is None else str(value) for value in values]
+                continue
+            mask = bytearray(value is None for value in values)
+            converter = int if field_type in (ID, INT) else float
+            columns[name] = array(_TYPECODES[field_type], (0 if value is None else converter(value) for value in values))
+            if any(mask):
+                nulls[name] = mask
+        return cls(list(fields), field_types, columns, len(rows), nulls)
+
+    # ---------- Доступ к данным ----------
+
+    def column(self, name: str):
+        """Колонка по имени поля (None, если поля нет)"""
+        return self.columns.get(name)
+
+    def value(self, name: str, index: int):
+        """Значение поля в строке с учетом отсутствующих значений"""
+        field_type = self.field_types.get(name, FIELD_TYPES.get(name, STR))
+        column = self.columns.get(name)
+        if column is None:
+            return _DEFAULTS[field_type]
+        mask = self.nulls.get(name)
+        if mask is not None and mask[index]:
+            return _DEFAULTS[field_type]
+        return column[index]
+
+    def record(self, index: int, fields: Optional[List[str]] = None) -> Dict:
+        """Строка таблицы в виде словаря"""
+        return {name: self.value(name, index) for name in (fields or self.field_names)}
+
+    def records(self, indices: Optional[Iterable[int]] = None, fields: Optional[List[str]] = None) -> List[Dict]:
+        """Строки таблицы по индексам (по умолчанию все) в виде словарей"""
+        if indices is None:
+            indices = range(self.row_count)
+        return [self.record(index, fields) for index in indices]
+
+    # ---------- Агрегации ----------
+
+    def totals(self, fields: Optional[List[str]] = None) -> Dict:
+        """Суммы по полям и пересчитанные Ctr / AvgCpc"""
+        fields = fields or [name for name in SUM_FIELDS if name in self.columns]
+        result = {name: sum(self.columns[name]) if name in self.columns else 0 for name in fields}
+        return derive_metrics(result)
+
+    def indices_where(self, field: str, max_value: float, inclusive: bool = True,
+                      indices: Optional[List[int]] = None) -> List[int]:
+        """
+        Индексы строк, где значение поля не превышает порог (отсутствующее значение считается нулем)
+        :param inclusive: True - value <= max_value, False - value < max_value
+        """
+        column = self.columns.get(field)
+        if indices is None:
+            indices = range(self.row_count)
+        if column is None:
+            return list(indices)
+        if inclusive:
+            mask = [value <= max_value for value in column]
+        else:
+            mask = [value < max_value for value in column]
+        if isinstance(indices, range) and len(indices) == self.row_count:
+            return list(compress(indices, mask))
+        return [index for index in indices if mask[index]]
+
+    def top_k(self, k: int, by: str = 'Clicks', indices: Optional[Iterable[int]] = None) -> List[int]:
+        """
+        Индексы k строк с наибольшим значением поля (по убыванию, при равенстве - в исходном порядке)
+        """
+        column = self.columns.get(by)
+        if indices is None:
+            indices = range(self.row_count)
+        if column is None:
+            return list(indices)[:k]
+        return heapq.nlargest(k, indices, key=column.__getitem__)
+
+    def argmax(self, by: str = 'Clicks') -> Optional[int]:
+        """Индекс строки с наибольшим значением поля (первой при равенстве)"""
+        top = self.top_k(1, by)
+        return top[0] if top else None
+
+    # ---------- Сериализация ----------
+
+    def to_bytes(self) -> bytes:
+        """
+        Бинарное представление: сигнатура, длина и JSON-заголовок, затем блоки колонок.
+        Числовые колонки пишутся как массивы, строковые - как JSON-список
+        """
+        blocks = []
+        header_fields = []
+        for name in self.field_names:
+            field_type = self.field_types[name]
+            column = self.columns[name]
+            if field_type == STR:
+                block = json.dumps(column, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            else:
+                block = column.tobytes()
+            entry = {'name': name, 'type': field_type, 'size': len(block)}
+            blocks.append(block)
+            mask = self.nulls.get(name)
+            if mask is not None:
+                entry['nulls'] = len(mask)
+                blocks.append(bytes(mask))
+            header_fields.append(entry)
+
+        header = json.dumps({'row_count': self.row_count, 'fields': header_fields},
+                            ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return b''.join([STATS_MAGIC, struct.pack('<I', len(header)), header] + blocks)
+
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> 'StatsTable':
+        """Восстанавливает таблицу из бинарного представления (в том числе сжатого)"""
+        raw = decode_bytes(raw)
+        if raw[:4] != STATS_MAGIC:
+            raise ValueError("Неизвестный формат колоночной статистики")
+        header_length = struct.unpack_from('<I', raw, 4)[0]
+        offset = 8 + header_length
+        header = json.loads(raw[8:offset])
+
+        field_names = []
+        field_types = {}
+        columns = {}
+        nulls = {}
+        view = memoryview(raw)
+        for entry in header['fields']:
+            name = entry['name']
+            field_type = entry['type']
+            block = view[offset:offset + entry['size']]
+            offset += entry['size']
+            if field_type == STR:
+                columns[name] = json.loads(bytes(block))
+            else:
+                column = array(_TYPECODES[field_type])
+                column.frombytes(block)
+                columns[name] = column
+            if 'nulls' in entry:
+                nulls[name] = bytearray(view[offset:offset + entry['nulls']])
+                offset += entry['nulls']
+            field_names.append(name)
+            field_types[name] = field_type
+
+        return cls(field_names, field_types, columns, header['row_count'], nulls)
+
+    def encode(self):
+        """Байты для сохранения в MinIO и метаданные объекта (сжатие по ARTIFACT_CODEC)"""
+        raw = self.to_bytes()
+        compressor = new_compressor()
+        if compressor is None:
+            return raw, columns_metadata(False)
+        return compressor.compress(raw) + compressor.flush(), columns_metadata(True)
+
+
+class StatsTableWriter:
+    """
+    Потоковая запись колоночного представления (формат StatsTable.to_bytes) по пачкам колонок.
+    Блоки колонок и маски пропусков дописываются во временные файлы (по файлу на колонку),
+    заголовок с размерами блоков пишется в finish(); в памяти хранится только текущая пачка
+    """
+
+    def __init__(self, fields: Optional[List[str]] = None):
+        self.fields = fields
+        self.field_names: Optional[List[str]] = None
+        self.field_types: Dict[str, str] = {}
+        self.row_count = 0
+        self._blocks = {}
+        self._masks = {}
+        self._with_nulls = set()
+
+    def write(self, report: ReportColumns):
+        """Дописывает пачку колонок (пачка без строк только задает состав полей)"""
+        if self.field_names is None:
+            self.field_names = [name for name in (self.fields or report.field_names) if name in report.columns]
+            for name in self.field_names:
+                self.field_types[name] = report.field_types[name]
+                self._blocks[name] = tempfile.TemporaryFile()
+                if report.field_types[name] != STR:
+                    self._masks[name] = tempfile.TemporaryFile()
+
+        for name in self.field_names:
+            column = report.columns[name]
+            block = self._blocks[name]
+            if self.field_types[name] == STR:
+                if column:
+                    # Элементы JSON-списка без скобок, скобки дописываются в finish()
+                    if block.tell():
+                        block.write(b',')
+                    block.write(json.dumps(column, ensure_ascii=False, separators=(',', ':')).encode('utf-8')[1:-1])
+                continue
+            column.tofile(block)
+            mask = report.nulls[name]
+            self._masks[name].write(mask)
+            if mask.find(1) >= 0:
+                self._with_nulls.add(name)
+        self.row_count += report.row_count
+
+    def finish(self, out):
+        """Пишет колоночное представление в out (объект с методом write)"""
+        blocks = []
+        header_fields = []
+        for name in self.field_names or []:
+            field_type = self.field_types[name]
+            block = self._blocks[name]
+            size = block.tell() + (2 if field_type == STR else 0)
+            entry = {'name': name, 'type': field_type, 'size': size}
+            blocks.append((block, field_type == STR))
+            if name in self._with_nulls:
+                entry['nulls'] = self.row_count
+                blocks.append((self._masks[name], False))
+            header_fields.append(entry)
+
+        header = json.dumps({'row_count': self.row_count, 'fields': header_fields},
+                            ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        out.write(STATS_MAGIC + struct.pack('<I', len(header)) + header)
+        for block, is_list in blocks:
+            block.seek(0)
+            if is_list:
+                out.write(b'[')
+            shutil.copyfileobj(block, out, 1024 * 1024)
+            if is_list:
+                out.write(b']')
+
+    def close(self):
+        """Удаляет временные файлы"""
+        for block in list(self._blocks.values()) + list(self._masks.values()):
+            block.close()
+        self._blocks = {}
+        self._masks = {}
+
+
+def load_stats_table(minio_client, bucket_name: str, object_name: str) -> Optional[StatsTable]:
+    """
+    Загружает колоночную статистику из MinIO
+    :return: таблица или None, если объекта нет или он поврежден
+    """
+    response = None
+    try:
+        response = minio_client.get_object(bucket_name, object_name)
+        return StatsTable.from_bytes(response.read())
+    except Exception:
+        return None
+    finally:
+        if response:
+            response.close()
+            response.release_conn()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилище дневной статистики Яндекс.Директ
+Статистика хранится в БД с ключом (логин клиента, кампания, группа, объявление, тип площадки, дата).
+При формировании отчета из API запрашиваются только отсутствующие дни и последние дни,
+данные за которые еще могут уточняться; статистика за период собирается из хранилища
+в тех же форматах, что и отчеты Reports API
+"""
+
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+from report_tsv_parser import ReportTSVParser, MISSING_VALUE
+from report_sharding import run_sharded_report
+
+load_dotenv('.env')
+
+# Количество дней, в течение которых статистика за день считается неокончательной
+STATS_SETTLE_DAYS = int(os.getenv('STATS_SETTLE_DAYS', '3'))
+
+SCHEMA = 'gen_report_context_contracts'
+
+# Поля отчетов, собираемых из хранилища (совпадают с FieldNames соответствующих отчетов API)
+CAMPAIGN_REPORT_FIELDS = ["CampaignId", "CampaignName", "Impressions", "Clicks", "Ctr", "BounceRate", "Cost", "AvgCpc"]
+SUMMARY_REPORT_FIELDS = ["Impressions", "Clicks", "Ctr", "BounceRate", "Cost", "AvgCpc"]
+AD_REPORT_FIELDS = ["CampaignId", "AdId", "Impressions", "Clicks", "Ctr", "BounceRate", "Cost", "AvgCpc"]
+ADGROUP_REPORT_FIELDS = ["CampaignId", "AdGroupId", "AdGroupName", "CampaignType", "AdNetworkType",
+                         "Impressions", "Clicks", "Ctr", "BounceRate", "Cost", "AvgCpc"]
+
+# Агрегаты по аддитивным показателям; производные метрики пересчитываются по суммам
+_METRICS_SQL = """
+    SUM(impressions), SUM(clicks), SUM(cost), SUM(sessions), SUM(bounces)
+"""
+
+# Отчеты: (измерения в SELECT, поля GROUP BY, поля отчета, тип отчета для заголовка)
+_REPORTS = {
+    'campaign': (
+        "campaign_id, (ARRAY_AGG(campaign_name ORDER BY stat_date DESC))[1]",
+        "campaign_id",
+        CAMPAIGN_REPORT_FIELDS,
+        "CAMPAIGN_PERFORMANCE_REPORT"
+    ),
+    'summary': (
+        None,
+        None,
+        SUMMARY_REPORT_FIELDS,
+        "CUSTOM_REPORT"
+    ),
+    'ad': (
+        "campaign_id, ad_id",
+        "campaign_id, ad_id",
+        AD_REPORT_FIELDS,
+        "AD_PERFORMANCE_REPORT"
+    ),
+    'adgroup': (
+        "campaign_id, adgroup_id, (ARRAY_AGG(adgroup_name ORDER BY stat_date DESC))[1], "
+        "(ARRAY_AGG(campaign_type ORDER BY stat_date DESC))[1], ad_network_type",
+        "campaign_id, adgroup_id, ad_network_type",
+        ADGROUP_REPORT_FIELDS,
+        "ADGROUP_PERFORMANCE_REPORT"
+    ),
+}
+
+
+def _to_date(value) -> date:
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _date_ranges(days: List[date]) -> List[Tuple[date, date]]:
+    """Разбивает отсортированный список дней на непрерывные диапазоны"""
+    ranges = []
+    for day in days:
+        if ranges and day - ranges[-1][1] == timedelta(days=1):
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
+def _format_value(value) -> str:
+    """Значение ячейки TSV (отсутствующее значение - как в Reports API)"""
+    if value is None:
+        return MISSING_VALUE
+    return str(value)
+
+
+def _metrics(impressions, clicks, cost, sessions, bounces) -> Dict:
+    """Показатели строки отчета по суммам аддитивных полей"""
+    impressions = int(impressions or 0)
+    clicks = int(clicks or 0)
+    cost = float(cost or 0)
+    sessions = int(sessions or 0)
+    bounces = int(bounces or 0)
+    return {
+        'Impressions': impressions,
+        'Clicks': clicks,
+        'Ctr': round(clicks / impressions * 100, 2) if impressions else None,
+        'BounceRate': round(bounces / sessions * 100, 2) if sessions else None,
+        'Cost': round(cost, 2),
+        'AvgCpc': round(cost / clicks, 2) if clicks else None,
+    }
+
+
+class StatsWarehouse:
+    """Хранилище дневной статистики в БД"""
+
+    def __init__(self, connection, settle_days: int = STATS_SETTLE_DAYS):
+        """
+        :param connection: соединение psycopg2 (DatabaseManager.connection)
+        :param settle_days: сколько последних дней статистики запрашивать повторно
+        """
+        self.connection = connection
+        self.settle_days = settle_days
+
+    # ---------- Загрузка из API ----------
+
+    def missing_days(self, client_login: str, campaign_ids: List[int], start_date, end_date) -> Dict[date, Set[int]]:
+        """
+        Дни периода, статистику за которые нужно запросить из API
+        :return: словарь день -> кампании, для которых день отсутствует или еще уточняется
+        """
+        start_date, end_date = _to_date(start_date), _to_date(end_date)
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(f"""
+                SELECT campaign_id, stat_date
+                FROM {SCHEMA}.dailystatscoverage
+                WHERE client_login = %s
+                  AND campaign_id = ANY(%s)
+                  AND stat_date BETWEEN %s AND %s
+                  AND loaded_at::date - stat_date >= %s
+            """, (client_login, list(campaign_ids), start_date, end_date, self.settle_days))
+            settled = set(cursor.fetchall())
+        finally:
+            cursor.close()
+
+        missing = {}
+        day = start_date
+        while day <= end_date:
+            campaigns = {campaign_id for campaign_id in campaign_ids if (campaign_id, day) not in settled}
+            if campaigns:
+                missing[day] = campaigns
+            day += timedelta(days=1)
+        return missing
+
+    def sync(self, api_client, client_login: str, campaign_ids: List[int], start_date, end_date) -> bool:
+        """
+        Дозагружает в хранилище недостающие дни периода
+        :param api_client: DirectAPIClient текущего клиента
+        :return: True, если все дни периода есть в хранилище
+        """
+        try:
+            missing = self.missing_days(client_login, campaign_ids, start_date, end_date)
+            total_days = (_to_date(end_date) - _to_date(start_date)).days + 1
+            if not missing:
+                print(f"📦 Вся статистика за период уже в хранилище ({total_days} дн.)")
+                return True
+
+            ranges = _date_ranges(sorted(missing))
+            print(f"📦 Статистика в хранилище: {total_days - len(missing)} из {total_days} дн., "
+                  f"запрашиваем из API диапазонов: {len(ranges)}")
+
+            for date_from, date_to in ranges:
+                campaigns = set()
+                day = date_from
+                while day <= date_to:
+                    campaigns |= missing[day]
+                    day += timedelta(days=1)
+
+                parser = ReportTSVParser()
+                result = run_sharded_report(
+                    api_client, 'create_daily_stats_report', sorted(campaigns),
+                    date_from.strftime("%Y-%m-%d"), date_to.strftime("%Y-%m-%d"), sink=parser, split_dates=True
+                )
+                if not result:
+                    print(f"❌ Не удалось получить дневную статистику за {date_from} - {date_to}")
+                    return False
+
+                self._replace_period(client_login, sorted(campaigns), date_from, date_to, parser.close())
+
+            return True
+
+        except Exception as e:
+            self.connection.rollback()
+            print(f"❌ Ошибка загрузки статистики в хранилище: {e}")
+            return False
+
+    def _replace_period(self, client_login: str, campaign_ids: List[int], date_from: date, date_to: date, columns):
+        """Заменяет статистику кампаний за период данными отчета и отмечает дни как загруженные"""
+        rows = []
+        if columns is not None:
+            for record in columns.iter_records():
+                rows.append((
+                    client_login,
+                    record['CampaignId'],
+                    record['AdGroupId'] or 0,
+                    record['AdId'] or 0,
+                    record['AdNetworkType'],
+                    record['Date'],
+                    record['CampaignName'],
+                    record['CampaignType'],
+                    record['AdGroupName'],
+                    record['Impressions'],
+                    record['Clicks'],
+                    record['Cost'],
+                    record['Sessions'],
+                    record['Bounces'],
+                ))
+
+        coverage = []
+        day = date_from
+        while day <= date_to:
+            coverage.extend((client_login, campaign_id, day) for campaign_id in campaign_ids)
+            day += timedelta(days=1)
+
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(f"""
+                DELETE FROM {SCHEMA}.dailystats
+                WHERE client_login = %s AND campaign_id = ANY(%s) AND stat_date BETWEEN %s AND %s
+            """, (client_login, campaign_ids, date_from, date_to))
+            if rows:
+                execute_values(cursor, f"""
+                    INSERT INTO {SCHEMA}.dailystats
+                        (client_login, campaign_id, adgroup_id, ad_id, ad_network_type, stat_date,
+                         campaign_name, campaign_type, adgroup_name, impressions, clicks, cost, sessions, bounces)
+                    VALUES %s
+                """, rows, page_size=5000)
+            execute_values(cursor, f"""
+                INSERT INTO {SCHEMA}.dailystatscoverage (client_login, campaign_id, stat_date)
+                VALUES %s
+                ON CONFLICT (client_login, campaign_id, stat_date)
+                DO UPDATE SET loaded_at = CURRENT_TIMESTAMP
+            """, coverage, page_size=5000)
+            self.connection.commit()
+            print(f"💾 В хранилище записано строк: {len(rows)} ({date_from} - {date_to})")
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    # ---------- Сборка отчетов ----------
+
+    def build_report(self, kind: str, client_login: str, campaign_ids: List[int], start_date, end_date,
+                     deleted_group_ids: Optional[List[int]] = None) -> Optional[Dict]:
+        """
+        Собирает отчет за период из хранилища в формате ответа DirectAPIClient (TSV в поле report)
+        :param kind: campaign / summary / ad / adgroup
+        :param deleted_group_ids: группы, исключаемые из статистики
+        """
+        select_dims, group_by, fields, report_type = _REPORTS[kind]
+        select = f"{select_dims}, {_METRICS_SQL}" if select_dims else _METRICS_SQL
+        query = f"""
+            SELECT {select}
+            FROM {SCHEMA}.dailystats
+            WHERE client_login = %s
+              AND campaign_id = ANY(%s)
+              AND stat_date BETWEEN %s AND %s
+              AND NOT (adgroup_id = ANY(%s))
+        """
+        if group_by:
+            query += f" GROUP BY {group_by} ORDER BY {group_by}"
+
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(query, (client_login, list(campaign_ids), _to_date(start_date), _to_date(end_date),
+                                   list(deleted_group_ids or [])))
+            db_rows = cursor.fetchall()
+        except Exception as e:
+            self.connection.rollback()
+            print(f"❌ Ошибка чтения статистики из хранилища: {e}")
+            return None
+        finally:
+            cursor.close()
+
+        dimension_fields = fields[:len(fields) - len(SUMMARY_REPORT_FIELDS)]
+        lines = [f"{report_type} (stats warehouse)", "\t".join(fields)]
+        for db_row in db_rows:
+            dims = db_row[:len(dimension_fields)]
+            metrics = _metrics(*db_row[len(dimension_fields):])
+            values = dict(zip(dimension_fields, dims))
+            values.update(metrics)
+            lines.append("\t".join(_format_value(values[name]) for name in fields))
+        lines.append(f"Total rows: {len(db_rows)}")
+
+        return {
+            'report': "\n".join(lines) + "\n",
+            'status': 'completed',
+            '_meta': {
+                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                'source': 'stats_warehouse',
+                'format': 'TSV',
+                'type': f'{kind}_performance'
+            }
+        }
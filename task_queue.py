@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Очередь этапов обработки отчетов в PostgreSQL (таблица reporttasks)
+Обработка отчета делится на этапы, которые выполняют процессы разных типов
+(WORKER_TYPE в main_processor) и масштабируются независимо:
+    api-fetch       - данные Директа и Wordstat, статистика, индекс отчета, URL (шаги 1-11)
+    browser-capture - скриншоты отчетов и объявлений в Chrome (шаги 12-13)
+    doc-render      - формирование файлов-отчетов (шаг 14)
+Процесс забирает задачу своего этапа через SELECT ... FOR UPDATE SKIP LOCKED, поэтому
+несколько процессов одного типа не получают одну и ту же задачу. После успешного этапа
+в той же транзакции ставится задача следующего этапа, и pg_notify будит процессы,
+ожидающие на канале этого этапа (см. report_listener). Пока этап выполняется, процесс
+продлевает аренду задачи (heartbeat_at, см. TaskHeartbeat); задачи процессов, завершившихся
+аварийно, возвращаются в очередь, когда аренда не продлевалась TASK_LEASE_TIMEOUT секунд,
+а после TASK_MAX_ATTEMPTS попыток задача считается ошибочной
+"""
+
+import json
+import os
+import socket
+import threading
+from typing import Dict, List, Optional
+
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from dotenv import load_dotenv
+
+load_dotenv('.env')
+
+STAGE_API_FETCH = 'api-fetch'
+STAGE_BROWSER_CAPTURE = 'browser-capture'
+STAGE_DOC_RENDER = 'doc-render'
+
+# Этапы в порядке выполнения
+STAGES = (STAGE_API_FETCH, STAGE_BROWSER_CAPTURE, STAGE_DOC_RENDER)
+
+# Время без продления аренды, после которого задача в статусе running считается брошенной, сек
+TASK_LEASE_TIMEOUT = int(os.getenv('TASK_LEASE_TIMEOUT', '600'))
+# Интервал продления аренды выполняемой задачи, сек (должен быть заметно меньше TASK_LEASE_TIMEOUT)
+TASK_HEARTBEAT_INTERVAL = float(os.getenv('TASK_HEARTBEAT_INTERVAL', '60'))
+# Максимум попыток задачи: брошенная задача с исчерпанными попытками не возвращается в очередь
+TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', '3'))
+
+TASKS_TABLE = 'gen_report_context_contracts.reporttasks'
+REPORTS_TABLE = 'gen_report_context_contracts.reports'
+
+
+def stage_channel(stage: str) -> str:
+    """Канал уведомлений о новых задачах этапа"""
+    return f"report_tasks_{stage.replace('-', '_')}"
+
+
+def next_stage(stage: str) -> Optional[str]:
+    index = STAGES.index(stage)
+    return STAGES[index + 1] if index + 1 < len(STAGES) else None
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TaskQueue:
+    """Операции с очередью этапов; каждая операция - отдельная транзакция на соединении connection"""
+
+    def __init__(self, connection, worker_id: Optional[str] = None):
+        """
+        :param connection: соединение psycopg2 (не в режиме autocommit)
+        :param worker_id: идентификатор процесса в задачах (по умолчанию hostname:pid)
+        """
+        self.connection = connection
+        self.worker_id = worker_id or default_worker_id()
+
+    def _execute(self, query: str, params=None, fetch: bool = False) -> List[tuple]:
+        with self.connection.cursor() as cursor:
+            try:
+                cursor.execute(query, params)
+                rows = cursor.fetchall() if fetch else []
+                self.connection.commit()
+                return rows
+            except Exception:
+                self.connection.rollback()
+                raise
+
+    def _insert_task_sql(self) -> str:
+        return f"""
+            INSERT INTO {TASKS_TABLE} (id_reports, stage, payload)
+            VALUES (%(report_id)s, %(stage)s, %(payload)s);
+            SELECT pg_notify(%(channel)s, %(report_id)s::text);
+        """
+
+    def _task_params(self, report: Dict, stage: str) -> Dict:
+        return {
+            'report_id': report['id'],
+            'stage': stage,
+            'payload': json.dumps(report, ensure_ascii=False, default=str),
+            'channel': stage_channel(stage)
+        }
+
+    def enqueue(self, report: Dict, stage: str = STAGE_API_FETCH) -> bool:
+        """Ставит этап отчета в очередь (report - строка отчета, передается этапу как есть)"""
+        try:
+            self._execute(self._insert_task_sql(), self._task_params(report, stage))
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка постановки этапа {stage} отчета {report.get('id')} в очередь: {e}")
+            return False
+
+    def enqueue_new_reports(self) -> List[int]:
+        """
+        Ставит в очередь первый этап отчетов в статусе 1 без незавершенных задач
+        (отчеты блокируются, так что несколько процессов api-fetch не поставят отчет дважды)
+        :return: id поставленных отчетов
+        """
+        query = f"""
+            SELECT r.id, r.id_requests, r.id_contracts, r.message
+            FROM {REPORTS_TABLE} r
+            WHERE r.id_status = 1
+            AND (r.is_deleted IS NULL OR r.is_deleted = false)
+            AND NOT EXISTS (
+                SELECT 1 FROM {TASKS_TABLE} t
+                WHERE t.id_reports = r.id AND t.status IN ('queued', 'running')
+            )
+            ORDER BY r.id
+            FOR UPDATE OF r SKIP LOCKED
+        """
+        try:
+            with self.connection.cursor() as cursor:
+                try:
+                    cursor.execute(query)
+                    reports = [
+                        {'id': row[0], 'id_requests': row[1], 'id_contracts': row[2], 'message': row[3]}
+                        for row in cursor.fetchall()
+                    ]
+                    for report in reports:
+                        cursor.execute(self._insert_task_sql(), self._task_params(report, STAGE_API_FETCH))
+                    self.connection.commit()
+                except Exception:
+                    self.connection.rollback()
+                    raise
+            if reports:
+                print(f"📥 Поставлено в очередь отчетов: {len(reports)}")
+            return [report['id'] for report in reports]
+        except Exception as e:
+            print(f"❌ Ошибка постановки новых отчетов в очередь: {e}")
+            return []
+
+    def claim(self, stage: str) -> Optional[Dict]:
+        """
+        Забирает следующую задачу этапа. Брошенные задачи (аренда не продлевалась TASK_LEASE_TIMEOUT)
+        предварительно возвращаются в очередь, а с исчерпанными попытками - отмечаются ошибочными
+        вместе с отчетом (статус 4)
+        :return: {'id', 'report', 'attempts'} или None, если задач нет
+        """
+        requeue = f"""
+            WITH expired AS (
+                UPDATE {TASKS_TABLE}
+                SET status = CASE WHEN attempts >= %(max_attempts)s THEN 'failed' ELSE 'queued' END,
+                    worker = NULL,
+                    finished_at = CASE WHEN attempts >= %(max_attempts)s THEN CURRENT_TIMESTAMP END,
+                    error = CASE WHEN attempts >= %(max_attempts)s THEN %(error)s ELSE error END
+                WHERE stage = %(stage)s AND status = 'running'
+                AND COALESCE(heartbeat_at, started_at) < CURRENT_TIMESTAMP - make_interval(secs => %(lease)s)
+                RETURNING id_reports, status
+            )
+            UPDATE {REPORTS_TABLE} r
+            SET id_status = 4, message = %(error)s
+            FROM expired e
+            WHERE r.id = e.id_reports AND e.status = 'failed'
+        """
+        requeue_params = {
+            'stage': stage,
+            'lease': TASK_LEASE_TIMEOUT,
+            'max_attempts': TASK_MAX_ATTEMPTS,
+            'error': f'Этап {stage} прерван {TASK_MAX_ATTEMPTS} раз (процесс завершился аварийно)'
+        }
+        claim = f"""
+            UPDATE {TASKS_TABLE}
+            SET status = 'running', worker = %s, attempts = attempts + 1,
+                started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM {TASKS_TABLE}
+                WHERE stage = %s AND status = 'queued'
+                ORDER BY id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, payload, attempts
+        """
+        try:
+            self._execute(requeue, requeue_params)
+            rows = self._execute(claim, (self.worker_id, stage), fetch=True)
+        except Exception as e:
+            print(f"❌ Ошибка получения задачи этапа {stage}: {e}")
+            return None
+        if not rows:
+            return None
+        task_id, payload, attempts = rows[0]
+        report = payload if isinstance(payload, dict) else json.loads(payload)
+        return {'id': task_id, 'report': report, 'attempts': attempts}
+
+    def complete(self, task: Dict, stage: str) -> bool:
+        """Завершает задачу и в той же транзакции ставит следующий этап отчета"""
+        stage_after = next_stage(stage)
+        query = f"""
+            UPDATE {TASKS_TABLE}
+            SET status = 'done', finished_at = CURRENT_TIMESTAMP, error = NULL
+            WHERE id = %(task_id)s;
+        """
+        params = {'task_id': task['id']}
+        if stage_after:
+            query += self._insert_task_sql()
+            params.update(self._task_params(task['report'], stage_after))
+        try:
+            self._execute(query, params)
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка завершения задачи {task['id']}: {e}")
+            return False
+
+    def fail(self, task: Dict, error: str) -> bool:
+        """Отмечает задачу ошибочной (отчет при этом переводится этапом в статус 4)"""
+        query = f"""
+            UPDATE {TASKS_TABLE}
+            SET status = 'failed', finished_at = CURRENT_TIMESTAMP, error = %s
+            WHERE id = %s
+        """
+        try:
+            self._execute(query, (error, task['id']))
+            return True
+        except Exception as e:
+            print(f"❌ Ошибка записи результата задачи {task['id']}: {e}")
+            return False
+
+
+class TaskHeartbeat:
+    """
+    Продление аренды выполняемой задачи: фоновый поток раз в TASK_HEARTBEAT_INTERVAL обновляет
+    heartbeat_at задачи по отдельному соединению в режиме autocommit (соединение этапа
+    занято его транзакциями). Используется как контекстный менеджер на время выполнения этапа
+    """
+
+    def __init__(self, task: Dict, worker_id: str, interval: float = TASK_HEARTBEAT_INTERVAL):
+        self.task = task
+        self.worker_id = worker_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._connection = None
+
+    def __enter__(self) -> 'TaskHeartbeat':
+        self._thread = threading.Thread(target=self._run, name=f"task-heartbeat-{self.task['id']}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+
+    def _connect(self):
+        if self._connection is None or self._connection.closed:
+            self._connection = psycopg2.connect(
+                host=os.getenv('DB_HOST'),
+                port=os.getenv('DB_PORT'),
+                database=os.getenv('DB_NAME'),
+                user=os.getenv('DB_USER'),
+                password=os.getenv('DB_PASSWORD')
+            )
+            self._connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        return self._connection
+
+    def beat(self) -> bool:
+        """
+        Продлевает аренду задачи
+        :return: False, если задача больше не принадлежит процессу (возвращена в очередь другим процессом)
+        """
+        query = f"""
+            UPDATE {TASKS_TABLE}
+            SET heartbeat_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND status = 'running' AND worker = %s
+        """
+        with self._connect().cursor() as cursor:
+            cursor.execute(query, (self.task['id'], self.worker_id))
+            return cursor.rowcount > 0
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    if not self.beat():
+                        print(f"⚠️ Аренда задачи {self.task['id']} потеряна: задача возвращена в очередь")
+                        return
+                except Exception as e:
+                    # Соединение переподключается при следующем продлении
+                    print(f"⚠️ Ошибка продления аренды задачи {self.task['id']}: {e}")
+                    if self._connection is not None:
+                        self._connection.close()
+        finally:
+            if self._connection is not None and not self._connection.closed:
+                self._connection.close()
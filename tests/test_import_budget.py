@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Импорт main_processor не должен загружать тяжелые модули этапов (см. utils/import_budget.py)
+Импорт выполняется в отдельном процессе: в процессе pytest модули могли быть загружены другими тестами
+"""
+import json
+import subprocess
+import sys
+
+from utils.import_budget import LAZY_MODULES, PROJECT_ROOT
+
+
+def _modules_after_import(module: str) -> set:
+    code = f"import json, sys; import {module}; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', code], cwd=PROJECT_ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, f"Импорт {module} завершился ошибкой:\n{result.stderr[-2000:]}"
+    return set(json.loads(result.stdout.splitlines()[-1]))
+
+
+def test_main_processor_does_not_load_stage_modules():
+    loaded = {name.split('.')[0] for name in _modules_after_import('main_processor')}
+    assert not loaded & set(LAZY_MODULES), f"Загружены модули этапов: {sorted(loaded & set(LAZY_MODULES))}"
@@ -9,37 +9,14 @@ import sys
 import os
 from typing import List, Dict, Any
 
+from report_tsv_parser import tsv_to_records
+
 def parse_tsv_to_json(tsv_content: str) -> Dict[str, Any]:
     """
     Преобразует TSV содержимое в JSON структуру
     """
-    lines = tsv_content.strip().split('\n')
-    
-    # Пропускаем первую строку с заголовком отчета
-    # Пропускаем вторую строку с названиями колонок
-    data_lines = lines[2:]  # Начинаем с третьей строки
-    
-    # Удаляем последнюю строку с "Total rows: X" если есть
-    if data_lines and data_lines[-1].startswith('Total rows:'):
-        data_lines = data_lines[:-1]
-    
-    # Удаляем пустые строки
-    data_lines = [line.strip() for line in data_lines if line.strip()]
-    
-    # Парсим данные
-    rows = []
-    for line in data_lines:
-        fields = line.split('\t')
-        if len(fields) >= 6:  # CampaignId, CampaignName, Impressions, Clicks, Ctr, BounceRate
-            row = {
-                "CampaignId": int(fields[0]) if fields[0].isdigit() else None,
-                "CampaignName": fields[1],
-                "Impressions": int(fields[2]) if fields[2].isdigit() else 0,
-                "Clicks": int(fields[3]) if fields[3].isdigit() else 0,
-                "Ctr": float(fields[4]) if fields[4].replace('.', '').isdigit() else 0.0,
-                "BounceRate": float(fields[5]) if fields[5].replace('.', '').isdigit() else 0.0
-            }
-            rows.append(row)
+    # Колонки определяются по строке с названиями полей отчета
+    rows = tsv_to_records(tsv_content, ["CampaignId", "CampaignName", "Impressions", "Clicks", "Ctr", "BounceRate"])
     
     # Создаем JSON структуру
     result = {
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Общий сервис загрузки объектов в MinIO
+Загрузки выполняются пулом потоков с ограниченной очередью (при заполнении очереди
+постановка новой загрузки ждет освобождения места), крупные объекты загружаются
+multipart-частями параллельно, при ошибках загрузка повторяется с экспоненциальной
+задержкой со случайным разбросом. Постановка в очередь возвращает Future: этапы
+конвейера ставят загрузки и ждут их завершения только в точке синхронизации (wait)
+"""
+
+import io
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+from dotenv import load_dotenv
+from minio import Minio
+
+load_dotenv('.env')
+
+# Количество потоков загрузки
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '8'))
+# Максимум загрузок в очереди (включая выполняющиеся)
+UPLOAD_QUEUE_SIZE = int(os.getenv('UPLOAD_QUEUE_SIZE', '64'))
+# Количество попыток загрузки объекта
+UPLOAD_RETRIES = int(os.getenv('UPLOAD_RETRIES', '3'))
+# Базовая задержка перед повтором, сек (удваивается с каждой попыткой)
+UPLOAD_BACKOFF = float(os.getenv('UPLOAD_BACKOFF', '0.5'))
+# Объекты больше порога загружаются multipart-частями этого размера (минимум для S3 - 5 МБ)
+UPLOAD_PART_SIZE = int(os.getenv('UPLOAD_PART_SIZE', str(16 * 1024 * 1024)))
+# Количество частей одного объекта, загружаемых параллельно
+UPLOAD_PART_PARALLEL = int(os.getenv('UPLOAD_PART_PARALLEL', '4'))
+
+
+class UploadService:
+    """Пул загрузок в MinIO с ограниченной очередью, повторами и Future на каждую загрузку"""
+
+    def __init__(self, minio: Minio, bucket_name: str, workers: int = UPLOAD_WORKERS,
+                 queue_size: int = UPLOAD_QUEUE_SIZE, retries: int = UPLOAD_RETRIES):
+        self.minio = minio
+        self.bucket_name = bucket_name
+        self.retries = max(1, retries)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='minio-upload')
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    # ---------- Постановка загрузок ----------
+
+    def submit_bytes(self, object_name: str, data: bytes, content_type: str = 'application/octet-stream',
+                     metadata: Optional[Dict] = None,
+                     on_done: Optional[Callable] = None) -> Future:
+        """
+        Ставит в очередь загрузку байтов
+        :param on_done: вызывается после успешной загрузки с результатом put_object
+        :return: Future с результатом put_object (ObjectWriteResult)
+        """
+        return self._submit(object_name, lambda: io.BytesIO(data), len(data), content_type, metadata,
+                            on_done, None)
+
+    def submit_file(self, object_name: str, file_path: str, content_type: str = 'application/octet-stream',
+                    metadata: Optional[Dict] = None, remove: bool = False,
+                    on_done: Optional[Callable] = None) -> Future:
+        """
+        Ставит в очередь загрузку локального файла
+        :param remove: удалить файл после успешной загрузки
+        """
+        cleanup = (lambda: os.remove(file_path)) if remove else None
+        return self._submit(object_name, lambda: open(file_path, 'rb'), os.path.getsize(file_path),
+                            content_type, metadata, on_done, cleanup)
+
+    def _submit(self, object_name: str, open_stream: Callable, length: int, content_type: str,
+                metadata: Optional[Dict], on_done: Optional[Callable], cleanup: Optional[Callable]) -> Future:
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._upload, object_name, open_stream, length, content_type,
+                                           metadata, on_done, cleanup)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, future: Future):
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+
+    # ---------- Загрузка ----------
+
+    def _upload(self, object_name: str, open_stream: Callable, length: int, content_type: str,
+                metadata: Optional[Dict], on_done: Optional[Callable], cleanup: Optional[Callable]):
+        for attempt in range(1, self.retries + 1):
+            try:
+                with open_stream() as stream:
+                    result = self.minio.put_object(
+                        self.bucket_name,
+                        object_name,
+                        stream,
+                        length=length,
+                        content_type=content_type,
+                        metadata=metadata,
+                        part_size=UPLOAD_PART_SIZE,
+                        num_parallel_uploads=UPLOAD_PART_PARALLEL
+                    )
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    print(f"❌ Ошибка загрузки {object_name} в MinIO (попыток: {attempt}): {e}")
+                    raise
+                delay = UPLOAD_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                print(f"⚠️ Ошибка загрузки {object_name} (попытка {attempt}): {e}, повтор через {delay:.1f} сек")
+                time.sleep(delay)
+
+        if on_done is not None:
+            on_done(result)
+        if cleanup is not None:
+            try:
+                cleanup()
+            except OSError:
+                pass
+        return result
+
+    # ---------- Синхронизация ----------
+
+    def wait(self, futures: Optional[Iterable[Future]] = None) -> bool:
+        """
+        Ждет завершения загрузок
+        :param futures: загрузки; по умолчанию - все выполняющиеся на данный момент.
+            Ошибки учитываются только для ожидаемых загрузок: результат своих загрузок
+            этап проверяет по своим Future (общего счетчика ошибок у сервиса нет, поэтому
+            ожидание одного этапа не скрывает ошибки загрузок другого)
+        :return: True, если все загрузки успешны
+        """
+        if futures is None:
+            with self._lock:
+                futures = list(self._pending)
+        success = True
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                success = False
+        return success
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+# Сервисы загрузки процесса (по bucket)
+_services: Dict[str, UploadService] = {}
+_services_lock = threading.Lock()
+
+
+def get_upload_service(minio: Minio, bucket_name: str) -> UploadService:
+    """Общий сервис загрузки для bucket (создается при первом обращении)"""
+    with _services_lock:
+        service = _services.get(bucket_name)
+        if service is None:
+            service = _services[bucket_name] = UploadService(minio, bucket_name)
+        return service
+
+
+def wait_all_uploads() -> bool:
+    """
+    Точка синхронизации конвейера: ждет выполняющиеся загрузки всех сервисов процесса
+    (результат - по этим загрузкам; завершившиеся раньше загрузки проверяют поставившие их этапы)
+    """
+    with _services_lock:
+        services = list(_services.values())
+    return all([service.wait() for service in services])
+
@@ -0,0 +1,198 @@
+"""
+Повторное использование сформированных файлов-отчетов.
+
+Отпечаток входных данных генератора складывается из ETag всех объектов папки отчета
+в MinIO, строк БД, которые читают генераторы (договор, заявка, организации, этапы,
+переписка, проекты, тексты форм документов), версии генераторов (содержимое
+generate_report_files) и текущей даты (она печатается в документах). Сформированный
+файл копируется в S3_REPORT_PATH/document_memo/<ID отчета>/<отпечаток входных данных>/<отпечаток файла>/;
+если при повторном формировании файл с тем же отпечатком уже есть, он копируется на стороне
+сервера (copy_object) вместо повторного формирования. Для отчета хранятся только копии
+последних входных данных: при сохранении копий с новым отпечатком прежние удаляются.
+"""
+import hashlib
+import io
+import os
+from datetime import date
+from pathlib import Path
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from minio.commonconfig import CopySource
+from minio.deleteobjects import DeleteObject
+
+from report_manifest import MANIFEST_FILENAME, report_folder
+
+load_dotenv()
+
+# Повторное использование файлов-отчетов с тем же отпечатком входных данных
+DOCUMENT_MEMO = int(os.getenv('DOCUMENT_MEMO', '1'))
+
+# Версия формата отпечатка
+MEMO_VERSION = 2
+MEMO_FOLDER = 'document_memo'
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+_GENERATORS_DIR = _PROJECT_ROOT / 'generate_report_files'
+# Общие модули, от которых зависит содержимое документов (пути от корня проекта)
+_SHARED_MODULES = (
+    'utils/docx_tables.py',
+    'utils/docx_images.py',
+    'utils/image_prefetch.py',
+    'utils/image_cache.py',
+    'report_index.py',
+    'stats_store.py',
+    'report_manifest.py',
+    'artifact_codec.py',
+)
+
+_generators_version = None
+
+
+def generators_version() -> str:
+    """Хэш файлов генераторов (код, шаблоны, медиа) - меняется при любом изменении генераторов"""
+    global _generators_version
+    if _generators_version is None:
+        digest = hashlib.sha1()
+        files = sorted(path for path in _GENERATORS_DIR.rglob('*')
+                       if path.is_file() and '__pycache__' not in path.parts)
+        files += [_PROJECT_ROOT / name for name in _SHARED_MODULES]
+        for path in files:
+            if path.exists():
+                digest.update(path.relative_to(_PROJECT_ROOT).as_posix().encode('utf-8'))
+                digest.update(path.read_bytes())
+        _generators_version = digest.hexdigest()
+    return _generators_version
+
+
+class DocumentMemo:
+    """Отпечатки входных данных генераторов отчета и хранилище сформированных файлов по отпечатку"""
+
+    def __init__(self, minio_client, report_id, db_conn):
+        """
+        :param minio_client: MinIOClient (подключенный)
+        :param db_conn: соединение psycopg2
+        """
+        self.minio = minio_client.client
+        self.bucket_name = minio_client.bucket_name
+        self.report_id = report_id
+        self.report_path = os.getenv('S3_REPORT_PATH')
+        digest = hashlib.sha1()
+        digest.update(f"{MEMO_VERSION}|{report_id}|{date.today().isoformat()}|{generators_version()}".encode('utf-8'))
+        digest.update(self._artifacts_state().encode('utf-8'))
+        digest.update(self._db_state(db_conn).encode('utf-8'))
+        self._base = digest.hexdigest()
+
+    def _artifacts_state(self) -> str:
+        """ETag всех объектов папки отчета (один LIST)"""
+        folder = report_folder(self.report_id)
+        objects = self.minio.list_objects(self.bucket_name, prefix=folder, recursive=True)
+        # Манифест - служебные сведения (время записи, контрольные точки), а не входные данные
+        return '\n'.join(sorted(f"{obj.object_name}={obj.etag}" for obj in objects
+                                 if obj.object_name != f"{folder}{MANIFEST_FILENAME}"))
+
+    def _db_state(self, db_conn) -> str:
+        """Строки БД, которые читают генераторы документов"""
+        schema = os.getenv('DB_SCHEMA')
+        query = f"""
+            SELECT concat_ws('|',
+                (SELECT row_to_json(c)::text FROM {schema}.contracts c WHERE c.id = r.id_contracts),
+                (SELECT row_to_json(q)::text FROM {schema}.requests q WHERE q.id = r.id_requests),
+                (SELECT string_agg(row_to_json(o)::text, '|' ORDER BY o.id)
+                 FROM {schema}.organizations o
+                 JOIN {schema}.contracts c ON o.id IN (c.id_customer, c.id_contractor)
+                 WHERE c.id = r.id_contracts),
+                (SELECT string_agg(row_to_json(t)::text, '|' ORDER BY t.id)
+                 FROM {schema}.terms t WHERE t.id_contract = r.id_contracts),
+                (SELECT string_agg(row_to_json(w)::text || coalesce(tl.theme, ''), '|' ORDER BY w.id)
+                 FROM {schema}."workСorrespondence" w
+                 LEFT JOIN {schema}.themesletter tl ON w.id_letter_name = tl.id
+                 WHERE w.id_requests = r.id_requests),
+                (SELECT string_agg(p.id || '=' || coalesce(p.name, ''), '|' ORDER BY p.id) FROM {schema}.projects p),
+                (SELECT string_agg(f.key || '=' || coalesce(f.text_data, ''), '|' ORDER BY f.key, f.id)
+                 FROM {schema}.textforformdocument f)
+            )
+            FROM {schema}.reports r
+            WHERE r.id = %s
+        """
+        with db_conn.cursor() as cur:
+            cur.execute(query, (self.report_id,))
+            row = cur.fetchone()
+        db_conn.commit()
+        if row is None:
+            raise ValueError(f'Отчёт {self.report_id} не найден')
+        return row[0] or ''
+
+    # ---------- Отпечатки ----------
+
+    def fingerprint(self, param: str) -> str:
+        """Отпечаток входных данных генератора (param - колонка выбора файла)"""
+        return hashlib.sha1(f"{self._base}|{param}".encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def combined_fingerprint(fingerprints: Dict[str, str]) -> str:
+        """Отпечаток архива из файлов с данными отпечатками"""
+        data = '|'.join(f"{param}={fingerprints[param]}" for param in sorted(fingerprints))
+        return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+    # ---------- Хранилище ----------
+
+    def _report_prefix(self) -> str:
+        return f"{self.report_path}/{MEMO_FOLDER}/{self.report_id}/"
+
+    def _memo_prefix(self, fingerprint: str) -> str:
+        return f"{self._report_prefix()}{self._base}/{fingerprint}/"
+
+    def find(self, fingerprint: str) -> Optional[str]:
+        """Сохраненный файл с отпечатком (полное имя объекта) или None"""
+        for obj in self.minio.list_objects(self.bucket_name, prefix=self._memo_prefix(fingerprint)):
+            return obj.object_name
+        return None
+
+    def report_file_name(self, memo_object: str) -> str:
+        """Имя файла отчета для сохраненного файла (ID/имя, как у генераторов)"""
+        return f"{self.report_id}/{memo_object.rsplit('/', 1)[-1]}"
+
+    def copy(self, source_object: str, target_object: str):
+        """Копирует объект на стороне сервера (если цели с тем же содержимым еще нет)"""
+        if source_object == target_object:
+            return
+        try:
+            target = self.minio.stat_object(self.bucket_name, target_object)
+            source = self.minio.stat_object(self.bucket_name, source_object)
+            if target.etag == source.etag:
+                return
+        except Exception:
+            pass
+        self.minio.copy_object(self.bucket_name, target_object, CopySource(self.bucket_name, source_object))
+
+    def store(self, fingerprint: str, object_name: str):
+        """Сохраняет загруженный файл отчета под отпечатком"""
+        self.copy(object_name, f"{self._memo_prefix(fingerprint)}{object_name.rsplit('/', 1)[-1]}")
+
+    def purge_stale(self) -> int:
+        """
+        Удаляет сохраненные файлы отчета с прежними входными данными
+        :return: количество удаленных объектов
+        """
+        current = f"{self._report_prefix()}{self._base}/"
+        stale = [DeleteObject(obj.object_name)
+                 for obj in self.minio.list_objects(self.bucket_name, prefix=self._report_prefix(), recursive=True)
+                 if not obj.object_name.startswith(current)]
+        if not stale:
+            return 0
+        # remove_objects возвращает ошибки лениво - удаление выполняется при переборе
+        errors = list(self.minio.remove_objects(self.bucket_name, stale))
+        for error in errors:
+            print(f'Не удалось удалить устаревший файл {error.name}: {error.message}')
+        return len(stale) - len(errors)
+
+    def read(self, object_name: str) -> io.BytesIO:
+        response = None
+        try:
+            response = self.minio.get_object(self.bucket_name, object_name)
+            return io.BytesIO(response.read())
+        finally:
+            if response:
+                response.close()
+                response.release_conn()
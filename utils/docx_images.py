@@ -0,0 +1,85 @@
+"""
+Вставка изображений в docx из памяти.
+
+Размеры берутся из заголовка файла (парсер python-docx, без декодирования пикселей)
+и вычисляются один раз на изображение. Повторно вставляемая в тот же документ картинка
+использует уже добавленную часть пакета (image part), без повторного разбора и хеширования.
+"""
+import hashlib
+import io
+from typing import Dict, Optional, Tuple
+
+from docx.image.image import Image as DocxImage
+from docx.oxml.shape import CT_Inline
+from docx.shape import InlineShape
+from docx.shared import Inches, Length
+
+# Разрешение, в котором исходный код переводит пиксели в дюймы
+DEFAULT_DPI = 96
+
+
+class DocxImageEmbedder:
+    """Вставляет изображения в документ из байтов; один экземпляр на документ"""
+
+    def __init__(self):
+        # sha1 -> DocxImage (разобранный заголовок)
+        self._images: Dict[str, DocxImage] = {}
+        # (id части документа, sha1) -> rId добавленной части изображения
+        self._rids: Dict[Tuple[int, str], str] = {}
+
+    def _get_image(self, data: bytes) -> Tuple[str, DocxImage]:
+        sha1 = hashlib.sha1(data).hexdigest()
+        image = self._images.get(sha1)
+        if image is None:
+            image = DocxImage.from_blob(data)
+            self._images[sha1] = image
+        return sha1, image
+
+    def image_size(self, data: bytes) -> Tuple[int, int]:
+        """Размеры изображения в пикселях по заголовку файла"""
+        _, image = self._get_image(data)
+        return image.px_width, image.px_height
+
+    def fit_size(self, data: bytes, max_width_px: Optional[int] = None, max_height_px: Optional[int] = None,
+                 min_square_height_px: Optional[int] = None, dpi: int = DEFAULT_DPI) -> Tuple[Length, Length]:
+        """
+        Рассчитывает размеры вставки с сохранением пропорций
+        :param max_width_px: максимальная ширина в пикселях
+        :param max_height_px: максимальная высота в пикселях
+        :param min_square_height_px: минимальная высота для квадратных изображений
+        :return: (ширина, высота) для add_picture
+        """
+        width, height = self.image_size(data)
+
+        if max_width_px and width > max_width_px:
+            height = int(height * max_width_px / width)
+            width = max_width_px
+        elif max_height_px and height > max_height_px:
+            width = int(width * max_height_px / height)
+            height = max_height_px
+        elif min_square_height_px and height < min_square_height_px and width == height:
+            width = int(width * min_square_height_px / height)
+            height = min_square_height_px
+
+        return Inches(width / dpi), Inches(height / dpi)
+
+    def add_picture(self, run, data: bytes, width: Optional[Length] = None,
+                    height: Optional[Length] = None) -> InlineShape:
+        """
+        Вставляет изображение в run. Если ширина или высота не заданы,
+        недостающий размер вычисляется пропорционально, как в run.add_picture
+        """
+        sha1, image = self._get_image(data)
+        part = run.part
+
+        key = (id(part), sha1)
+        r_id = self._rids.get(key)
+        if r_id is None:
+            r_id, image = part.get_or_add_image(io.BytesIO(data))
+            self._images[sha1] = image
+            self._rids[key] = r_id
+
+        cx, cy = image.scaled_dimensions(width, height)
+        inline = CT_Inline.new_pic_inline(part.next_id, r_id, image.filename, cx, cy)
+        run._r.add_drawing(inline)
+        return InlineShape(inline)
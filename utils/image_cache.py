@@ -0,0 +1,287 @@
+"""
+Контентно-адресуемый кэш изображений объявлений.
+
+Изображения хранятся по ключу (AdImageHash, вариант): локальный дисковый кэш с вытеснением
+по давности использования (LRU) и общий уровень в MinIO со сроком хранения объектов
+(правило жизненного цикла bucket). Один и тот же объект используется всеми генераторами,
+поэтому для одного клиента изображение скачивается с Яндекса один раз.
+"""
+import io
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Optional
+
+import requests
+from dotenv import load_dotenv
+from minio import Minio
+from minio.commonconfig import ENABLED, Filter
+from minio.deleteobjects import DeleteObject
+from minio.lifecycleconfig import Expiration, LifecycleConfig, Rule
+from minio_factory import get_minio
+
+load_dotenv()
+
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', os.path.join(os.getcwd(), 'image_cache'))
+IMAGE_CACHE_MAX_MB = int(os.getenv('IMAGE_CACHE_MAX_MB', '512'))
+IMAGE_CACHE_S3_PREFIX = 'gen_report_context_contracts/image_cache'
+# Срок хранения изображений в MinIO, дней (после него изображение скачивается с Яндекса заново)
+IMAGE_CACHE_S3_TTL_DAYS = max(1, int(os.getenv('IMAGE_CACHE_S3_TTL_DAYS', '30')))
+# Идентификатор правила жизненного цикла bucket для префикса кэша
+IMAGE_CACHE_LIFECYCLE_RULE = 'image-cache-expiry'
+
+# Варианты изображения
+ORIGINAL = 'original'
+PREVIEW = 'preview'
+
+
+def resized_variant(max_width: int, max_height: int, quality: int) -> str:
+    """Имя варианта для уменьшенной копии изображения"""
+    return f'resized_{max_width}x{max_height}_q{quality}'
+
+
+class ImageCache:
+    """Двухуровневый кэш изображений: локальный диск (LRU) + MinIO"""
+
+    def __init__(self, cache_dir: str = IMAGE_CACHE_DIR, max_bytes: int = IMAGE_CACHE_MAX_MB * 1024 * 1024,
+                 minio_client: Minio = None, bucket_name: str = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._minio_client = minio_client
+        self.bucket_name = bucket_name or os.getenv('S3_BUCKET_NAME', 'dit-services-dev')
+        self._lock = threading.Lock()
+        # Оценка занятого места; полный обход каталога только при превышении лимита
+        self._size_estimate = None
+        # Срок хранения уровня MinIO проверяется один раз за процесс (при первой записи)
+        self._s3_expiry_checked = False
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def minio_client(self) -> Minio:
+        """Общий MinIO-клиент процесса (запрашивается при первом обращении)"""
+        if self._minio_client is None:
+            self._minio_client = get_minio()
+        return self._minio_client
+
+    @staticmethod
+    def _key(image_hash: str, variant: str) -> str:
+        return f'{image_hash}_{variant}'
+
+    def local_path(self, image_hash: str, variant: str) -> str:
+        """Путь к файлу изображения в локальном кэше (файл может отсутствовать)"""
+        key = self._key(image_hash, variant)
+        # Раскладываем по подпапкам, чтобы не держать тысячи файлов в одном каталоге
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, image_hash: str, variant: str = ORIGINAL, url: str = None) -> Optional[bytes]:
+        """
+        Получить изображение из кэша. При промахе ищет в MinIO, затем скачивает по url
+        :param image_hash: AdImageHash
+        :param variant: original / preview / resized_*
+        :param url: адрес для скачивания при отсутствии в кэше
+        :return: байты изображения или None
+        """
+        if not image_hash:
+            return self._download(url) if url else None
+
+        data = self._get_local(image_hash, variant)
+        if data is not None:
+            return data
+
+        data = self._get_s3(image_hash, variant)
+        if data is not None:
+            self._put_local(image_hash, variant, data)
+            return data
+
+        if not url:
+            return None
+
+        data = self._download(url)
+        if data is not None:
+            self.put(image_hash, variant, data)
+        return data
+
+    def get_stream(self, image_hash: str, variant: str = ORIGINAL, url: str = None) -> Optional[io.BytesIO]:
+        """То же, что get, но возвращает BytesIO"""
+        data = self.get(image_hash, variant, url)
+        return io.BytesIO(data) if data is not None else None
+
+    def get_local_uri(self, image_hash: str, variant: str = ORIGINAL, url: str = None) -> Optional[str]:
+        """
+        Возвращает file:// URI изображения в локальном кэше для подстановки в HTML,
+        чтобы браузер не скачивал изображение повторно. При ошибке возвращает исходный url
+        """
+        if not image_hash or self.get(image_hash, variant, url) is None:
+            return url
+        return Path(self.local_path(image_hash, variant)).as_uri()
+
+    def put(self, image_hash: str, variant: str, data: bytes):
+        """Сохранить изображение в оба уровня кэша"""
+        self._put_local(image_hash, variant, data)
+        try:
+            self.minio_client.put_object(
+                self.bucket_name,
+                f'{IMAGE_CACHE_S3_PREFIX}/{self._key(image_hash, variant)}',
+                io.BytesIO(data),
+                length=len(data),
+                content_type='application/octet-stream'
+            )
+        except Exception as e:
+            print(f"⚠️ Не удалось сохранить изображение {image_hash} ({variant}) в MinIO: {e}")
+            return
+        self._ensure_s3_expiry()
+
+    def _ensure_s3_expiry(self):
+        """
+        Ограничивает уровень MinIO: объекты кэша удаляются через IMAGE_CACHE_S3_TTL_DAYS дней
+        после записи правилом жизненного цикла bucket. Если правило задать нельзя
+        (например, нет прав на настройку bucket), устаревшие объекты удаляются здесь
+        """
+        with self._lock:
+            if self._s3_expiry_checked:
+                return
+            self._s3_expiry_checked = True
+        try:
+            self._set_lifecycle_rule()
+        except Exception as e:
+            print(f"⚠️ Не удалось задать срок хранения кэша изображений в MinIO: {e}, удаляем устаревшие объекты")
+            try:
+                self.purge_expired()
+            except Exception as purge_error:
+                print(f"⚠️ Не удалось удалить устаревшие изображения из MinIO: {purge_error}")
+
+    def _set_lifecycle_rule(self):
+        """Добавляет (обновляет) правило срока хранения префикса кэша, правила других префиксов сохраняются"""
+        config = self.minio_client.get_bucket_lifecycle(self.bucket_name)
+        rules = list(config.rules) if config else []
+        for rule in rules:
+            if rule.rule_id == IMAGE_CACHE_LIFECYCLE_RULE and rule.expiration is not None \
+                    and rule.expiration.days == IMAGE_CACHE_S3_TTL_DAYS:
+                return
+        rules = [rule for rule in rules if rule.rule_id != IMAGE_CACHE_LIFECYCLE_RULE]
+        rules.append(Rule(
+            ENABLED,
+            rule_filter=Filter(prefix=f'{IMAGE_CACHE_S3_PREFIX}/'),
+            rule_id=IMAGE_CACHE_LIFECYCLE_RULE,
+            expiration=Expiration(days=IMAGE_CACHE_S3_TTL_DAYS)
+        ))
+        self.minio_client.set_bucket_lifecycle(self.bucket_name, LifecycleConfig(rules))
+        print(f"🗑️ Срок хранения кэша изображений в MinIO: {IMAGE_CACHE_S3_TTL_DAYS} дн.")
+
+    def purge_expired(self) -> int:
+        """
+        Удаляет из MinIO изображения, записанные раньше IMAGE_CACHE_S3_TTL_DAYS дней назад
+        :return: количество удаленных объектов
+        """
+        expired_before = datetime.now(timezone.utc) - timedelta(days=IMAGE_CACHE_S3_TTL_DAYS)
+        expired = [DeleteObject(obj.object_name)
+                   for obj in self.minio_client.list_objects(self.bucket_name, prefix=f'{IMAGE_CACHE_S3_PREFIX}/',
+                                                             recursive=True)
+                   if obj.last_modified is not None and obj.last_modified < expired_before]
+        if not expired:
+            return 0
+        # remove_objects возвращает ошибки лениво - удаление выполняется при переборе
+        errors = list(self.minio_client.remove_objects(self.bucket_name, expired))
+        for error in errors:
+            print(f"⚠️ Не удалось удалить изображение {error.name} из MinIO: {error.message}")
+        return len(expired) - len(errors)
+
+    def _get_local(self, image_hash: str, variant: str) -> Optional[bytes]:
+        path = self.local_path(image_hash, variant)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Обновляем время доступа для LRU
+            os.utime(path, None)
+            return data
+        except OSError:
+            return None
+
+    def _put_local(self, image_hash: str, variant: str, data: bytes):
+        path = self.local_path(image_hash, variant)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._evict(len(data))
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить изображение {image_hash} ({variant}) на диск: {e}")
+
+    def _get_s3(self, image_hash: str, variant: str) -> Optional[bytes]:
+        response = None
+        try:
+            response = self.minio_client.get_object(
+                self.bucket_name,
+                f'{IMAGE_CACHE_S3_PREFIX}/{self._key(image_hash, variant)}'
+            )
+            return response.read()
+        except Exception:
+            return None
+        finally:
+            if response:
+                response.close()
+                response.release_conn()
+
+    def _download(self, url: str, max_retries: int = 3) -> Optional[bytes]:
+        for attempt in range(max_retries):
+            try:
+                response = requests.get(url, timeout=15)
+                if response.status_code == 200:
+                    return response.content
+                print(f"    ⚠ HTTP {response.status_code} при скачивании изображения (попытка {attempt + 1})")
+            except Exception as e:
+                print(f"    ✗ Ошибка скачивания изображения (попытка {attempt + 1}): {e}")
+            if attempt < max_retries - 1:
+                time.sleep(2)
+        print(f"    ❌ Не удалось скачать изображение после {max_retries} попыток: {url}")
+        return None
+
+    def _evict(self, added_bytes: int = 0):
+        """Удаляет давно не использованные файлы при превышении лимита размера"""
+        with self._lock:
+            if self._size_estimate is not None:
+                self._size_estimate += added_bytes
+                if self._size_estimate <= self.max_bytes:
+                    return
+
+            files = []
+            total = 0
+            for root, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            if total > self.max_bytes:
+                files.sort()
+                for _, size, path in files:
+                    if total <= self.max_bytes:
+                        break
+                    try:
+                        os.remove(path)
+                        total -= size
+                    except OSError:
+                        pass
+
+            self._size_estimate = total
+
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    """Общий для всех генераторов экземпляр кэша изображений"""
+    global _image_cache
+    with _image_cache_lock:
+        if _image_cache is None:
+            _image_cache = ImageCache()
+        return _image_cache
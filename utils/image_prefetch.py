@@ -0,0 +1,164 @@
+"""
+Предварительная загрузка изображений отчета.
+
+Все изображения отчета собираются заранее и скачиваются параллельно пулом потоков
+(через общий кэш изображений); сжатые копии для презентации готовит CompressedImageVariants.
+Генераторы документов затем вставляют готовые байты.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Iterable, Optional, Tuple
+
+from PIL import Image
+
+from utils.image_cache import get_image_cache, ORIGINAL, resized_variant
+
+IMAGE_PREFETCH_WORKERS = int(os.getenv('IMAGE_PREFETCH_WORKERS', '8'))
+
+
+def resize_image_bytes(data: bytes, max_width: int = 800, max_height: int = 600, quality: int = 85) -> bytes:
+    """
+    Уменьшает изображение с сохранением пропорций и сохраняет в JPEG
+    """
+    img = Image.open(BytesIO(data))
+
+    original_width, original_height = img.size
+    ratio = min(max_width / original_width, max_height / original_height, 1)
+    if ratio < 1:
+        img = img.resize((int(original_width * ratio), int(original_height * ratio)), Image.Resampling.LANCZOS)
+
+    # Конвертируем в RGB если нужно (для JPEG)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        # Создаем белый фон для прозрачных изображений
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=quality, optimize=True)
+    return output.getvalue()
+
+
+def _resize_task(args: Tuple[bytes, int, int, int]) -> Optional[bytes]:
+    data, max_width, max_height, quality = args
+    try:
+        return resize_image_bytes(data, max_width, max_height, quality)
+    except Exception:
+        return None
+
+
+def prefetch_images(images: Iterable[Tuple[str, str]], variant: str = ORIGINAL,
+                    max_workers: int = IMAGE_PREFETCH_WORKERS, download: bool = True) -> Dict[str, bytes]:
+    """
+    Параллельно загружает изображения через общий кэш
+    :param images: пары (AdImageHash, url)
+    :param variant: вариант изображения в кэше (original / preview / resized_*)
+    :param download: скачивать ли по url при промахе кэша (False - только поиск в кэше)
+    :return: словарь AdImageHash -> байты (только успешно загруженные)
+    """
+    unique = {}
+    for image_hash, url in images:
+        if image_hash and url and image_hash not in unique:
+            unique[image_hash] = url
+
+    if not unique:
+        return {}
+
+    print(f"🖼️ Предзагрузка {len(unique)} изображений ({variant}), потоков: {max_workers}")
+    cache = get_image_cache()
+    result = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique)))) as executor:
+        futures = {
+            image_hash: executor.submit(cache.get, image_hash, variant, url if download else None)
+            for image_hash, url in unique.items()
+        }
+        for image_hash, future in futures.items():
+            try:
+                data = future.result()
+            except Exception as e:
+                print(f"    ✗ Ошибка предзагрузки изображения {image_hash}: {e}")
+                continue
+            if data is not None:
+                result[image_hash] = data
+
+    print(f"✅ Предзагружено изображений: {len(result)} из {len(unique)}")
+    return result
+
+
+class CompressedImageVariants:
+    """
+    Сжатые копии изображений одного документа для параллельной подготовки.
+    Каждое изображение готовится один раз, даже если его одновременно запрашивают несколько потоков;
+    исходники с одинаковым содержимым (ключ - хеш байтов) сжимаются один раз. Вместе с байтами
+    сохраняются размеры сжатой копии, чтобы не открывать её повторно при вставке
+    """
+
+    def __init__(self, max_width: int = 800, max_height: int = 600, quality: int = 85):
+        self.max_width = max_width
+        self.max_height = max_height
+        self.quality = quality
+        self.variant = resized_variant(max_width, max_height, quality)
+        self.cache = get_image_cache()
+        self._lock = threading.Lock()
+        # AdImageHash -> Future[(байты, ширина, высота) или None]
+        self._by_hash: Dict[str, Future] = {}
+        # sha1 исходника -> Future[байты сжатой копии или None]
+        self._by_content: Dict[str, Future] = {}
+
+    def _claim(self, futures: Dict[str, Future], key: str) -> Tuple[Future, bool]:
+        """Future для ключа и признак того, что результат должен посчитать вызывающий поток"""
+        with self._lock:
+            future = futures.get(key)
+            if future is not None:
+                return future, False
+            future = futures[key] = Future()
+            return future, True
+
+    def get(self, image_hash: str, url: str) -> Optional[Tuple[bytes, int, int]]:
+        """
+        Сжатая копия изображения
+        :return: (байты JPEG, ширина, высота) или None, если изображение получить не удалось
+        """
+        if not image_hash or not url:
+            return None
+        future, owner = self._claim(self._by_hash, image_hash)
+        if not owner:
+            return future.result()
+        try:
+            result = self._prepare(image_hash, url)
+        except Exception as e:
+            print(f"    ✗ Ошибка подготовки изображения {image_hash}: {e}")
+            result = None
+        future.set_result(result)
+        return result
+
+    def _prepare(self, image_hash: str, url: str) -> Optional[Tuple[bytes, int, int]]:
+        # Готовая копия из общего кэша изображений (без скачивания)
+        data = self.cache.get(image_hash, self.variant)
+        if data is None:
+            original = self.cache.get(image_hash, ORIGINAL, url)
+            if original is None:
+                print(f"    ❌ Не удалось получить изображение {image_hash}")
+                return None
+            data = self._compress(original)
+            if data is None:
+                print(f"    ✗ Не удалось уменьшить изображение {image_hash}")
+                return None
+            self.cache.put(image_hash, self.variant, data)
+
+        width, height = Image.open(BytesIO(data)).size
+        return data, width, height
+
+    def _compress(self, original: bytes) -> Optional[bytes]:
+        future, owner = self._claim(self._by_content, hashlib.sha1(original).hexdigest())
+        if not owner:
+            return future.result()
+        future.set_result(_resize_task((original, self.max_width, self.max_height, self.quality)))
+        return future.result()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверка времени запуска main_processor
+Импорт main_processor выполняется в отдельном процессе под `python -X importtime`:
+проверяется, что суммарное время импорта укладывается в бюджет и что тяжелые
+библиотеки этапов (selenium, python-docx, python-pptx, openpyxl, PIL, генераторы файлов)
+не загружаются при старте - они импортируются только при выполнении своего этапа.
+
+Запуск из корня проекта (код возврата 1 при нарушении бюджета):
+    python -m utils.import_budget
+"""
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv('.env')
+
+# Бюджет времени импорта main_processor, мс
+IMPORT_TIME_BUDGET_MS = int(os.getenv('IMPORT_TIME_BUDGET_MS', '800'))
+
+# Модули, которые не должны загружаться при импорте main_processor
+LAZY_MODULES = (
+    'selenium',
+    'selenium_stealth',
+    'webdriver_manager',
+    'docx',
+    'pptx',
+    'openpyxl',
+    'PIL',
+    'generate_report_files',
+    'generate_screenshots_refactored',
+    'ad_screenshots_very_good_generator',
+)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_imports(module: str = 'main_processor') -> List[Tuple[str, int, int]]:
+    """
+    Импортирует модуль в отдельном процессе с -X importtime
+    :return: список (модуль, уровень вложенности, накопленное время мкс) в порядке вывода
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Импорт {module} завершился ошибкой:\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            # Строка заголовка
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), depth, int(parts[1])))
+    return imports
+
+
+def check_import_budget(module: str = 'main_processor', budget_ms: int = IMPORT_TIME_BUDGET_MS) -> bool:
+    """Проверяет бюджет времени импорта и отсутствие тяжелых модулей; печатает самые медленные импорты"""
+    try:
+        imports = measure_imports(module)
+    except Exception as e:
+        print(f"❌ Не удалось измерить время импорта: {e}")
+        return False
+
+    total_us = next((cumulative for name, _, cumulative in imports if name == module), 0)
+    # Самые медленные модули, импортированные напрямую из module (по накопленному времени)
+    direct: Dict[str, int] = {}
+    for name, depth, cumulative in imports:
+        if depth == 1:
+            direct[name] = cumulative
+    slowest = sorted(direct.items(), key=lambda item: item[1], reverse=True)[:10]
+
+    print(f"⏱️ Импорт {module}: {total_us / 1000:.0f} мс (бюджет {budget_ms} мс)")
+    for name, cumulative in slowest:
+        print(f"   {cumulative / 1000:8.1f} мс  {name}")
+
+    loaded = sorted({name.split('.')[0] for name, _, _ in imports} & set(LAZY_MODULES))
+    success = True
+    if loaded:
+        print(f"❌ При импорте {module} загружаются модули этапов: {', '.join(loaded)}")
+        success = False
+    if total_us > budget_ms * 1000:
+        print(f"❌ Время импорта {module} превышает бюджет")
+        success = False
+    if success:
+        print("✅ Бюджет времени импорта соблюден")
+    return success
+
+
+if __name__ == '__main__':
+    sys.exit(0 if check_import_budget() else 1)
@@ -1,24 +1,38 @@
+import importlib
 import io
 import os
 import zipfile
+from concurrent.futures import Future
 from zipfile import ZipFile
 
 import psycopg2
 from psycopg2.extensions import connection, cursor
 from psycopg2.extras import RealDictCursor
 import dotenv
-from minio_client import MinIOClient
-
-from generate_report_files.soprovod_generator import generate_soprovod
-from generate_report_files.act_generator import generate_act
-from generate_report_files.statement_generator import generate_vedomost
-from generate_report_files.screen_ads.ad_screenshots_generator import generate_screens_ads
-from generate_report_files.presentation.presentation_generator import generate_presentation
-from generate_report_files.media_plan.mediaplan_generator import generate_mediaplan
-from generate_report_files.report_generator import word_report_generate
+from minio_client import MinIOClient, get_minio_client
+from utils.document_memo import DocumentMemo, DOCUMENT_MEMO
 
 dotenv.load_dotenv()
 
+# Генераторы файлов по колонкам выбора отчета: "модуль:функция".
+# Модуль генератора (python-docx, python-pptx, openpyxl, PIL) импортируется только
+# при формировании выбранного файла, а не при импорте модуля
+FILE_GENERATORS = {
+    'select_content_report': 'generate_report_files.report_generator:word_report_generate',
+    'select_screenshots_ads': 'generate_report_files.screen_ads.ad_screenshots_generator:generate_screens_ads',
+    'select_machine_media_statement': 'generate_report_files.statement_generator:generate_vedomost',
+    'select_presentation_keys': 'generate_report_files.presentation.presentation_generator:generate_presentation',
+    'select_media_plan': 'generate_report_files.media_plan.mediaplan_generator:generate_mediaplan',
+    'select_cover_letter': 'generate_report_files.soprovod_generator:generate_soprovod',
+    'select_act': 'generate_report_files.act_generator:generate_act'
+}
+
+
+def load_generator(param: str):
+    """Функция-генератор файла для колонки выбора (импортирует модуль генератора)"""
+    module_name, func_name = FILE_GENERATORS[param].split(':')
+    return getattr(importlib.import_module(module_name), func_name)
+
 # Параметры подключения к БД
 DB_CONFIG = {
     'host': os.getenv('DB_HOST', 'localhost'),
@@ -109,15 +123,6 @@ class FileFormatter:
     def __init__(self, report_id, minio_client):
         self.report_id = report_id
         self.selected_params = None
-        self.param_funcs = {
-            'select_content_report': word_report_generate,
-            'select_screenshots_ads': generate_screens_ads,
-            'select_machine_media_statement': generate_vedomost,
-            'select_presentation_keys': generate_presentation,
-            'select_media_plan': generate_mediaplan,
-            'select_cover_letter': generate_soprovod,
-            'select_act': generate_act
-        }
 
         self.minio_client = minio_client
 
@@ -170,18 +175,92 @@ class FileFormatter:
 
         return output_file, output_filename
 
+    def open_document_memo(self):
+        """Отпечатки входных данных генераторов (None - повторное использование файлов выключено или недоступно)"""
+        if not DOCUMENT_MEMO:
+            return None
+        try:
+            return DocumentMemo(self.minio_client, self.report_id, self.db_conn)
+        except Exception as e:
+            print(f'Не удалось рассчитать отпечаток входных данных, файлы будут сформированы заново: {e}')
+            return None
+
+    def reuse_memo_file(self, memo: DocumentMemo, memo_object: str):
+        """
+        Копирует сохраненный файл в папку отчета на стороне сервера
+        :return: имя файла (ID/имя), путь в S3 и завершенный Future (как у submit_to_s3)
+        """
+        filename = memo.report_file_name(memo_object)
+        output_path = '/'.join((os.getenv('S3_REPORT_PATH'), filename))
+        future = Future()
+        try:
+            memo.copy(memo_object, output_path)
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
+        return filename, output_path, future
+
     def create_files_by_params(self):
         files_to_create = filter(lambda param: self.selected_params[param], self.selected_params)
         create_files = []
+        # Загрузки идут в фоне, пока формируются следующие файлы: (колонка, путь в S3, Future)
+        uploads = []
+        # Файлы с тем же отпечатком входных данных не формируются заново
+        memo = self.open_document_memo()
+        fingerprints = {}
+        # Загруженные файлы, которые нужно сохранить под отпечатком: (отпечаток, путь в S3)
+        to_store = []
         try:
             for param in files_to_create:
-                file, filename = self.param_funcs[param](self.report_id)
-                s3_file_path = self.upload_to_s3(file, filename, self.minio_client)
-                self.write_s3path_to_bd(self.report_id, os.getenv(self.get_colname_by_param(param)), s3_file_path)
-                create_files.append((file, filename))
-            zipfile, zipfile_name = self.all_reports_zip_create(self.report_id, *create_files)
-            s3_path = self.upload_to_s3(zipfile, zipfile_name, self.minio_client)
-            self.write_s3path_to_bd(self.report_id, os.getenv('ALL_REPORT_ZIP'), s3_path)
+                memo_object = None
+                if memo:
+                    fingerprints[param] = memo.fingerprint(param)
+                    memo_object = memo.find(fingerprints[param])
+                if memo_object:
+                    print(f'Файл {param} с теми же входными данными уже сформирован, копируем: {memo_object}')
+                    filename, s3_file_path, future = self.reuse_memo_file(memo, memo_object)
+                    # Содержимое для архива читается, только если архив придется собирать
+                    create_files.append((memo_object, filename))
+                else:
+                    file, filename = load_generator(param)(self.report_id)
+                    s3_file_path, future = self.submit_to_s3(file, filename, self.minio_client)
+                    create_files.append((file, filename))
+                    if memo:
+                        to_store.append((fingerprints[param], s3_file_path))
+                uploads.append((os.getenv(self.get_colname_by_param(param)), s3_file_path, future))
+
+            zip_fingerprint = memo.combined_fingerprint(fingerprints) if memo else None
+            memo_zip = memo.find(zip_fingerprint) if memo else None
+            if memo_zip:
+                print(f'Архив с теми же файлами уже сформирован, копируем: {memo_zip}')
+                _, s3_path, future = self.reuse_memo_file(memo, memo_zip)
+            else:
+                create_files = [(memo.read(file) if isinstance(file, str) else file, filename)
+                                for file, filename in create_files]
+                zipfile, zipfile_name = self.all_reports_zip_create(self.report_id, *create_files)
+                s3_path, future = self.submit_to_s3(zipfile, zipfile_name, self.minio_client)
+                if memo:
+                    to_store.append((zip_fingerprint, s3_path))
+            uploads.append((os.getenv('ALL_REPORT_ZIP'), s3_path, future))
+
+            # Пути записываются в БД только после успешной загрузки файла
+            for column, path, future in uploads:
+                future.result()
+                print(f'Файл отправлен в хранилище: {path}')
+                self.write_s3path_to_bd(self.report_id, column, path)
+
+            for fingerprint, path in to_store:
+                try:
+                    memo.store(fingerprint, path)
+                except Exception as e:
+                    print(f'Не удалось сохранить файл {path} для повторного использования: {e}')
+            if to_store:
+                try:
+                    removed = memo.purge_stale()
+                    if removed:
+                        print(f'Удалено устаревших файлов для повторного использования: {removed}')
+                except Exception as e:
+                    print(f'Не удалось удалить устаревшие файлы для повторного использования: {e}')
         except Exception as err:
             print('Ошибка при создании файла')
             raise err
@@ -198,31 +277,19 @@ class FileFormatter:
         }
         return param_to_colname.get(param)
 
-    def upload_to_s3(self, file, file_name, minio_client=None):
+    def submit_to_s3(self, file, file_name, minio_client=None):
         """
-        Отправляет файл в S3-хранилище
+        Ставит файл в очередь отправки в S3-хранилище (повторы при ошибках выполняет сервис загрузки)
         :param minio_client:
         :param file:
         :param file_name: имя файла - критически важно чтобы содержало ID отчёта для которого файл создан (19/filename.docx)
-        :return:
+        :return: путь к файлу в хранилище и Future загрузки
         """
         if not minio_client:
-            minio_client = MinIOClient()
-            minio_client.connect()
-        error = None
-        for _ in range(3):
-            try:
-                s3_report_path = os.getenv('S3_REPORT_PATH')
-                output_path = '/'.join((s3_report_path, file_name))
-                minio_client.upload_memory_file(output_path, file, len(file.getvalue()))
-                print(f'Файл отправлен в хранилище: {output_path}')
-                return output_path
-            except Exception as e:
-                print(f'Ошибка отправки отчёта (попытка {_ + 1}) {file_name} в хранилище: {e}')
-                error = e
-                continue
-        print('Критическая ошибка отправки отчёта')
-        raise error
+            minio_client = get_minio_client()
+        s3_report_path = os.getenv('S3_REPORT_PATH')
+        output_path = '/'.join((s3_report_path, file_name))
+        return output_path, minio_client.submit_memory_file(output_path, file)
 
     def write_s3path_to_bd(self, report_id: int, column: str, s3_path: str):
         """